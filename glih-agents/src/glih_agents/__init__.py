@@ -3,4 +3,6 @@ __all__ = [
     "route_advisor",
     "customer_notifier",
     "ops_summarizer",
+    "steps",
+    "prompt_budget",
 ]
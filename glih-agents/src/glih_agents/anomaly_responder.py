@@ -2,11 +2,21 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 
+from .prompt_budget import PrefixedPrompt, context_budget, fit_context
+from .steps import Steps, arun_steps, run_steps
+
 logger = logging.getLogger(__name__)
 
 
 class AnomalyResponder:
     """Detect and respond to cold chain anomalies for Lineage Logistics."""
+
+    # Static head of the recommendation prompt (cacheable across runs)
+    RECOMMENDATION_PREFIX = (
+        "You are the anomaly response assistant for Lineage Logistics cold chain operations.\n"
+        "You receive a detected shipment anomaly and the standard operating procedures (SOPs) retrieved for it.\n"
+        "Provide a concise 2-3 sentence recommendation for the operations team, grounded in the SOPs.\n\n"
+    )
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
@@ -14,6 +24,7 @@ class AnomalyResponder:
         self.temp_critical = config.get('anomaly_temperature_critical_c', 5.0)
         self.response_target = config.get('anomaly_response_time_target_minutes', 5)
         self.notification_channels = config.get('anomaly_notification_channels', ['email'])
+        self.llm_model = (config.get('llm') or {}).get('model')
         
         # Temperature ranges by product type (from config)
         self.temp_ranges = config.get('lineage', {}).get('temperature_ranges', {})
@@ -125,6 +136,13 @@ class AnomalyResponder:
     
     def respond_to_anomaly(self, event: Dict[str, Any], vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
         """Main entry point: detect anomaly and generate response."""
+        return run_steps(self._respond_steps(event, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    async def arespond_to_anomaly(self, event: Dict[str, Any], vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
+        """respond_to_anomaly with async search / LLM callbacks."""
+        return await arun_steps(self._respond_steps(event, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    def _respond_steps(self, event: Dict[str, Any], can_search: bool, can_generate: bool) -> Steps:
         logger.info(f"Processing event for shipment {event.get('shipment_id')}")
         
         # 1. Detect anomaly
@@ -140,10 +158,10 @@ class AnomalyResponder:
         
         # 2. Retrieve relevant SOPs
         sops = []
-        if vector_search_fn:
+        if can_search:
             try:
                 sop_query = f"{anomaly['type']} for {event.get('product_type', 'general')} product"
-                sop_results = vector_search_fn(sop_query, collection='lineage-sops', k=3)
+                sop_results = yield ('search', sop_query, 'lineage-sops', 3)
                 sops = [r.get('document', '') for r in sop_results]
             except Exception as e:
                 logger.error(f"SOP retrieval failed: {e}")
@@ -154,9 +172,10 @@ class AnomalyResponder:
         
         # 4. Generate detailed recommendation using LLM (if available)
         recommendation = None
-        if llm_generate_fn and sops:
+        if can_generate and sops:
             try:
-                prompt = f"""Temperature breach detected for Lineage Logistics shipment:
+                sop_context = fit_context(sops, context_budget(self.llm_model), self.llm_model, separator=chr(10))
+                prompt = PrefixedPrompt(self.RECOMMENDATION_PREFIX, f"""Temperature breach detected for Lineage Logistics shipment:
                 
                 Shipment ID: {event.get('shipment_id')}
                 Product Type: {event.get('product_type')}
@@ -165,11 +184,9 @@ class AnomalyResponder:
                 Details: {anomaly['details']}
                 
                 Relevant SOPs:
-                {chr(10).join(sops)}
-                
-                Provide a concise 2-3 sentence recommendation for the operations team.
-                """
-                recommendation = llm_generate_fn(prompt)
+                {sop_context.text(chr(10))}
+                """)
+                recommendation = yield ('llm', prompt)
             except Exception as e:
                 logger.error(f"LLM generation failed: {e}")
         
@@ -2,11 +2,28 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 
+from .prompt_budget import PrefixedPrompt
+from .steps import Steps, arun_steps, run_steps
+
 logger = logging.getLogger(__name__)
 
 
 class CustomerNotifier:
     """Generate and send proactive customer notifications for Lineage Logistics."""
+
+    # Static head of the notification prompt (cacheable across runs)
+    NOTIFICATION_PREFIX = (
+        "You write customer notification emails for Lineage Logistics cold chain operations.\n"
+        "Generate a clear, professional email notification that:\n"
+        "1. Has a clear subject line\n"
+        "2. Addresses the customer contact by name\n"
+        "3. Informs the customer of the situation clearly\n"
+        "4. Explains what action we're taking\n"
+        "5. Provides next steps or timeline (e.g., update within 1-2 hours)\n"
+        "6. Maintains customer confidence\n"
+        "7. Signs off with the SENDER's name and title\n"
+        "Format as a proper email with Subject line, greeting, body, and signature.\n\n"
+    )
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
@@ -251,6 +268,13 @@ This is an automated notification from Lineage Logistics Cold Chain Management S
     
     def notify_customer(self, event: Dict[str, Any], llm_generate_fn=None) -> Dict[str, Any]:
         """Main entry point: generate and send customer notification."""
+        return run_steps(self._notify_steps(event, bool(llm_generate_fn)), None, llm_generate_fn)
+    
+    async def anotify_customer(self, event: Dict[str, Any], llm_generate_fn=None) -> Dict[str, Any]:
+        """notify_customer with an async LLM callback."""
+        return await arun_steps(self._notify_steps(event, bool(llm_generate_fn)), None, llm_generate_fn)
+    
+    def _notify_steps(self, event: Dict[str, Any], can_generate: bool) -> Steps:
         logger.info(f"Processing notification for shipment {event.get('shipment_id')}")
         
         # 1. Determine notification type (check both 'type' and 'notification_type' fields)
@@ -284,10 +308,10 @@ This is an automated notification from Lineage Logistics Cold Chain Management S
         dispatcher_name = event.get('dispatcher_name') or self.dispatcher_name
         dispatcher_title = event.get('dispatcher_title') or self.dispatcher_title
         
-        if llm_generate_fn and notification_type in ['delay', 'issue', 'temperature_breach']:
+        if can_generate and notification_type in ['delay', 'issue', 'temperature_breach']:
             # Use LLM for more nuanced messaging on sensitive topics
             try:
-                prompt = f"""Generate a professional customer notification email for Lineage Logistics:
+                prompt = PrefixedPrompt(self.NOTIFICATION_PREFIX, f"""Generate a professional customer notification email for Lineage Logistics:
                 
                 Customer: {customer.get('name')}
                 Contact: {customer.get('contact_name')}
@@ -299,19 +323,9 @@ This is an automated notification from Lineage Logistics Cold Chain Management S
                 Details: {event.get('details', {})}
                 
                 SENDER (Dispatcher): {dispatcher_name}, {dispatcher_title}
-                
-                Generate a clear, professional email notification that:
-                1. Has a clear subject line
-                2. Addresses the customer contact by name
-                3. Informs the customer of the situation clearly
-                4. Explains what action we're taking
-                5. Provides next steps or timeline (e.g., update within 1-2 hours)
-                6. Maintains customer confidence
-                7. Signs off with the dispatcher's name and title: "{dispatcher_name}, {dispatcher_title}"
-                
-                Format as a proper email with Subject line, greeting, body, and signature.
-                """
-                message = llm_generate_fn(prompt)
+                Sign off as: "{dispatcher_name}, {dispatcher_title}"
+                """)
+                message = yield ('llm', prompt)
             except Exception as e:
                 logger.error(f"LLM generation failed: {e}, using template")
                 message = self.generate_message(event, customer, template)
@@ -2,17 +2,32 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import logging
 
+from .prompt_budget import PrefixedPrompt, context_budget, fit_context
+from .steps import Steps, arun_steps, run_steps
+
 logger = logging.getLogger(__name__)
 
 
 class OpsSummarizer:
     """Generate shift handoff reports, performance digests, and incident summaries for Lineage Logistics."""
+
+    # Static head of the summary prompt (cacheable across runs)
+    SUMMARY_PREFIX = (
+        "You write executive operations summaries for Lineage Logistics cold chain operations.\n"
+        "You receive shift metrics, incidents and historical context.\n"
+        "Provide:\n"
+        "1. Executive summary (2-3 sentences)\n"
+        "2. Key highlights (3-5 bullet points)\n"
+        "3. Issues requiring attention (if any)\n"
+        "4. Recommendations for next shift (2-3 bullet points)\n\n"
+    )
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.summary_window_hours = config.get('ops_summary_window_hours', 24)
         self.summary_schedule = config.get('ops_summary_schedule', 'shift_end')
         self.export_format = config.get('ops_export_format', 'pdf')
+        self.llm_model = (config.get('llm') or {}).get('model')
     
     def get_events(self, time_window: str) -> List[Dict[str, Any]]:
         """Retrieve events for the specified time window."""
@@ -163,6 +178,13 @@ class OpsSummarizer:
     
     def summarize_ops(self, time_window: str = '24h', vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
         """Main entry point: generate operations summary."""
+        return run_steps(self._summarize_steps(time_window, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    async def asummarize_ops(self, time_window: str = '24h', vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
+        """summarize_ops with async search / LLM callbacks."""
+        return await arun_steps(self._summarize_steps(time_window, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    def _summarize_steps(self, time_window: str, can_search: bool, can_generate: bool) -> Steps:
         logger.info(f"Generating ops summary for {time_window}")
         
         # 1. Aggregate events
@@ -174,10 +196,10 @@ class OpsSummarizer:
         
         # 3. Query for historical context
         context = []
-        if vector_search_fn:
+        if can_search:
             try:
                 context_query = f"Operational performance trends {time_window}"
-                context_results = vector_search_fn(context_query, collection='lineage-ops-history', k=3)
+                context_results = yield ('search', context_query, 'lineage-ops-history', 3)
                 context = [r.get('document', '') for r in context_results]
             except Exception as e:
                 logger.error(f"Context retrieval failed: {e}")
@@ -188,9 +210,10 @@ class OpsSummarizer:
         issues_requiring_attention = []
         recommendations = []
         
-        if llm_generate_fn:
+        if can_generate:
             try:
-                prompt = f"""Generate an executive operations summary for Lineage Logistics:
+                history_context = fit_context(context, context_budget(self.llm_model), self.llm_model, separator=chr(10))
+                prompt = PrefixedPrompt(self.SUMMARY_PREFIX, f"""Generate an executive operations summary for Lineage Logistics:
                 
                 Time period: {time_window}
                 Total shipments: {metrics['total_shipments']}
@@ -206,16 +229,10 @@ class OpsSummarizer:
                 {chr(10).join([f"- {i['type']}: {i['description']} (Severity: {i['severity']}, Resolved: {i['resolved']})" for i in incidents])}
                 
                 Historical context:
-                {chr(10).join(context) if context else 'No historical data available'}
-                
-                Provide:
-                1. Executive summary (2-3 sentences)
-                2. Key highlights (3-5 bullet points)
-                3. Issues requiring attention (if any)
-                4. Recommendations for next shift (2-3 bullet points)
-                """
+                {history_context.text(chr(10), empty='No historical data available')}
+                """)
                 
-                summary_text = llm_generate_fn(prompt)
+                summary_text = yield ('llm', prompt)
                 
                 # Parse LLM response (simplified)
                 executive_summary = summary_text
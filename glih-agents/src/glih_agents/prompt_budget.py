@@ -0,0 +1,224 @@
+"""
+Token-budgeted prompt context, shared by /query and the agents.
+
+PrefixedPrompt marks the static head of a prompt (preamble, boilerplate,
+output rules) so LLM providers can serve it from their prompt cache.
+
+Retrieved chunks are fitted into a per-model token budget before they are
+pasted into a prompt:
+
+  1. Dedupe: chunks are split into sentences and any sentence already taken
+     from a higher-ranked chunk is dropped. The ingest chunker overlaps
+     neighbouring chunks by whole sentences, so adjacent hits mostly repeat
+     each other. Repeats within one chunk (table cells such as "N/A") stay,
+     and kept sentences keep their original separators, so SOP steps and
+     table rows stay on their own lines.
+  2. Budget: chunks are taken in rank order until the budget is spent. The
+     chunk that overflows is cut at a sentence boundary (if a useful amount
+     of budget is left), and everything ranked below it is dropped.
+
+Tokens are counted with tiktoken for OpenAI models when it is installed,
+otherwise estimated from characters per token for the model family.
+
+Env:
+  GLIH_PROMPT_CONTEXT_TOKENS   context budget per prompt (default 3000)
+  GLIH_PROMPT_RESERVE_TOKENS   kept free in the model window for the answer (default 1024)
+"""
+
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover - optional
+    tiktoken = None  # type: ignore
+
+CONTEXT_TOKENS = int(os.getenv("GLIH_PROMPT_CONTEXT_TOKENS", "3000"))
+RESERVE_TOKENS = int(os.getenv("GLIH_PROMPT_RESERVE_TOKENS", "1024"))
+# A partial chunk smaller than this is not worth including
+_MIN_PARTIAL_TOKENS = 48
+
+# Context windows by model-name prefix (longest prefix wins)
+_CONTEXT_WINDOWS = {
+    "gpt-4o": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4.1": 1_000_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+    "o1": 128_000,
+    "o3": 200_000,
+    "claude": 200_000,
+    "mistral-large": 128_000,
+    "mistral": 32_000,
+    "open-mistral": 32_000,
+    "open-mixtral": 32_000,
+    "deepseek": 64_000,
+}
+_DEFAULT_WINDOW = 8_192
+
+# Characters per token for families without a local tokenizer
+_CHARS_PER_TOKEN = {
+    "claude": 3.5,
+    "mistral": 3.6,
+    "open-mistral": 3.6,
+    "open-mixtral": 3.6,
+    "deepseek": 3.8,
+}
+_DEFAULT_CHARS_PER_TOKEN = 4.0
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=\n)')
+
+
+def _prefix_lookup(table: dict, model: Optional[str], default):
+    name = (model or "").lower()
+    best = max((p for p in table if name.startswith(p)), key=len, default=None)
+    return table[best] if best else default
+
+
+@lru_cache(maxsize=32)
+def _encoding(model: Optional[str]):
+    if tiktoken is None or not model or not model.lower().startswith(("gpt-", "o1", "o3", "text-embedding")):
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Tokens in `text` for `model` (exact for OpenAI models with tiktoken, else estimated)."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / _prefix_lookup(_CHARS_PER_TOKEN, model, _DEFAULT_CHARS_PER_TOKEN))
+
+
+def context_budget(model: Optional[str] = None, prompt_tokens: int = 0) -> int:
+    """Context tokens allowed for `model`, given `prompt_tokens` of instructions around it."""
+    window = _prefix_lookup(_CONTEXT_WINDOWS, model, _DEFAULT_WINDOW)
+    return max(0, min(CONTEXT_TOKENS, window - RESERVE_TOKENS - prompt_tokens))
+
+
+class PrefixedPrompt(str):
+    """
+    A prompt whose leading `prefix` is identical across calls. It behaves as
+    the plain string prefix + suffix everywhere; LLMProvider sends the prefix
+    as a separate, cacheable block.
+    """
+
+    def __new__(cls, prefix: str, suffix: str) -> "PrefixedPrompt":
+        obj = super().__new__(cls, prefix + suffix)
+        obj.prefix = prefix
+        return obj
+
+    @property
+    def suffix(self) -> str:
+        return str.__str__(self)[len(self.prefix):]
+
+
+def _sentences(text: str) -> List[str]:
+    """Sentences of `text`, each with the whitespace after it: joining them gives back `text`."""
+    out, start = [], 0
+    for m in _SENTENCE_END.finditer(text):
+        if m.end() > start:
+            out.append(text[start:m.end()])
+            start = m.end()
+    if start < len(text):
+        out.append(text[start:])
+    return out
+
+
+def _norm(sentence: str) -> str:
+    return " ".join(sentence.split()).casefold()
+
+
+@dataclass
+class ContextFit:
+    """Result of fit_context: the chunks that made it in, and what was cut."""
+    chunks: List[str] = field(default_factory=list)
+    kept: List[int] = field(default_factory=list)  # input indices of `chunks`
+    tokens: int = 0
+    budget: int = 0
+    input_tokens: int = 0
+    deduped_sentences: int = 0
+    dropped: int = 0
+    truncated: bool = False
+
+    def text(self, separator: str = "\n\n---\n\n", empty: str = "") -> str:
+        return separator.join(self.chunks) if self.chunks else empty
+
+    def report(self) -> dict:
+        return {
+            "context_tokens": self.tokens,
+            "context_budget": self.budget,
+            "context_input_tokens": self.input_tokens,
+            "context_chunks": len(self.chunks),
+            "context_dropped": self.dropped,
+            "context_deduped_sentences": self.deduped_sentences,
+            "context_truncated": self.truncated,
+        }
+
+
+def fit_context(chunks: List[str], budget: int, model: Optional[str] = None, separator: str = "\n\n---\n\n") -> ContextFit:
+    """Dedupe `chunks` (best-ranked first) and keep what fits in `budget` tokens."""
+    fit = ContextFit(budget=budget)
+    sep_tokens = count_tokens(separator, model)
+    seen = set()
+    for idx, chunk in enumerate(chunks):
+        chunk = chunk or ""
+        fit.input_tokens += count_tokens(chunk, model)
+        if fit.truncated or fit.tokens >= budget:
+            fit.dropped += 1
+            continue
+        sentences, keys = [], set()
+        for s in _sentences(chunk):
+            key = _norm(s)
+            if not key:
+                # Blank lines: keep the paragraph break after the previous sentence
+                if sentences:
+                    sentences[-1] += s
+                continue
+            if key in seen:
+                fit.deduped_sentences += 1
+                continue
+            keys.add(key)
+            sentences.append(s)
+        # Only lower-ranked chunks are deduped against this one
+        seen |= keys
+        if not sentences:
+            fit.dropped += 1
+            continue
+        text = "".join(sentences).strip()
+        cost = count_tokens(text, model) + (sep_tokens if fit.chunks else 0)
+        if fit.tokens + cost <= budget:
+            fit.chunks.append(text)
+            fit.kept.append(idx)
+            fit.tokens += cost
+            continue
+        # Overflow: keep the leading sentences that fit, drop everything below
+        room = budget - fit.tokens - (sep_tokens if fit.chunks else 0)
+        fit.truncated = True
+        partial, used = [], 0
+        if room >= _MIN_PARTIAL_TOKENS:
+            for s in sentences:
+                t = count_tokens(s, model)
+                if used + t > room:
+                    break
+                partial.append(s)
+                used += t
+        if partial:
+            fit.chunks.append("".join(partial).strip())
+            fit.kept.append(idx)
+            fit.tokens += used + (sep_tokens if len(fit.chunks) > 1 else 0)
+        else:
+            fit.dropped += 1
+    return fit
@@ -3,11 +3,24 @@ from datetime import datetime, timedelta
 import logging
 import math
 
+from .prompt_budget import PrefixedPrompt, context_budget, fit_context
+from .steps import Steps, arun_steps, run_steps
+
 logger = logging.getLogger(__name__)
 
 
 class RouteAdvisor:
     """Optimize routing to prevent delays, reduce costs, and minimize spoilage for Lineage Logistics."""
+
+    # Static head of the recommendation prompt (cacheable across runs)
+    RECOMMENDATION_PREFIX = (
+        "You are the route optimization assistant for Lineage Logistics cold chain operations.\n"
+        "You receive an at-risk shipment, candidate alternative routes and historical route performance.\n"
+        "Provide a concise 2-3 sentence recommendation for the operations team, including:\n"
+        "1. Which route to take and why\n"
+        "2. Expected impact on delivery time and cost\n"
+        "3. Any precautions or monitoring needed\n\n"
+    )
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
@@ -15,6 +28,7 @@ class RouteAdvisor:
         self.spoilage_risk_threshold = config.get('route_spoilage_risk_threshold', 0.7)
         self.optimization_enabled = config.get('route_optimization_enabled', True)
         self.weather_integration = config.get('route_weather_integration', False)
+        self.llm_model = (config.get('llm') or {}).get('model')
         
         # Product shelf life (hours)
         self.shelf_life = {
@@ -127,6 +141,13 @@ class RouteAdvisor:
     
     def advise_route(self, shipment: Dict[str, Any], vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
         """Main entry point: analyze route and provide recommendations."""
+        return run_steps(self._advise_steps(shipment, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    async def aadvise_route(self, shipment: Dict[str, Any], vector_search_fn=None, llm_generate_fn=None) -> Dict[str, Any]:
+        """advise_route with async search / LLM callbacks."""
+        return await arun_steps(self._advise_steps(shipment, bool(vector_search_fn), bool(llm_generate_fn)), vector_search_fn, llm_generate_fn)
+    
+    def _advise_steps(self, shipment: Dict[str, Any], can_search: bool, can_generate: bool) -> Steps:
         logger.info(f"Analyzing route for shipment {shipment.get('shipment_id')}")
         
         # 1. Calculate current ETA
@@ -158,19 +179,20 @@ class RouteAdvisor:
         
         # 5. Retrieve historical route performance
         route_history = []
-        if vector_search_fn:
+        if can_search:
             try:
                 route_query = f"Route performance {shipment.get('origin')} to {shipment.get('destination')}"
-                history_results = vector_search_fn(route_query, collection='lineage-routes', k=3)
+                history_results = yield ('search', route_query, 'lineage-routes', 3)
                 route_history = [r.get('document', '') for r in history_results]
             except Exception as e:
                 logger.error(f"Route history retrieval failed: {e}")
         
         # 6. Generate detailed recommendation using LLM
         recommendation = None
-        if llm_generate_fn and route_history:
+        if can_generate and route_history:
             try:
-                prompt = f"""Route optimization needed for Lineage Logistics shipment:
+                history_context = fit_context(route_history, context_budget(self.llm_model), self.llm_model, separator=chr(10))
+                prompt = PrefixedPrompt(self.RECOMMENDATION_PREFIX, f"""Route optimization needed for Lineage Logistics shipment:
                 
                 Shipment ID: {shipment.get('shipment_id')}
                 Product Type: {shipment.get('product_type')}
@@ -183,14 +205,9 @@ class RouteAdvisor:
                 {chr(10).join([f"- {r['name']}: {r['estimated_hours']}h, ${r['cost_estimate']}, Risk: {', '.join(r['risk_factors']) or 'None'}" for r in alternatives])}
                 
                 Historical Performance:
-                {chr(10).join(route_history)}
-                
-                Provide a concise 2-3 sentence recommendation for the operations team, including:
-                1. Which route to take and why
-                2. Expected impact on delivery time and cost
-                3. Any precautions or monitoring needed
-                """
-                recommendation = llm_generate_fn(prompt)
+                {history_context.text(chr(10))}
+                """)
+                recommendation = yield ('llm', prompt)
             except Exception as e:
                 logger.error(f"LLM generation failed: {e}")
         
@@ -0,0 +1,51 @@
+"""
+Step protocol shared by the agents.
+
+Each agent's main flow is written once, as a generator that yields the I/O it
+needs and receives the results:
+
+    ("search", query, collection, k)  -> list of result dicts
+    ("llm", prompt)                   -> generated text
+
+`collection` is a collection name, or a list of names ("name:weight"
+entries allowed) for one fused search across all of them.
+
+An exception raised by a callback is thrown back into the generator at the
+yield, so the agent's own try/except handles it exactly as before.
+run_steps drives the flow with plain callbacks; arun_steps awaits async ones,
+so an agent run on the event loop holds no thread while the LLM answers.
+"""
+
+from typing import Any, Callable, Generator, Optional, Tuple
+
+Steps = Generator[Tuple[Any, ...], Any, Any]
+
+
+def run_steps(steps: Steps, vector_search_fn: Optional[Callable] = None, llm_generate_fn: Optional[Callable] = None) -> Any:
+    try:
+        request = next(steps)
+        while True:
+            fn = vector_search_fn if request[0] == "search" else llm_generate_fn
+            try:
+                result = fn(*request[1:])
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+async def arun_steps(steps: Steps, vector_search_fn: Optional[Callable] = None, llm_generate_fn: Optional[Callable] = None) -> Any:
+    try:
+        request = next(steps)
+        while True:
+            fn = vector_search_fn if request[0] == "search" else llm_generate_fn
+            try:
+                result = await fn(*request[1:])
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
@@ -0,0 +1,219 @@
+"""
+GLIH Platform — /query Answer Cache
+===================================
+Stores full /query results (answer + citations) so that asking the same
+question of an unchanged collection does not pay for retrieval and an LLM
+call again.
+
+Exact key: sha256 of
+  collection, collection generation, normalized query (NFC, casefolded,
+  whitespace collapsed), k, style, max_distance, LLM provider, LLM model,
+  metadata filter (if any). A federated query keys on every collection,
+  its generation and its weight.
+
+Collection generations live in one small file per collection
+(CollectionGenerations). Ingest, delete and reset bump them, and every
+worker reads the file on lookup. An ingest in one worker therefore
+invalidates cached answers in all of them, without any explicit eviction.
+
+Near-duplicate mode (GLIH_ANSWER_CACHE_SIMILARITY > 0): when the exact key
+misses, the query embedding is compared with the embeddings of cached
+entries that share every other key component (same collection generation,
+k, style, ...). The best match at or above the cosine threshold is served.
+
+Memory only: LRU with a per-entry TTL. stats() reports hits, semantic hits,
+misses and the hit rate for /health/detailed.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+ANSWER_CACHE_ENABLED = os.getenv("GLIH_ANSWER_CACHE", "1").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIZE = int(os.getenv("GLIH_ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_S = float(os.getenv("GLIH_ANSWER_CACHE_TTL_S", "600"))
+# Cosine similarity threshold for near-duplicate hits; 0 disables the mode
+ANSWER_CACHE_SIMILARITY = float(os.getenv("GLIH_ANSWER_CACHE_SIMILARITY", "0"))
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text or "").casefold().split())
+
+
+class CollectionGenerations:
+    """
+    Per-collection generation tokens ("<counter> <nonce>"), one file each,
+    shared by every worker on the host. The nonce keeps tokens unique even if
+    two workers bump the same counter concurrently.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, collection: str) -> str:
+        return os.path.join(self.root, f"{collection}.gen")
+
+    def get(self, collection: str) -> str:
+        try:
+            with open(self._path(collection), "r", encoding="utf-8") as fh:
+                return fh.read().strip() or "0"
+        except FileNotFoundError:
+            return "0"
+
+    def bump(self, collection: str) -> str:
+        try:
+            counter = int(self.get(collection).split()[0]) + 1
+        except ValueError:
+            counter = 1
+        token = f"{counter} {uuid.uuid4().hex[:8]}"
+        tmp = f"{self._path(collection)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(token + "\n")
+        os.replace(tmp, self._path(collection))
+        return token
+
+
+class AnswerCache:
+    """LRU + TTL cache of /query results with an optional near-duplicate lookup."""
+
+    def __init__(
+        self,
+        generations: CollectionGenerations,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ) -> None:
+        self.generations = generations
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        # key → (result, created_at, bucket, unit query embedding or None)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, str, Optional[np.ndarray]]]" = OrderedDict()
+        # bucket (every key component except the query) → keys, for near-duplicate scans
+        self._buckets: Dict[str, Dict[str, None]] = {}
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls, generations_dir: str) -> Optional["AnswerCache"]:
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        return cls(CollectionGenerations(generations_dir))
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity > 0
+
+    def keys(
+        self,
+        collection: Union[str, Sequence[str]],
+        query: str,
+        k: int,
+        style: str,
+        max_distance: Optional[float],
+        provider: str,
+        model: str,
+        filters: str = "",
+        weights: Optional[Sequence[float]] = None,
+    ) -> Tuple[str, str]:
+        """
+        (exact key, bucket) for a request against the collection's current
+        generation. `filters` is the metadata filter's canonical key; filtered
+        requests get their own bucket, unfiltered keys are unchanged.
+        A federated request passes its collections (and their `weights`); an
+        ingest into any one of them invalidates the answer.
+        """
+        if isinstance(collection, str):
+            parts = [collection, self.generations.get(collection)]
+        else:
+            names = list(collection)
+            parts = [",".join(names), ",".join(self.generations.get(c) for c in names)]
+            if weights is not None:
+                parts.append(",".join(f"{w:g}" for w in weights))
+        parts += [str(k), style, repr(max_distance), provider, model]
+        if filters:
+            parts.append(filters)
+        bucket = "\x1f".join(parts)
+        key = hashlib.sha256(f"{bucket}\x1e{normalize_query(query)}".encode("utf-8")).hexdigest()
+        return key, hashlib.sha256(bucket.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        _, _, bucket, _ = self._entries.pop(key)
+        members = self._buckets.get(bucket)
+        if members is not None:
+            members.pop(key, None)
+            if not members:
+                del self._buckets[bucket]
+
+    def get(self, key: str, bucket: str, embedding: Optional[List[float]] = None) -> Optional[Tuple[Dict[str, Any], str]]:
+        """(cached result, "exact" | "semantic") or None."""
+        min_created = time.time() - self.ttl_s
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < min_created:
+                self._drop(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0], "exact"
+            if embedding is not None and self.semantic and bucket in self._buckets:
+                q = np.asarray(embedding, dtype=np.float32)
+                q /= np.linalg.norm(q) or 1.0
+                cands = [c for c in self._buckets[bucket] if self._entries[c][3] is not None and self._entries[c][1] >= min_created]
+                if cands:
+                    sims = np.stack([self._entries[c][3] for c in cands]) @ q
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.similarity:
+                        self._entries.move_to_end(cands[best])
+                        self._stats["semantic_hits"] += 1
+                        result = dict(self._entries[cands[best]][0])
+                        result["cache_similarity"] = round(float(sims[best]), 4)
+                        return result, "semantic"
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, bucket: str, result: Dict[str, Any], embedding: Optional[List[float]] = None) -> None:
+        unit = None
+        if embedding is not None and self.semantic:
+            unit = np.asarray(embedding, dtype=np.float32)
+            unit /= np.linalg.norm(unit) or 1.0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, time.time(), bucket, unit)
+            self._buckets.setdefault(bucket, {})[key] = None
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def bump(self, collection: str) -> None:
+        """Collection content changed: every cached answer for it becomes unreachable."""
+        self.generations.bump(collection)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+        lookups = out["hits"] + out["semantic_hits"] + out["misses"]
+        out["hit_rate"] = round((out["hits"] + out["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        out["capacity"] = self.max_entries
+        out["ttl_s"] = self.ttl_s
+        out["similarity_threshold"] = self.similarity or None
+        return out
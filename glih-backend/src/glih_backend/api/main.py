@@ -1,18 +1,23 @@
+import asyncio
 import os
 import io
+import json
 import uuid
 import re
 import time
 import logging
 import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime as _datetime
 
 # ── Sentry (optional — only activates when SENTRY_DSN is set) ────────────────
@@ -39,6 +44,8 @@ from ..history_store import (
     save_notification,
     get_notifications,
     get_history_stats,
+    get_write_queue_stats,
+    shutdown_history_writer,
 )
 from ..dispatchers import (
     login as admin_login,
@@ -54,7 +61,36 @@ from ..providers import (
     make_embeddings_provider,
     make_vector_store,
     make_llm_provider,
+    get_embedding_batch_stats,
+    get_llm_coalescing_stats,
+    get_prompt_cache_stats,
+    aclose_async_clients,
+)
+from ..llm_resilience import get_llm_resilience_stats
+from ..bm25_index import BM25Index, build_index, tokenize
+from ..bm25_store import BM25Store
+from ..embedding_cache import EmbeddingCache
+from ..embedding_store import (
+    EMBEDDING_MODEL_KEY,
+    PLACEHOLDER_MODEL,
+    EmbeddingStore,
+    chunk_ids,
+    document_id,
+    embedding_tag,
+    select_chunks,
 )
+from ..answer_cache import AnswerCache
+from ..reranker import RERANK_ENABLED, Reranker, get_reranker
+from ..metadata_filter import FilterError, MetadataFilter, build_filter
+from ..federated import (
+    FEDERATED_TIMEOUT_MS,
+    CollectionSpecError,
+    Federation,
+    federation_label,
+    fuse_collections,
+    parse_collections,
+)
+from ..vector_stores import get_bulk_upsert_stats
 from pypdf import PdfReader
 from bs4 import BeautifulSoup
 
@@ -95,6 +131,7 @@ def _complete_run(run_id: str, result: dict = None, error: str = None) -> None:
 _RATE_LIMIT_QUERY   = os.getenv("RATE_LIMIT_QUERY",  "30/minute")
 _RATE_LIMIT_AGENTS  = os.getenv("RATE_LIMIT_AGENTS", "20/minute")
 _RATE_LIMIT_INGEST  = os.getenv("RATE_LIMIT_INGEST", "10/minute")
+_RATE_LIMIT_QUERY_BATCH = os.getenv("RATE_LIMIT_QUERY_BATCH", "5/minute")
 limiter = Limiter(key_func=get_remote_address, default_limits=["200/minute"])
 
 app = FastAPI(title="GLIH Backend", version="0.1.0")
@@ -144,6 +181,19 @@ async def _startup():
     create_admin_user()
     seed_sample_dispatchers()
 
+@app.on_event("shutdown")
+def _shutdown():
+    # Drain the history write-behind queue so in-flight records survive a restart
+    if not shutdown_history_writer(timeout=float(os.getenv("GLIH_HISTORY_SHUTDOWN_TIMEOUT_S", "20"))):
+        logger.warning("History writer did not drain before shutdown timeout")
+    # Straggling retrieval branches (timed out, still running) are abandoned
+    _retrieval_pool.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def _close_provider_clients():
+    # Pooled AsyncClient behind agenerate / aembed
+    await aclose_async_clients()
+
 class _AuthRegisterReq(BaseModel):
     name:     str
     email:    str
@@ -310,47 +360,260 @@ _cfg = load_config()
 _emb = make_embeddings_provider(_cfg)
 _vs = make_vector_store(_cfg)
 _llm = make_llm_provider(_cfg)
+# Query-time embeddings are cached by (provider, model, normalized text); ingest
+# chunks are one-off and go straight to the provider.
+_emb_cache: Optional[EmbeddingCache] = EmbeddingCache.from_env()
+# Optional cross-encoder pass over the RRF-fused candidates (GLIH_RERANK=1).
+# The model loads in the background so the first query stays within budget.
+_reranker: Optional[Reranker] = get_reranker() if RERANK_ENABLED else None
+if _reranker is not None:
+    _reranker.warm()
 
 logger.info(f"GLIH Backend initialized: LLM={_llm.provider}/{_llm.model}, Embeddings={_emb.provider}/{_emb.model}, VectorStore={_vs.provider}")
 
 # ---------------------------------------------------------------------------
-# BM25 index cache — keyed by collection name, invalidated on every ingest
+# BM25 index cache — keyed by collection name. Built once per collection from
+# the vector store, then kept current incrementally by the ingest endpoints.
+# With GLIH_BM25_PERSIST (default on) the index lives on disk next to the
+# vector store (see bm25_store): workers memory-map the current generation,
+# ingest publishes a new one, and every worker reloads when CURRENT changes.
 # ---------------------------------------------------------------------------
-_bm25_cache: Dict[str, Any] = {}
+_BM25_PERSIST = os.getenv("GLIH_BM25_PERSIST", "1").lower() in ("1", "true", "yes")
+_BM25_DIR = os.getenv("GLIH_BM25_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(_vs.persist_dir)) if _vs.persist_dir else os.path.join(os.getcwd(), "data"),
+    "bm25",
+)
+_bm25_store: Optional[BM25Store] = BM25Store(_BM25_DIR) if _BM25_PERSIST else None
+# /query answer cache — entries are keyed by a per-collection generation that
+# ingest / delete / reset bump (files under data/generations, shared by workers).
+_answer_cache: Optional[AnswerCache] = AnswerCache.from_env(
+    os.getenv("GLIH_GENERATIONS_DIR") or os.path.join(os.path.dirname(_BM25_DIR), "generations")
+)
+# Ingest-time embeddings, content-addressed by (provider, model, chunk text) and
+# memory-mapped from disk: re-ingested chunks are not sent to the provider again.
+_emb_store: Optional[EmbeddingStore] = EmbeddingStore.from_env(
+    os.getenv("GLIH_EMBED_STORE_DIR") or os.path.join(os.path.dirname(_BM25_DIR), "embeddings")
+)
+# collection → (generation token, index); the token is None when not persisted
+_bm25_cache: Dict[str, Tuple[Optional[str], BM25Index]] = {}
+# One lock per collection serializes its build / load / update (file I/O and
+# cold-build scans included); _bm25_lock only guards the lock table, so a
+# large ingest or cold build never blocks BM25 on other collections.
+_bm25_locks: Dict[str, threading.Lock] = {}
+_bm25_lock = threading.Lock()
+# Collections whose store cannot list its chunks (Pinecone pod indexes): decided
+# on the first query, after which the BM25 branch is skipped without a build
+_bm25_unavailable: Set[str] = set()
+
+
+def _bm25_collection_lock(collection: str) -> threading.Lock:
+    with _bm25_lock:
+        lock = _bm25_locks.get(collection)
+        if lock is None:
+            lock = _bm25_locks[collection] = threading.Lock()
+        return lock
+
+
+def _bm25_source(collection: str) -> Optional[str]:
+    """Identity of the vector-store collection behind an on-disk index."""
+    return _vs.collection_token(collection)
+
+
+def _collection_changed(collection: str) -> None:
+    """Content of a collection changed: cached /query answers for it are stale."""
+    if _answer_cache is not None:
+        try:
+            _answer_cache.bump(collection)
+        except Exception as exc:
+            logger.warning(f"Answer cache generation bump failed for '{collection}': {exc}")
 
 
 def _invalidate_bm25(collection: str) -> None:
-    _bm25_cache.pop(collection, None)
+    """Drop a collection's index entirely (collection deleted or reset)."""
+    with _bm25_collection_lock(collection):
+        _bm25_cache.pop(collection, None)
+        if _bm25_store is not None:
+            try:
+                _bm25_store.drop(collection)
+            except Exception as exc:
+                logger.warning(f"BM25 index drop failed for '{collection}': {exc}")
+
+
+def _bm25_add(collection: str, ids: List[str], texts: List[str], metas: Optional[List[Dict[str, Any]]]) -> None:
+    """Append freshly ingested chunks to the collection's index, if it is built."""
+    if _bm25_store is None:
+        # Holding the lock means a concurrent cold build either already saw these
+        # chunks in the store (add() replaces them by id) or finishes first.
+        with _bm25_collection_lock(collection):
+            entry = _bm25_cache.get(collection)
+            if entry is not None:
+                entry[1].add(ids, texts, metas)
+        return
+    try:
+        with _bm25_collection_lock(collection), _bm25_store.lock(collection):
+            token = _bm25_store.current(collection)
+            if token is None:
+                # Never built: the first query's cold build scans the store, chunks included
+                return
+            source = _bm25_source(collection)
+            entry = _bm25_cache.get(collection)
+            loaded = (token, entry[1]) if entry is not None and entry[0] == token else _bm25_store.load(collection, source)
+            if loaded is None:
+                # Index on disk is from a previous instance of the collection — rebuilt on next query
+                _bm25_cache.pop(collection, None)
+                return
+            loaded[1].add(ids, texts, metas)
+            _bm25_store.save(collection, loaded[1], source)
+            # Swap in the mmapped generation so the new chunks' text is not kept on the heap
+            _bm25_cache[collection] = _bm25_store.load(collection)
+    except Exception as exc:
+        logger.warning(f"BM25 index update failed for '{collection}': {exc}")
+        _bm25_cache.pop(collection, None)
 
 
-def _get_bm25_index(collection: str) -> Optional[Dict[str, Any]]:
-    """Return (or build and cache) a BM25Okapi index for the given collection."""
-    if collection in _bm25_cache:
-        return _bm25_cache[collection]
+def _build_bm25_from_store(collection: str) -> Optional[BM25Index]:
+    """Cold build: scan every chunk of the collection from the vector store."""
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[Dict] = []
     try:
-        from rank_bm25 import BM25Okapi  # type: ignore
-        coll = _vs.get_collection(collection)
-        if coll is None:
-            return None
-        raw = coll.get(include=["documents", "metadatas"])
-        docs: List[str] = raw.get("documents") or []
-        ids: List[str] = raw.get("ids") or []
-        metas: List[Dict] = raw.get("metadatas") or [{}] * len(docs)
-        if not docs:
+        for batch in _vs.scan(collection):
+            for r in batch:
+                ids.append(r["id"])
+                docs.append(r.get("document") or "")
+                metas.append(r.get("metadata") or {})
+    except NotImplementedError as exc:
+        logger.warning(f"BM25 index unavailable for '{collection}', hybrid search is vector-only: {exc}")
+        _bm25_unavailable.add(collection)
+        return None
+    entry = build_index(ids, docs, metas)
+    logger.info(f"BM25 index built for '{collection}': {len(entry)} docs")
+    return entry
+
+
+def _get_bm25_index(collection: str) -> Optional[BM25Index]:
+    """Return the BM25 index for a collection: cached, loaded from disk, or built once."""
+    if collection in _bm25_unavailable:
+        return None
+    entry = _bm25_cache.get(collection)
+    token = _bm25_store.current(collection) if _bm25_store is not None else None
+    if entry is not None and entry[0] == token:
+        return entry[1]
+    with _bm25_collection_lock(collection):
+        try:
+            if _bm25_store is None:
+                if collection not in _bm25_cache:
+                    index = _build_bm25_from_store(collection)
+                    if index is None:
+                        return None
+                    _bm25_cache[collection] = (None, index)
+                return _bm25_cache[collection][1]
+            entry = _bm25_cache.get(collection)
+            token = _bm25_store.current(collection)
+            if entry is not None and token is not None and entry[0] == token:
+                return entry[1]
+            source = _bm25_source(collection)
+            loaded = _bm25_store.load(collection, source) if token is not None else None
+            if loaded is None:
+                with _bm25_store.lock(collection):
+                    # Another worker may have built it while we waited for the lock
+                    loaded = _bm25_store.load(collection, source)
+                    if loaded is None:
+                        index = _build_bm25_from_store(collection)
+                        if index is None:
+                            return None
+                        _bm25_store.save(collection, index, source)
+                        loaded = _bm25_store.load(collection)
+            _bm25_cache[collection] = loaded
+            return loaded[1]
+        except Exception as exc:
+            logger.warning(f"BM25 index build failed for '{collection}': {exc}")
             return None
-        tokenized = [d.lower().split() for d in docs]
-        entry: Dict[str, Any] = {
-            "bm25": BM25Okapi(tokenized),
-            "docs": docs,
-            "ids": ids,
-            "metas": metas,
-        }
-        _bm25_cache[collection] = entry
-        logger.info(f"BM25 index built for '{collection}': {len(docs)} docs")
-        return entry
+
+
+# Hybrid retrieval runs the lexical branch (BM25) alongside the semantic branch
+# (embed + vector search). Each branch has its own deadline; a branch that errors
+# or misses it is dropped from the RRF fusion instead of failing the query. A
+# timed-out branch keeps running in the pool (e.g. a cold BM25 build) so later
+# queries benefit from it.
+_RETRIEVAL_WORKERS = int(os.getenv("GLIH_RETRIEVAL_WORKERS", "16"))
+_VECTOR_TIMEOUT_S = float(os.getenv("GLIH_VECTOR_TIMEOUT_MS", "10000")) / 1000.0
+_BM25_TIMEOUT_S = float(os.getenv("GLIH_BM25_TIMEOUT_MS", "2000")) / 1000.0
+_retrieval_pool = ThreadPoolExecutor(max_workers=_RETRIEVAL_WORKERS, thread_name_prefix="glih-retrieval")
+
+
+def _embed_query(text: str) -> List[float]:
+    if _emb_cache is None:
+        return _emb.embed([text])[0]
+    return _emb_cache.embed(_emb, [text])[0]
+
+
+async def _aembed_query(text: str) -> List[float]:
+    if _emb_cache is None:
+        return (await _emb.aembed([text]))[0]
+    return (await _emb_cache.aembed(_emb, [text]))[0]
+
+
+def _vector_branch(query: str, collection: str, fetch_k: int, where: Optional[MetadataFilter] = None) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    t0 = time.perf_counter()
+    q_emb = _embed_query(query)
+    t1 = time.perf_counter()
+    results = _vs.query_by_vector(collection, q_emb, k=fetch_k, where=where)
+    t2 = time.perf_counter()
+    return results, {
+        "embed_ms": round((t1 - t0) * 1000, 1),
+        "vector_search_ms": round((t2 - t1) * 1000, 1),
+        "vector_ms": round((t2 - t0) * 1000, 1),
+    }
+
+
+def _bm25_branch(query: str, collection: str, fetch_k: int, where: Optional[MetadataFilter] = None) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, float]]:
+    t0 = time.perf_counter()
+    bm25 = _get_bm25_index(collection)
+    hits = bm25.search(tokenize(query), fetch_k, where=where) if bm25 is not None and len(bm25) else None
+    return hits, {"bm25_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def _await_branch(future, deadline: float, name: str, timings: Dict[str, Any], started: float):
+    """
+    Wait for one branch until its deadline and merge its own timings. Never
+    raises: a failed or late branch records its status and yields None. Only
+    this (request) thread writes `timings`, so a straggler cannot mutate it.
+    """
+    try:
+        out, branch_timings = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        timings.update(branch_timings)
+        timings[f"{name}_status"] = "ok" if out is not None else "empty"
+        return out
+    except FutureTimeoutError:
+        timings[f"{name}_status"] = "timeout"
+        logger.warning(f"Hybrid search: {name} branch exceeded {deadline - started:.2f}s, fusing without it")
     except Exception as exc:
-        logger.warning(f"BM25 index build failed for '{collection}': {exc}")
-        return None
+        timings[f"{name}_status"] = "error"
+        timings[f"{name}_error"] = str(exc)[:200]
+        logger.warning(f"Hybrid search: {name} branch failed: {exc}")
+    timings[f"{name}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return None
+
+
+async def _aawait_branch(future, deadline: float, name: str, timings: Dict[str, Any], started: float):
+    """_await_branch for the event loop. The branch is shielded, so a late one keeps running."""
+    try:
+        out, branch_timings = await asyncio.wait_for(
+            asyncio.shield(future), timeout=max(0.0, deadline - time.perf_counter())
+        )
+        timings.update(branch_timings)
+        timings[f"{name}_status"] = "ok" if out is not None else "empty"
+        return out
+    except asyncio.TimeoutError:
+        timings[f"{name}_status"] = "timeout"
+        logger.warning(f"Hybrid search: {name} branch exceeded {deadline - started:.2f}s, fusing without it")
+    except Exception as exc:
+        timings[f"{name}_status"] = "error"
+        timings[f"{name}_error"] = str(exc)[:200]
+        logger.warning(f"Hybrid search: {name} branch failed: {exc}")
+    timings[f"{name}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return None
 
 
 def _hybrid_search(
@@ -359,28 +622,168 @@ def _hybrid_search(
     k: int = 4,
     fetch_k: int = 20,
     rrf_k: int = 60,
+    timings: Optional[Dict[str, Any]] = None,
+    rerank: Optional[bool] = None,
+    where: Optional[MetadataFilter] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Hybrid retrieval: ChromaDB vector search + BM25, fused via RRF.
-    Falls back to pure vector search if BM25 is unavailable.
+    Hybrid retrieval: vector-store search + BM25 in parallel, fused via RRF.
+    Falls back to whichever branch answered if the other is unavailable, fails
+    or times out; raises only when neither produced results. Per-branch timings
+    and statuses are written into `timings` when given. With the reranker on
+    (`rerank`, default GLIH_RERANK) the fused candidates are reordered by the
+    cross-encoder before the top `k` are taken. A `where` metadata filter is
+    pushed into both branches: the vector store's own filter, and a slot mask
+    on the BM25 postings.
     """
-    # --- Vector search ---
-    q_emb = _emb.embed([query])[0]
-    vector_results: List[Dict[str, Any]] = _vs.search_in(collection, q_emb, k=fetch_k)
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    vec_future = _retrieval_pool.submit(_vector_branch, query, collection, fetch_k, where)
+    bm25_future = _retrieval_pool.submit(_bm25_branch, query, collection, fetch_k, where)
+    vector_results = _await_branch(vec_future, started + _VECTOR_TIMEOUT_S, "vector", timings, started)
+    bm25_hits = _await_branch(bm25_future, started + _BM25_TIMEOUT_S, "bm25", timings, started)
+    reranker = _rerank_stage(rerank)
+    if reranker is None:
+        return _fuse_branches(vector_results, bm25_hits, k, rrf_k, timings)
+    fused = _fuse_branches(vector_results, bm25_hits, max(k, reranker.candidates), rrf_k, timings)
+    return reranker.rerank(query, fused, k, timings)
+
+
+async def _ahybrid_search(
+    query: str,
+    collection: str,
+    k: int = 4,
+    fetch_k: int = 20,
+    rrf_k: int = 60,
+    timings: Optional[Dict[str, Any]] = None,
+    rerank: Optional[bool] = None,
+    where: Optional[MetadataFilter] = None,
+    embedding: Optional["asyncio.Future[List[float]]"] = None,
+) -> List[Dict[str, Any]]:
+    """
+    _hybrid_search on the event loop: the query embedding is awaited (no thread
+    held while the provider answers); BM25 and the local vector lookup still
+    run on the retrieval pool. Same deadlines, statuses and fusion.
+    `embedding` is a shared future for the query vector, so a federated search
+    embeds the question once for all of its collections.
+    """
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    bm25_future = asyncio.wrap_future(_retrieval_pool.submit(_bm25_branch, query, collection, fetch_k, where))
+
+    async def vector_branch() -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        t0 = time.perf_counter()
+        q_emb = await (embedding if embedding is not None else _aembed_query(query))
+        t1 = time.perf_counter()
+        results = await loop.run_in_executor(_retrieval_pool, lambda: _vs.query_by_vector(collection, q_emb, k=fetch_k, where=where))
+        t2 = time.perf_counter()
+        return results, {
+            "embed_ms": round((t1 - t0) * 1000, 1),
+            "vector_search_ms": round((t2 - t1) * 1000, 1),
+            "vector_ms": round((t2 - t0) * 1000, 1),
+        }
+
+    vec_task = asyncio.ensure_future(vector_branch())
+    vector_results = await _aawait_branch(vec_task, started + _VECTOR_TIMEOUT_S, "vector", timings, started)
+    bm25_hits = await _aawait_branch(bm25_future, started + _BM25_TIMEOUT_S, "bm25", timings, started)
+    reranker = _rerank_stage(rerank)
+    if reranker is None:
+        return _fuse_branches(vector_results, bm25_hits, k, rrf_k, timings)
+    fused = _fuse_branches(vector_results, bm25_hits, max(k, reranker.candidates), rrf_k, timings)
+    return await reranker.arerank(query, fused, k, timings)
 
-    # --- BM25 search ---
-    bm25_entry = _get_bm25_index(collection)
-    if bm25_entry is None:
-        return vector_results[:k]
 
-    from rank_bm25 import BM25Okapi  # type: ignore (already imported above)
-    bm25: BM25Okapi = bm25_entry["bm25"]
-    bm25_docs: List[str] = bm25_entry["docs"]
-    bm25_ids: List[str] = bm25_entry["ids"]
-    bm25_metas: List[Dict] = bm25_entry["metas"]
+def _rerank_stage(rerank: Optional[bool]) -> Optional[Reranker]:
+    """The reranker for this call: the configured one, or forced on/off (eval harness)."""
+    if rerank is None:
+        return _reranker
+    return (_reranker or get_reranker()) if rerank else None
 
-    scores = bm25.get_scores(query.lower().split())
-    top_bm25_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:fetch_k]
+
+async def _afederated_search(
+    query: str,
+    federation: Federation,
+    k: int = 4,
+    fetch_k: int = 20,
+    timings: Optional[Dict[str, Any]] = None,
+    rerank: Optional[bool] = None,
+    where: Optional[MetadataFilter] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hybrid search over several collections at once, fused into one ranking
+    (weighted RRF, see federated.py). Every collection runs concurrently under
+    its own GLIH_FEDERATED_TIMEOUT_MS deadline; a late or failed collection is
+    left out of the fusion and reported in timings["collections"]. The
+    reranker, when on, scores the fused candidates once, across collections.
+    Raises only when no collection answered.
+    """
+    timings = timings if timings is not None else {}
+    started = time.perf_counter()
+    embedding = asyncio.ensure_future(_aembed_query(query))
+    reranker = _rerank_stage(rerank)
+    depth = max(k, reranker.candidates) if reranker is not None else k
+    per_collection: Dict[str, Dict[str, Any]] = {name: {"weight": weight} for name, weight in federation}
+    tasks = {
+        name: asyncio.ensure_future(_ahybrid_search(
+            query, name, k=depth, fetch_k=fetch_k, timings=per_collection[name], rerank=False, where=where, embedding=embedding,
+        ))
+        for name, _ in federation
+    }
+    deadline = started + FEDERATED_TIMEOUT_MS / 1000.0
+
+    async def collect(name: str) -> Optional[List[Dict[str, Any]]]:
+        ct = per_collection[name]
+        try:
+            results = await asyncio.wait_for(asyncio.shield(tasks[name]), timeout=max(0.0, deadline - time.perf_counter()))
+            ct["status"], ct["hits"] = "ok", len(results)
+            return results
+        except asyncio.TimeoutError:
+            ct["status"] = "timeout"
+            logger.warning(f"Federated search: '{name}' exceeded {FEDERATED_TIMEOUT_MS:.0f} ms, fusing without it")
+        except Exception as exc:
+            ct["status"], ct["error"] = "error", str(exc)[:200]
+            logger.warning(f"Federated search: '{name}' failed: {exc}")
+        finally:
+            ct["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return None
+
+    outcomes = await asyncio.gather(*(collect(name) for name, _ in federation))
+    ranked = {name: results for (name, _), results in zip(federation, outcomes) if results is not None}
+    # A straggler keeps writing into its own dict; report a snapshot
+    timings["collections"] = {name: dict(ct) for name, ct in per_collection.items()}
+    timings["federated_status"] = "ok" if len(ranked) == len(federation) else "partial"
+    if not ranked:
+        errors = [ct.get("error") for ct in per_collection.values() if ct.get("error")]
+        if errors:
+            raise RuntimeError(errors[0])
+        raise TimeoutError(f"federated retrieval timed out after {FEDERATED_TIMEOUT_MS:.0f} ms")
+    t_fuse = time.perf_counter()
+    fused = fuse_collections(ranked, dict(federation), depth)
+    timings["federated_fusion_ms"] = round((time.perf_counter() - t_fuse) * 1000, 2)
+    if reranker is None:
+        return fused[:k]
+    return await reranker.arerank(query, fused, k, timings)
+
+
+def _fuse_branches(
+    vector_results: Optional[List[Dict[str, Any]]],
+    bm25_hits: Optional[List[Dict[str, Any]]],
+    k: int,
+    rrf_k: int,
+    timings: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """RRF over whichever branches answered; raises only when neither did."""
+    t_fuse = time.perf_counter()
+    if vector_results is None:
+        if not bm25_hits:
+            if timings.get("vector_status") == "error":
+                raise RuntimeError(timings.get("vector_error") or "vector search failed")
+            raise TimeoutError(f"retrieval timed out after {timings.get('vector_ms')} ms")
+        vector_results = []
+    if not bm25_hits:
+        timings["fusion_ms"] = 0.0
+        return vector_results[:k]
 
     # --- RRF fusion ---
     rrf_scores: Dict[str, float] = {}
@@ -391,19 +794,23 @@ def _hybrid_search(
         rrf_scores[rid] = rrf_scores.get(rid, 0.0) + 1.0 / (rrf_k + rank + 1)
         id_to_result[rid] = result
 
-    for rank, idx in enumerate(top_bm25_idx):
-        rid = bm25_ids[idx]
+    for rank, hit in enumerate(bm25_hits):
+        rid = hit["id"]
         rrf_scores[rid] = rrf_scores.get(rid, 0.0) + 1.0 / (rrf_k + rank + 1)
         if rid not in id_to_result:
             id_to_result[rid] = {
                 "id": rid,
-                "document": bm25_docs[idx],
-                "metadata": bm25_metas[idx],
+                "document": hit["document"],
+                "metadata": hit["metadata"],
                 "distance": None,
             }
 
     fused_ids = sorted(rrf_scores, key=lambda d: rrf_scores[d], reverse=True)
-    return [id_to_result[d] for d in fused_ids[:k]]
+    timings["fusion_ms"] = round((time.perf_counter() - t_fuse) * 1000, 2)
+    fused = [id_to_result[d] for d in fused_ids[:k]]
+    for r in fused:
+        r["rrf_score"] = rrf_scores[r["id"]]
+    return fused
 
 
 @app.get("/")
@@ -416,13 +823,14 @@ def debug_bm25(collection: str = "lineage-sops", q: str = "temperature breach da
     entry = _get_bm25_index(collection)
     if entry is None:
         return {"status": "failed", "docs": 0}
-    scores = entry["bm25"].get_scores(q.lower().split())
-    top5 = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:5]
+    top5 = entry.search(tokenize(q), 5)
     return {
         "status": "ok",
-        "total_docs": len(entry["docs"]),
+        "total_docs": len(entry),
+        "index": entry.stats(),
+        "generation": (_bm25_cache.get(collection) or (None,))[0],
         "query": q,
-        "top5": [{"id": entry["ids"][i], "score": round(float(scores[i]), 4), "snippet": entry["docs"][i][:120]} for i in top5],
+        "top5": [{"id": h["id"], "score": round(float(h["score"]), 4), "snippet": h["document"][:120]} for h in top5],
     }
 
 
@@ -434,15 +842,7 @@ def health():
 @app.get("/health/detailed")
 def health_detailed():
     """Detailed health check with provider status."""
-    llm_available = False
-    if _llm.provider == "openai":
-        llm_available = _llm._openai is not None
-    elif _llm.provider == "mistral":
-        llm_available = _llm._mistral is not None or bool(os.getenv("MISTRAL_API_KEY"))
-    elif _llm.provider == "anthropic":
-        llm_available = _llm._anthropic is not None
-    elif _llm.provider == "deepseek":
-        llm_available = _llm._deepseek is not None
+    llm_available = _llm.primary.available
 
     emb_available = False
     if _emb.provider == "openai":
@@ -451,10 +851,10 @@ def health_detailed():
         emb_available = _emb._mistral is not None
     elif _emb.provider == "huggingface":
         emb_available = True
+    elif _emb.provider == "local":
+        emb_available = _emb._local is not None
 
-    vs_available = False
-    if _vs.provider == "chromadb":
-        vs_available = _vs._chroma is not None
+    vs_available = _vs.health_check().get("status") == "healthy"
 
     return {
         "status": "ok",
@@ -477,6 +877,17 @@ def health_detailed():
             },
         },
         "collections": _vs.list_collections(),
+        "history": get_write_queue_stats(),
+        "embedding_cache": _emb_cache.stats() if _emb_cache is not None else {"enabled": False},
+        "embedding_batches": get_embedding_batch_stats(),
+        "llm_coalescing": get_llm_coalescing_stats(),
+        "llm_resilience": get_llm_resilience_stats(),
+        "llm_prompt_cache": get_prompt_cache_stats(),
+        "local_embeddings": _emb._local.stats() if _emb._local is not None else {"enabled": False},
+        "answer_cache": _answer_cache.stats() if _answer_cache is not None else {"enabled": False},
+        "reranker": _reranker.stats() if _reranker is not None else {"enabled": False},
+        "embedding_store": _emb_store.stats() if _emb_store is not None else {"enabled": False},
+        "vector_upserts": get_bulk_upsert_stats(),
     }
 
 
@@ -494,6 +905,8 @@ def get_config(_: dict = Depends(require_permission("settings:view"))):
         emb_present = bool(os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_TOKEN"))
     elif emb_provider == "mistral":
         emb_present = bool(os.getenv("MISTRAL_API_KEY"))
+    elif emb_provider == "local":
+        emb_present = True  # no key needed
     return {
         "config": safe,
         "providers": {
@@ -505,6 +918,72 @@ def get_config(_: dict = Depends(require_permission("settings:view"))):
     }
 
 
+def _embed_chunks(texts: List[str]) -> Tuple[List[List[float]], int]:
+    """Embed ingest chunks through the content-addressed store: (vectors, reused count)."""
+    if _emb_store is not None and _emb.available:
+        return _emb_store.embed(_emb, texts)
+    return _emb.embed(texts), 0
+
+
+def _index_chunks(collection: Optional[str], texts: List[str], metas: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Idempotent ingest of chunks: ids are derived from chunk text + metadata, so
+    chunks the collection already holds are skipped, and only chunks whose
+    text was never embedded by the current model reach the provider.
+
+    Each chunk records the embedding model that produced its vector. A chunk
+    counts as present only if that model is the current one, so placeholder
+    vectors and vectors from a model replaced via /embeddings/select are
+    re-embedded (and overwritten under the same id) by the next ingest.
+    """
+    coll_name = collection or _vs.collection
+    tag = embedding_tag(_emb)
+    ids = chunk_ids(texts, metas)
+    stored = {
+        r["id"]: r.get("metadata") or {}
+        for r in (_vs.get(coll_name, list(dict.fromkeys(ids)), include_documents=False) if ids else [])
+    }
+    keep, stale = select_chunks(ids, stored, tag)
+    if tag == PLACEHOLDER_MODEL and keep:
+        logger.warning(
+            f"Ingesting {len(keep)} chunk(s) into '{coll_name}' with placeholder embeddings "
+            f"({_emb.provider} is not configured); they are re-embedded once a provider is available"
+        )
+    count, reused, upsert_s = 0, 0, 0.0
+    if keep:
+        new_texts = [texts[i] for i in keep]
+        new_ids = [ids[i] for i in keep]
+        # Ingest time (epoch seconds) for date-range filters; stamped after the
+        # ids are derived, so re-ingesting the same chunk is still a no-op
+        # (a re-embedded chunk keeps its original ingest time)
+        now = int(time.time())
+        new_metas = [
+            {
+                "ingested_at": stored.get(ids[i], {}).get("ingested_at", now),
+                **((metas[i] if metas else None) or {}),
+                EMBEDDING_MODEL_KEY: tag,
+            }
+            for i in keep
+        ]
+        embeddings, reused = _embed_chunks(new_texts)
+        t_upsert = time.perf_counter()
+        count = _vs.upsert(coll_name, new_ids, embeddings, new_texts, new_metas)
+        upsert_s = time.perf_counter() - t_upsert
+        _bm25_add(coll_name, new_ids, new_texts, new_metas)
+        _collection_changed(coll_name)
+    return {
+        "ingested": count,
+        "collection": coll_name,
+        "provider": _vs.provider,
+        "skipped": len(texts) - len(keep),
+        "reembedded": stale,
+        "embedding_model": tag,
+        "reused_embeddings": reused,
+        "upsert_ms": round(upsert_s * 1000, 1),
+        "vectors_per_sec": round(count / upsert_s, 1) if count and upsert_s > 0 else None,
+    }
+
+
 class IngestRequest(BaseModel):
     texts: List[str]
     metadatas: Optional[List[Dict[str, Any]]] = None
@@ -514,15 +993,7 @@ class IngestRequest(BaseModel):
 @app.post("/ingest")
 def ingest(req: IngestRequest, _: dict = Depends(require_permission("documents:ingest"))):
     try:
-        embeddings = _emb.embed(req.texts)
-        if req.collection:
-            count = _vs.index_to(req.collection, req.texts, embeddings, req.metadatas)
-            coll_name = req.collection
-        else:
-            count = _vs.index(req.texts, embeddings, req.metadatas)
-            coll_name = _vs.collection
-        _invalidate_bm25(coll_name)
-        return {"ingested": count, "collection": coll_name, "provider": _vs.provider}
+        return _index_chunks(req.collection, req.texts, req.metadatas)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ingest_failed: {e}")
 
@@ -593,6 +1064,8 @@ def _emb_env_present_for(provider: str) -> bool:
         return bool(os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_TOKEN"))
     if provider == "mistral":
         return bool(os.getenv("MISTRAL_API_KEY"))
+    if provider == "local":
+        return True
     return False
 
 
@@ -604,12 +1077,13 @@ class EmbeddingsSelectRequest(BaseModel):
 @app.get("/embeddings/current")
 def embeddings_current():
     provider = (_cfg.get("embeddings", {}) or {}).get("provider", "openai")
-    model = (_cfg.get("embeddings", {}) or {}).get("openai_model" if provider == "openai" else (_cfg.get("embeddings", {}) or {}).get("hf_model"))
+    model_key = {"openai": "openai_model", "huggingface": "hf_model", "mistral": "mistral_model", "local": "local_model"}.get(provider, "")
+    model = (_cfg.get("embeddings", {}) or {}).get(model_key)
     return {
         "provider": provider,
         "model": model,
         "api_key_present": _emb_env_present_for(provider),
-        "supported_providers": ["openai", "huggingface", "mistral"],
+        "supported_providers": ["openai", "huggingface", "mistral", "local"],
     }
 
 
@@ -630,10 +1104,15 @@ def embeddings_select(req: EmbeddingsSelectRequest, _: dict = Depends(require_pe
         elif provider == "mistral":
             if model:
                 _cfg["embeddings"]["mistral_model"] = model
+        elif provider == "local":
+            if model:
+                _cfg["embeddings"]["local_model"] = model
 
         # Recreate embeddings provider
         global _emb
         _emb = make_embeddings_provider(_cfg)
+        if _emb_cache is not None:
+            _emb_cache.invalidate()
         try:
             save_config(_cfg)
         except Exception:
@@ -771,22 +1250,14 @@ async def ingest_file(request: Request, files: List[UploadFile] = File(...), chu
                     text = _normalize_text(content.decode("utf-8", "ignore"))
                 except Exception:
                     text = ""
-            doc_id = str(uuid.uuid4())
+            doc_id = document_id(name, text)
             chunks = _chunk_text(text, chunk_size, overlap)
             for idx, ch in enumerate(chunks):
                 texts.append(ch)
                 metas.append({"source": name, "doc_id": doc_id, "chunk_id": idx})
         if not texts:
             return {"ingested": 0, "collection": collection or _vs.collection, "provider": _vs.provider}
-        embeddings = _emb.embed(texts)
-        if collection:
-            count = _vs.index_to(collection, texts, embeddings, metas)
-            coll_name = collection
-        else:
-            count = _vs.index(texts, embeddings, metas)
-            coll_name = _vs.collection
-        _invalidate_bm25(coll_name)
-        return {"ingested": count, "collection": coll_name, "provider": _vs.provider, "documents": len(files)}
+        return {**_index_chunks(collection, texts, metas), "documents": len(files)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ingest_file_failed: {e}")
 
@@ -889,7 +1360,7 @@ def ingest_url(req: URLIngestRequest, _: dict = Depends(require_permission("docu
     for u in req.urls:
         try:
             raw = _fetch_url_text(u)
-            doc_id = str(uuid.uuid4())
+            doc_id = document_id(u, raw)
             chunks = _chunk_text(raw, req.chunk_size, req.overlap)
             for idx, ch in enumerate(chunks):
                 if ch.strip():
@@ -901,85 +1372,648 @@ def ingest_url(req: URLIngestRequest, _: dict = Depends(require_permission("docu
         if not texts:
             msg = "; ".join(errors) if errors else "no content extracted"
             raise HTTPException(status_code=422, detail=f"0 chunks from all URLs — {msg}")
-        embeddings = _emb.embed(texts)
-        if req.collection:
-            count = _vs.index_to(req.collection, texts, embeddings, metas)
-            coll_name = req.collection
-        else:
-            count = _vs.index(texts, embeddings, metas)
-            coll_name = _vs.collection
-        _invalidate_bm25(coll_name)
-        return {"ingested": count, "collection": coll_name, "provider": _vs.provider, "urls": len(req.urls) - len(errors), "errors": errors}
+        return {**_index_chunks(req.collection, texts, metas), "urls": len(req.urls) - len(errors), "errors": errors}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ingest_url_failed: {e}")
 
 
+_QUERY_STYLES = {
+    "concise": "Answer in 1-3 sentences.",
+    "bulleted": "Answer with short bullet points only.",
+    "detailed": "Provide a detailed but focused answer.",
+    "json-list": "Return a JSON array of strings summarizing the key points.",
+}
+
+
+def _answer_cache_keys(
+    q: str, coll_name: str, k: int, style: str, max_distance: Optional[float], where: Optional[MetadataFilter],
+    federation: Optional[Federation] = None,
+):
+    # A federated answer depends on every collection's generation and weight
+    collection = [name for name, _ in federation] if federation else coll_name
+    weights = [weight for _, weight in federation] if federation else None
+    return _answer_cache.keys(
+        collection, q, k, style, max_distance, _llm.provider, _llm.model,
+        filters=where.key() if where else "", weights=weights,
+    )
+
+
+async def _aanswer_cache_lookup(
+    q: str, coll_name: str, k: int, style: str, max_distance: Optional[float], where: Optional[MetadataFilter] = None,
+    federation: Optional[Federation] = None,
+):
+    if _answer_cache is None:
+        return None, None, None, None
+    cache_key, cache_bucket = _answer_cache_keys(q, coll_name, k, style, max_distance, where, federation)
+    q_vec = None
+    if _answer_cache.semantic:
+        try:
+            q_vec = await _aembed_query(q)
+        except Exception as e:
+            logger.warning(f"Answer cache: query embedding failed, exact match only: {e}")
+    return cache_key, cache_bucket, q_vec, _answer_cache.get(cache_key, cache_bucket, q_vec)
+
+
+async def _aretrieve_for_query(
+    q: str, coll_name: str, k: int, max_distance: Optional[float], timings: Dict[str, Any], started: float,
+    where: Optional[MetadataFilter] = None,
+    federation: Optional[Federation] = None,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Hybrid (or federated) retrieval → deduped, distance-filtered results and their context snippets."""
+    if federation:
+        results = await _afederated_search(q, federation, k=k, fetch_k=min(k * 5, 40), timings=timings, where=where)
+    else:
+        results = await _ahybrid_search(q, coll_name, k=k, fetch_k=min(k * 5, 40), timings=timings, where=where)
+    timings["retrieval_ms"] = round((time.time() - started) * 1000, 1)
+    return _prepare_results(results, max_distance)
+
+
+def _prepare_results(results: List[Dict[str, Any]], max_distance: Optional[float]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # Deduplicate by doc_id+chunk_id. Ingest ids are deterministic now, but
+    # collections built before that may still hold repeated uploads.
+    seen: set = set()
+    deduped = []
+    for r in results:
+        md = r.get("metadata") or {}
+        key = (md.get("doc_id"), md.get("chunk_id"), (r.get("document") or "")[:100])
+        if key not in seen:
+            seen.add(key)
+            deduped.append(r)
+    results = deduped
+    # Filter by distance if requested. Order is the retrieval rank (RRF or
+    # reranker): re-sorting by distance would push BM25-only hits to the end.
+    if max_distance is not None:
+        results = [r for r in results if r.get("distance") is None or r.get("distance") <= max_distance]
+    context_snippets = [r.get("document", "") for r in results if r.get("document")]
+    return results, context_snippets
+
+
+_QUERY_PROMPT_PREFIX = (
+    "You are a logistics intelligence assistant. Use only the provided context to answer the question. If the answer is not in the context, say you don't know.\n\n"
+)
+
+
+def _query_prompt(q: str, context_snippets: List[str], k: int, style: str, timings: Optional[Dict[str, Any]] = None) -> str:
+    """
+    RAG prompt with the top-k snippets fitted to the model's context budget
+    (overlapping sentences deduped, lowest-ranked context trimmed first).
+    Token accounting goes into `timings`.
+    """
+    style_inst = _QUERY_STYLES.get(style, _QUERY_STYLES["concise"])
+
+    def render(context: str) -> str:
+        return PrefixedPrompt(
+            _QUERY_PROMPT_PREFIX,
+            f"Context:\n{context}\n\nQuestion: {q}\nInstructions: {style_inst}\nAnswer:",
+        )
+
+    budget = context_budget(_llm.model, count_tokens(render(""), _llm.model))
+    fit = fit_context(context_snippets[:k], budget, _llm.model)
+    prompt = render(fit.text(empty="(no context retrieved)"))
+    if timings is not None:
+        timings.update(fit.report())
+        timings["prompt_tokens"] = count_tokens(prompt, _llm.model)
+    return prompt
+
+
+def _query_citations(results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    citations: List[Dict[str, Any]] = []
+    for r in results[:k]:
+        md = r.get("metadata") or {}
+        snippet = (r.get("document") or "")[:300]
+        citations.append({
+            "id": r.get("id"),
+            "source": md.get("source") or md.get("source_url"),
+            "doc_id": md.get("doc_id"),
+            "chunk_id": md.get("chunk_id"),
+            "distance": r.get("distance"),
+            "rerank_score": r.get("rerank_score"),
+            "collection": r.get("collection"),
+            "snippet": snippet,
+        })
+    return citations
+
+
+def _retrieval_clean(timings: Dict[str, Any]) -> bool:
+    """
+    Answers from a degraded retrieval (a branch failed or timed out, or the
+    reranker fell back to RRF order), or served by a failover LLM instead of
+    the configured one, are not cached.
+    """
+    served_by = timings.get("llm_served_by")
+    if served_by is not None and served_by != f"{_llm.provider}/{_llm.model or ''}":
+        return False
+    if timings.get("rerank_status") not in (None, "ok", "skipped"):
+        return False
+    collections = timings.get("collections")
+    if collections is not None:
+        return timings.get("federated_status") == "ok" and all(
+            ct.get(f"{b}_status") in ("ok", "empty") for ct in collections.values() for b in ("vector", "bm25")
+        )
+    return all(timings.get(f"{b}_status") in ("ok", "empty") for b in ("vector", "bm25"))
+
+
+def _serve_cached_query(hit, q: str, coll_name: str, k: int, style: str, started: float, current_user: dict) -> Dict[str, Any]:
+    """/query result for an answer-cache hit, recorded in history like a fresh answer."""
+    cached, mode = hit
+    duration_ms = int((time.time() - started) * 1000)
+    result = {**cached, "query": q, "cached": mode, "timings": {"total_ms": duration_ms}}
+    save_query(
+        user_id=current_user["id"],
+        user_email=current_user["email"],
+        query=q,
+        answer=result["answer"],
+        citations=result["citations"],
+        collection=coll_name,
+        provider=result["provider"],
+        model=result["model"],
+        k=k,
+        style=style,
+        duration_ms=duration_ms,
+    )
+    logger.info(f"Query served from answer cache ({mode}): duration_ms={duration_ms}")
+    return result
+
+
+async def _answer_query(
+    q: str,
+    coll_name: str,
+    k: int,
+    style: str,
+    max_distance: Optional[float],
+    results: List[Dict[str, Any]],
+    context_snippets: List[str],
+    timings: Dict[str, Any],
+    started: float,
+    current_user: dict,
+    cache_entry: Tuple[Any, Any, Any],
+) -> Dict[str, Any]:
+    """Prompt + LLM call for retrieved context → /query result, cached and saved to history."""
+    prompt = _query_prompt(q, context_snippets, k, style, timings)
+    _llm_start = time.time()
+    answer, llm_info = await _llm.agenerate_served(prompt)
+    timings["llm_ms"] = round((time.time() - _llm_start) * 1000, 1)
+    timings["llm_served_by"] = llm_info["served_by"]
+    timings["llm_cached_tokens"] = llm_info.get("cached_tokens")
+    citations = _query_citations(results, k)
+    duration_ms = int((time.time() - started) * 1000)
+    timings["total_ms"] = duration_ms
+    result = {
+        "query": q,
+        "answer": answer,
+        "retrieved": len(context_snippets),
+        "citations": citations,
+        "collection": coll_name,
+        "provider": _llm.provider,
+        "model": _llm.model,
+        "k": k,
+        "max_distance": max_distance,
+        "style": style,
+        "cached": False,
+        "timings": timings,
+    }
+    cache_key, cache_bucket, q_vec = cache_entry
+    if _answer_cache is not None and _retrieval_clean(timings):
+        _answer_cache.put(cache_key, cache_bucket, {f: v for f, v in result.items() if f != "timings"}, q_vec)
+    # Persist to history so dispatchers can review past queries
+    save_query(
+        user_id=current_user["id"],
+        user_email=current_user["email"],
+        query=q,
+        answer=answer,
+        citations=citations,
+        collection=coll_name,
+        provider=_llm.provider,
+        model=_llm.model,
+        k=k,
+        style=style,
+        duration_ms=duration_ms,
+    )
+    logger.info(f"Query completed: retrieved={len(context_snippets)}, answer_length={len(answer)}, duration_ms={duration_ms}")
+    return result
+
+
+def _request_filter(**params: Any) -> Optional[MetadataFilter]:
+    """Filter query parameters / body fields → MetadataFilter; 400 when invalid."""
+    try:
+        return build_filter(**params)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=f"invalid_filter: {e}")
+
+
+def _request_collections(spec: Any) -> Optional[Federation]:
+    """`collections` parameter / body field → [(name, weight)]; 400 when invalid."""
+    try:
+        return parse_collections(spec)
+    except CollectionSpecError as e:
+        raise HTTPException(status_code=400, detail=f"invalid_collections: {e}")
+
+
 @app.get("/query")
 @limiter.limit(_RATE_LIMIT_QUERY)
-def query(request: Request, q: str = "hello", k: int = 4, collection: Optional[str] = None, max_distance: Optional[float] = None, style: str = "concise", current_user: dict = Depends(get_current_user)):
-    logger.info(f"Query received: q='{q[:50]}...', collection={collection}, k={k}, max_distance={max_distance}, style={style}")
+async def query(
+    request: Request,
+    q: str = "hello",
+    k: int = 4,
+    collection: Optional[str] = None,
+    max_distance: Optional[float] = None,
+    style: str = "concise",
+    source: Optional[str] = None,
+    doc_id: Optional[str] = None,
+    facility: Optional[str] = None,
+    product_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    date_field: str = "ingested_at",
+    filters: Optional[str] = None,
+    collections: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Answer `q` from the collection. Retrieval can be restricted by metadata:
+    source, doc_id, facility, product_type, a date_from / date_to range on
+    `date_field` (epoch seconds, default the ingest time), and `filters`, a
+    JSON filter spec (see metadata_filter) ANDed with the named ones.
+
+    `collections` ("lineage-sops:2,lineage-routes") searches several
+    collections concurrently and answers from one fused ranking; citations
+    carry the collection each chunk came from. It replaces `collection`.
+    """
+    where = _request_filter(
+        source=source, doc_id=doc_id, facility=facility, product_type=product_type,
+        date_from=date_from, date_to=date_to, date_field=date_field, filters=filters,
+    )
+    federation = _request_collections(collections)
+    logger.info(f"Query received: q='{q[:50]}...', collection={collections or collection}, k={k}, max_distance={max_distance}, style={style}, filter={where}")
     _query_start = time.time()
     try:
-        coll_name = collection or _vs.collection
-        fetch_k = min(k * 5, 40)
-        results = _hybrid_search(q, coll_name, k=k, fetch_k=fetch_k)
-        # Deduplicate by doc_id+chunk_id (same chunk ingested multiple times)
-        seen: set = set()
-        deduped = []
-        for r in results:
-            md = r.get("metadata") or {}
-            key = (md.get("doc_id"), md.get("chunk_id"), (r.get("document") or "")[:100])
-            if key not in seen:
-                seen.add(key)
-                deduped.append(r)
-        results = deduped
-        # Filter/sort results by distance if requested
-        if max_distance is not None:
-            results = [r for r in results if r.get("distance") is None or r.get("distance") <= max_distance]
-        results = sorted(results, key=lambda r: (r.get("distance") is None, r.get("distance") or 0.0))
-        context_snippets = [r.get("document", "") for r in results if r.get("document")]
-        context = "\n\n---\n\n".join(context_snippets[:k]) if context_snippets else "(no context retrieved)"
-        # Style instructions
-        style_map = {
-            "concise": "Answer in 1-3 sentences.",
-            "bulleted": "Answer with short bullet points only.",
-            "detailed": "Provide a detailed but focused answer.",
-            "json-list": "Return a JSON array of strings summarizing the key points.",
-        }
-        style_inst = style_map.get(style, style_map["concise"])
-        prompt = (
-            "You are a logistics intelligence assistant. Use only the provided context to answer the question. If the answer is not in the context, say you don't know.\n\n"
-            f"Context:\n{context}\n\nQuestion: {q}\nInstructions: {style_inst}\nAnswer:"
+        coll_name = federation_label(federation) if federation else (collection or _vs.collection)
+        cache_key, cache_bucket, q_vec, hit = await _aanswer_cache_lookup(q, coll_name, k, style, max_distance, where, federation)
+        if hit is not None:
+            return _serve_cached_query(hit, q, coll_name, k, style, _query_start, current_user)
+        timings: Dict[str, Any] = {}
+        results, context_snippets = await _aretrieve_for_query(q, coll_name, k, max_distance, timings, _query_start, where, federation)
+        return await _answer_query(
+            q, coll_name, k, style, max_distance, results, context_snippets, timings, _query_start, current_user,
+            (cache_key, cache_bucket, q_vec),
         )
-        answer = _llm.generate(prompt)
-        citations: List[Dict[str, Any]] = []
-        for r in results[:k]:
-            md = r.get("metadata") or {}
-            snippet = (r.get("document") or "")[:300]
-            citations.append({
-                "id": r.get("id"),
-                "source": md.get("source") or md.get("source_url"),
-                "doc_id": md.get("doc_id"),
-                "chunk_id": md.get("chunk_id"),
-                "distance": r.get("distance"),
-                "snippet": snippet,
-            })
-        duration_ms = int((time.time() - _query_start) * 1000)
-        result = {
+    except Exception as e:
+        logger.error(f"Query failed: {e}")
+        raise HTTPException(status_code=500, detail=f"query_failed: {e}")
+
+
+# ── Batch query ───────────────────────────────────────────────────────────────
+# POST /query/batch answers many questions against one collection:
+#   1. all questions are embedded in one batched provider call
+#   2. answer-cache hits are streamed straight away
+#   3. the misses are retrieved together: one multi-embedding vector store
+#      query and one BM25 search_many (a single (queries × docs) bincount),
+#      each under the usual branch deadline, then fused per question
+#   4. LLM calls run with bounded concurrency and each answer is written as
+#      one NDJSON line (the /query result plus "index") as soon as it is done
+# With `collections`, step 3 is one federated search per question instead
+# (bounded by the same concurrency), fused across collections as in /query.
+# Answers go through the same answer cache and history as /query.
+_QUERY_BATCH_MAX = int(os.getenv("GLIH_QUERY_BATCH_MAX", "100"))
+_QUERY_BATCH_CONCURRENCY = int(os.getenv("GLIH_QUERY_BATCH_CONCURRENCY", "8"))
+
+
+class QueryBatchRequest(BaseModel):
+    questions: List[str]
+    collection: Optional[str] = None
+    k: int = 4
+    max_distance: Optional[float] = None
+    style: str = "concise"
+    concurrency: Optional[int] = None
+    # Metadata filter, applied to every question (same fields as GET /query)
+    source: Optional[str] = None
+    doc_id: Optional[str] = None
+    facility: Optional[str] = None
+    product_type: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    date_field: str = "ingested_at"
+    filters: Optional[Dict[str, Any]] = None
+    # Federated search (same spec as /query `collections`); replaces `collection`
+    collections: Optional[List[str]] = None
+
+
+def _bm25_branch_many(queries: List[str], collection: str, fetch_k: int, where: Optional[MetadataFilter] = None) -> Tuple[Optional[List[List[Dict[str, Any]]]], Dict[str, float]]:
+    t0 = time.perf_counter()
+    bm25 = _get_bm25_index(collection)
+    hits = bm25.search_many([tokenize(q) for q in queries], fetch_k, where=where) if bm25 is not None and len(bm25) else None
+    return hits, {"bm25_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+async def _abatch_retrieve(
+    questions: List[str],
+    coll_name: str,
+    k: int,
+    max_distance: Optional[float],
+    q_vecs: Optional[List[List[float]]],
+    embed_error: Optional[Exception],
+    timings: Dict[str, Any],
+    where: Optional[MetadataFilter] = None,
+) -> List[Tuple[Optional[Tuple[List[Dict[str, Any]], List[str]]], Dict[str, Any], Optional[Exception]]]:
+    """
+    Hybrid retrieval for every question at once. Returns, per question,
+    ((results, context snippets) or None, its timings, error or None).
+    """
+    started = time.perf_counter()
+    fetch_k = min(k * 5, 40)
+    loop = asyncio.get_running_loop()
+    bm25_future = asyncio.wrap_future(_retrieval_pool.submit(_bm25_branch_many, questions, coll_name, fetch_k, where))
+
+    async def vector_branch() -> Tuple[List[List[Dict[str, Any]]], Dict[str, float]]:
+        if q_vecs is None:
+            raise embed_error or RuntimeError("query embedding failed")
+        t0 = time.perf_counter()
+        results = await loop.run_in_executor(_retrieval_pool, lambda: _vs.query_many(coll_name, q_vecs, k=fetch_k, where=where))
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        return results, {"vector_search_ms": ms, "vector_ms": ms}
+
+    vector_results = await _aawait_branch(asyncio.ensure_future(vector_branch()), started + _VECTOR_TIMEOUT_S, "vector", timings, started)
+    bm25_hits = await _aawait_branch(bm25_future, started + _BM25_TIMEOUT_S, "bm25", timings, started)
+    timings["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    fuse_k = max(k, _reranker.candidates) if _reranker is not None else k
+
+    async def finish(i: int):
+        q_timings = dict(timings)
+        try:
+            fused = _fuse_branches(
+                vector_results[i] if vector_results is not None else None,
+                bm25_hits[i] if bm25_hits is not None else None,
+                fuse_k, 60, q_timings,
+            )
+            if _reranker is not None:
+                fused = await _reranker.arerank(questions[i], fused, k, q_timings)
+            return _prepare_results(fused, max_distance), q_timings, None
+        except Exception as e:
+            return None, q_timings, e
+
+    return list(await asyncio.gather(*(finish(i) for i in range(len(questions)))))
+
+
+async def _abatch_retrieve_federated(
+    questions: List[str],
+    federation: Federation,
+    k: int,
+    max_distance: Optional[float],
+    concurrency: int,
+    started: float,
+    where: Optional[MetadataFilter] = None,
+) -> List[Tuple[Optional[Tuple[List[Dict[str, Any]], List[str]]], Dict[str, Any], Optional[Exception]]]:
+    """
+    _abatch_retrieve() for a federated batch: each question gets its own
+    federated search (every collection fused, see _afederated_search), at
+    most `concurrency` questions at a time. Query embeddings come from the
+    embedding cache the batch call just filled.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(q: str):
+        timings: Dict[str, Any] = {}
+        async with semaphore:
+            try:
+                return await _aretrieve_for_query(q, "", k, max_distance, timings, started, where, federation), timings, None
+            except Exception as e:
+                return None, timings, e
+
+    return list(await asyncio.gather(*(one(q) for q in questions)))
+
+
+@app.post("/query/batch")
+@limiter.limit(_RATE_LIMIT_QUERY_BATCH)
+async def query_batch(request: Request, req: QueryBatchRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Answer many questions in one request. Streams NDJSON: one /query result
+    per question (with "index", its position in `questions`) in completion
+    order, or {"index", "query", "error"} for a question that failed, then a
+    final {"done": true, ...} summary line.
+    """
+    questions = [q for q in (req.questions or [])]
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions_required")
+    if len(questions) > _QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"too_many_questions: max {_QUERY_BATCH_MAX}")
+    k, style, max_distance = req.k, req.style, req.max_distance
+    where = _request_filter(
+        source=req.source, doc_id=req.doc_id, facility=req.facility, product_type=req.product_type,
+        date_from=req.date_from, date_to=req.date_to, date_field=req.date_field, filters=req.filters,
+    )
+    federation = _request_collections(req.collections)
+    coll_name = federation_label(federation) if federation else (req.collection or _vs.collection)
+    concurrency = max(1, min(req.concurrency or _QUERY_BATCH_CONCURRENCY, _QUERY_BATCH_CONCURRENCY))
+    logger.info(f"Batch query received: {len(questions)} questions, collection={coll_name}, k={k}, concurrency={concurrency}")
+    _batch_start = time.time()
+    batch_timings: Dict[str, Any] = {}
+    try:
+        # 1. One batched embedding call for every question
+        t0 = time.perf_counter()
+        q_vecs: Optional[List[List[float]]] = None
+        embed_error: Optional[Exception] = None
+        try:
+            q_vecs = await (_emb_cache.aembed(_emb, questions) if _emb_cache is not None else _emb.aembed(questions))
+        except Exception as e:
+            embed_error = e
+            logger.warning(f"Batch query: embedding failed, BM25 only: {e}")
+        batch_timings["embed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        # 2. Answer cache
+        hits: List[Tuple[int, Any]] = []
+        misses: List[int] = []
+        cache_entries: Dict[int, Tuple[Any, Any, Any]] = {}
+        for i, q in enumerate(questions):
+            if _answer_cache is None:
+                misses.append(i)
+                cache_entries[i] = (None, None, None)
+                continue
+            q_vec = q_vecs[i] if q_vecs is not None and _answer_cache.semantic else None
+            cache_key, cache_bucket = _answer_cache_keys(q, coll_name, k, style, max_distance, where, federation)
+            cache_entries[i] = (cache_key, cache_bucket, q_vec)
+            hit = _answer_cache.get(cache_key, cache_bucket, q_vec)
+            if hit is not None:
+                hits.append((i, hit))
+            else:
+                misses.append(i)
+
+        # 3. Retrieval for the misses, as one batch
+        retrieved: Dict[int, Any] = {}
+        if misses and federation:
+            for i, r in zip(misses, await _abatch_retrieve_federated(
+                [questions[i] for i in misses], federation, k, max_distance, concurrency, _batch_start, where,
+            )):
+                retrieved[i] = r
+        elif misses:
+            miss_vecs = [q_vecs[i] for i in misses] if q_vecs is not None else None
+            for i, r in zip(misses, await _abatch_retrieve(
+                [questions[i] for i in misses], coll_name, k, max_distance, miss_vecs, embed_error, batch_timings, where,
+            )):
+                retrieved[i] = r
+    except Exception as e:
+        logger.error(f"Batch query failed: {e}")
+        raise HTTPException(status_code=500, detail=f"query_failed: {e}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(i: int) -> Dict[str, Any]:
+        q = questions[i]
+        prepared, timings, error = retrieved[i]
+        if error is not None:
+            return {"index": i, "query": q, "error": f"query_failed: {error}"}
+        results, context_snippets = prepared
+        async with semaphore:
+            try:
+                result = await _answer_query(
+                    q, coll_name, k, style, max_distance, results, context_snippets, timings, _batch_start, current_user,
+                    cache_entries[i],
+                )
+            except Exception as e:
+                logger.error(f"Batch query failed for question {i}: {e}")
+                return {"index": i, "query": q, "error": f"query_failed: {e}"}
+        return {"index": i, **result}
+
+    async def lines():
+        failed = 0
+        for i, hit in hits:
+            result = _serve_cached_query(hit, questions[i], coll_name, k, style, _batch_start, current_user)
+            yield json.dumps({"index": i, **result}, default=str) + "\n"
+        tasks = [asyncio.ensure_future(answer(i)) for i in misses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += "error" in line
+                yield json.dumps(line, default=str) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+        yield json.dumps({
+            "done": True,
+            "questions": len(questions),
+            "cached": len(hits),
+            "failed": failed,
+            "timings": {**batch_timings, "total_ms": int((time.time() - _batch_start) * 1000)},
+        }) + "\n"
+        logger.info(f"Batch query completed: {len(questions)} questions, {len(hits)} cached, {failed} failed, duration_ms={int((time.time() - _batch_start) * 1000)}")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.get("/query/stream")
+@limiter.limit(_RATE_LIMIT_QUERY)
+async def query_stream(
+    request: Request,
+    q: str = "hello",
+    k: int = 4,
+    collection: Optional[str] = None,
+    max_distance: Optional[float] = None,
+    style: str = "concise",
+    source: Optional[str] = None,
+    doc_id: Optional[str] = None,
+    facility: Optional[str] = None,
+    product_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    date_field: str = "ingested_at",
+    filters: Optional[str] = None,
+    collections: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    /query as Server-Sent Events:
+      event: citations  retrieval result (citations, retrieved, provider, model, timings)
+      event: token      {"text": ...} per answer delta, in order
+      event: done       {"answer_length", "cached", "timings"}
+      event: error      {"detail": ...} if the LLM fails mid-stream
+    Retrieval errors still fail the request with a 500 before the stream opens.
+    History is written by a background task after the last event, and only
+    for answers that completed. Metadata filters and `collections` are the
+    same as /query.
+    """
+    where = _request_filter(
+        source=source, doc_id=doc_id, facility=facility, product_type=product_type,
+        date_from=date_from, date_to=date_to, date_field=date_field, filters=filters,
+    )
+    federation = _request_collections(collections)
+    logger.info(f"Stream query received: q='{q[:50]}...', collection={collections or collection}, k={k}, style={style}, filter={where}")
+    _query_start = time.time()
+    coll_name = federation_label(federation) if federation else (collection or _vs.collection)
+    try:
+        cache_key, cache_bucket, q_vec, hit = await _aanswer_cache_lookup(q, coll_name, k, style, max_distance, where, federation)
+        timings: Dict[str, Any] = {}
+        if hit is not None:
+            cached, mode = hit
+            citations, retrieved, prompt = cached["citations"], cached["retrieved"], None
+        else:
+            mode = False
+            results, context_snippets = await _aretrieve_for_query(q, coll_name, k, max_distance, timings, _query_start, where, federation)
+            citations, retrieved = _query_citations(results, k), len(context_snippets)
+            prompt = _query_prompt(q, context_snippets, k, style, timings)
+    except Exception as e:
+        logger.error(f"Stream query failed: {e}")
+        raise HTTPException(status_code=500, detail=f"query_failed: {e}")
+
+    completed: Dict[str, Any] = {}
+
+    def events():
+        yield _sse("citations", {
             "query": q,
-            "answer": answer,
-            "retrieved": len(context_snippets),
-            "citations": citations,
             "collection": coll_name,
+            "citations": citations,
+            "retrieved": retrieved,
             "provider": _llm.provider,
             "model": _llm.model,
-            "k": k,
-            "max_distance": max_distance,
-            "style": style,
-        }
-        # Persist to history so dispatchers can review past queries
+            "cached": mode,
+            "timings": dict(timings),
+        })
+        parts: List[str] = []
+        if prompt is None:
+            parts.append(cached["answer"])
+            yield _sse("token", {"text": cached["answer"]})
+        else:
+            _llm_start = time.time()
+            try:
+                served_by, deltas = _llm.generate_stream_served(prompt)
+                timings["llm_served_by"] = served_by
+                for delta in deltas:
+                    if not parts:
+                        timings["first_token_ms"] = round((time.time() - _query_start) * 1000, 1)
+                    parts.append(delta)
+                    yield _sse("token", {"text": delta})
+            except Exception as e:
+                logger.error(f"Stream query failed after {len(parts)} deltas: {e}")
+                yield _sse("error", {"detail": f"query_failed: {e}"})
+                return
+            timings["llm_ms"] = round((time.time() - _llm_start) * 1000, 1)
+        answer = "".join(parts)
+        timings["total_ms"] = int((time.time() - _query_start) * 1000)
+        completed["answer"] = answer
+        yield _sse("done", {"answer_length": len(answer), "cached": mode, "timings": timings})
+
+    def persist():
+        if "answer" not in completed:
+            return
+        answer = completed["answer"]
+        if prompt is not None and _answer_cache is not None and _retrieval_clean(timings):
+            _answer_cache.put(cache_key, cache_bucket, {
+                "query": q,
+                "answer": answer,
+                "retrieved": retrieved,
+                "citations": citations,
+                "collection": coll_name,
+                "provider": _llm.provider,
+                "model": _llm.model,
+                "k": k,
+                "max_distance": max_distance,
+                "style": style,
+                "cached": False,
+            }, q_vec)
         save_query(
             user_id=current_user["id"],
             user_email=current_user["email"],
@@ -991,13 +2025,16 @@ def query(request: Request, q: str = "hello", k: int = 4, collection: Optional[s
             model=_llm.model,
             k=k,
             style=style,
-            duration_ms=duration_ms,
+            duration_ms=timings.get("total_ms"),
         )
-        logger.info(f"Query completed: retrieved={len(context_snippets)}, answer_length={len(answer)}, duration_ms={duration_ms}")
-        return result
-    except Exception as e:
-        logger.error(f"Query failed: {e}")
-        raise HTTPException(status_code=500, detail=f"query_failed: {e}")
+        logger.info(f"Stream query completed: retrieved={retrieved}, answer_length={len(answer)}, timings={timings}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist),
+    )
 
 
 @app.get("/index/collections")
@@ -1014,18 +2051,8 @@ def index_collections():
 def collection_stats(name: str):
     """Get statistics for a specific collection."""
     try:
-        if _vs.provider == "chromadb" and _vs._chroma:
-            coll = _vs.get_collection(name)
-            if coll:
-                count = coll.count()
-                metadata = getattr(coll, "metadata", {})
-                return {
-                    "name": name,
-                    "count": count,
-                    "metadata": metadata,
-                    "provider": _vs.provider,
-                }
-        return {"name": name, "count": 0, "provider": _vs.provider}
+        stats = _vs.get_collection_stats(name)
+        return {"name": name, "count": stats.get("count", 0), "metadata": stats.get("metadata", {}), "provider": _vs.provider}
     except Exception as e:
         logger.error(f"collection_stats failed for {name}: {e}")
         raise HTTPException(status_code=500, detail=f"collection_stats_failed: {e}")
@@ -1037,8 +2064,9 @@ def delete_collection(name: str, _: dict = Depends(require_permission("settings:
     try:
         if name == _vs.collection:
             raise HTTPException(status_code=400, detail="Cannot delete default collection")
-        if _vs.provider == "chromadb" and _vs._chroma:
-            _vs._chroma.delete_collection(name)
+        if _vs.delete_collection(name):
+            _invalidate_bm25(name)
+            _collection_changed(name)
             logger.info(f"Deleted collection: {name}")
             return {"deleted": name, "status": "ok"}
         raise HTTPException(status_code=404, detail="Collection not found")
@@ -1053,12 +2081,9 @@ def delete_collection(name: str, _: dict = Depends(require_permission("settings:
 def reset_collection(name: str, _: dict = Depends(require_permission("settings:edit"))):
     """Reset a collection (delete and recreate)."""
     try:
-        if _vs.provider == "chromadb" and _vs._chroma:
-            try:
-                _vs._chroma.delete_collection(name)
-            except Exception:
-                pass
-            _vs._chroma.get_or_create_collection(name)
+        if _vs.reset_collection(name):
+            _invalidate_bm25(name)
+            _collection_changed(name)
             logger.info(f"Reset collection: {name}")
             return {"reset": name, "status": "ok"}
         raise HTTPException(status_code=404, detail="Collection not found")
@@ -1080,32 +2105,65 @@ if _agents_src not in _sys.path:
     _sys.path.insert(0, _agents_src)
 
 from glih_agents.anomaly_responder import AnomalyResponder
+from glih_agents.prompt_budget import PrefixedPrompt, context_budget, count_tokens, fit_context
 from glih_agents.route_advisor import RouteAdvisor
 from glih_agents.customer_notifier import CustomerNotifier
 from glih_agents.ops_summarizer import OpsSummarizer
 
 
-def _make_vector_search_fn(run_id: str = None):
-    """Return a closure that searches the vector store, emitting progress events."""
-    def _search(query: str, collection: str = "lineage-sops", k: int = 4) -> List[Dict[str, Any]]:
+def _make_vector_search_fn(run_id: str = None, where: Optional[MetadataFilter] = None, federation: Optional[Federation] = None):
+    """
+    Return a coroutine fn that searches the vector store, emitting progress
+    events. `where` (the run's metadata filter) is applied to every search.
+    With `federation` (the run's collections), or when an agent asks for a
+    list of collections, the search is a federated one over all of them.
+    """
+    async def _search(query: str, collection: Any = "lineage-sops", k: int = 4) -> List[Dict[str, Any]]:
+        targets = federation or (parse_collections(list(collection)) if isinstance(collection, (list, tuple)) else None)
+        if targets:
+            return await _federated(query, targets, k)
         if run_id:
-            emit_progress(run_id, "retrieval", f"Searching '{collection}' → \"{query[:60]}\"")
-        emb = _emb.embed([query])[0]
-        results = _vs.search_in(collection, emb, k=k)
+            scope = f" [{where.key()}]" if where else ""
+            emit_progress(run_id, "retrieval", f"Searching '{collection}'{scope} → \"{query[:60]}\"")
+        emb = await _aembed_query(query)
+        results = await asyncio.get_running_loop().run_in_executor(
+            _retrieval_pool, lambda: _vs.query_by_vector(collection, emb, k=k, where=where)
+        )
         if run_id:
             emit_progress(run_id, "retrieval_done", f"Retrieved {len(results)} document chunks from {collection}", {"count": len(results), "collection": collection})
         return results
+
+    async def _federated(query: str, targets: Federation, k: int) -> List[Dict[str, Any]]:
+        name = federation_label(targets)
+        if run_id:
+            scope = f" [{where.key()}]" if where else ""
+            emit_progress(run_id, "retrieval", f"Searching {len(targets)} collections '{name}'{scope} → \"{query[:60]}\"")
+        timings: Dict[str, Any] = {}
+        results = await _afederated_search(query, targets, k=k, fetch_k=min(k * 5, 40), timings=timings, where=where)
+        if run_id:
+            per_collection = {c: {"status": ct.get("status"), "hits": ct.get("hits", 0), "ms": ct.get("ms")} for c, ct in timings["collections"].items()}
+            emit_progress(run_id, "retrieval_done", f"Retrieved {len(results)} document chunks from {name}", {"count": len(results), "collection": name, "collections": per_collection})
+        return results
+
     return _search
 
 
 def _make_llm_fn(run_id: str = None):
-    """Return a closure that calls the LLM, emitting progress events."""
-    def _generate(prompt: str) -> str:
+    """Return a coroutine fn that calls the LLM, emitting progress events."""
+    async def _generate(prompt: str) -> str:
         if run_id:
-            emit_progress(run_id, "llm_call", f"Calling {_llm.provider}/{_llm.model} ({len(prompt)} char prompt)…")
-        result = _llm.generate(prompt)
+            prompt_tokens = count_tokens(prompt, _llm.model)
+            emit_progress(run_id, "llm_call", f"Calling {_llm.provider}/{_llm.model} ({prompt_tokens} token prompt)…", {"prompt_tokens": prompt_tokens, "chars": len(prompt)})
+        result, llm_info = await _llm.agenerate_served(prompt)
         if run_id:
-            emit_progress(run_id, "llm_done", f"LLM response received ({len(result)} chars)", {"chars": len(result)})
+            cached = llm_info.get("cached_tokens") or 0
+            emit_progress(run_id, "llm_done", f"LLM response received from {llm_info['served_by']} ({len(result)} chars, {cached} cached prompt tokens)", {
+                "chars": len(result),
+                "served_by": llm_info["served_by"],
+                "prompt_tokens": llm_info.get("prompt_tokens"),
+                "cached_tokens": cached,
+                "cache": llm_info.get("cache"),
+            })
         return result
     return _generate
 
@@ -1128,9 +2186,14 @@ class AnomalyRequest(BaseModel):
     threshold_max_c: Optional[float] = 4.0
     location: Optional[str] = "Unknown"
     breach_duration_min: Optional[int] = 0
+    # Metadata filter spec for the agent's document searches (see metadata_filter)
+    filters: Optional[Dict[str, Any]] = None
+    # Collections to search instead of the agent's default one, e.g.
+    # ["lineage-sops:2", "lineage-ops-history"]; results are fused (see federated)
+    collections: Optional[List[str]] = None
 
 
-def _run_anomaly_background(run_id: str, req: AnomalyRequest, user_id: str = "", user_email: str = ""):
+async def _run_anomaly_background(run_id: str, req: AnomalyRequest, user_id: str = "", user_email: str = ""):
     start = time.time()
     try:
         emit_progress(run_id, "init", f"AnomalyResponder started for shipment {req.shipment_id}")
@@ -1143,7 +2206,7 @@ def _run_anomaly_background(run_id: str, req: AnomalyRequest, user_id: str = "",
             "location": req.location,
             "duration_minutes": req.breach_duration_min,
         }
-        result = agent.respond_to_anomaly(event, _make_vector_search_fn(run_id), _make_llm_fn(run_id))
+        result = await agent.arespond_to_anomaly(event, _make_vector_search_fn(run_id, MetadataFilter.from_spec(req.filters), parse_collections(req.collections)), _make_llm_fn(run_id))
         duration_ms = int((time.time() - start) * 1000)
         emit_progress(run_id, "complete", f"AnomalyResponder finished in {duration_ms}ms", {"duration_ms": duration_ms})
         run_result = {"run_id": run_id, "agent_name": "AnomalyResponder", "status": "success", "result": result, "duration_ms": duration_ms}
@@ -1165,6 +2228,8 @@ def _run_anomaly_background(run_id: str, req: AnomalyRequest, user_id: str = "",
 @app.post("/agents/anomaly")
 @limiter.limit(_RATE_LIMIT_AGENTS)
 def run_anomaly_agent(request: Request, req: AnomalyRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(require_permission("agents:run"))):
+    _request_filter(filters=req.filters)
+    _request_collections(req.collections)
     run_id = str(uuid.uuid4())
     _init_run(run_id)
     emit_progress(run_id, "queued", f"AnomalyResponder queued for {req.shipment_id}")
@@ -1179,9 +2244,14 @@ class RouteRequest(BaseModel):
     product_type: Optional[str] = "Seafood"
     start_time: Optional[str] = None
     constraints: Optional[Dict[str, Any]] = {}
+    # Metadata filter spec for the agent's document searches (see metadata_filter)
+    filters: Optional[Dict[str, Any]] = None
+    # Collections to search instead of the agent's default one, e.g.
+    # ["lineage-sops:2", "lineage-ops-history"]; results are fused (see federated)
+    collections: Optional[List[str]] = None
 
 
-def _run_route_background(run_id: str, req: RouteRequest, user_id: str = "", user_email: str = ""):
+async def _run_route_background(run_id: str, req: RouteRequest, user_id: str = "", user_email: str = ""):
     start = time.time()
     try:
         emit_progress(run_id, "init", f"RouteAdvisor started for {req.shipment_id}")
@@ -1196,7 +2266,7 @@ def _run_route_background(run_id: str, req: RouteRequest, user_id: str = "", use
             "start_time": req.start_time or _dt.now().isoformat(),
             "constraints": req.constraints or {},
         }
-        result = agent.advise_route(request_data, _make_vector_search_fn(run_id), _make_llm_fn(run_id))
+        result = await agent.aadvise_route(request_data, _make_vector_search_fn(run_id, MetadataFilter.from_spec(req.filters), parse_collections(req.collections)), _make_llm_fn(run_id))
         duration_ms = int((time.time() - start) * 1000)
         emit_progress(run_id, "complete", f"RouteAdvisor finished in {duration_ms}ms", {"duration_ms": duration_ms})
         run_result = {"run_id": run_id, "agent_name": "RouteAdvisor", "status": "success", "result": result, "duration_ms": duration_ms}
@@ -1218,6 +2288,8 @@ def _run_route_background(run_id: str, req: RouteRequest, user_id: str = "", use
 @app.post("/agents/route")
 @limiter.limit(_RATE_LIMIT_AGENTS)
 def run_route_agent(request: Request, req: RouteRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(require_permission("agents:run"))):
+    _request_filter(filters=req.filters)
+    _request_collections(req.collections)
     run_id = str(uuid.uuid4())
     _init_run(run_id)
     emit_progress(run_id, "queued", f"RouteAdvisor queued for {req.shipment_id}")
@@ -1235,7 +2307,7 @@ class NotifyRequest(BaseModel):
     dispatcher_title: Optional[str] = "Cold Chain Operations Dispatcher"
 
 
-def _run_notify_background(run_id: str, req: NotifyRequest, user_id: str = "", user_email: str = ""):
+async def _run_notify_background(run_id: str, req: NotifyRequest, user_id: str = "", user_email: str = ""):
     start = time.time()
     try:
         emit_progress(run_id, "init", f"CustomerNotifier started for {req.customer_id}")
@@ -1251,7 +2323,7 @@ def _run_notify_background(run_id: str, req: NotifyRequest, user_id: str = "", u
             "dispatcher_name": req.dispatcher_name,
             "dispatcher_title": req.dispatcher_title,
         }
-        result = agent.notify_customer(request_data, _make_llm_fn(run_id))
+        result = await agent.anotify_customer(request_data, _make_llm_fn(run_id))
         duration_ms = int((time.time() - start) * 1000)
         emit_progress(run_id, "complete", f"CustomerNotifier finished in {duration_ms}ms", {"duration_ms": duration_ms})
         run_result = {"run_id": run_id, "agent_name": "CustomerNotifier", "status": "success", "result": result, "duration_ms": duration_ms}
@@ -1289,15 +2361,20 @@ def run_notify_agent(request: Request, req: NotifyRequest, background_tasks: Bac
 class OpsSummaryRequest(BaseModel):
     time_window: Optional[str] = "24h"
     facility: Optional[str] = "all"
+    # Metadata filter spec for the agent's document searches (see metadata_filter)
+    filters: Optional[Dict[str, Any]] = None
+    # Collections to search instead of the agent's default one, e.g.
+    # ["lineage-sops:2", "lineage-ops-history"]; results are fused (see federated)
+    collections: Optional[List[str]] = None
 
 
-def _run_ops_summary_background(run_id: str, req: OpsSummaryRequest, user_id: str = "", user_email: str = ""):
+async def _run_ops_summary_background(run_id: str, req: OpsSummaryRequest, user_id: str = "", user_email: str = ""):
     start = time.time()
     try:
         emit_progress(run_id, "init", f"OpsSummarizer started — window: {req.time_window}, facility: {req.facility}")
         emit_progress(run_id, "aggregate", f"Aggregating operational events for the last {req.time_window}")
         agent = OpsSummarizer(_cfg)
-        result = agent.summarize_ops(req.time_window, _make_vector_search_fn(run_id), _make_llm_fn(run_id))
+        result = await agent.asummarize_ops(req.time_window, _make_vector_search_fn(run_id, MetadataFilter.from_spec(req.filters), parse_collections(req.collections)), _make_llm_fn(run_id))
         duration_ms = int((time.time() - start) * 1000)
         emit_progress(run_id, "complete", f"OpsSummarizer finished in {duration_ms}ms", {"duration_ms": duration_ms})
         run_result = {"run_id": run_id, "agent_name": "OpsSummarizer", "status": "success", "result": result, "duration_ms": duration_ms}
@@ -1319,6 +2396,8 @@ def _run_ops_summary_background(run_id: str, req: OpsSummaryRequest, user_id: st
 @app.post("/agents/ops-summary")
 @limiter.limit(_RATE_LIMIT_AGENTS)
 def run_ops_summary_agent(request: Request, req: OpsSummaryRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(require_permission("agents:run"))):
+    _request_filter(filters=req.filters)
+    _request_collections(req.collections)
     run_id = str(uuid.uuid4())
     _init_run(run_id)
     emit_progress(run_id, "queued", f"OpsSummarizer queued — {req.time_window} window")
@@ -1330,10 +2409,18 @@ def run_ops_summary_agent(request: Request, req: OpsSummaryRequest, background_t
 # History — Query & Agent Run Retrieval
 # ===========================================================================
 
+def _next_before(records: List[dict], limit: int) -> Optional[str]:
+    """Keyset cursor for the next page — (timestamp, seq) of the oldest record returned."""
+    if records and len(records) >= limit:
+        return records[-1].get("cursor") or records[-1].get("timestamp")
+    return None
+
+
 @app.get("/history/queries")
 def history_queries(
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -1341,11 +2428,13 @@ def history_queries(
 
     Admins see all users' queries by passing ?all=true (not yet implemented — returns own history).
     Each record contains: query text, answer, citations, provider, model, timestamp.
+    For deep pages pass ?before=<next_before from the previous page> instead of a large offset.
     """
     is_admin = current_user.get("role") == "admin"
     uid = None if is_admin else current_user["id"]
-    records = get_queries(user_id=uid, limit=limit, offset=offset)
-    return {"queries": records, "count": len(records), "limit": limit, "offset": offset}
+    records = get_queries(user_id=uid, limit=limit, offset=offset, before=before)
+    return {"queries": records, "count": len(records), "limit": limit, "offset": offset,
+            "next_before": _next_before(records, limit)}
 
 
 @app.get("/history/queries/{record_id}")
@@ -1364,6 +2453,7 @@ def history_agent_runs(
     agent_name: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -1377,8 +2467,9 @@ def history_agent_runs(
     """
     is_admin = current_user.get("role") == "admin"
     uid = None if is_admin else current_user["id"]
-    records = get_agent_runs(user_id=uid, agent_name=agent_name, limit=limit, offset=offset)
-    return {"agent_runs": records, "count": len(records), "limit": limit, "offset": offset}
+    records = get_agent_runs(user_id=uid, agent_name=agent_name, limit=limit, offset=offset, before=before)
+    return {"agent_runs": records, "count": len(records), "limit": limit, "offset": offset,
+            "next_before": _next_before(records, limit)}
 
 
 @app.get("/history/agents/{run_id}")
@@ -1402,6 +2493,7 @@ def history_notifications(
     shipment_id: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -1413,8 +2505,9 @@ def history_notifications(
     """
     is_admin = current_user.get("role") == "admin"
     uid = None if is_admin else current_user["id"]
-    records = get_notifications(user_id=uid, shipment_id=shipment_id, limit=limit, offset=offset)
-    return {"notifications": records, "count": len(records), "limit": limit, "offset": offset}
+    records = get_notifications(user_id=uid, shipment_id=shipment_id, limit=limit, offset=offset, before=before)
+    return {"notifications": records, "count": len(records), "limit": limit, "offset": offset,
+            "next_before": _next_before(records, limit)}
 
 
 @app.get("/history/stats")
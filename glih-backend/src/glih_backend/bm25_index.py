@@ -0,0 +1,575 @@
+"""
+GLIH Platform — Incremental BM25 Index
+=======================================
+Inverted index used by the lexical branch of hybrid search.
+
+Replaces "rebuild rank_bm25.BM25Okapi from the whole collection after every
+ingest": new chunks are appended to the postings and deleted chunks are
+tombstoned, so an ingest costs O(tokens ingested) and the next query pays
+nothing.
+
+Layout (NumPy):
+  CSR term-document matrix   indptr[V+1], indices[P] (doc slot), tfs[P]
+                             rows = term ids, one row per vocabulary term
+  delta chunks               one term-sorted COO chunk (terms, slots, tfs)
+                             per ingest batch since the last compaction;
+                             merged into the CSR arrays with one vectorized
+                             sort once they grow past _COMPACT_RATIO of the
+                             base (or _COMPACT_MAX_CHUNKS chunks)
+  doc_len[slot], alive[slot] per-document length and tombstone mask
+  df[term id]                live document frequency per term
+
+Scores are the Okapi BM25 variant used by rank_bm25.BM25Okapi (k1=1.5,
+b=0.75, epsilon=0.25): idf = ln(N - df + 0.5) - ln(df + 0.5), and negative
+idfs are floored to epsilon × average idf over the vocabulary. The idf vector
+and the per-document length normalisation k1·(1 - b + b·dl/avgdl) are
+precomputed once per corpus change. A query is a sparse dot product over the
+CSR rows of its terms (np.bincount), and top-k uses np.argpartition instead
+of a full sort. Per-document summation follows BM25Okapi term by term, so
+get_scores() matches BM25Okapi.get_scores() for the same corpus up to float
+rounding of the idf logs. search_many() scores a batch of queries as one
+(queries × docs) bincount, reading each distinct term's postings once.
+
+Metadata filters (a MetadataFilter, `where=`) become a boolean slot mask
+that drops postings before they are weighted and summed, so a filtered
+query scores only the documents it can return. Per-field value columns are
+built on first use and extended as documents are added; masks are cached
+per filter until the corpus changes.
+
+Slots are assigned in insertion order and never reused, which keeps tie
+order stable across incremental updates. Chunk ids, text and metadata are held
+in _Column objects so an index loaded by bm25_store can serve them straight
+from memory-mapped segment files.
+"""
+from __future__ import annotations
+
+import json
+import operator
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_INITIAL_CAPACITY = 1024
+# Merge delta postings / drop tombstoned postings once they exceed this share of the CSR base
+_COMPACT_RATIO = 0.25
+_COMPACT_MIN_POSTINGS = 50_000
+_COMPACT_MAX_CHUNKS = 32
+# Documents tokenized per delta chunk — bounds memory while ingesting large batches
+_ADD_BATCH = 20_000
+# Dense (queries × slots) cells scored at once by search_many
+_BATCH_CELLS = 4_000_000
+# Filter masks kept per index
+_MASK_CACHE = 32
+_RANGE = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def tokenize(text: str) -> List[str]:
+    """The tokenizer hybrid search has always used: lowercase + whitespace split."""
+    return (text or "").lower().split()
+
+
+def _grow(arr: np.ndarray, needed: int) -> np.ndarray:
+    if needed <= len(arr):
+        return arr
+    out = np.zeros(max(needed, 2 * len(arr), _INITIAL_CAPACITY), dtype=arr.dtype)
+    out[: len(arr)] = arr
+    return out
+
+
+class _Column:
+    """
+    Values by slot: read-only segments (UTF-8 blob + offsets, usually mmapped
+    by bm25_store) followed by an in-memory tail of values added since.
+    """
+
+    def __init__(self, as_json: bool = False) -> None:
+        self._as_json = as_json
+        self._starts: List[int] = []
+        self._segments: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._stored = 0
+        self._tail: List[Any] = []
+
+    def __len__(self) -> int:
+        return self._stored + len(self._tail)
+
+    def attach(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        """Append a stored segment. Only valid while the tail is empty."""
+        self._starts.append(self._stored)
+        self._segments.append((blob, offsets))
+        self._stored += len(offsets) - 1
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self._tail.extend(values)
+
+    def raw(self, slot: int) -> bytes:
+        if slot >= self._stored:
+            value = self._tail[slot - self._stored]
+            return (json.dumps(value, default=str) if self._as_json else value).encode("utf-8")
+        seg = bisect_right(self._starts, slot) - 1
+        blob, offsets = self._segments[seg]
+        pos = slot - self._starts[seg]
+        return bytes(blob[offsets[pos]:offsets[pos + 1]])
+
+    def __getitem__(self, slot: int) -> Any:
+        if slot >= self._stored:
+            return self._tail[slot - self._stored]
+        text = self.raw(slot).decode("utf-8")
+        return json.loads(text) if self._as_json else text
+
+    def encode(self, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Slots [start, end) as (uint8 blob, int64 offsets) for a segment file."""
+        parts = [self.raw(slot) for slot in range(start, end)]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+        return np.frombuffer(b"".join(parts), dtype=np.uint8), offsets
+
+
+class BM25Index:
+    """Incremental Okapi BM25 index over one collection."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25) -> None:
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._lock = threading.RLock()
+        # Vocabulary
+        self.vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._df = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        # Documents, addressed by slot
+        self._n_slots = 0
+        self._n_docs = 0
+        self.total_len = 0
+        self._doc_len = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        self._alive = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self.ids = _Column()
+        self.docs = _Column()
+        self.metas = _Column(as_json=True)
+        self._slot_of: Optional[Dict[str, int]] = {}
+        # Postings: CSR base + delta appended since the last compaction
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._tfs = np.zeros(0, dtype=np.int32)
+        self._delta: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._delta_postings = 0
+        self._dead_postings = 0
+        # Precomputed per corpus change
+        self._idf: Optional[np.ndarray] = None
+        self._norm: Optional[np.ndarray] = None
+        self._version = 0
+        # Metadata filters: field → value per slot, filter key → (version, mask)
+        self._facets: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._masks: "OrderedDict[str, Tuple[int, np.ndarray]]" = OrderedDict()
+        # What bm25_store has already written: slots, terms, delta chunks, CSR base
+        self._saved_slots = 0
+        self._saved_terms = 0
+        self._saved_chunks = 0
+        self._saved_base = False
+
+    # ── Corpus stats ─────────────────────────────────────────────────────────
+
+    @property
+    def corpus_size(self) -> int:
+        return self._n_docs
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self._n_docs if self._n_docs else 0.0
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    def _slots(self) -> Dict[str, int]:
+        """id → slot for live documents (built on first mutation of a loaded index)."""
+        if self._slot_of is None:
+            alive = self._alive
+            self._slot_of = {self.ids[slot]: slot for slot in range(self._n_slots) if alive[slot]}
+        return self._slot_of
+
+    def _changed(self) -> None:
+        self._idf = None
+        self._norm = None
+        self._version += 1
+
+    def _idf_vector(self) -> np.ndarray:
+        """idf per term id, with BM25Okapi's epsilon floor for negative values."""
+        if self._idf is None:
+            n_terms = len(self.vocab)
+            df = self._df[:n_terms].astype(np.float64)
+            present = df > 0
+            raw = np.zeros(n_terms, dtype=np.float64)
+            raw[present] = np.log(self._n_docs - df[present] + 0.5) - np.log(df[present] + 0.5)
+            avg = float(raw[present].mean()) if present.any() else 0.0
+            idf = np.where(raw < 0, self.epsilon * avg, raw)
+            idf[~present] = 0.0
+            self._idf = idf
+        return self._idf
+
+    def _norm_vector(self) -> np.ndarray:
+        """k1 · (1 - b + b · dl / avgdl) per slot — the BM25 length normalisation."""
+        if self._norm is None:
+            doc_len = self._doc_len[: self._n_slots]
+            avgdl = self.avgdl or 1.0
+            self._norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+        return self._norm
+
+    def idf(self, term: str) -> float:
+        """BM25Okapi idf for a term (0.0 for out-of-vocabulary terms)."""
+        with self._lock:
+            tid = self.vocab.get(term)
+            if tid is None:
+                return 0.0
+            return float(self._idf_vector()[tid])
+
+    # ── Mutation ─────────────────────────────────────────────────────────────
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> int:
+        """Append documents. An id that is already indexed is replaced. Returns docs added."""
+        with self._lock:
+            if len(set(ids)) < len(ids):
+                # Same id twice in one batch: the last occurrence wins, as with sequential adds
+                last = sorted({doc_id: pos for pos, doc_id in enumerate(ids)}.values())
+                ids = [ids[p] for p in last]
+                documents = [documents[p] for p in last]
+                metadatas = [metadatas[p] if p < len(metadatas) else None for p in last] if metadatas else None
+            slot_of = self._slots()
+            stale = [doc_id for doc_id in ids if doc_id in slot_of]
+            if stale:
+                self.remove(stale)
+            for start in range(0, len(ids), _ADD_BATCH):
+                end = start + _ADD_BATCH
+                self._add_chunk(ids[start:end], documents[start:end], metadatas[start:end] if metadatas else None)
+            self._changed()
+            self._maybe_compact()
+            return len(ids)
+
+    def _add_chunk(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]],
+    ) -> None:
+        first = self._n_slots
+        self._n_slots += len(ids)
+        vocab = self.vocab
+        n_terms = len(vocab)
+        intern = vocab.setdefault
+        flat: List[int] = []
+        lengths: List[int] = []
+        for text in documents:
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            flat.extend([intern(tok, len(vocab)) for tok in tokens])
+        # (term, slot) pairs → term frequencies, term-major, in one np.unique
+        stride = self._n_slots
+        keys = np.asarray(flat, dtype=np.int64) * stride + np.repeat(np.arange(first, stride, dtype=np.int64), lengths)
+        if len(vocab) > n_terms:
+            self._terms.extend(reversed(list(islice(reversed(vocab), len(vocab) - n_terms))))
+        keys, tfs = np.unique(keys, return_counts=True)
+        terms = keys // stride
+        self._delta.append((terms, keys % stride, tfs.astype(np.int32)))
+        self._delta_postings += len(terms)
+        self._df = _grow(self._df, len(vocab))
+        self._df[: len(vocab)] += np.bincount(terms, minlength=len(vocab))
+        self._doc_len = _grow(self._doc_len, self._n_slots)
+        self._alive = _grow(self._alive, self._n_slots)
+        self._doc_len[first:self._n_slots] = lengths
+        self._alive[first:self._n_slots] = True
+        self.total_len += sum(lengths)
+        self._n_docs += len(ids)
+        self.ids.extend(ids)
+        self.docs.extend(documents)
+        self.metas.extend(
+            ((metadatas[pos] if metadatas and pos < len(metadatas) else None) or {}) for pos in range(len(ids))
+        )
+        slot_of = self._slots()
+        for pos, doc_id in enumerate(ids):
+            slot_of[doc_id] = first + pos
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Delete documents by id (tombstoned until compaction). Returns docs removed."""
+        removed = 0
+        with self._lock:
+            slot_of = self._slots()
+            for doc_id in ids:
+                slot = slot_of.pop(doc_id, None)
+                if slot is None:
+                    continue
+                terms = set(tokenize(self.docs[slot] or ""))
+                for tok in terms:
+                    self._df[self.vocab[tok]] -= 1
+                self._dead_postings += len(terms)
+                self._alive[slot] = False
+                self.total_len -= int(self._doc_len[slot])
+                self._n_docs -= 1
+                removed += 1
+            if removed:
+                self._changed()
+                self._maybe_compact()
+        return removed
+
+    def _maybe_compact(self) -> None:
+        pending = self._delta_postings + self._dead_postings
+        if len(self._delta) > _COMPACT_MAX_CHUNKS or pending >= max(
+            _COMPACT_MIN_POSTINGS, _COMPACT_RATIO * len(self._indices)
+        ):
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge delta postings into the CSR arrays and drop tombstoned postings."""
+        with self._lock:
+            n_terms = len(self.vocab)
+            base_terms = np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int64), np.diff(self._indptr))
+            terms = np.concatenate([base_terms] + [c[0] for c in self._delta])
+            slots_arr = np.concatenate([self._indices] + [c[1] for c in self._delta])
+            tfs_arr = np.concatenate([self._tfs] + [c[2] for c in self._delta])
+            keep = self._alive[slots_arr]
+            terms, slots_arr, tfs_arr = terms[keep], slots_arr[keep], tfs_arr[keep]
+            # Stable: within a row, older (base) postings stay ahead of newer (delta) ones
+            order = np.argsort(terms, kind="stable")
+            self._indices = slots_arr[order]
+            self._tfs = tfs_arr[order]
+            self._indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))]).astype(np.int64)
+            self._delta = []
+            self._delta_postings = 0
+            self._dead_postings = 0
+            self._saved_chunks = 0
+            self._saved_base = False
+
+    # ── Scoring ──────────────────────────────────────────────────────────────
+
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        if tid < len(self._indptr) - 1:
+            lo, hi = self._indptr[tid], self._indptr[tid + 1]
+            slots, tfs = self._indices[lo:hi], self._tfs[lo:hi]
+        else:
+            slots, tfs = self._indices[:0], self._tfs[:0]
+        if self._delta:
+            parts_s, parts_t = [slots], [tfs]
+            for terms, c_slots, c_tfs in self._delta:
+                lo, hi = np.searchsorted(terms, (tid, tid + 1))
+                if hi > lo:
+                    parts_s.append(c_slots[lo:hi])
+                    parts_t.append(c_tfs[lo:hi])
+            if len(parts_s) > 1:
+                slots, tfs = np.concatenate(parts_s), np.concatenate(parts_t)
+        if self._dead_postings:
+            keep = self._alive[slots]
+            slots, tfs = slots[keep], tfs[keep]
+        return slots, tfs
+
+    def _weights(self, tid: int, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """(slots, BM25 term weights) of one term's postings, restricted to `mask`."""
+        slots, tfs = self._postings(tid)
+        if mask is not None:
+            keep = mask[slots]
+            slots, tfs = slots[keep], tfs[keep]
+        tf = tfs.astype(np.float64)
+        return slots, self._idf_vector()[tid] * (tf * (self.k1 + 1) / (tf + self._norm_vector()[slots]))
+
+    def _score(self, query_tokens: List[str], mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sparse dot product of the query against the term-document matrix.
+        Returns (dense scores over slots, sorted slots matching at least one term).
+        """
+        if not self._n_docs:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        seg_slots: List[np.ndarray] = []
+        seg_weights: List[np.ndarray] = []
+        per_term: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # Repeated query tokens count once per occurrence, as in BM25Okapi. Segments
+        # are concatenated in query order and np.bincount accumulates sequentially,
+        # so each document's score is summed in the same order BM25Okapi uses.
+        for q in query_tokens:
+            tid = self.vocab.get(q)
+            if tid is None or self._df[tid] <= 0:
+                continue
+            if tid not in per_term:
+                per_term[tid] = self._weights(tid, mask)
+            slots, weights = per_term[tid]
+            seg_slots.append(slots)
+            seg_weights.append(weights)
+        if not seg_slots:
+            return np.zeros(self._n_slots), np.zeros(0, dtype=np.int64)
+        all_slots = np.concatenate(seg_slots)
+        scores = np.bincount(all_slots, weights=np.concatenate(seg_weights), minlength=self._n_slots)
+        return scores, np.unique(all_slots)
+
+    def _score_many(self, queries: List[List[str]], mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        _score for several queries at once: (n_queries × slots) scores and
+        matched-term counts. Row r's segments are offset by r · slots, so one
+        bincount accumulates every query, each in its own term order.
+        """
+        n = self._n_slots
+        n_q = len(queries)
+        per_term: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        seg_slots: List[np.ndarray] = []
+        seg_weights: List[np.ndarray] = []
+        for row, query_tokens in enumerate(queries):
+            for q in query_tokens:
+                tid = self.vocab.get(q)
+                if tid is None or self._df[tid] <= 0:
+                    continue
+                if tid not in per_term:
+                    per_term[tid] = self._weights(tid, mask)
+                slots, weights = per_term[tid]
+                seg_slots.append(slots + row * n)
+                seg_weights.append(weights)
+        if not seg_slots:
+            return np.zeros((n_q, n)), np.zeros((n_q, n), dtype=np.int64)
+        flat = np.concatenate(seg_slots)
+        scores = np.bincount(flat, weights=np.concatenate(seg_weights), minlength=n_q * n)
+        hits = np.bincount(flat, minlength=n_q * n)
+        return scores.reshape(n_q, n), hits.reshape(n_q, n)
+
+    def get_scores(self, query_tokens: List[str]) -> List[float]:
+        """Dense scores in slot order (live documents only) — same as BM25Okapi.get_scores()."""
+        with self._lock:
+            scores, _ = self._score(query_tokens)
+            if not self._n_docs:
+                return []
+            return scores[np.flatnonzero(self._alive[: self._n_slots])].tolist()
+
+    def top_k(self, query_tokens: List[str], k: int, where: Any = None) -> List[Tuple[int, float]]:
+        """(slot, score) of the k best matching documents, best first, ties by slot."""
+        with self._lock:
+            mask = self.mask(where) if where else None
+            if mask is not None and not mask.any():
+                return []
+            scores, matched = self._score(query_tokens, mask)
+            return self._pick(scores, matched, k)
+
+    @staticmethod
+    def _pick(scores: np.ndarray, matched: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if k <= 0 or not len(matched):
+            return []
+        s = scores[matched]
+        if k < len(s):
+            kth = np.partition(s, len(s) - k)[len(s) - k]
+            above = np.flatnonzero(s > kth)
+            ties = np.flatnonzero(s == kth)[: k - len(above)]
+            pick = np.concatenate([above, ties])
+        else:
+            pick = np.arange(len(s))
+        order = pick[np.lexsort((matched[pick], -s[pick]))]
+        return [(int(matched[i]), float(s[i])) for i in order]
+
+    def search(self, query_tokens: List[str], k: int, where: Any = None) -> List[Dict[str, Any]]:
+        """
+        Top-k matching documents, best first (ties keep insertion order).
+        Documents sharing no term with the query, or failing the `where`
+        MetadataFilter, are not returned.
+        """
+        with self._lock:
+            return [
+                {
+                    "id": self.ids[slot],
+                    "document": self.docs[slot],
+                    "metadata": self.metas[slot],
+                    "score": score,
+                }
+                for slot, score in self.top_k(query_tokens, k, where)
+            ]
+
+    def search_many(self, queries: List[List[str]], k: int, where: Any = None) -> List[List[Dict[str, Any]]]:
+        """search() for a batch of tokenized queries; same results, one pass over the postings."""
+        with self._lock:
+            out: List[List[Dict[str, Any]]] = []
+            mask = self.mask(where) if where and self._n_docs else None
+            if not self._n_docs or (mask is not None and not mask.any()):
+                return [[] for _ in queries]
+            step = max(1, _BATCH_CELLS // max(self._n_slots, 1))
+            for start in range(0, len(queries), step):
+                scores, hits = self._score_many(queries[start:start + step], mask)
+                for row in range(scores.shape[0]):
+                    matched = np.flatnonzero(hits[row])
+                    out.append([
+                        {
+                            "id": self.ids[slot],
+                            "document": self.docs[slot],
+                            "metadata": self.metas[slot],
+                            "score": score,
+                        }
+                        for slot, score in self._pick(scores[row], matched, k)
+                    ])
+            return out
+
+    # ── Metadata filters ─────────────────────────────────────────────────────
+
+    def _facet(self, field: str, numeric: bool) -> np.ndarray:
+        """
+        One metadata field by slot: objects (None when missing), or float64
+        (NaN when missing or not a number) for range conditions.
+        """
+        col = self._facets.get((field, numeric))
+        start = 0 if col is None else len(col)
+        if start < self._n_slots:
+            values = [(self.metas[slot] or {}).get(field) for slot in range(start, self._n_slots)]
+            if numeric:
+                tail = np.array(
+                    [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+                    dtype=np.float64,
+                )
+            else:
+                tail = np.empty(len(values), dtype=object)
+                tail[:] = values
+            col = tail if col is None else np.concatenate([col, tail])
+            self._facets[(field, numeric)] = col
+        return col
+
+    def mask(self, where: Any) -> np.ndarray:
+        """Live slots whose metadata passes `where` (a MetadataFilter). Read-only; shared by callers."""
+        with self._lock:
+            key = where.key()
+            cached = self._masks.get(key)
+            if cached is not None and cached[0] == self._version and len(cached[1]) == self._n_slots:
+                self._masks.move_to_end(key)
+                return cached[1]
+            mask = self._alive[: self._n_slots].copy()
+            for field, op, value in where.conditions:
+                if op in _RANGE:
+                    with np.errstate(invalid="ignore"):
+                        mask &= _RANGE[op](self._facet(field, True), value)
+                    continue
+                col = self._facet(field, False)
+                hit = np.zeros(self._n_slots, dtype=bool)
+                for v in (value if op == "in" else (value,)):
+                    hit |= np.asarray(col == v, dtype=bool)
+                mask &= hit
+            mask.setflags(write=False)
+            self._masks[key] = (self._version, mask)
+            while len(self._masks) > _MASK_CACHE:
+                self._masks.popitem(last=False)
+            return mask
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "docs": self._n_docs,
+                "terms": int(np.count_nonzero(self._df[: len(self.vocab)])),
+                "postings": int(len(self._indices) + self._delta_postings - self._dead_postings),
+                "pending_postings": self._delta_postings,
+                "avgdl": round(self.avgdl, 2),
+            }
+
+
+def build_index(
+    ids: List[str],
+    documents: List[str],
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+) -> BM25Index:
+    """Build an index from a full collection dump (cold start)."""
+    index = BM25Index()
+    index.add(ids, documents, metadatas)
+    index.compact()
+    return index
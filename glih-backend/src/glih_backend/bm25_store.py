@@ -0,0 +1,334 @@
+"""
+GLIH Platform — On-disk BM25 Index Store
+========================================
+Persists BM25Index generations next to the vector store so that every
+gunicorn worker on a host memory-maps the same files instead of scanning the
+collection and keeping its own copy of the index.
+
+Layout (one directory per collection under GLIH_BM25_DIR):
+  CURRENT                      "<generation> <epoch>", replaced atomically
+  .lock                        writer lock (flock / msvcrt)
+  gen-00000007.json            manifest of generation 7
+  gen-00000007.alive.npy       tombstone mask   ┐ small, rewritten
+  gen-00000007.df.npy          document freqs   ┘ per generation
+  seg-00000003/                immutable segment written by generation 3
+      indptr.npy indices.npy tfs.npy     kind "csr": full postings snapshot
+      terms.npy slots.npy tfs.npy        kind "coo": one ingest, term-sorted
+      doc_len.npy                        lengths of the segment's slots
+      ids|docs|metas.npy + .off.npy      UTF-8 blobs + offsets per slot
+      vocab.txt                          terms first seen in this segment
+
+A generation is an optional csr segment, the coo segments ingested after it,
+and its own alive/df vectors. An ingest writes one small coo segment. After
+the index compacts in memory, the next save writes a fresh csr snapshot and
+older segments are retired. Arrays are opened with np.load(mmap_mode="r"),
+so postings and chunk text sit once in the page cache however many workers
+there are. Loading opens files and rebuilds the term → id dict; it does not
+scan the collection.
+
+Writers serialize on the collection lock and always start from the latest
+generation, so concurrent ingests in different workers never lose updates.
+Readers compare CURRENT on each lookup and reload when it changes. The epoch
+changes whenever the directory is dropped and rebuilt, so a recreated
+collection never reuses a generation token.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .bm25_index import BM25Index
+
+try:
+    import fcntl  # type: ignore
+
+    def _lock_file(fh) -> None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+    def _try_lock_file(fh) -> bool:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock_file(fh) -> None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt  # type: ignore
+    import time
+
+    def _lock_file(fh) -> None:
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _try_lock_file(fh) -> bool:
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock_file(fh) -> None:
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+logger = logging.getLogger("glih.bm25_store")
+
+FORMAT = "glih-bm25"
+FORMAT_VERSION = 1
+# Generations kept on disk besides the current one (readers may still be mapping them)
+_KEEP_GENERATIONS = 2
+
+
+def _save_npy(path: str, arr: np.ndarray) -> None:
+    with open(path, "wb") as fh:
+        np.save(fh, np.ascontiguousarray(arr))
+
+
+class BM25Store:
+    """Versioned, memory-mappable BM25 index generations, one directory per collection."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, collection: str) -> str:
+        return os.path.join(self.root, collection)
+
+    # ── Generation pointer ───────────────────────────────────────────────────
+
+    def current(self, collection: str) -> Optional[str]:
+        """The current generation token, or None if the collection has no index on disk."""
+        try:
+            with open(os.path.join(self._dir(collection), "CURRENT"), "r", encoding="utf-8") as fh:
+                return fh.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def lock(self, collection: str) -> Iterator[None]:
+        """Exclusive writer lock for one collection, across processes."""
+        d = self._dir(collection)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, ".lock"), "a+b") as fh:
+            _lock_file(fh)
+            try:
+                yield
+            finally:
+                _unlock_file(fh)
+
+    def drop(self, collection: str) -> None:
+        """Remove a collection's index (collection deleted or reset)."""
+        d = self._dir(collection)
+        if not os.path.isdir(d):
+            return
+        with self.lock(collection):
+            for name in os.listdir(d):
+                if name == ".lock":
+                    continue
+                path = os.path.join(d, name)
+                try:
+                    shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+                except OSError as e:  # still mapped on Windows — retired on the next save
+                    logger.warning(f"BM25 store: could not remove {path}: {e}")
+
+    # ── Load ─────────────────────────────────────────────────────────────────
+
+    def load(self, collection: str, source: Optional[str] = None) -> Optional[Tuple[str, BM25Index]]:
+        """
+        (token, index) for the current generation, or None if there is none.
+        `source` identifies the vector-store collection the index was built from;
+        an index built from a different one (store wiped and recreated) is ignored.
+        """
+        for _ in range(3):
+            token = self.current(collection)
+            if token is None:
+                return None
+            try:
+                manifest = self._manifest(collection, int(token.split()[0]))
+                if source and manifest.get("source") not in (None, source):
+                    logger.info(f"BM25 store: index for '{collection}' was built from another collection instance")
+                    return None
+                return token, self._load_generation(collection, manifest)
+            except FileNotFoundError:
+                # A writer retired this generation between reading CURRENT and opening it
+                continue
+        return None
+
+    def _manifest(self, collection: str, generation: int) -> Dict[str, Any]:
+        with open(os.path.join(self._dir(collection), f"gen-{generation:08d}.json"), "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if manifest.get("format") != FORMAT or manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported BM25 index format {manifest.get('format')} v{manifest.get('version')}")
+        return manifest
+
+    def _load_generation(self, collection: str, manifest: Dict[str, Any]) -> BM25Index:
+        d = self._dir(collection)
+        generation = manifest["generation"]
+        index = BM25Index(**manifest["params"])
+        doc_lens: List[np.ndarray] = []
+        terms: List[str] = []
+        for seg in manifest["segments"]:
+            sd = os.path.join(d, seg["name"])
+
+            def mm(name: str) -> np.ndarray:
+                return np.load(os.path.join(sd, name), mmap_mode="r")
+
+            if seg["kind"] == "csr":
+                index._indptr, index._indices, index._tfs = mm("indptr.npy"), mm("indices.npy"), mm("tfs.npy")
+            else:
+                index._delta.append((mm("terms.npy"), mm("slots.npy"), mm("tfs.npy")))
+            if seg["n_slots"]:
+                doc_lens.append(mm("doc_len.npy"))
+                index.ids.attach(mm("ids.npy"), mm("ids.off.npy"))
+                index.docs.attach(mm("docs.npy"), mm("docs.off.npy"))
+                index.metas.attach(mm("metas.npy"), mm("metas.off.npy"))
+            if seg["n_terms"]:
+                with open(os.path.join(sd, "vocab.txt"), "r", encoding="utf-8") as fh:
+                    terms.extend(fh.read().split("\n"))
+        stem = os.path.join(d, f"gen-{generation:08d}")
+        index._terms = terms
+        index.vocab = {term: tid for tid, term in enumerate(terms)}
+        # Small per-document / per-term vectors are private, writable copies
+        index._df = np.array(np.load(stem + ".df.npy"))
+        index._alive = np.array(np.load(stem + ".alive.npy"))
+        index._doc_len = np.concatenate(doc_lens) if doc_lens else np.zeros(0, dtype=np.int64)
+        index._n_slots = manifest["n_slots"]
+        index._n_docs = manifest["n_docs"]
+        index.total_len = manifest["total_len"]
+        index._delta_postings = manifest["delta_postings"]
+        index._dead_postings = manifest["dead_postings"]
+        index._slot_of = None
+        index._saved_slots, index._saved_terms = index._n_slots, len(terms)
+        index._saved_chunks, index._saved_base = len(index._delta), True
+        return index
+
+    # ── Save ─────────────────────────────────────────────────────────────────
+
+    def save(self, collection: str, index: BM25Index, source: Optional[str] = None) -> str:
+        """
+        Write the index as the next generation and publish it. Callers hold
+        lock(collection) and must have loaded `index` from the current
+        generation (or built it from scratch when there is none).
+        """
+        d = self._dir(collection)
+        with index._lock:
+            token = self.current(collection)
+            prev_gen, epoch = (int(token.split()[0]), token.split()[1]) if token else (0, uuid.uuid4().hex[:12])
+            generation = prev_gen + 1
+            segments: List[Dict[str, Any]] = []
+            full = not (token and index._saved_base)
+            if not full:
+                segments = list(self._manifest(collection, prev_gen)["segments"])
+            else:
+                # A csr snapshot holds every posting; merge the delta first
+                index.compact()
+            new_rows = index._n_slots > index._saved_slots or full
+            new_chunks = index._delta[index._saved_chunks:]
+            if full or new_rows or new_chunks or len(index._terms) > index._saved_terms:
+                segments.append(self._write_segment(d, generation, index, full))
+            stem = os.path.join(d, f"gen-{generation:08d}")
+            _save_npy(stem + ".df.npy", index._df[: len(index._terms)])
+            _save_npy(stem + ".alive.npy", index._alive[: index._n_slots])
+            manifest = {
+                "format": FORMAT,
+                "version": FORMAT_VERSION,
+                "generation": generation,
+                "epoch": epoch,
+                "source": source,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "params": {"k1": index.k1, "b": index.b, "epsilon": index.epsilon},
+                "n_slots": index._n_slots,
+                "n_docs": index._n_docs,
+                "n_terms": len(index._terms),
+                "total_len": index.total_len,
+                "delta_postings": index._delta_postings,
+                "dead_postings": index._dead_postings,
+                "segments": segments,
+            }
+            with open(stem + ".json.tmp", "w", encoding="utf-8") as fh:
+                json.dump(manifest, fh, indent=1)
+            os.replace(stem + ".json.tmp", stem + ".json")
+            new_token = f"{generation} {epoch}"
+            with open(os.path.join(d, "CURRENT.tmp"), "w", encoding="utf-8") as fh:
+                fh.write(new_token + "\n")
+            os.replace(os.path.join(d, "CURRENT.tmp"), os.path.join(d, "CURRENT"))
+            index._saved_slots, index._saved_terms = index._n_slots, len(index._terms)
+            index._saved_chunks, index._saved_base = len(index._delta), True
+        self._retire(collection, generation)
+        return new_token
+
+    def _write_segment(self, d: str, generation: int, index: BM25Index, full: bool) -> Dict[str, Any]:
+        name = f"seg-{generation:08d}"
+        tmp = os.path.join(d, name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        slot_start = 0 if full else index._saved_slots
+        term_start = 0 if full else index._saved_terms
+        if full:
+            _save_npy(os.path.join(tmp, "indptr.npy"), index._indptr)
+            _save_npy(os.path.join(tmp, "indices.npy"), index._indices)
+            _save_npy(os.path.join(tmp, "tfs.npy"), index._tfs)
+        else:
+            chunks = index._delta[index._saved_chunks:]
+            terms = np.concatenate([np.zeros(0, dtype=np.int64)] + [c[0] for c in chunks])
+            order = np.argsort(terms, kind="stable")
+            _save_npy(os.path.join(tmp, "terms.npy"), terms[order])
+            _save_npy(os.path.join(tmp, "slots.npy"), np.concatenate([np.zeros(0, dtype=np.int64)] + [c[1] for c in chunks])[order])
+            _save_npy(os.path.join(tmp, "tfs.npy"), np.concatenate([np.zeros(0, dtype=np.int32)] + [c[2] for c in chunks])[order])
+        n_slots = index._n_slots - slot_start
+        if n_slots:
+            _save_npy(os.path.join(tmp, "doc_len.npy"), index._doc_len[slot_start:index._n_slots])
+            for col_name in ("ids", "docs", "metas"):
+                blob, offsets = getattr(index, col_name).encode(slot_start, index._n_slots)
+                _save_npy(os.path.join(tmp, f"{col_name}.npy"), blob)
+                _save_npy(os.path.join(tmp, f"{col_name}.off.npy"), offsets)
+        n_terms = len(index._terms) - term_start
+        if n_terms:
+            with open(os.path.join(tmp, "vocab.txt"), "w", encoding="utf-8") as fh:
+                fh.write("\n".join(index._terms[term_start:]))
+        # Left over by a save that died before publishing this generation
+        shutil.rmtree(os.path.join(d, name), ignore_errors=True)
+        os.replace(tmp, os.path.join(d, name))
+        return {
+            "name": name,
+            "kind": "csr" if full else "coo",
+            "slot_start": slot_start,
+            "n_slots": n_slots,
+            "term_start": term_start,
+            "n_terms": n_terms,
+        }
+
+    def _retire(self, collection: str, generation: int) -> None:
+        """Delete generations older than the last _KEEP_GENERATIONS and unreferenced segments."""
+        d = self._dir(collection)
+        keep_from = generation - _KEEP_GENERATIONS
+        referenced = set()
+        for g in range(max(1, keep_from), generation + 1):
+            try:
+                referenced.update(seg["name"] for seg in self._manifest(collection, g)["segments"])
+            except (FileNotFoundError, ValueError):
+                continue
+        for name in os.listdir(d):
+            path = os.path.join(d, name)
+            try:
+                if name.startswith("gen-") and int(name[4:12]) < keep_from:
+                    os.remove(path)
+                elif name.startswith("seg-") and not name.endswith(".tmp") and name not in referenced:
+                    shutil.rmtree(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"BM25 store: could not retire {path}: {e}")
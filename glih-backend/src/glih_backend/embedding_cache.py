@@ -0,0 +1,231 @@
+"""
+GLIH Platform — Query Embedding Cache
+=====================================
+Bounded cache in front of EmbeddingsProvider.embed for query-time texts.
+Dispatchers and agents send the same few queries over and over ("temperature
+breach for Dairy product" from AnomalyResponder, the dashboard presets, ...).
+Each repeat used to cost one embeddings API round trip.
+
+Entries are keyed by (provider, model, normalized text). Normalization is
+Unicode NFC plus whitespace collapsing. Case is kept because embedding models
+are case-sensitive.
+
+Tiers:
+  memory  LRU (OrderedDict) with a per-entry TTL — GLIH_EMBED_CACHE_SIZE
+          entries, GLIH_EMBED_CACHE_TTL_S seconds
+  disk    optional SQLite file shared by every worker on the host
+          (GLIH_EMBED_CACHE_DB). WAL journal, vectors stored as float32
+          blobs, same TTL. A disk hit is promoted into memory.
+
+Only misses reach the provider, in one batched call, with input order kept.
+Counters (hits, disk_hits, misses, evictions, expired) are reported by
+stats() and surfaced under /health/detailed. invalidate() empties the memory
+tier. /embeddings/select calls it when the model changes. Disk rows are keyed
+by provider and model, so other workers' entries stay valid.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+EMBED_CACHE_ENABLED = os.getenv("GLIH_EMBED_CACHE", "1").lower() in ("1", "true", "yes")
+EMBED_CACHE_SIZE = int(os.getenv("GLIH_EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL_S = float(os.getenv("GLIH_EMBED_CACHE_TTL_S", "3600"))
+EMBED_CACHE_DB = os.getenv("GLIH_EMBED_CACHE_DB", "")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def cache_key(provider: str, model: str, text: str) -> str:
+    return hashlib.sha256(f"{provider}\x1f{model}\x1f{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed shared tier. One connection per thread, like the history store."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    key        TEXT PRIMARY KEY,
+                    provider   TEXT NOT NULL,
+                    model      TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    vector     BLOB NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_created ON embeddings (created_at)")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str], min_created: float) -> Dict[str, Tuple[List[float], float]]:
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({marks}) AND created_at >= ?",
+            (*keys, min_created),
+        ).fetchall()
+        return {key: (array("f", blob).tolist(), created) for key, blob, created in rows}
+
+    def put_many(self, rows: List[Tuple[str, str, str, float, List[float]]]) -> None:
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, provider, model, created_at, vector) VALUES (?, ?, ?, ?, ?)",
+                [(k, p, m, t, array("f", v).tobytes()) for k, p, m, t, v in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge_expired(self, min_created: float) -> int:
+        return self._conn().execute("DELETE FROM embeddings WHERE created_at < ?", (min_created,)).rowcount
+
+
+class EmbeddingCache:
+    """LRU + TTL embedding cache with an optional shared SQLite tier."""
+
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE, ttl_s: float = EMBED_CACHE_TTL_S, disk_path: str = "") -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self._mem: "OrderedDict[str, Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(disk_path) if disk_path else None
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "disk_errors": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["EmbeddingCache"]:
+        if not EMBED_CACHE_ENABLED:
+            return None
+        return cls(EMBED_CACHE_SIZE, EMBED_CACHE_TTL_S, EMBED_CACHE_DB)
+
+    def _put_mem(self, key: str, vec: List[float], created: float) -> None:
+        self._mem[key] = (vec, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _lookup(self, provider: Any, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str], float]:
+        """(keys, cached vectors by key, missing key → first text, now)."""
+        now = time.time()
+        min_created = now - self.ttl_s
+        keys = [cache_key(provider.provider, provider.model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                entry = self._mem.get(key)
+                if entry is None:
+                    continue
+                if entry[1] < min_created:
+                    del self._mem[key]
+                    self._stats["expired"] += 1
+                    continue
+                self._mem.move_to_end(key)
+                found[key] = entry[0]
+                self._stats["hits"] += 1
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self._disk is not None:
+            try:
+                disk = self._disk.get_many(missing, min_created)
+            except Exception as e:
+                self._stats["disk_errors"] += 1
+                logger.warning(f"Embedding cache disk tier read failed: {e}")
+                disk = {}
+            with self._lock:
+                for key, (vec, created) in disk.items():
+                    self._put_mem(key, vec, created)
+                    found[key] = vec
+                    self._stats["disk_hits"] += 1
+            missing = [k for k in missing if k not in found]
+        first_text: Dict[str, str] = {}
+        if missing:
+            wanted = set(missing)
+            for key, text in zip(keys, texts):
+                if key in wanted:
+                    first_text.setdefault(key, text)
+        return keys, found, {k: first_text[k] for k in missing}, now
+
+    def _store(self, provider: Any, missing: List[str], vecs: List[List[float]], found: Dict[str, List[float]], now: float) -> None:
+        with self._lock:
+            self._stats["misses"] += len(missing)
+            for key, vec in zip(missing, vecs):
+                self._put_mem(key, vec, now)
+                found[key] = vec
+        if self._disk is not None:
+            try:
+                self._disk.put_many(
+                    [(k, provider.provider, provider.model, now, v) for k, v in zip(missing, vecs)]
+                )
+            except Exception as e:
+                self._stats["disk_errors"] += 1
+                logger.warning(f"Embedding cache disk tier write failed: {e}")
+
+    def embed(self, provider: Any, texts: List[str]) -> List[List[float]]:
+        """
+        Embed `texts` with `provider` (anything with .provider, .model, .embed),
+        serving repeats from cache. Duplicates within one call are embedded once.
+        """
+        keys, found, missing, now = self._lookup(provider, texts)
+        if missing:
+            self._store(provider, list(missing), provider.embed(list(missing.values())), found, now)
+        return [found[k] for k in keys]
+
+    async def aembed(self, provider: Any, texts: List[str]) -> List[List[float]]:
+        """embed() for coroutines: misses go through provider.aembed."""
+        keys, found, missing, now = self._lookup(provider, texts)
+        if missing:
+            self._store(provider, list(missing), await provider.aembed(list(missing.values())), found, now)
+        return [found[k] for k in keys]
+
+    def invalidate(self) -> None:
+        """Drop the memory tier (model switched). Disk rows are model-keyed and stay valid."""
+        with self._lock:
+            self._mem.clear()
+        if self._disk is not None:
+            try:
+                self._disk.purge_expired(time.time() - self.ttl_s)
+            except Exception as e:
+                logger.warning(f"Embedding cache disk purge failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._mem)
+        lookups = out["hits"] + out["disk_hits"] + out["misses"]
+        out["hit_rate"] = round((out["hits"] + out["disk_hits"]) / lookups, 4) if lookups else 0.0
+        out["capacity"] = self.max_entries
+        out["ttl_s"] = self.ttl_s
+        out["disk"] = self._disk.path if self._disk is not None else None
+        return out
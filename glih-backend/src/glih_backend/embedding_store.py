@@ -0,0 +1,302 @@
+"""
+GLIH Platform — Content-Addressed Embedding Store
+=================================================
+Persistent store of chunk embeddings keyed by sha256(provider, model, chunk
+text). Ingest looks vectors up here before calling the embeddings provider.
+Re-uploading an SOP PDF, or the same text under another collection or
+filename, therefore costs no embedding calls for chunks that were seen before.
+
+Layout (one directory per provider/model under GLIH_EMBED_STORE_DIR):
+  meta.json     {"provider", "model", "dim"}
+  vectors.f32   row-major float32 vectors, append-only, memory-mapped for reads
+  keys.bin      32-byte sha256 digests, row i of vectors.f32 ↔ key i
+  .lock         writer lock (flock / msvcrt), shared with other workers
+
+Appends take the lock, write vectors first and keys second. A row therefore
+becomes visible to other workers (which tail keys.bin by size) only after its
+vector is on disk. A crash between the two writes leaves a trailing orphan
+vector (or a torn key), which the next writer truncates. Readers never take
+the lock.
+
+The store is never rewritten in place; deleting a model directory is the only
+eviction.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .bm25_store import _lock_file, _unlock_file
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+EMBED_STORE_ENABLED = os.getenv("GLIH_EMBED_STORE", "1").lower() in ("1", "true", "yes")
+
+_KEY_BYTES = 32
+# Namespace for deterministic chunk / document ids (uuid5)
+_ID_NAMESPACE = uuid.UUID("6f1c1f0e-4a53-5d0b-9c8e-0b6c6c1d2a11")
+
+
+def content_key(provider: str, model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{provider}\x1f{model}\x1f{text}".encode("utf-8")).digest()
+
+
+def document_id(source: str, text: str) -> str:
+    """Stable id for an ingested document: same source + same extracted text → same id."""
+    return str(uuid.uuid5(_ID_NAMESPACE, f"doc\x1f{source}\x1f{hashlib.sha256(text.encode('utf-8')).hexdigest()}"))
+
+
+def chunk_ids(texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> List[str]:
+    """
+    Deterministic vector-store ids: uuid5 over chunk text + metadata. Re-ingesting
+    the same chunks yields the same ids, so the write is idempotent. The id does
+    not depend on the embedding model: a re-embedded chunk overwrites its old
+    vector instead of sitting next to it.
+    """
+    metas = metadatas or [{}] * len(texts)
+    return [
+        str(uuid.uuid5(_ID_NAMESPACE, f"chunk\x1f{json.dumps(m or {}, sort_keys=True, default=str)}\x1f{t}"))
+        for t, m in zip(texts, metas)
+    ]
+
+
+# Chunk metadata key recording which embedding model produced the stored vector
+EMBEDDING_MODEL_KEY = "embedding_model"
+# Tag for vectors from the fallback embedder (no provider configured)
+PLACEHOLDER_MODEL = "placeholder"
+
+
+def embedding_tag(provider: Any) -> str:
+    """
+    "provider/model" of an embeddings provider, or PLACEHOLDER_MODEL when its
+    embed() would return placeholder vectors. Ingest stores it with each chunk
+    and treats a chunk as present only when the tag still matches.
+    """
+    if not getattr(provider, "available", True):
+        return PLACEHOLDER_MODEL
+    return f"{provider.provider}/{provider.model or ''}"
+
+
+def select_chunks(ids: List[str], stored: Dict[str, Dict[str, Any]], tag: str) -> Tuple[List[int], int]:
+    """
+    Positions of `ids` to (re-)embed and upsert, first occurrence only, and how
+    many of them are already stored under another embedding tag. `stored` maps
+    the ids the collection holds to their metadata.
+    """
+    keep: List[int] = []
+    seen: set = set()
+    stale = 0
+    for i, cid in enumerate(ids):
+        if cid in seen:
+            continue
+        if cid in stored:
+            if (stored[cid] or {}).get(EMBEDDING_MODEL_KEY) == tag:
+                continue
+            stale += 1
+        seen.add(cid)
+        keep.append(i)
+    return keep, stale
+
+
+class _ModelVectors:
+    """keys.bin + vectors.f32 for one provider/model."""
+
+    def __init__(self, path: str, provider: str, model: str) -> None:
+        self.path = path
+        self.provider = provider
+        self.model = model
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._keys_read = 0  # bytes of keys.bin already indexed
+        self._mm: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        meta = self._read_meta()
+        if meta:
+            self.dim = int(meta["dim"])
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _writer(self) -> Iterator[None]:
+        with open(self._file(".lock"), "a+b") as fh:
+            _lock_file(fh)
+            try:
+                yield
+            finally:
+                _unlock_file(fh)
+
+    def _refresh(self) -> None:
+        """Index keys appended since the last look (by this or another worker)."""
+        try:
+            size = os.path.getsize(self._file("keys.bin"))
+        except OSError:
+            return
+        size -= size % _KEY_BYTES
+        if size <= self._keys_read:
+            return
+        if self.dim is None:
+            meta = self._read_meta()
+            if not meta:
+                return
+            self.dim = int(meta["dim"])
+        with open(self._file("keys.bin"), "rb") as fh:
+            fh.seek(self._keys_read)
+            blob = fh.read(size - self._keys_read)
+        row = self._keys_read // _KEY_BYTES
+        for off in range(0, len(blob), _KEY_BYTES):
+            self._rows.setdefault(blob[off:off + _KEY_BYTES], row)
+            row += 1
+        self._keys_read = size
+        self._mm = None  # remap to cover the new rows
+
+    def _vectors(self) -> np.ndarray:
+        if self._mm is None:
+            rows = self._keys_read // _KEY_BYTES
+            self._mm = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, self.dim or 0))
+        return self._mm
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            found = [(k, self._rows[k]) for k in keys if k in self._rows]
+            if not found:
+                return {}
+            mat = self._vectors()[[row for _, row in found]]
+        return {k: vec.tolist() for (k, _), vec in zip(found, mat)}
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]) -> int:
+        arr = np.asarray(vectors, dtype=np.float32)
+        if arr.ndim != 2 or arr.shape[0] != len(keys):
+            raise ValueError(f"expected {len(keys)} vectors, got shape {arr.shape}")
+        with self._lock, self._writer():
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(arr.shape[1])
+                tmp = self._file(f"meta.json.{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump({"provider": self.provider, "model": self.model, "dim": self.dim}, fh)
+                os.replace(tmp, self._file("meta.json"))
+            if arr.shape[1] != self.dim:
+                raise ValueError(f"dimension {arr.shape[1]} does not match stored dimension {self.dim}")
+            fresh: Dict[bytes, int] = {}
+            for i, k in enumerate(keys):
+                if k not in self._rows and k not in fresh:
+                    fresh[k] = i
+            if not fresh:
+                return 0
+            rows = self._keys_read // _KEY_BYTES
+            vec_path = self._file("vectors.f32")
+            with open(vec_path, "ab") as fh:
+                # Drop orphan vectors from a writer that died before appending its keys
+                fh.truncate(rows * self.dim * 4)
+                fh.write(np.ascontiguousarray(arr[list(fresh.values())]).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+            with open(self._file("keys.bin"), "ab") as fh:
+                fh.truncate(rows * _KEY_BYTES)  # and a torn key write
+                fh.write(b"".join(fresh.keys()))
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._refresh()
+            return len(fresh)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._keys_read // _KEY_BYTES
+
+
+class EmbeddingStore:
+    """Content-addressed, memory-mapped float32 embedding store shared by workers."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._models: Dict[Tuple[str, str], _ModelVectors] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, root: str) -> Optional["EmbeddingStore"]:
+        if not EMBED_STORE_ENABLED:
+            return None
+        return cls(root)
+
+    def _model(self, provider: str, model: str) -> _ModelVectors:
+        key = (provider, model)
+        with self._lock:
+            mv = self._models.get(key)
+            if mv is None:
+                slug = hashlib.sha256(f"{provider}\x1f{model}".encode("utf-8")).hexdigest()[:16]
+                mv = self._models[key] = _ModelVectors(os.path.join(self.root, f"{provider}-{slug}"), provider, model)
+            return mv
+
+    def embed(self, provider: Any, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """
+        (vectors in input order, number served from the store). `provider` is
+        anything with .provider, .model and .embed. Only unseen texts reach it,
+        deduplicated, in one call.
+        """
+        if not texts:
+            return [], 0
+        mv = self._model(provider.provider, str(provider.model or ""))
+        keys = [content_key(mv.provider, mv.model, t) for t in texts]
+        try:
+            found = mv.get_many(list(dict.fromkeys(keys)))
+        except Exception as e:
+            logger.warning(f"Embedding store read failed, embedding everything: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            found = {}
+        missing: Dict[bytes, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found:
+                missing.setdefault(k, t)
+        if missing:
+            vecs = provider.embed(list(missing.values()))
+            for k, v in zip(missing, vecs):
+                found[k] = v
+            try:
+                stored = mv.put_many(list(missing), vecs)
+            except Exception as e:
+                logger.warning(f"Embedding store write failed: {e}")
+                stored = 0
+                with self._lock:
+                    self._stats["errors"] += 1
+        else:
+            stored = 0
+        with self._lock:
+            self._stats["hits"] += len(found) - len(missing)
+            self._stats["misses"] += len(missing)
+            self._stats["stored"] += stored
+        return [found[k] for k in keys], sum(1 for k in keys if k not in missing)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            models = list(self._models.values())
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        out["root"] = self.root
+        out["models"] = {f"{mv.provider}/{mv.model}": {"vectors": len(mv), "dim": mv.dim} for mv in models}
+        return out
@@ -0,0 +1,144 @@
+"""
+GLIH Platform — Federated Retrieval
+===================================
+One question, several collections, one ranked list. /query, /query/stream,
+/query/batch and the agent runs (`collections`) fan the hybrid search out to
+every collection concurrently and fuse the per-collection rankings here.
+
+  - Each collection is searched with the usual hybrid retrieval (vector +
+    BM25, RRF) and gets its own deadline (GLIH_FEDERATED_TIMEOUT_MS). A slow
+    or failing collection is dropped from the fusion (status "timeout" /
+    "error") instead of stalling the query.
+  - Scores from different collections are not comparable (RRF scores depend
+    on list lengths, distances on how dense a collection is), so the fusion
+    is rank based: weighted RRF, sum over collections of
+    weight / (rrf_k + rank). fused_score is that sum normalized to 0..1,
+    where 1 means ranked first in every collection.
+  - collection_score is the hit's own score min-max normalized within its
+    collection. Equal ranks in different collections tie on the fused
+    score; collection_score, then the vector distance, break the tie.
+  - Every result keeps its provenance: collection, collection_rank, and
+    collections (all collections that returned the same chunk id).
+
+Collection spec: "lineage-sops:2,lineage-routes" (or a list of such entries);
+the weight defaults to 1.
+
+Env:
+  GLIH_FEDERATED_TIMEOUT_MS        per-collection deadline (default 3000)
+  GLIH_FEDERATED_MAX_COLLECTIONS   collections per request (default 8)
+  GLIH_FEDERATED_RRF_K             RRF constant for the cross-collection fusion (default 60)
+"""
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+FEDERATED_TIMEOUT_MS = float(os.getenv("GLIH_FEDERATED_TIMEOUT_MS", "3000"))
+FEDERATED_MAX_COLLECTIONS = int(os.getenv("GLIH_FEDERATED_MAX_COLLECTIONS", "8"))
+FEDERATED_RRF_K = int(os.getenv("GLIH_FEDERATED_RRF_K", "60"))
+
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.\-]{0,127}$")
+
+Federation = List[Tuple[str, float]]
+
+
+class CollectionSpecError(ValueError):
+    """Invalid collections spec (bad name or weight, too many collections)."""
+
+
+def parse_collections(spec: Union[str, Sequence[str], None]) -> Optional[Federation]:
+    """
+    "a:2,b" or ["a:2", "b"] → [("a", 2.0), ("b", 1.0)]. None / empty → None.
+    Repeated names keep the first entry.
+    """
+    if not spec:
+        return None
+    entries = spec.split(",") if isinstance(spec, str) else list(spec)
+    out: Dict[str, float] = {}
+    for entry in entries:
+        if not isinstance(entry, str):
+            raise CollectionSpecError(f"collection entry must be a string, got {entry!r}")
+        name, _, weight_text = entry.strip().partition(":")
+        name = name.strip()
+        if not name:
+            continue
+        if not _NAME.match(name):
+            raise CollectionSpecError(f"invalid collection name {name!r}")
+        try:
+            weight = float(weight_text) if weight_text.strip() else 1.0
+        except ValueError:
+            raise CollectionSpecError(f"invalid weight for '{name}': {weight_text!r}")
+        if not 0 < weight < float("inf"):
+            raise CollectionSpecError(f"weight for '{name}' must be a positive number")
+        out.setdefault(name, weight)
+    if not out:
+        return None
+    if len(out) > FEDERATED_MAX_COLLECTIONS:
+        raise CollectionSpecError(f"at most {FEDERATED_MAX_COLLECTIONS} collections per query")
+    return list(out.items())
+
+
+def federation_label(federation: Federation) -> str:
+    """Canonical display / history name: "a,b" (weights only when not 1)."""
+    return ",".join(name if weight == 1 else f"{name}:{weight:g}" for name, weight in federation)
+
+
+def _native_scores(results: List[Dict[str, Any]], rrf_k: int) -> List[float]:
+    """A collection's own relevance scores, higher is better."""
+    scores = []
+    for rank, r in enumerate(results):
+        if r.get("rrf_score") is not None:
+            scores.append(float(r["rrf_score"]))
+        elif r.get("distance") is not None:
+            scores.append(-float(r["distance"]))
+        else:
+            scores.append(1.0 / (rrf_k + rank + 1))
+    return scores
+
+
+def fuse_collections(
+    ranked: Dict[str, List[Dict[str, Any]]],
+    weights: Dict[str, float],
+    k: int,
+    rrf_k: int = FEDERATED_RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    Weighted RRF over per-collection rankings → top `k` with provenance.
+    `weights` covers every collection that was asked, so a dropped collection
+    still counts in the normalization (fused scores stay comparable between
+    a complete and a partial fan-out).
+    """
+    total_weight = sum(weights.values()) or 1.0
+    scale = (rrf_k + 1) / total_weight
+    fused: Dict[str, float] = {}
+    norm: Dict[str, float] = {}
+    best: Dict[str, Dict[str, Any]] = {}
+    seen_in: Dict[str, List[str]] = {}
+
+    for collection, results in ranked.items():
+        weight = weights.get(collection, 1.0)
+        native = _native_scores(results, rrf_k)
+        lo, hi = (min(native), max(native)) if native else (0.0, 0.0)
+        for rank, (r, score) in enumerate(zip(results, native)):
+            rid = r["id"]
+            fused[rid] = fused.get(rid, 0.0) + weight / (rrf_k + rank + 1)
+            within = (score - lo) / (hi - lo) if hi > lo else 1.0
+            seen_in.setdefault(rid, []).append(collection)
+            if rid not in best or within > norm[rid]:
+                norm[rid] = within
+                best[rid] = {**r, "collection": collection, "collection_rank": rank + 1, "collection_score": round(within, 4)}
+
+    def order(rid: str) -> Tuple[float, float, float]:
+        distance = best[rid].get("distance")
+        return (-fused[rid], -norm[rid], distance if distance is not None else float("inf"))
+
+    out = []
+    for rid in sorted(fused, key=order)[:k]:
+        r = best[rid]
+        r["fused_score"] = round(fused[rid] * scale, 4)
+        r["collections"] = seen_in[rid]
+        out.append(r)
+    return out
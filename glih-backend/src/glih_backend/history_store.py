@@ -1,76 +1,722 @@
 """
 GLIH Platform — Conversation & Agent History Store
 ====================================================
-Persists every query, agent run, and notification to a JSON file so
-dispatchers and admins can review past interactions at any time.
-
-Storage layout  (data/glih_history.json):
-{
-  "queries":        [ QueryRecord, ... ],   # RAG query history
-  "agent_runs":     [ AgentRunRecord, ... ],# Agent execution history
-  "notifications":  [ NotificationRecord, ... ] # Notification audit trail
-}
-
-Records are appended and capped at MAX_RECORDS each to prevent unbounded growth.
-Migration to PostgreSQL: replace _load/_save with SQLAlchemy session calls —
-the function signatures stay identical so callers don't change.
+Persists every query, agent run, and notification so dispatchers and
+admins can review past interactions at any time.
+
+Three record kinds are kept:
+  "queries"        QueryRecord        — RAG query history
+  "agent_runs"     AgentRunRecord     — Agent execution history
+  "notifications"  NotificationRecord — Notification audit trail
+
+Backends (selected with GLIH_HISTORY_BACKEND):
+
+  sqlite (default)  data/glih_history.db — append-only, WAL journal so readers
+                    never block the writer and every gunicorn worker can share
+                    the file. Each insert is O(log n) instead of a full rewrite.
+                    Indexed on user_id, agent_name, shipment_id and timestamp;
+                    pages can be fetched by keyset (`before=<cursor>`)
+                    instead of OFFSET scans.
+  json              data/glih_history.json — legacy single-file store. Every
+                    write re-serializes the whole file; records are capped at
+                    MAX_RECORDS each. Kept for local debugging only.
+
+On first start the SQLite backend imports an existing glih_history.json once
+(see migrate_json_to_sqlite). It can also be run by hand:
+
+    python -m glih_backend.history_store migrate [path/to/glih_history.json]
+
+Writes go through a bounded write-behind queue (GLIH_HISTORY_WRITE_BEHIND=1,
+the default): save_* returns immediately and a background thread persists
+records in batches. Records still queued are visible to the get_*_by_id
+lookups. A batch that cannot be written is retried with backoff, then
+spilled to glih_history.spill.jsonl and replayed after the next successful
+write. Call flush_history() when a caller needs read-your-writes, and
+shutdown_history_writer() on exit (wired into the FastAPI shutdown event).
+
+The public function signatures are backend-agnostic so callers don't change.
 """
 from __future__ import annotations
 
+import atexit
 import json
 import logging
+import os
 import pathlib
+import queue
+import sqlite3
 import threading
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
-_DB_PATH = (
-    pathlib.Path(__file__).parent.parent.parent.parent.parent
-    / "data"
-    / "glih_history.json"
-)
+_DATA_DIR = pathlib.Path(__file__).parent.parent.parent.parent.parent / "data"
+
+_DB_PATH = _DATA_DIR / "glih_history.json"
+_SQLITE_PATH = pathlib.Path(os.getenv("GLIH_HISTORY_DB", str(_DATA_DIR / "glih_history.db")))
+
+HISTORY_BACKEND = os.getenv("GLIH_HISTORY_BACKEND", "sqlite").strip().lower()
 
-# Cap each list to prevent unbounded growth. Oldest entries are dropped.
+# Cap each list to prevent unbounded growth (JSON backend only). Oldest entries are dropped.
 MAX_RECORDS = 10_000
 
+# Record kind → field holding the record's unique id
+_ID_FIELDS = {
+    "queries":       "id",
+    "agent_runs":    "run_id",
+    "notifications": "id",
+}
+
 _lock = threading.Lock()
 
 
-# ── Internal helpers ──────────────────────────────────────────────────────────
+def _now() -> str:
+    return datetime.utcnow().isoformat()
 
-def _load() -> Dict[str, List[dict]]:
-    """Load history from disk. Returns empty structure if missing or corrupt."""
-    try:
-        if _DB_PATH.exists():
-            return json.loads(_DB_PATH.read_text(encoding="utf-8"))
-    except Exception as exc:
-        logger.warning(f"Could not load history DB: {exc}")
-    return {"queries": [], "agent_runs": [], "notifications": []}
 
+def _match(record: dict, filters: Dict[str, Any]) -> bool:
+    return all(record.get(k) == v for k, v in filters.items())
 
-def _save(db: Dict[str, List[dict]]) -> None:
-    """Write history to disk atomically."""
-    try:
-        _DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-        _DB_PATH.write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding="utf-8")
-    except Exception as exc:
-        logger.warning(f"Could not save history DB: {exc}")
 
+def _parse_cursor(before: str) -> Tuple[str, Optional[int]]:
+    """
+    Keyset cursor "<timestamp>|<seq>" → (timestamp, seq). A bare timestamp
+    (older clients) gives seq None, meaning "strictly older than timestamp".
+    """
+    ts, sep, seq = before.rpartition("|")
+    if sep and seq.lstrip("-").isdigit():
+        return ts, int(seq)
+    return before, None
+
+
+def _cursor(timestamp: str, seq: int) -> str:
+    return f"{timestamp}|{seq}"
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+
+class _JSONBackend:
+    """Legacy whole-file JSON store. O(history) per write — debugging only."""
+
+    name = "json"
+
+    def __init__(self, path: pathlib.Path = _DB_PATH) -> None:
+        self.path = path
+
+    def _load(self) -> Dict[str, List[dict]]:
+        """Load history from disk. Returns empty structure if missing or corrupt."""
+        try:
+            if self.path.exists():
+                return json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as exc:
+            logger.warning(f"Could not load history DB: {exc}")
+        return {"queries": [], "agent_runs": [], "notifications": []}
+
+    def _save(self, db: Dict[str, List[dict]]) -> None:
+        """Write history to disk. Raises, so the write-behind queue retries or spills the batch."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    def append_batch(self, items: List[Tuple[str, dict]]) -> None:
+        """Append (kind, record) pairs with one load/save and trim to MAX_RECORDS (keeps newest)."""
+        if not items:
+            return
+        with _lock:
+            db = self._load()
+            for kind, record in items:
+                db.setdefault(kind, []).append(record)
+            for kind in {k for k, _ in items}:
+                if len(db[kind]) > MAX_RECORDS:
+                    db[kind] = db[kind][-MAX_RECORDS:]
+            self._save(db)
+
+    def append(self, kind: str, record: dict) -> None:
+        self.append_batch([(kind, record)])
+
+    def list(
+        self,
+        kind: str,
+        filters: Dict[str, Any],
+        limit: int,
+        offset: int,
+        before: Optional[str],
+    ) -> List[dict]:
+        with _lock:
+            db = self._load()
+        # Position in the file is the tie-breaker for equal timestamps
+        rows = [(r.get("timestamp") or "", i, r) for i, r in enumerate(db.get(kind, [])) if _match(r, filters)]
+        if before:
+            ts, seq = _parse_cursor(before)
+            rows = [x for x in rows if x[0] < ts or (seq is not None and x[0] == ts and x[1] < seq)]
+        # Newest first
+        rows.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        return [{**r, "cursor": _cursor(t, i)} for t, i, r in rows[offset: offset + limit]]
+
+    def get(self, kind: str, record_id: str) -> Optional[dict]:
+        with _lock:
+            db = self._load()
+        id_field = _ID_FIELDS[kind]
+        for r in db.get(kind, []):
+            if r.get(id_field) == record_id:
+                return r
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with _lock:
+            db = self._load()
+        agent_breakdown: Dict[str, int] = {}
+        for r in db.get("agent_runs", []):
+            name = r.get("agent_name", "unknown")
+            agent_breakdown[name] = agent_breakdown.get(name, 0) + 1
+        return {
+            "total_queries":       len(db.get("queries", [])),
+            "total_agent_runs":    len(db.get("agent_runs", [])),
+            "total_notifications": len(db.get("notifications", [])),
+            "agent_breakdown":     agent_breakdown,
+        }
+
+
+class _SQLiteBackend:
+    """
+    Append-only SQLite store in WAL mode.
 
-def _now() -> str:
-    return datetime.utcnow().isoformat()
+    Every kind gets its own table with the same layout: an autoincrement `seq`
+    (insertion order / tie-breaker), the record id, the columns we filter on,
+    and the full record as a JSON blob so the record shape never has to be
+    mirrored in the schema.
+    """
 
+    name = "sqlite"
+
+    def __init__(self, path: pathlib.Path = _SQLITE_PATH) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread — sqlite3 connections are not thread-safe."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            if not self._schema_ready:
+                self._init_schema(conn)
+        return conn
+
+    def _init_schema(self, conn: sqlite3.Connection) -> None:
+        with _lock:
+            if self._schema_ready:
+                return
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            for kind in _ID_FIELDS:
+                conn.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {kind} (
+                        seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id          TEXT NOT NULL UNIQUE,
+                        user_id     TEXT,
+                        agent_name  TEXT,
+                        shipment_id TEXT,
+                        timestamp   TEXT NOT NULL,
+                        data        TEXT NOT NULL
+                    )"""
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{kind}_ts ON {kind} (timestamp, seq)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{kind}_user ON {kind} (user_id, timestamp, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_agent_runs_agent ON agent_runs (agent_name, timestamp, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_notifications_shipment ON notifications (shipment_id, timestamp, seq)")
+            self._schema_ready = True
+
+    @staticmethod
+    def _row(kind: str, record: dict) -> tuple:
+        record_id = record.get(_ID_FIELDS[kind]) or str(uuid.uuid4())
+        return (
+            record_id,
+            record.get("user_id"),
+            record.get("agent_name"),
+            record.get("shipment_id"),
+            record.get("timestamp") or _now(),
+            json.dumps(record, ensure_ascii=False, default=str),
+        )
+
+    def append_batch(self, items: List[Tuple[str, dict]]) -> int:
+        """
+        Insert (kind, record) pairs in a single transaction — one fsync per batch.
+        Duplicate ids are ignored. Returns rows inserted.
+        """
+        if not items:
+            return 0
+        by_kind: Dict[str, List[tuple]] = {}
+        for kind, record in items:
+            by_kind.setdefault(kind, []).append(self._row(kind, record))
+        conn = self._conn()
+        inserted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, rows in by_kind.items():
+                cur = conn.executemany(
+                    f"INSERT OR IGNORE INTO {kind} (id, user_id, agent_name, shipment_id, timestamp, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                inserted += cur.rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted
+
+    def append_many(self, kind: str, records: List[dict]) -> int:
+        return self.append_batch([(kind, r) for r in records])
+
+    def append(self, kind: str, record: dict) -> None:
+        try:
+            self.append_batch([(kind, record)])
+        except Exception as exc:
+            logger.warning(f"Could not save history record ({kind}): {exc}")
+
+    def list(
+        self,
+        kind: str,
+        filters: Dict[str, Any],
+        limit: int,
+        offset: int,
+        before: Optional[str],
+    ) -> List[dict]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        for col, val in filters.items():
+            clauses.append(f"{col} = ?")
+            params.append(val)
+        if before:
+            ts, seq = _parse_cursor(before)
+            if seq is None:
+                clauses.append("timestamp < ?")
+                params.append(ts)
+            else:
+                # Same order as ORDER BY, so a page ending inside a run of
+                # equal timestamps resumes within that run
+                clauses.append("(timestamp < ? OR (timestamp = ? AND seq < ?))")
+                params.extend([ts, ts, seq])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT data, timestamp, seq FROM {kind} {where} ORDER BY timestamp DESC, seq DESC LIMIT ? OFFSET ?"
+        params.extend([max(0, int(limit)), max(0, int(offset))])
+        try:
+            rows = self._conn().execute(sql, params).fetchall()
+        except Exception as exc:
+            logger.warning(f"Could not read history ({kind}): {exc}")
+            return []
+        return [{**json.loads(data), "cursor": _cursor(ts, seq)} for data, ts, seq in rows]
+
+    def get(self, kind: str, record_id: str) -> Optional[dict]:
+        try:
+            row = self._conn().execute(f"SELECT data FROM {kind} WHERE id = ?", (record_id,)).fetchone()
+        except Exception as exc:
+            logger.warning(f"Could not read history ({kind}): {exc}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        totals = {
+            kind: conn.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0]
+            for kind in _ID_FIELDS
+        }
+        agent_breakdown = {
+            (name or "unknown"): count
+            for name, count in conn.execute(
+                "SELECT agent_name, COUNT(*) FROM agent_runs GROUP BY agent_name"
+            ).fetchall()
+        }
+        return {
+            "total_queries":       totals["queries"],
+            "total_agent_runs":    totals["agent_runs"],
+            "total_notifications": totals["notifications"],
+            "agent_breakdown":     agent_breakdown,
+        }
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# ── Migration ─────────────────────────────────────────────────────────────────
+
+def migrate_json_to_sqlite(
+    json_path: Optional[pathlib.Path] = None,
+    backend: Optional[_SQLiteBackend] = None,
+) -> Dict[str, int]:
+    """
+    One-shot import of a legacy glih_history.json into the SQLite store.
 
-def _append(db: Dict[str, List[dict]], key: str, record: dict) -> None:
-    """Append a record and trim to MAX_RECORDS (keeps newest)."""
-    db[key].append(record)
-    if len(db[key]) > MAX_RECORDS:
-        db[key] = db[key][-MAX_RECORDS:]
+    Safe to re-run: records are keyed by their id, so duplicates are skipped.
+    The JSON file is left untouched. Returns rows inserted per record kind.
+    """
+    json_path = pathlib.Path(json_path) if json_path else _DB_PATH
+    backend = backend or (_backend if isinstance(_backend, _SQLiteBackend) else _SQLiteBackend())
+    db = _JSONBackend(json_path)._load()
+    inserted: Dict[str, int] = {}
+    for kind in _ID_FIELDS:
+        # JSON lists are oldest-first, so insertion order (seq) stays chronological
+        inserted[kind] = backend.append_many(kind, db.get(kind) or [])
+    backend.set_meta("json_migrated_at", _now())
+    logger.info(f"History migrated from {json_path}: {inserted}")
+    return inserted
+
+
+def _make_backend():
+    if HISTORY_BACKEND == "json":
+        return _JSONBackend()
+    if HISTORY_BACKEND != "sqlite":
+        logger.warning(f"Unknown GLIH_HISTORY_BACKEND '{HISTORY_BACKEND}' — using sqlite")
+    backend = _SQLiteBackend()
+    try:
+        if _DB_PATH.exists() and backend.get_meta("json_migrated_at") is None:
+            migrate_json_to_sqlite(_DB_PATH, backend)
+    except Exception as exc:
+        logger.warning(f"History JSON migration failed: {exc}")
+    return backend
+
+
+_backend = _make_backend()
+
+
+# ── Write-behind queue ────────────────────────────────────────────────────────
+#
+# save_* calls only enqueue the record; a background thread drains the queue
+# and writes each batch in one transaction. Request latency no longer includes
+# a disk write, and N concurrent saves cost one fsync instead of N.
+#
+# Backpressure: when the queue is full the caller waits up to
+# _ENQUEUE_TIMEOUT_S, then writes synchronously — audit records are never
+# dropped. Both events are counted in get_write_queue_stats().
+#
+# Failures: a batch is retried _WRITE_RETRIES times with exponential backoff;
+# if the database is still unavailable the batch is appended to the spill
+# file (JSON lines) and replayed, idempotently (duplicate ids are ignored),
+# after the next batch that writes successfully. Only a batch that can be
+# neither written nor spilled is counted as failed.
+
+WRITE_BEHIND_ENABLED = os.getenv("GLIH_HISTORY_WRITE_BEHIND", "1") not in {"0", "false", "False"}
+_FLUSH_INTERVAL_S    = float(os.getenv("GLIH_HISTORY_FLUSH_INTERVAL_MS", "250")) / 1000.0
+_BATCH_SIZE          = int(os.getenv("GLIH_HISTORY_BATCH_SIZE", "200"))
+_QUEUE_MAX           = int(os.getenv("GLIH_HISTORY_QUEUE_MAX", "10000"))
+_ENQUEUE_TIMEOUT_S   = float(os.getenv("GLIH_HISTORY_ENQUEUE_TIMEOUT_MS", "50")) / 1000.0
+_WRITE_RETRIES       = int(os.getenv("GLIH_HISTORY_WRITE_RETRIES", "3"))
+_SPILL_PATH          = pathlib.Path(os.getenv("GLIH_HISTORY_SPILL", str(_DATA_DIR / "glih_history.spill.jsonl")))
+
+
+class _WriteBehindQueue:
+    """Bounded in-process queue with a single background flusher thread."""
+
+    def __init__(
+        self,
+        backend,
+        max_size: int = _QUEUE_MAX,
+        batch_size: int = _BATCH_SIZE,
+        flush_interval_s: float = _FLUSH_INTERVAL_S,
+        enqueue_timeout_s: float = _ENQUEUE_TIMEOUT_S,
+        retries: int = _WRITE_RETRIES,
+        spill_path: pathlib.Path = _SPILL_PATH,
+    ) -> None:
+        self.backend = backend
+        self.retries = max(0, retries)
+        self.spill_path = pathlib.Path(spill_path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = max(0.001, flush_interval_s)
+        self.enqueue_timeout_s = max(0.0, enqueue_timeout_s)
+        self._q: "queue.Queue[Tuple[str, dict]]" = queue.Queue(maxsize=max(1, max_size))
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # (kind, record id) → record, until it is written (read-your-writes for lookups)
+        self._pending: Dict[Tuple[str, str], dict] = {}
+        # Keys of _pending that were spilled; another worker may replay them
+        self._spilled: set = set()
+        self._pending_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "enqueued":        0,
+            "written":         0,
+            "batches":         0,
+            "retried":         0,   # batch write attempts that were retried
+            "spilled":         0,   # records written to the spill file
+            "replayed":        0,   # spilled records later written to the database
+            "failed":          0,   # records neither written nor spilled
+            "queue_full":      0,   # puts that found the queue full and had to wait
+            "sync_writes":     0,   # puts that gave up waiting and wrote inline
+            "max_depth":       0,
+            "last_batch_size": 0,
+            "last_flush_ms":   None,
+        }
+
+    def _bump(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for key, val in deltas.items():
+                self._stats[key] += val
+
+    def _ensure_started(self) -> None:
+        # Started lazily and re-started after fork so each gunicorn worker owns its flusher.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="glih-history-writer", daemon=True)
+            self._thread.start()
+
+    def pending(self, kind: str, record_id: str) -> Optional[dict]:
+        """A record that is queued (or spilled) but not yet in the database."""
+        with self._pending_lock:
+            return self._pending.get((kind, record_id))
+
+    def _track(self, batch: List[Tuple[str, dict]], add: bool) -> None:
+        with self._pending_lock:
+            for kind, record in batch:
+                key = (kind, record.get(_ID_FIELDS[kind]))
+                if add:
+                    self._pending[key] = record
+                else:
+                    self._pending.pop(key, None)
+                    self._spilled.discard(key)
+
+    def put(self, kind: str, record: dict) -> None:
+        item = (kind, record)
+        self._track([item], add=True)
+        if self._stop.is_set():
+            self._write([item])
+            return
+        self._ensure_started()
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            self._bump(queue_full=1)
+            try:
+                self._q.put(item, timeout=self.enqueue_timeout_s)
+            except queue.Full:
+                self._bump(sync_writes=1)
+                self._write([item])
+                return
+        self._bump(enqueued=1)
+        depth = self._q.qsize()
+        with self._stats_lock:
+            if depth > self._stats["max_depth"]:
+                self._stats["max_depth"] = depth
+
+    def _write(self, batch: List[Tuple[str, dict]]) -> None:
+        start = time.time()
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._bump(retried=1)
+                time.sleep(min(5.0, 0.1 * (2 ** (attempt - 1))))
+            try:
+                self.backend.append_batch(batch)
+                error = None
+                break
+            except Exception as exc:
+                error = exc
+        if error is None:
+            self._bump(written=len(batch), batches=1)
+            self._track(batch, add=False)
+            self._replay_spill()
+        else:
+            logger.warning(f"History batch write failed after {self.retries + 1} attempts ({len(batch)} records): {error}")
+            self._spill(batch)
+        with self._stats_lock:
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_flush_ms"] = round((time.time() - start) * 1000, 2)
+
+    def _spill(self, batch: List[Tuple[str, dict]]) -> None:
+        """Append a batch the database refused to the spill file (kept pending for lookups)."""
+        try:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            lines = "".join(
+                json.dumps({"kind": kind, "record": record}, ensure_ascii=False, default=str) + "\n"
+                for kind, record in batch
+            )
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._pending_lock:
+                self._spilled.update((kind, record.get(_ID_FIELDS[kind])) for kind, record in batch)
+            self._bump(spilled=len(batch))
+            logger.warning(f"History: spilled {len(batch)} records to {self.spill_path}")
+        except Exception as exc:
+            self._bump(failed=len(batch))
+            self._track(batch, add=False)
+            logger.error(f"History: could not spill {len(batch)} records, dropped: {exc}")
+
+    def _replay_spill(self) -> None:
+        """Write spilled records back once the database accepts writes again."""
+        if not self.spill_path.exists():
+            self._forget_replayed()
+            return
+        # Claim the file first so only one worker replays a given spill
+        claimed = self.spill_path.with_name(f"{self.spill_path.name}.{os.getpid()}.replay")
+        try:
+            os.replace(self.spill_path, claimed)
+        except FileNotFoundError:
+            self._forget_replayed()
+            return
+        items: List[Tuple[str, dict]] = []
+        with open(claimed, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    items.append((entry["kind"], entry["record"]))
+                except (ValueError, KeyError):
+                    continue  # torn last line
+        written = 0
+        try:
+            for i in range(0, len(items), self.batch_size):
+                self.backend.append_batch(items[i:i + self.batch_size])
+                written = min(i + self.batch_size, len(items))
+        except Exception as exc:
+            # Still unavailable: put the records not written yet back for the next attempt
+            logger.warning(f"History: spill replay failed after {written} of {len(items)} records, will retry: {exc}")
+            with open(self.spill_path, "a", encoding="utf-8") as dst:
+                dst.write("".join(
+                    json.dumps({"kind": kind, "record": record}, ensure_ascii=False, default=str) + "\n"
+                    for kind, record in items[written:]
+                ))
+        claimed.unlink(missing_ok=True)
+        self._track(items[:written], add=False)
+        if written:
+            self._bump(replayed=written)
+            logger.info(f"History: replayed {written} spilled records")
+
+    def _forget_replayed(self) -> None:
+        """Stop serving spilled records from memory once they are in the database (another worker replayed them)."""
+        with self._pending_lock:
+            keys = list(self._spilled)
+        if not keys:
+            return
+        stored = [key for key in keys if self.backend.get(*key) is not None]
+        with self._pending_lock:
+            for key in stored:
+                self._pending.pop(key, None)
+                self._spilled.discard(key)
+
+    def _drain(self, first: Tuple[str, dict]) -> List[Tuple[str, dict]]:
+        """Collect up to batch_size items, waiting at most flush_interval_s after the first."""
+        batch = [first]
+        deadline = time.time() + self.flush_interval_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0 or self._stop.is_set():
+                    batch.append(self._q.get_nowait())
+                else:
+                    batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._q.empty()):
+            try:
+                first = self._q.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                continue
+            batch = self._drain(first)
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._q.task_done()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything enqueued so far is written. Returns False on timeout."""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            # No live flusher in this process — drain inline.
+            while True:
+                try:
+                    first = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                batch = self._drain(first)
+                self._write(batch)
+                for _ in batch:
+                    self._q.task_done()
+            return True
+        deadline = time.time() + timeout
+        while self._q.unfinished_tasks:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """Flush and stop the flusher thread. Later puts are written synchronously."""
+        ok = self.flush(timeout)
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=max(0.1, self.flush_interval_s * 2))
+        return ok
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out.update({
+            "enabled":           True,
+            "queue_depth":       self._q.qsize(),
+            "capacity":          self._q.maxsize,
+            "batch_size":        self.batch_size,
+            "flush_interval_ms": int(self.flush_interval_s * 1000),
+            "avg_batch_size":    round(out["written"] / out["batches"], 2) if out["batches"] else 0.0,
+        })
+        return out
+
+
+_writer: Optional[_WriteBehindQueue] = _WriteBehindQueue(_backend) if WRITE_BEHIND_ENABLED else None
+
+
+def _persist(kind: str, record: dict) -> None:
+    if _writer is not None:
+        _writer.put(kind, record)
+    else:
+        _backend.append(kind, record)
+
+
+def _pending_record(kind: str, record_id: str) -> Optional[dict]:
+    return _writer.pending(kind, record_id) if _writer is not None else None
+
+
+def flush_history(timeout: float = 10.0) -> bool:
+    """Wait until all queued history records are durable. Returns False on timeout."""
+    return _writer.flush(timeout) if _writer is not None else True
+
+
+def shutdown_history_writer(timeout: float = 10.0) -> bool:
+    """Flush pending records and stop the background writer (FastAPI shutdown hook)."""
+    return _writer.close(timeout) if _writer is not None else True
+
+
+def get_write_queue_stats() -> Dict[str, Any]:
+    """Write-behind queue metrics: depth, throughput and backpressure counters."""
+    if _writer is None:
+        return {"enabled": False, "backend": _backend.name}
+    return {"backend": _backend.name, **_writer.stats()}
+
+
+# Safety net for scripts and workers that exit without the FastAPI shutdown event.
+atexit.register(shutdown_history_writer, 5.0)
 
 
 # ── Query history ─────────────────────────────────────────────────────────────
@@ -115,10 +761,7 @@ def save_query(
         "duration_ms": duration_ms,
         "timestamp":   _now(),
     }
-    with _lock:
-        db = _load()
-        _append(db, "queries", record)
-        _save(db)
+    _persist("queries", record)
     logger.debug(f"Query saved: id={record_id} user={user_email}")
     return record_id
 
@@ -127,6 +770,7 @@ def get_queries(
     user_id: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
 ) -> List[dict]:
     """
     Retrieve query history.
@@ -135,25 +779,17 @@ def get_queries(
         user_id: Filter to a specific user. None = all users (admin view).
         limit:   Max records to return (newest first).
         offset:  Skip this many records (for pagination).
+        before:  Keyset cursor — only records older than it. Pass the `cursor`
+                 of the last record of the previous page ("<timestamp>|<seq>";
+                 a bare timestamp means timestamp < before).
     """
-    with _lock:
-        db = _load()
-    records = db["queries"]
-    if user_id:
-        records = [r for r in records if r.get("user_id") == user_id]
-    # Newest first
-    records = list(reversed(records))
-    return records[offset: offset + limit]
+    filters = {"user_id": user_id} if user_id else {}
+    return _backend.list("queries", filters, limit, offset, before)
 
 
 def get_query_by_id(record_id: str) -> Optional[dict]:
-    """Retrieve a single query record by its ID."""
-    with _lock:
-        db = _load()
-    for r in db["queries"]:
-        if r.get("id") == record_id:
-            return r
-    return None
+    """Retrieve a single query record by its ID (including one not yet written)."""
+    return _pending_record("queries", record_id) or _backend.get("queries", record_id)
 
 
 # ── Agent run history ─────────────────────────────────────────────────────────
@@ -193,10 +829,7 @@ def save_agent_run(
         "error":       error,
         "timestamp":   _now(),
     }
-    with _lock:
-        db = _load()
-        _append(db, "agent_runs", record)
-        _save(db)
+    _persist("agent_runs", record)
     logger.debug(f"Agent run saved: run_id={run_id} agent={agent_name} status={status}")
 
 
@@ -205,6 +838,7 @@ def get_agent_runs(
     agent_name: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
 ) -> List[dict]:
     """
     Retrieve agent run history.
@@ -214,26 +848,19 @@ def get_agent_runs(
         agent_name: Filter to a specific agent (e.g. "AnomalyResponder").
         limit:      Max records to return (newest first).
         offset:     Pagination offset.
+        before:     Keyset cursor (`cursor` of the last record already seen).
     """
-    with _lock:
-        db = _load()
-    records = db["agent_runs"]
+    filters: Dict[str, Any] = {}
     if user_id:
-        records = [r for r in records if r.get("user_id") == user_id]
+        filters["user_id"] = user_id
     if agent_name:
-        records = [r for r in records if r.get("agent_name") == agent_name]
-    records = list(reversed(records))
-    return records[offset: offset + limit]
+        filters["agent_name"] = agent_name
+    return _backend.list("agent_runs", filters, limit, offset, before)
 
 
 def get_agent_run_by_id(run_id: str) -> Optional[dict]:
-    """Retrieve a single agent run by its run_id."""
-    with _lock:
-        db = _load()
-    for r in db["agent_runs"]:
-        if r.get("run_id") == run_id:
-            return r
-    return None
+    """Retrieve a single agent run by its run_id (including one not yet written)."""
+    return _pending_record("agent_runs", run_id) or _backend.get("agent_runs", run_id)
 
 
 # ── Notification audit trail ──────────────────────────────────────────────────
@@ -276,10 +903,7 @@ def save_notification(
         "status":            status,
         "timestamp":         _now(),
     }
-    with _lock:
-        db = _load()
-        _append(db, "notifications", record)
-        _save(db)
+    _persist("notifications", record)
     logger.debug(f"Notification saved: id={record_id} shipment={shipment_id}")
     return record_id
 
@@ -289,6 +913,7 @@ def get_notifications(
     shipment_id: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    before: Optional[str] = None,
 ) -> List[dict]:
     """
     Retrieve notification history.
@@ -298,16 +923,14 @@ def get_notifications(
         shipment_id: Filter by shipment ID.
         limit:       Max records (newest first).
         offset:      Pagination offset.
+        before:      Keyset cursor (`cursor` of the last record already seen).
     """
-    with _lock:
-        db = _load()
-    records = db["notifications"]
+    filters: Dict[str, Any] = {}
     if user_id:
-        records = [r for r in records if r.get("user_id") == user_id]
+        filters["user_id"] = user_id
     if shipment_id:
-        records = [r for r in records if r.get("shipment_id") == shipment_id]
-    records = list(reversed(records))
-    return records[offset: offset + limit]
+        filters["shipment_id"] = shipment_id
+    return _backend.list("notifications", filters, limit, offset, before)
 
 
 # ── Stats ─────────────────────────────────────────────────────────────────────
@@ -329,17 +952,16 @@ def get_history_stats() -> Dict[str, Any]:
       }
     }
     """
-    with _lock:
-        db = _load()
-
-    agent_breakdown: Dict[str, int] = {}
-    for r in db["agent_runs"]:
-        name = r.get("agent_name", "unknown")
-        agent_breakdown[name] = agent_breakdown.get(name, 0) + 1
-
-    return {
-        "total_queries":       len(db["queries"]),
-        "total_agent_runs":    len(db["agent_runs"]),
-        "total_notifications": len(db["notifications"]),
-        "agent_breakdown":     agent_breakdown,
-    }
+    return _backend.stats()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        src = pathlib.Path(sys.argv[2]) if len(sys.argv) > 2 else _DB_PATH
+        target = _backend if isinstance(_backend, _SQLiteBackend) else _SQLiteBackend()
+        print(json.dumps(migrate_json_to_sqlite(src, target), indent=2))
+    else:
+        print("usage: python -m glih_backend.history_store migrate [path/to/glih_history.json]")
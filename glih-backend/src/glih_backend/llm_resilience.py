@@ -0,0 +1,485 @@
+"""
+GLIH Platform — LLM Resilience Layer
+====================================
+Wraps the configured LLM provider and an ordered failover list
+([llm].failover in glih.toml) so that a degraded provider costs a request
+seconds, not the 120 s worker timeout.
+
+Per provider (process-wide, keyed "provider/model"):
+  - Circuit breaker. GLIH_LLM_BREAKER_FAILURES consecutive failures open it,
+    and calls skip the provider. After GLIH_LLM_BREAKER_COOLDOWN_S it goes
+    half-open: exactly one request probes it. Success closes it; failure
+    re-opens it for another cooldown.
+  - Rolling window of successful call latencies (p95 for hedging).
+
+Per request:
+  1. The first provider in the chain whose breaker admits it is called.
+  2. Hedging: if that call has not answered by its p95 latency (once at
+     least GLIH_LLM_HEDGE_MIN_SAMPLES calls have been seen, never earlier
+     than GLIH_LLM_HEDGE_MIN_MS), the next admitted provider is started as
+     well. The first success wins; losers are cancelled (a sync call that
+     is already running in a worker thread finishes in the background).
+  3. Failover: when a call fails and nothing else is in flight, the next
+     admitted provider is called.
+  4. GLIH_LLM_DEADLINE_S bounds the whole request.
+
+Every call returns which provider served it ("provider/model") along with
+that provider's token usage. Providers
+without credentials are left out of the chain; when none has credentials,
+the primary's echo fallback answers, as before.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+_BREAKER_FAILURES = int(os.getenv("GLIH_LLM_BREAKER_FAILURES", "5"))
+_BREAKER_COOLDOWN_S = float(os.getenv("GLIH_LLM_BREAKER_COOLDOWN_S", "30"))
+_HEDGE_ENABLED = os.getenv("GLIH_LLM_HEDGE", "1").lower() in ("1", "true", "yes")
+_HEDGE_MIN_MS = float(os.getenv("GLIH_LLM_HEDGE_MIN_MS", "1500"))
+_HEDGE_MIN_SAMPLES = int(os.getenv("GLIH_LLM_HEDGE_MIN_SAMPLES", "20"))
+_DEADLINE_S = float(os.getenv("GLIH_LLM_DEADLINE_S", "90"))
+_POOL_WORKERS = int(os.getenv("GLIH_LLM_POOL_WORKERS", "32"))
+
+
+class CircuitOpenError(RuntimeError):
+    """No provider in the chain is currently admitting calls."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker plus a latency window for one provider."""
+
+    def __init__(self, name: str, failures: int = _BREAKER_FAILURES, cooldown_s: float = _BREAKER_COOLDOWN_S, window: int = 200) -> None:
+        self.name = name
+        self.failures = max(failures, 1)
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._latencies: deque = deque(maxlen=window)
+        self._counts = {"calls": 0, "ok": 0, "failed": 0, "served": 0, "opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self._state = "half_open"
+                self._probing = False
+            if self._state == "closed" or (self._state == "half_open" and not self._probing):
+                self._probing = self._state == "half_open"
+                self._counts["calls"] += 1
+                return True
+            self._counts["rejected"] += 1
+            return False
+
+    def record(self, ok: bool, latency_ms: Optional[float] = None) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._counts["ok"] += 1
+                self._consecutive = 0
+                if latency_ms is not None:
+                    self._latencies.append(latency_ms)
+                if self._state != "closed":
+                    logger.info(f"LLM circuit {self.name} closed")
+                self._state = "closed"
+                return
+            self._counts["failed"] += 1
+            self._consecutive += 1
+            if self._state == "half_open" or (self._state == "closed" and self._consecutive >= self.failures):
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._counts["opened"] += 1
+                logger.warning(f"LLM circuit {self.name} opened after {self._consecutive} consecutive failures")
+
+    def release(self) -> None:
+        """An admitted call was abandoned (cancelled hedge) before it finished."""
+        with self._lock:
+            self._probing = False
+
+    def served(self) -> None:
+        with self._lock:
+            self._counts["served"] += 1
+
+    def hedge_delay_s(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < _HEDGE_MIN_SAMPLES:
+                return None
+            lat = sorted(self._latencies)
+        p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        return max(p95, _HEDGE_MIN_MS) / 1000.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counts)
+            out["state"] = self._state
+            out["consecutive_failures"] = self._consecutive
+            lat = sorted(self._latencies)
+        out["p50_ms"] = round(lat[len(lat) // 2], 1) if lat else None
+        out["p95_ms"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1) if lat else None
+        return out
+
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "short_circuited": 0, "deadline_exceeded": 0}
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_pid: Optional[int] = None
+
+
+def _label(p: Any) -> str:
+    return f"{p.provider}/{p.model or ''}"
+
+
+def _breaker(p: Any) -> CircuitBreaker:
+    name = _label(p)
+    with _lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = CircuitBreaker(name)
+        return b
+
+
+def _served(p: Any, out: Tuple[str, Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    text, usage = out
+    return text, dict(usage, served_by=_label(p))
+
+
+def _count(field: str, n: int = 1) -> None:
+    with _lock:
+        _stats[field] += n
+
+
+def _call_pool() -> ThreadPoolExecutor:
+    """Executor for sync calls that may be hedged; recreated after a fork."""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=max(_POOL_WORKERS, 2), thread_name_prefix="glih-llm")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def get_llm_resilience_stats() -> Dict[str, Any]:
+    with _lock:
+        out: Dict[str, Any] = dict(_stats)
+        breakers = list(_breakers.values())
+    out["providers"] = {b.name: b.snapshot() for b in breakers}
+    out["hedging"] = _HEDGE_ENABLED
+    out["deadline_s"] = _DEADLINE_S
+    return out
+
+
+def _attempt(p: Any, prompt: str) -> Tuple[str, Dict[str, Any]]:
+    b = _breaker(p)
+    t0 = time.monotonic()
+    try:
+        out = p.generate_ex(prompt)
+    except Exception as e:
+        b.record(False)
+        logger.warning(f"LLM {b.name} failed: {e}")
+        raise
+    b.record(True, (time.monotonic() - t0) * 1000)
+    return out
+
+
+async def _aattempt(p: Any, prompt: str) -> Tuple[str, Dict[str, Any]]:
+    b = _breaker(p)
+    t0 = time.monotonic()
+    try:
+        out = await p.agenerate_ex(prompt)
+    except asyncio.CancelledError:
+        b.release()
+        raise
+    except Exception as e:
+        b.record(False)
+        logger.warning(f"LLM {b.name} failed: {e}")
+        raise
+    b.record(True, (time.monotonic() - t0) * 1000)
+    return out
+
+
+class _CommittedStream:
+    """
+    Rest of a stream after its first delta. Records the provider's outcome
+    exactly once: success at the end, failure on an error, and a release of
+    the breaker admission when the caller closes or drops it part-way (client
+    disconnect), so a half-open probe is never left in flight. A plain
+    generator cannot do this if it is dropped before its first next().
+    """
+
+    def __init__(self, b: CircuitBreaker, head: Optional[str], it: Iterator[str]) -> None:
+        self._b = b
+        self._head = head
+        self._it = it
+        self._done = False
+
+    def __iter__(self) -> "_CommittedStream":
+        return self
+
+    def __next__(self) -> str:
+        if self._done:
+            raise StopIteration
+        if self._head is not None:
+            head, self._head = self._head, None
+            return head
+        try:
+            return next(self._it)
+        except StopIteration:
+            self._done = True
+            self._b.record(True)
+            raise
+        except Exception:
+            self._done = True
+            self._b.record(False)
+            raise
+
+    def close(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._b.release()
+        close = getattr(self._it, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ResilientLLM:
+    """
+    LLMProvider-compatible front for a primary provider and its failover list.
+    provider / model (and any other attribute) are the primary's.
+    """
+
+    def __init__(self, providers: List[Any]) -> None:
+        if not providers:
+            raise ValueError("ResilientLLM needs at least one provider")
+        self.providers = providers
+        self.primary = providers[0]
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ("primary", "providers"):
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    @property
+    def available(self) -> bool:
+        return any(p.available for p in self.providers)
+
+    def _chain(self) -> List[Any]:
+        return [p for p in self.providers if p.available]
+
+    # ── Sync ──────────────────────────────────────────────────────────────────
+
+    def generate(self, prompt: str) -> str:
+        return self.generate_served(prompt)[0]
+
+    def generate_served(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        (answer, call info): the provider's token usage (prompt, completion,
+        cached tokens) plus served_by, the "provider/model" that answered.
+        """
+        chain = self._chain()
+        _count("requests")
+        if not chain:
+            return _served(self.primary, self.primary.generate_ex(prompt))
+        deadline = time.monotonic() + _DEADLINE_S
+        candidates = iter(chain)
+        pending: Dict[Future, Any] = {}
+        first: Optional[Any] = None
+        started = time.monotonic()
+        hedged = False
+        last_err: Optional[BaseException] = None
+
+        def launch() -> bool:
+            nonlocal first
+            for p in candidates:
+                if _breaker(p).allow():
+                    pending[_call_pool().submit(_attempt, p, prompt)] = p
+                    first = first or p
+                    return True
+            return False
+
+        # Even a single-provider chain runs on the pool, so the deadline applies
+        if not launch():
+            _count("short_circuited")
+            raise CircuitOpenError(f"llm_unavailable: circuit open for {', '.join(_label(p) for p in chain)}")
+        try:
+            while pending:
+                now = time.monotonic()
+                timeout = deadline - now
+                if timeout <= 0:
+                    break
+                hedge_at = None
+                if _HEDGE_ENABLED and not hedged and len(pending) == 1 and len(chain) > 1:
+                    delay = _breaker(first).hedge_delay_s()
+                    if delay is not None:
+                        hedge_at = started + delay
+                        timeout = min(timeout, max(hedge_at - now, 0.0))
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedged = True
+                        if launch():
+                            _count("hedges")
+                    continue
+                for fut in done:
+                    p = pending.pop(fut)
+                    try:
+                        out = fut.result()
+                    except Exception as e:
+                        last_err = e
+                        continue
+                    if p is not first:
+                        _count("hedge_wins" if hedged else "failovers")
+                    _breaker(p).served()
+                    return _served(p, out)
+                if not pending and not launch():
+                    break
+        finally:
+            # Losing hedges and calls still running at the deadline. A call that
+            # has not started yet is dropped and its breaker admission released;
+            # one already running in a worker thread cannot be interrupted and
+            # records its own outcome when it returns.
+            for fut, p in pending.items():
+                if fut.cancel():
+                    _breaker(p).release()
+        if pending:
+            _count("deadline_exceeded")
+            raise TimeoutError(f"llm_timeout: no provider answered within {_DEADLINE_S:.0f}s")
+        if last_err is None:
+            _count("short_circuited")
+            raise CircuitOpenError("llm_unavailable: every remaining provider circuit is open")
+        raise last_err
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        return self.generate_stream_served(prompt)[1]
+
+    def generate_stream_served(self, prompt: str) -> Tuple[str, Iterator[str]]:
+        """
+        ("provider/model", text deltas). Providers are tried in order until one
+        produces its first delta; after that the stream is committed to it.
+        """
+        chain = self._chain()
+        _count("requests")
+        if not chain:
+            return _label(self.primary), self.primary.generate_stream(prompt)
+        last_err: Optional[BaseException] = None
+        for i, p in enumerate(chain):
+            b = _breaker(p)
+            if not b.allow():
+                continue
+            it = p.generate_stream(prompt)
+            try:
+                head = next(it, None)
+            except Exception as e:
+                b.record(False)
+                logger.warning(f"LLM {b.name} stream failed: {e}")
+                last_err = e
+                continue
+            if i:
+                _count("failovers")
+            b.served()
+            return _label(p), self._tail(b, head, it)
+        if last_err is None:
+            _count("short_circuited")
+            raise CircuitOpenError(f"llm_unavailable: circuit open for {', '.join(_label(p) for p in chain)}")
+        raise last_err
+
+    @staticmethod
+    def _tail(b: CircuitBreaker, head: Optional[str], it: Iterator[str]) -> Iterator[str]:
+        return _CommittedStream(b, head, it)
+
+    # ── Async ─────────────────────────────────────────────────────────────────
+
+    async def agenerate(self, prompt: str) -> str:
+        return (await self.agenerate_served(prompt))[0]
+
+    async def agenerate_served(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """generate_served() on the event loop; losing hedges are cancelled."""
+        chain = self._chain()
+        _count("requests")
+        if not chain:
+            return _served(self.primary, await self.primary.agenerate_ex(prompt))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _DEADLINE_S
+        candidates = iter(chain)
+        pending: Dict[asyncio.Task, Any] = {}
+        first: Optional[Any] = None
+        started = loop.time()
+        hedged = False
+        last_err: Optional[BaseException] = None
+
+        def launch() -> bool:
+            nonlocal first
+            for p in candidates:
+                if _breaker(p).allow():
+                    pending[loop.create_task(_aattempt(p, prompt))] = p
+                    first = first or p
+                    return True
+            return False
+
+        if not launch():
+            _count("short_circuited")
+            raise CircuitOpenError(f"llm_unavailable: circuit open for {', '.join(_label(p) for p in chain)}")
+        try:
+            while pending:
+                now = loop.time()
+                timeout = deadline - now
+                if timeout <= 0:
+                    break
+                hedge_at = None
+                if _HEDGE_ENABLED and not hedged and len(pending) == 1 and len(chain) > 1:
+                    delay = _breaker(first).hedge_delay_s()
+                    if delay is not None:
+                        hedge_at = started + delay
+                        timeout = min(timeout, max(hedge_at - now, 0.0))
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and loop.time() >= hedge_at:
+                        hedged = True
+                        if launch():
+                            _count("hedges")
+                    continue
+                for task in done:
+                    p = pending.pop(task)
+                    if task.exception() is not None:
+                        last_err = task.exception()
+                        continue
+                    if p is not first:
+                        _count("hedge_wins" if hedged else "failovers")
+                    _breaker(p).served()
+                    return _served(p, task.result())
+                if not pending and not launch():
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        if pending:
+            _count("deadline_exceeded")
+            raise TimeoutError(f"llm_timeout: no provider answered within {_DEADLINE_S:.0f}s")
+        if last_err is None:
+            _count("short_circuited")
+            raise CircuitOpenError("llm_unavailable: every remaining provider circuit is open")
+        raise last_err
@@ -0,0 +1,391 @@
+"""
+GLIH Platform — Local CPU Embeddings
+====================================
+In-process embedding engine behind the `local` EmbeddingsProvider. It runs a
+small sentence-transformers model (all-MiniLM-L6-v2 by default) on the CPU,
+so ingest and query make no network round trip, and retrieval can be
+benchmarked end to end on an air-gapped host.
+
+Backends (GLIH_LOCAL_EMBED_BACKEND):
+  onnx                   onnxruntime + tokenizers. The model is either a local
+                         directory (tokenizer.json + model.onnx or onnx/model.onnx)
+                         or a Hub id, which is fetched once into the HF cache.
+  sentence-transformers  torch via the sentence-transformers package.
+  auto (default)         onnx when onnxruntime and tokenizers import, else
+                         sentence-transformers.
+
+GLIH_LOCAL_EMBED_QUANTIZED=1 picks an int8 model. ONNX looks for a shipped
+quantized file (model_quantized.onnx, onnx/model_qint8_*.onnx, ...) and
+otherwise quantizes model.onnx once with onnxruntime.quantization. torch
+applies dynamic int8 quantization to the Linear layers.
+
+Dynamic batching: calls smaller than one batch (query traffic) go to a
+collector thread. It waits up to GLIH_LOCAL_EMBED_MAX_WAIT_MS to merge
+concurrent requests into one forward pass of up to GLIH_LOCAL_EMBED_BATCH
+texts. Larger calls (ingest) are sorted by length, so padding stays short,
+and split into full batches. Forward passes run on a thread pool sized to
+the cores: GLIH_LOCAL_EMBED_WORKERS passes in parallel, each using
+cores / workers intra-op threads.
+
+Vectors are pooled (mean or CLS, per the model's 1_Pooling config) and, when
+the model declares a Normalize module, L2-normalized, like
+SentenceTransformer.encode.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+LOCAL_EMBED_MODEL = os.getenv("GLIH_LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBED_BACKEND = os.getenv("GLIH_LOCAL_EMBED_BACKEND", "auto").lower()
+LOCAL_EMBED_QUANTIZED = os.getenv("GLIH_LOCAL_EMBED_QUANTIZED", "0").lower() in ("1", "true", "yes")
+LOCAL_EMBED_ONNX_FILE = os.getenv("GLIH_LOCAL_EMBED_ONNX_FILE", "")
+LOCAL_EMBED_BATCH = int(os.getenv("GLIH_LOCAL_EMBED_BATCH", "32"))
+LOCAL_EMBED_MAX_WAIT_MS = float(os.getenv("GLIH_LOCAL_EMBED_MAX_WAIT_MS", "5"))
+LOCAL_EMBED_MAX_TOKENS = int(os.getenv("GLIH_LOCAL_EMBED_MAX_TOKENS", "256"))
+_CORES = os.cpu_count() or 1
+LOCAL_EMBED_WORKERS = int(os.getenv("GLIH_LOCAL_EMBED_WORKERS", str(max(1, _CORES // 2))))
+
+_ONNX_FILES = ["model.onnx", "onnx/model.onnx"]
+_ONNX_QUANTIZED_FILES = [
+    "model_quantized.onnx",
+    "onnx/model_quantized.onnx",
+    "onnx/model_qint8_avx512_vnni.onnx",
+    "onnx/model_qint8_avx512.onnx",
+    "onnx/model_quint8_avx2.onnx",
+    "onnx/model_qint8_arm64.onnx",
+]
+
+
+# ── Encoders ──────────────────────────────────────────────────────────────────
+
+def _read_json(path: str) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _resolve_model_dir(model: str, onnx_candidates: List[str]) -> str:
+    """Local directory as-is; a Hub id is downloaded (tokenizer, configs, ONNX weights) once."""
+    if os.path.isdir(model):
+        return model
+    try:
+        from huggingface_hub import snapshot_download  # type: ignore
+    except Exception as e:
+        raise RuntimeError(f"'{model}' is not a local directory and huggingface_hub is not installed: {e}")
+    return snapshot_download(
+        repo_id=model,
+        allow_patterns=["*.json", "*.txt", "1_Pooling/*"] + onnx_candidates,
+    )
+
+
+class _OnnxEncoder:
+    """tokenizers + onnxruntime; one InferenceSession shared by all workers."""
+
+    name = "onnx"
+
+    def __init__(self, model: str, quantized: bool, intra_threads: int, max_tokens: int) -> None:
+        import onnxruntime as ort  # type: ignore
+        from tokenizers import Tokenizer  # type: ignore
+
+        if LOCAL_EMBED_ONNX_FILE:
+            candidates = [LOCAL_EMBED_ONNX_FILE]
+        else:
+            candidates = (_ONNX_QUANTIZED_FILES if quantized else []) + _ONNX_FILES
+        model_dir = _resolve_model_dir(model, candidates)
+        path = next((os.path.join(model_dir, c) for c in candidates if os.path.isfile(os.path.join(model_dir, c))), None)
+        if path is None:
+            raise RuntimeError(f"no ONNX model in {model_dir} (looked for {', '.join(candidates)})")
+        if quantized and not LOCAL_EMBED_ONNX_FILE and os.path.basename(path) == "model.onnx":
+            path = self._quantize(path)
+        self.model_path = path
+        self.quantized = os.path.basename(path) != "model.onnx"
+
+        st_cfg = _read_json(os.path.join(model_dir, "sentence_bert_config.json")) or {}
+        self.max_tokens = int(st_cfg.get("max_seq_length") or max_tokens)
+        pooling = _read_json(os.path.join(model_dir, "1_Pooling", "config.json")) or {}
+        self.cls_pooling = bool(pooling.get("pooling_mode_cls_token"))
+        modules = _read_json(os.path.join(model_dir, "modules.json")) or []
+        # Without a modules.json we cannot tell; MiniLM-style models normalize
+        self.normalize = not modules or any("Normalize" in str(m.get("type", "")) for m in modules)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_tokens)
+        pad_token = "[PAD]" if self.tokenizer.token_to_id("[PAD]") is not None else "<pad>"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = max(1, intra_threads)
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _quantize(path: str) -> str:
+        """int8 dynamic quantization of model.onnx, cached next to it."""
+        out = os.path.join(os.path.dirname(path), "model_quantized.onnx")
+        if os.path.isfile(out):
+            return out
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+            tmp = f"{out}.{os.getpid()}.tmp"
+            quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+            os.replace(tmp, out)
+            logger.info(f"Local embeddings: quantized {path} -> {out}")
+            return out
+        except Exception as e:
+            logger.warning(f"Local embeddings: int8 quantization unavailable, using fp32 model: {e}")
+            return path
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encs = self.tokenizer.encode_batch(texts)
+        ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.asarray([e.type_ids for e in encs], dtype=np.int64)
+        hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+        if hidden.ndim == 2:  # model already pooled
+            vecs = hidden
+        elif self.cls_pooling:
+            vecs = hidden[:, 0]
+        else:
+            m = mask[:, :, None].astype(hidden.dtype)
+            vecs = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+        vecs = vecs.astype(np.float32, copy=False)
+        if self.normalize:
+            vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs
+
+
+class _TorchEncoder:
+    """sentence-transformers on CPU, optionally with dynamic int8 Linear layers."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model: str, quantized: bool, intra_threads: int, max_tokens: int) -> None:
+        import torch  # type: ignore
+        from sentence_transformers import SentenceTransformer  # type: ignore
+
+        torch.set_num_threads(max(1, intra_threads))
+        st = SentenceTransformer(model, device="cpu")
+        if max_tokens and (st.max_seq_length or 0) > max_tokens:
+            st.max_seq_length = max_tokens
+        if quantized:
+            st = torch.quantization.quantize_dynamic(st, {torch.nn.Linear}, dtype=torch.qint8)
+        st.eval()
+        self.model = st
+        self.model_path = model
+        self.quantized = quantized
+        self._torch = torch
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        with self._torch.inference_mode():
+            vecs = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+def _load_encoder(model: str, backend: str, quantized: bool, intra_threads: int, max_tokens: int):
+    if backend not in ("auto", "onnx", "sentence-transformers"):
+        raise RuntimeError(f"unknown GLIH_LOCAL_EMBED_BACKEND '{backend}'")
+    if backend in ("auto", "onnx"):
+        try:
+            return _OnnxEncoder(model, quantized, intra_threads, max_tokens)
+        except ImportError as e:
+            if backend == "onnx":
+                raise RuntimeError(f"onnx backend needs onnxruntime and tokenizers: {e}")
+            logger.info(f"Local embeddings: onnx backend unavailable ({e}), trying sentence-transformers")
+    try:
+        return _TorchEncoder(model, quantized, intra_threads, max_tokens)
+    except ImportError as e:
+        raise RuntimeError(
+            f"no local embedding backend available (pip install 'glih-backend[local]' or sentence-transformers): {e}"
+        )
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+
+class LocalEmbedder:
+    """Lazily loaded encoder + dynamic batcher + CPU worker pool."""
+
+    def __init__(
+        self,
+        model: str = LOCAL_EMBED_MODEL,
+        backend: str = LOCAL_EMBED_BACKEND,
+        quantized: bool = LOCAL_EMBED_QUANTIZED,
+        batch_size: int = LOCAL_EMBED_BATCH,
+        max_wait_ms: float = LOCAL_EMBED_MAX_WAIT_MS,
+        workers: int = LOCAL_EMBED_WORKERS,
+        max_tokens: int = LOCAL_EMBED_MAX_TOKENS,
+    ) -> None:
+        self.model = model
+        self.backend = backend
+        self.quantized = quantized
+        self.batch_size = max(1, batch_size)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.workers = max(1, workers)
+        self.max_tokens = max_tokens
+        self._encoder = None
+        self._load_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="glih-local-embed")
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._collector: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._latency: "deque[float]" = deque(maxlen=500)
+        self._stats = {"calls": 0, "items": 0, "batches": 0, "coalesced_requests": 0, "errors": 0}
+        self.load_ms: Optional[float] = None
+
+    # ── lifecycle ──
+
+    def encoder(self):
+        if self._encoder is None:
+            with self._load_lock:
+                if self._encoder is None:
+                    t0 = time.perf_counter()
+                    intra = max(1, _CORES // self.workers)
+                    self._encoder = _load_encoder(self.model, self.backend, self.quantized, intra, self.max_tokens)
+                    self.load_ms = round((time.perf_counter() - t0) * 1000, 1)
+                    logger.info(
+                        f"Local embeddings: {self._encoder.name} model {self._encoder.model_path} loaded in "
+                        f"{self.load_ms}ms (workers={self.workers}, intra_threads={intra}, quantized={self._encoder.quantized})"
+                    )
+        return self._encoder
+
+    def _ensure_collector(self) -> None:
+        if self._collector is None or not self._collector.is_alive():
+            with self._load_lock:
+                if self._collector is None or not self._collector.is_alive():
+                    self._collector = threading.Thread(target=self._collect, name="glih-local-embed-batcher", daemon=True)
+                    self._collector.start()
+
+    # ── batching ──
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        t0 = time.perf_counter()
+        try:
+            vecs = self.encoder().encode(texts)
+        except Exception:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            raise
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(texts)
+            self._latency.append((time.perf_counter() - t0) * 1000)
+        return vecs
+
+    def _run_group(self, group: List[Tuple[List[str], Future]]) -> None:
+        texts = [t for item, _ in group for t in item]
+        try:
+            vecs = self._forward(texts)
+        except Exception as e:
+            for _, fut in group:
+                fut.set_exception(e)
+            return
+        pos = 0
+        for item, fut in group:
+            fut.set_result(vecs[pos:pos + len(item)])
+            pos += len(item)
+
+    def _collect(self) -> None:
+        while True:
+            first = self._queue.get()
+            group = [first]
+            size = len(first[0])
+            deadline = time.monotonic() + self.max_wait_s
+            while size < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                group.append(item)
+                size += len(item[0])
+            if len(group) > 1:
+                with self._stats_lock:
+                    self._stats["coalesced_requests"] += len(group)
+            self._pool.submit(self._run_group, group)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self.encoder()  # load errors surface in the caller, not the batcher
+        with self._stats_lock:
+            self._stats["calls"] += 1
+        if len(texts) < self.batch_size:
+            self._ensure_collector()
+            fut: Future = Future()
+            self._queue.put((list(texts), fut))
+            return fut.result().tolist()
+        # Ingest: length-sorted full batches keep padding short; results go back in input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        chunks = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        futures = [self._pool.submit(self._forward, [texts[i] for i in chunk]) for chunk in chunks]
+        out = np.empty((len(texts), 0), dtype=np.float32)
+        for chunk, fut in zip(chunks, futures):
+            vecs = fut.result()
+            if out.shape[1] != vecs.shape[1]:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            out[chunk] = vecs
+        return out.tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out: Dict[str, Any] = dict(self._stats)
+            lat = sorted(self._latency)
+        if lat:
+            out["batch_ms_p50"] = round(lat[len(lat) // 2], 1)
+            out["batch_ms_p95"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1)
+        if out["batches"]:
+            out["avg_batch_items"] = round(out["items"] / out["batches"], 1)
+        enc = self._encoder
+        out.update({
+            "model": self.model,
+            "backend": enc.name if enc is not None else self.backend,
+            "model_path": enc.model_path if enc is not None else None,
+            "quantized": enc.quantized if enc is not None else self.quantized,
+            "loaded": enc is not None,
+            "load_ms": self.load_ms,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "max_wait_ms": self.max_wait_s * 1000,
+        })
+        return out
+
+
+_embedders: Dict[str, LocalEmbedder] = {}
+_embedders_lock = threading.Lock()
+_embedders_pid: Optional[int] = None
+
+
+def get_local_embedder(model: Optional[str] = None) -> LocalEmbedder:
+    """One engine (model + pool + batcher) per model and process."""
+    global _embedders_pid
+    model = model or LOCAL_EMBED_MODEL
+    with _embedders_lock:
+        if _embedders_pid != os.getpid():
+            _embedders_pid = os.getpid()
+            _embedders.clear()
+        emb = _embedders.get(model)
+        if emb is None:
+            emb = _embedders[model] = LocalEmbedder(model)
+        return emb
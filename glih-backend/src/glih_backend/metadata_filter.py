@@ -0,0 +1,292 @@
+"""
+GLIH Platform — Metadata Filters
+================================
+One filter model for every retrieval path. /query, /query/stream,
+/query/batch and the agent search closure build a MetadataFilter. Each
+backend then gets it in its own dialect, so filtering happens inside the
+store before the top-k is taken, not on the results afterwards:
+
+  Chroma     where={"$and": [{"facility": {"$eq": "DAL-01"}}, ...]}
+  Qdrant     Filter(must=[FieldCondition(...), ...])
+  Pinecone   filter={"facility": {"$eq": "DAL-01"}, ...}
+  Weaviate   with_where({"operator": "And", "operands": [...]})
+  FAISS      IDSelector over the rows whose metadata matches()
+  BM25       boolean slot mask applied to the postings before scoring
+
+Spec (JSON / dict), all conditions ANDed:
+
+  {"facility": "DAL-01",                          equality
+   "product_type": ["Dairy", "Seafood"],          any of
+   "ingested_at": {"gte": "2024-01-01", "lt": 1735689600}}   range
+
+Range bounds are numbers, or ISO dates / datetimes (converted to epoch
+seconds, UTC). Date fields must therefore be stored as epoch seconds, like
+the `ingested_at` stamp that ingest adds. A plain {field: value} dict, the
+old `where=` form, is also a valid spec.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Operators: equality, membership and the four range comparisons
+_RANGE_OPS = ("gt", "gte", "lt", "lte")
+_OPS = ("eq", "in") + _RANGE_OPS
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_.\-]{0,63}$")
+_DATE_ONLY = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MAX_CONDITIONS = 32
+_MAX_IN_VALUES = 256
+
+Condition = Tuple[str, str, Any]
+
+
+class FilterError(ValueError):
+    """Invalid filter spec (bad field name, operator or value)."""
+
+
+def _to_epoch(value: Any) -> float:
+    """Range bound → number. ISO dates/datetimes become epoch seconds (UTC if naive)."""
+    if isinstance(value, bool):
+        raise FilterError(f"range bound must be a number or ISO date, got {value!r}")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return float(text)
+        except ValueError:
+            pass
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            raise FilterError(f"range bound must be a number or ISO date, got {value!r}")
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    raise FilterError(f"range bound must be a number or ISO date, got {value!r}")
+
+
+def _scalar(field: str, value: Any) -> Any:
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    raise FilterError(f"filter value for '{field}' must be a string, number or boolean")
+
+
+class MetadataFilter:
+    """An AND of (field, op, value) conditions over chunk metadata."""
+
+    __slots__ = ("conditions",)
+
+    def __init__(self, conditions: Iterable[Condition] = ()) -> None:
+        self.conditions: Tuple[Condition, ...] = tuple(conditions)
+        if len(self.conditions) > _MAX_CONDITIONS:
+            raise FilterError(f"at most {_MAX_CONDITIONS} filter conditions")
+
+    # ── construction ──
+
+    @classmethod
+    def from_spec(cls, spec: Optional[Dict[str, Any]]) -> Optional["MetadataFilter"]:
+        """Parse a spec dict. None or {} → None (no filter)."""
+        if not spec:
+            return None
+        if not isinstance(spec, dict):
+            raise FilterError("filters must be a JSON object")
+        conditions: List[Condition] = []
+        for field, value in spec.items():
+            if not isinstance(field, str) or not _FIELD.match(field):
+                raise FilterError(f"invalid filter field {field!r}")
+            if isinstance(value, dict):
+                if not value:
+                    raise FilterError(f"empty condition for '{field}'")
+                for op, operand in value.items():
+                    op = op.lstrip("$")
+                    if op not in _OPS:
+                        raise FilterError(f"unknown operator '{op}' for '{field}' (use {', '.join(_OPS)})")
+                    if op == "in":
+                        conditions.append(cls._in(field, operand))
+                    elif op == "eq":
+                        conditions.append((field, "eq", _scalar(field, operand)))
+                    else:
+                        conditions.append((field, op, _to_epoch(operand)))
+            elif isinstance(value, (list, tuple)):
+                conditions.append(cls._in(field, value))
+            else:
+                conditions.append((field, "eq", _scalar(field, value)))
+        return cls(conditions) if conditions else None
+
+    @staticmethod
+    def _in(field: str, values: Any) -> Condition:
+        if not isinstance(values, (list, tuple)) or not values:
+            raise FilterError(f"'in' for '{field}' needs a non-empty list")
+        if len(values) > _MAX_IN_VALUES:
+            raise FilterError(f"'in' for '{field}' takes at most {_MAX_IN_VALUES} values")
+        values = tuple(dict.fromkeys(_scalar(field, v) for v in values))
+        return (field, "eq", values[0]) if len(values) == 1 else (field, "in", values)
+
+    @classmethod
+    def from_json(cls, text: Optional[str]) -> Optional["MetadataFilter"]:
+        if not text:
+            return None
+        try:
+            spec = json.loads(text)
+        except ValueError as e:
+            raise FilterError(f"filters is not valid JSON: {e}")
+        return cls.from_spec(spec)
+
+    @classmethod
+    def coerce(cls, where: Any) -> Optional["MetadataFilter"]:
+        """MetadataFilter, spec dict or None → MetadataFilter or None."""
+        if where is None or isinstance(where, MetadataFilter):
+            return where or None
+        return cls.from_spec(where)
+
+    def merged(self, other: Optional["MetadataFilter"]) -> "MetadataFilter":
+        return MetadataFilter(self.conditions + (other.conditions if other else ()))
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions)
+
+    def __repr__(self) -> str:
+        return f"MetadataFilter({self.key()})"
+
+    def key(self) -> str:
+        """Canonical text form, for cache keys."""
+        return "[" + ",".join(sorted(json.dumps([f, op, list(v) if op == "in" else v]) for f, op, v in self.conditions)) + "]"
+
+    # ── evaluation ──
+
+    def matches(self, metadata: Optional[Dict[str, Any]]) -> bool:
+        md = metadata or {}
+        for field, op, value in self.conditions:
+            have = md.get(field)
+            if have is None:
+                return False
+            if op == "eq":
+                if have != value:
+                    return False
+            elif op == "in":
+                if have not in value:
+                    return False
+            else:
+                if isinstance(have, bool) or not isinstance(have, (int, float)):
+                    return False
+                if op == "gt" and not have > value:
+                    return False
+                if op == "gte" and not have >= value:
+                    return False
+                if op == "lt" and not have < value:
+                    return False
+                if op == "lte" and not have <= value:
+                    return False
+        return True
+
+    # ── backend dialects ──
+
+    def to_chroma(self) -> Dict[str, Any]:
+        clauses = [{field: {f"${op}": list(value) if op == "in" else value}} for field, op, value in self.conditions]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def to_pinecone(self) -> Dict[str, Any]:
+        # Fields are ANDed implicitly; several operators on one field share a dict
+        out: Dict[str, Dict[str, Any]] = {}
+        clauses: List[Dict[str, Any]] = []
+        for field, op, value in self.conditions:
+            ops = out.setdefault(field, {})
+            if f"${op}" in ops:
+                clauses.append({field: {f"${op}": list(value) if op == "in" else value}})
+            else:
+                ops[f"${op}"] = list(value) if op == "in" else value
+        return {"$and": [{f: ops} for f, ops in out.items()] + clauses} if clauses else dict(out)
+
+    def to_qdrant(self, models: Any) -> Any:
+        """qdrant_client.models.Filter; `models` is the qdrant_client.models module."""
+        must = []
+        ranges: Dict[str, Dict[str, Any]] = {}
+        for field, op, value in self.conditions:
+            if op == "eq":
+                must.append(models.FieldCondition(key=field, match=models.MatchValue(value=value)))
+            elif op == "in":
+                must.append(models.FieldCondition(key=field, match=models.MatchAny(any=list(value))))
+            else:
+                ranges.setdefault(field, {})[op] = value
+        for field, bounds in ranges.items():
+            must.append(models.FieldCondition(key=field, range=models.Range(**bounds)))
+        return models.Filter(must=must)
+
+    def to_weaviate(self, prop: Callable[[str], str] = lambda f: f, int_fields: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        GraphQL where filter. `prop` maps a metadata field to its property name.
+        Weaviate rejects valueNumber on an 'int' property, so numeric operands
+        of `int_fields` are sent as valueInt; a fractional range bound is
+        rounded to the integer bound that selects the same values.
+        """
+        ops = {"eq": "Equal", "gt": "GreaterThan", "gte": "GreaterThanEqual", "lt": "LessThan", "lte": "LessThanEqual"}
+        ints = set(int_fields)
+
+        def operand(field: str, op: str, value: Any) -> Dict[str, Any]:
+            if field in ints and isinstance(value, float):
+                if value.is_integer():
+                    value = int(value)
+                elif op in ("gte", "lt"):
+                    value = math.ceil(value)
+                elif op in ("gt", "lte"):
+                    value = math.floor(value)
+            if isinstance(value, bool):
+                typed = {"valueBoolean": value}
+            elif isinstance(value, int):
+                typed = {"valueInt": value}
+            elif isinstance(value, float):
+                typed = {"valueNumber": value}
+            else:
+                typed = {"valueText": value}
+            return {"path": [prop(field)], "operator": ops[op], **typed}
+
+        operands = []
+        for field, op, value in self.conditions:
+            if op == "in":
+                operands.append({"operator": "Or", "operands": [operand(field, "eq", v) for v in value]})
+            else:
+                operands.append(operand(field, op, value))
+        return operands[0] if len(operands) == 1 else {"operator": "And", "operands": operands}
+
+
+def _upper_bound(date_to: Optional[str]) -> Tuple[str, Optional[str]]:
+    """date_to → range condition. A bare date includes that whole day: lt the next midnight."""
+    if date_to and _DATE_ONLY.match(date_to.strip()):
+        try:
+            day = datetime.fromisoformat(date_to.strip())
+        except ValueError:
+            raise FilterError(f"range bound must be a number or ISO date, got {date_to!r}")
+        return "lt", (day + timedelta(days=1)).date().isoformat()
+    return "lte", date_to
+
+
+def build_filter(
+    source: Optional[str] = None,
+    doc_id: Optional[str] = None,
+    facility: Optional[str] = None,
+    product_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    date_field: str = "ingested_at",
+    filters: Any = None,
+) -> Optional[MetadataFilter]:
+    """
+    The /query filter parameters → MetadataFilter. `filters` is a spec dict
+    or its JSON text and is ANDed with the named fields. A date-only
+    `date_to` includes the whole day.
+    """
+    spec: Dict[str, Any] = {}
+    for field, value in (("source", source), ("doc_id", doc_id), ("facility", facility), ("product_type", product_type)):
+        if value:
+            spec[field] = value
+    if date_from or date_to:
+        spec[date_field] = {op: v for op, v in (("gte", date_from), _upper_bound(date_to)) if v}
+    named = MetadataFilter.from_spec(spec)
+    extra = MetadataFilter.from_json(filters) if isinstance(filters, str) else MetadataFilter.from_spec(filters)
+    if named is None:
+        return extra
+    return named.merged(extra)
@@ -1,16 +1,27 @@
 from __future__ import annotations
+import asyncio
 import os
-import uuid
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 import json
 
+import random
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 import time
 
 try:
-    from openai import OpenAI  # openai >= 1.x
+    from openai import AsyncOpenAI, OpenAI  # openai >= 1.x
 except Exception:  # pragma: no cover - allow import-time flexibility
     OpenAI = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
 
 # Optional providers
 try:
@@ -25,14 +36,491 @@ except Exception:  # pragma: no cover
     MistralClient = None  # type: ignore
     ChatMessage = None  # type: ignore
 
-try:
-    # chromadb >= 0.5 has PersistentClient
-    from chromadb import PersistentClient as _ChromaPersistentClient  # type: ignore
-    _HAVE_PERSISTENT = True
-except Exception:  # chromadb < 0.5 fallback
-    _HAVE_PERSISTENT = False
-    import chromadb  # type: ignore
-    from chromadb.config import Settings  # type: ignore
+from .llm_resilience import ResilientLLM
+from .single_flight import SingleFlight
+from .vector_stores import VectorStoreBase, get_vector_store
+
+
+# ── Embedding batching ────────────────────────────────────────────────────────
+# Inputs are split into batches by item count and by estimated tokens (~4
+# chars/token), batches are dispatched concurrently on a per-provider executor
+# (at most GLIH_EMBED_CONCURRENCY in flight per process), results are put back
+# in input order, and only the batches that failed are retried, with
+# exponential backoff + jitter. A single batch (the query path) runs inline.
+# Per-batch latency is recorded for /health/detailed.
+_EMBED_CONCURRENCY = int(os.getenv("GLIH_EMBED_CONCURRENCY", "4"))
+_EMBED_MAX_RETRIES = int(os.getenv("GLIH_EMBED_MAX_RETRIES", "2"))
+# Provider request limits: OpenAI 2048 inputs / 300k tokens, Mistral ~16k tokens
+_EMBED_BATCH_LIMITS = {
+    "openai": (512, 200_000),
+    "mistral": (128, 15_000),
+}
+if os.getenv("GLIH_EMBED_BATCH_ITEMS") or os.getenv("GLIH_EMBED_BATCH_TOKENS"):
+    for _p, (_items, _tokens) in list(_EMBED_BATCH_LIMITS.items()):
+        _EMBED_BATCH_LIMITS[_p] = (
+            int(os.getenv("GLIH_EMBED_BATCH_ITEMS", _items)),
+            int(os.getenv("GLIH_EMBED_BATCH_TOKENS", _tokens)),
+        )
+
+# HuggingFace Inference API: same layer, over one pooled keep-alive Session.
+# 429 / 5xx / connection errors are retried inside the request (Retry-After is
+# honoured); other 4xx fail immediately.
+_HF_BATCH_SIZE = int(os.getenv("GLIH_HF_BATCH_SIZE", "32"))
+_HF_CONCURRENCY = int(os.getenv("GLIH_HF_CONCURRENCY", "4"))
+_HF_MAX_RETRIES = int(os.getenv("GLIH_HF_MAX_RETRIES", "4"))
+_HF_TIMEOUT_S = float(os.getenv("GLIH_HF_TIMEOUT_S", "60"))
+_HF_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_embed_lock = threading.Lock()
+_embed_pid: int | None = None
+_embed_pools: Dict[str, ThreadPoolExecutor] = {}
+_hf_session: requests.Session | None = None
+
+
+def _embed_pool(name: str, workers: int) -> ThreadPoolExecutor:
+    """Per-provider batch executor, created lazily and again after a fork."""
+    global _embed_pid, _hf_session
+    with _embed_lock:
+        if _embed_pid != os.getpid():
+            _embed_pid = os.getpid()
+            _embed_pools.clear()
+            _hf_session = None
+        pool = _embed_pools.get(name)
+        if pool is None:
+            pool = _embed_pools[name] = ThreadPoolExecutor(
+                max_workers=max(workers, 1), thread_name_prefix=f"glih-embed-{name}"
+            )
+        return pool
+
+
+def _hf_clients():
+    """Pooled Session + batch executor for the HF Inference API."""
+    global _hf_session
+    pool = _embed_pool("huggingface", _HF_CONCURRENCY)
+    with _embed_lock:
+        if _hf_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(_HF_CONCURRENCY, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _hf_session = session
+        return _hf_session, pool
+
+
+class _EmbedBatchMetrics:
+    """Per-batch latency / size / attempts, with aggregates over the recent window."""
+
+    def __init__(self, window: int = 500) -> None:
+        self._lock = threading.Lock()
+        self._recent: "deque[Dict[str, Any]]" = deque(maxlen=window)
+        self._totals = {"calls": 0, "batches": 0, "items": 0, "retried_batches": 0, "failed_batches": 0}
+
+    def record(self, provider: str, items: int, est_tokens: int, latency_ms: float, ok: bool, attempt: int) -> None:
+        with self._lock:
+            self._recent.append({
+                "provider": provider, "items": items, "est_tokens": est_tokens,
+                "latency_ms": round(latency_ms, 1), "ok": ok, "attempt": attempt,
+            })
+            self._totals["batches"] += 1
+            if ok:
+                self._totals["items"] += items
+            else:
+                self._totals["failed_batches"] += 1
+            if attempt > 0:
+                self._totals["retried_batches"] += 1
+
+    def call(self) -> None:
+        with self._lock:
+            self._totals["calls"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            out: Dict[str, Any] = dict(self._totals)
+        lat = sorted(r["latency_ms"] for r in recent if r["ok"])
+        if lat:
+            out["latency_ms_p50"] = lat[len(lat) // 2]
+            out["latency_ms_p95"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            out["latency_ms_max"] = lat[-1]
+            out["avg_batch_items"] = round(sum(r["items"] for r in recent if r["ok"]) / len(lat), 1)
+        out["recent"] = recent[-10:]
+        return out
+
+
+_embed_metrics = _EmbedBatchMetrics()
+
+
+def get_embedding_batch_stats() -> Dict[str, Any]:
+    """Counters and per-batch latencies of the embedding batching layer."""
+    return _embed_metrics.snapshot()
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _split_batches(texts: List[str], max_items: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """[start, end) ranges holding at most max_items texts and ~max_tokens tokens (min. one text)."""
+    ranges: List[Tuple[int, int]] = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        t = _estimate_tokens(text)
+        if i > start and (i - start >= max_items or tokens + t > max_tokens):
+            ranges.append((start, i))
+            start, tokens = i, 0
+        tokens += t
+    if start < len(texts):
+        ranges.append((start, len(texts)))
+    return ranges
+
+
+def _embed_batched(
+    provider: str,
+    texts: List[str],
+    call: Callable[[List[str]], List[List[float]]],
+    max_items: int,
+    max_tokens: int,
+    pool: ThreadPoolExecutor,
+    retries: int,
+) -> List[List[float]]:
+    """Split, dispatch concurrently, retry only failed batches, reassemble in order."""
+    if not texts:
+        return []
+    _embed_metrics.call()
+    ranges = _split_batches(texts, max(max_items, 1), max(max_tokens, 1))
+    results: List[List[List[float]] | None] = [None] * len(ranges)
+
+    def run(idx: int, attempt: int) -> List[List[float]]:
+        lo, hi = ranges[idx]
+        batch = texts[lo:hi]
+        t0 = time.perf_counter()
+        try:
+            vecs = call(batch)
+            if len(vecs) != len(batch):
+                raise RuntimeError(f"expected {len(batch)} vectors, got {len(vecs)}")
+        except Exception:
+            _embed_metrics.record(provider, len(batch), sum(map(_estimate_tokens, batch)), (time.perf_counter() - t0) * 1000, False, attempt)
+            raise
+        _embed_metrics.record(provider, len(batch), sum(map(_estimate_tokens, batch)), (time.perf_counter() - t0) * 1000, True, attempt)
+        return vecs
+
+    pending = list(range(len(ranges)))
+    last_err: Exception | None = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(min(20.0, 0.6 * (2 ** (attempt - 1))) * (0.5 + random.random()))
+        failed: List[int] = []
+        if len(pending) == 1:
+            try:
+                results[pending[0]] = run(pending[0], attempt)
+            except Exception as e:
+                failed, last_err = pending, e
+        else:
+            futures = [(idx, pool.submit(run, idx, attempt)) for idx in pending]
+            for idx, fut in futures:
+                try:
+                    results[idx] = fut.result()
+                except Exception as e:
+                    failed.append(idx)
+                    last_err = e
+        if not failed:
+            break
+        pending = failed
+    else:
+        raise RuntimeError(f"{len(pending)}/{len(ranges)} batches failed: {last_err}")
+    return [vec for batch in results for vec in batch]  # type: ignore[union-attr]
+
+
+def _hf_post_batch(session: requests.Session, url: str, headers: Dict[str, str], batch: List[str]) -> List[List[float]]:
+    last_err: Exception | None = None
+    for attempt in range(_HF_MAX_RETRIES + 1):
+        delay = min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random())
+        try:
+            r = session.post(
+                url,
+                headers=headers,
+                json={"inputs": batch, "options": {"wait_for_model": True}},
+                timeout=_HF_TIMEOUT_S,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            last_err = e
+        else:
+            if r.status_code < 400:
+                arr = r.json()
+                if not isinstance(arr, list) or len(arr) != len(batch):
+                    raise RuntimeError(f"HF embeddings: expected {len(batch)} vectors, got {type(arr).__name__}")
+                # Each item may be [dims] or [[dims]] depending on the pipeline
+                return [[float(x) for x in (v[0] if v and isinstance(v[0], list) else v)] for v in arr]
+            # Surface a helpful error body
+            last_err = RuntimeError(f"HF embeddings error {r.status_code}: {r.text}")
+            if r.status_code not in _HF_RETRY_STATUS:
+                raise last_err
+            retry_after = r.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        if attempt < _HF_MAX_RETRIES:
+            time.sleep(delay)
+    raise last_err if isinstance(last_err, RuntimeError) else RuntimeError(f"HF embeddings failed: {last_err}")
+
+
+# ── Async clients ─────────────────────────────────────────────────────────────
+# agenerate / aembed run on the event loop. They share one pooled
+# httpx.AsyncClient per loop (connections belong to the loop that opened
+# them), used both directly (REST) and as the transport of the async SDK
+# clients. GLIH_ASYNC_MAX_CONNECTIONS bounds upstream connections per worker.
+# A call waiting on the provider holds a connection, not a thread.
+_ASYNC_MAX_CONNECTIONS = int(os.getenv("GLIH_ASYNC_MAX_CONNECTIONS", "200"))
+_ASYNC_MAX_KEEPALIVE = int(os.getenv("GLIH_ASYNC_MAX_KEEPALIVE", "50"))
+_LLM_TIMEOUT_S = float(os.getenv("GLIH_LLM_TIMEOUT_S", "60"))
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _async_http() -> httpx.AsyncClient:
+    """Pooled keep-alive AsyncClient of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_http_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=_ASYNC_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(_LLM_TIMEOUT_S, connect=10.0),
+        )
+    return client
+
+
+async def aclose_async_clients() -> None:
+    """Close the running loop's pooled client (FastAPI shutdown)."""
+    client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _async_sdk(owner: Any, factory: Callable[[httpx.AsyncClient], Any]) -> Any:
+    """Per-loop async SDK client of a provider instance, on the shared transport."""
+    loop = asyncio.get_running_loop()
+    client = owner._aclients.get(loop)
+    if client is None:
+        client = owner._aclients[loop] = factory(_async_http())
+    return client
+
+
+# ── LLM request coalescing ────────────────────────────────────────────────────
+# Byte-identical prompts that are in flight at the same time (several
+# dispatchers raising the same anomaly, a load test repeating one question)
+# share one upstream completion. Key: provider, model, sha256(prompt),
+# temperature. Sync and async callers coalesce separately.
+_LLM_COALESCE = os.getenv("GLIH_LLM_COALESCE", "1").lower() in ("1", "true", "yes")
+_llm_flights = SingleFlight(enabled=_LLM_COALESCE)
+
+
+def get_llm_coalescing_stats() -> Dict[str, Any]:
+    """Leader / coalesced / in-flight counters of the LLM single-flight layer."""
+    return _llm_flights.stats()
+
+
+# ── Prompt prefix caching ─────────────────────────────────────────────────────
+# A prompt may carry a static prefix (a str with a `.prefix` attribute, e.g.
+# glih_agents.prompt_budget.PrefixedPrompt): the agent preamble, SOP
+# boilerplate and output rules that are byte-identical across runs. The
+# prefix is sent first (OpenAI/DeepSeek/Mistral: in the system message;
+# Anthropic: a system block with a cache_control breakpoint), so provider
+# prompt caching can reuse it. OpenAI and DeepSeek cache automatically once
+# the prompt is long enough; Anthropic caches at the breakpoint. Providers
+# that do not report cached tokens (Mistral, echo) go through a local LRU of
+# prefixes instead: a repeated prefix is counted as reusable tokens.
+_LLM_SYSTEM = "You are a helpful assistant for logistics intelligence."
+_LLM_DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "deepseek": "deepseek-chat",
+    "anthropic": "claude-3-sonnet-20240229",
+    "mistral": "open-mistral-7b",
+}
+_PREFIX_CACHE_SIZE = int(os.getenv("GLIH_PROMPT_PREFIX_CACHE_SIZE", "256"))
+
+
+def _split_prompt(prompt: str) -> Tuple[str, str]:
+    """(static prefix, dynamic rest) of a prompt; plain strings have no prefix."""
+    prefix = getattr(prompt, "prefix", "") or ""
+    text = str(prompt)
+    if prefix and text.startswith(prefix):
+        return prefix, text[len(prefix):]
+    return "", text
+
+
+def _chat_usage(resp: Any) -> Dict[str, Any]:
+    """Token usage of an OpenAI-style chat completion (OpenAI, DeepSeek, Mistral SDK)."""
+    u = getattr(resp, "usage", None)
+    if u is None:
+        return {}
+    out: Dict[str, Any] = {
+        "prompt_tokens": getattr(u, "prompt_tokens", None),
+        "completion_tokens": getattr(u, "completion_tokens", None),
+    }
+    details = getattr(u, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(u, "prompt_cache_hit_tokens", None)  # DeepSeek
+    if cached is not None:
+        out["cached_tokens"] = cached
+    return out
+
+
+def _anthropic_usage(resp: Any) -> Dict[str, Any]:
+    u = getattr(resp, "usage", None)
+    if u is None:
+        return {}
+    read = getattr(u, "cache_read_input_tokens", None) or 0
+    write = getattr(u, "cache_creation_input_tokens", None) or 0
+    return {
+        "prompt_tokens": (getattr(u, "input_tokens", 0) or 0) + read + write,
+        "completion_tokens": getattr(u, "output_tokens", None),
+        "cached_tokens": read,
+        "cache_write_tokens": write,
+    }
+
+
+def _rest_usage(jr: Dict[str, Any]) -> Dict[str, Any]:
+    u = jr.get("usage") or {}
+    return {"prompt_tokens": u.get("prompt_tokens"), "completion_tokens": u.get("completion_tokens")} if u else {}
+
+
+class _PromptCacheStats:
+    """Per provider/model token and cache counters, plus the local prefix LRU."""
+
+    def __init__(self, size: int = _PREFIX_CACHE_SIZE) -> None:
+        self._lock = threading.Lock()
+        self._size = max(size, 1)
+        self._prefixes: "OrderedDict[bytes, int]" = OrderedDict()
+        self._by_model: Dict[str, Dict[str, int]] = {}
+
+    def seen_prefix(self, label: str, prefix: str) -> int:
+        """Estimated tokens of `prefix` if this provider/model sent it before, else 0."""
+        if not prefix:
+            return 0
+        key = hashlib.sha256(f"{label}\x1f{prefix}".encode("utf-8")).digest()
+        with self._lock:
+            if key in self._prefixes:
+                self._prefixes.move_to_end(key)
+                return self._prefixes[key]
+            self._prefixes[key] = _estimate_tokens(prefix)
+            while len(self._prefixes) > self._size:
+                self._prefixes.popitem(last=False)
+        return 0
+
+    def record(self, label: str, usage: Dict[str, Any]) -> None:
+        with self._lock:
+            m = self._by_model.setdefault(label, {
+                "calls": 0, "cached_calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0,
+            })
+            m["calls"] += 1
+            m["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            m["cached_tokens"] += usage.get("cached_tokens") or 0
+            m["cache_write_tokens"] += usage.get("cache_write_tokens") or 0
+            if usage.get("cached_tokens"):
+                m["cached_calls"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {k: dict(v) for k, v in self._by_model.items()}
+            tracked = len(self._prefixes)
+        for m in models.values():
+            m["cached_ratio"] = round(m["cached_tokens"] / m["prompt_tokens"], 4) if m["prompt_tokens"] else 0.0
+        return {"models": models, "local_prefixes": tracked}
+
+
+_prompt_cache = _PromptCacheStats()
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """Prompt / cached token totals per LLM provider/model."""
+    return _prompt_cache.snapshot()
+
+
+async def _aembed_batched(
+    provider: str,
+    texts: List[str],
+    call: Callable[[List[str]], Any],
+    max_items: int,
+    max_tokens: int,
+    concurrency: int,
+    retries: int,
+) -> List[List[float]]:
+    """_embed_batched for coroutines: batches are gathered (at most `concurrency` in flight)."""
+    if not texts:
+        return []
+    _embed_metrics.call()
+    ranges = _split_batches(texts, max(max_items, 1), max(max_tokens, 1))
+    results: List[List[List[float]] | None] = [None] * len(ranges)
+    sem = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(idx: int, attempt: int) -> List[List[float]]:
+        lo, hi = ranges[idx]
+        batch = texts[lo:hi]
+        est = sum(map(_estimate_tokens, batch))
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                vecs = await call(batch)
+                if len(vecs) != len(batch):
+                    raise RuntimeError(f"expected {len(batch)} vectors, got {len(vecs)}")
+            except Exception:
+                _embed_metrics.record(provider, len(batch), est, (time.perf_counter() - t0) * 1000, False, attempt)
+                raise
+        _embed_metrics.record(provider, len(batch), est, (time.perf_counter() - t0) * 1000, True, attempt)
+        return vecs
+
+    pending = list(range(len(ranges)))
+    last_err: Exception | None = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(min(20.0, 0.6 * (2 ** (attempt - 1))) * (0.5 + random.random()))
+        outcomes = await asyncio.gather(*(run(idx, attempt) for idx in pending), return_exceptions=True)
+        failed: List[int] = []
+        for idx, out in zip(pending, outcomes):
+            if isinstance(out, Exception):
+                failed.append(idx)
+                last_err = out
+            elif isinstance(out, BaseException):
+                raise out
+            else:
+                results[idx] = out
+        if not failed:
+            break
+        pending = failed
+    else:
+        raise RuntimeError(f"{len(pending)}/{len(ranges)} batches failed: {last_err}")
+    return [vec for batch in results for vec in batch]  # type: ignore[union-attr]
+
+
+async def _ahf_post_batch(url: str, headers: Dict[str, str], batch: List[str]) -> List[List[float]]:
+    """Async _hf_post_batch: same status-aware retries and Retry-After handling."""
+    client = _async_http()
+    last_err: Exception | None = None
+    for attempt in range(_HF_MAX_RETRIES + 1):
+        delay = min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random())
+        try:
+            r = await client.post(
+                url,
+                headers=headers,
+                json={"inputs": batch, "options": {"wait_for_model": True}},
+                timeout=_HF_TIMEOUT_S,
+            )
+        except httpx.TransportError as e:
+            last_err = e
+        else:
+            if r.status_code < 400:
+                arr = r.json()
+                if not isinstance(arr, list) or len(arr) != len(batch):
+                    raise RuntimeError(f"HF embeddings: expected {len(batch)} vectors, got {type(arr).__name__}")
+                return [[float(x) for x in (v[0] if v and isinstance(v[0], list) else v)] for v in arr]
+            last_err = RuntimeError(f"HF embeddings error {r.status_code}: {r.text}")
+            if r.status_code not in _HF_RETRY_STATUS:
+                raise last_err
+            retry_after = r.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        if attempt < _HF_MAX_RETRIES:
+            await asyncio.sleep(delay)
+    raise last_err if isinstance(last_err, RuntimeError) else RuntimeError(f"HF embeddings failed: {last_err}")
 
 
 class EmbeddingsProvider:
@@ -41,190 +529,137 @@ class EmbeddingsProvider:
         self.model = model
         self._openai: OpenAI | None = None
         self._mistral = None
+        self._local = None
+        self._aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
         if self.provider == "openai" and OpenAI is not None:
             self._openai = OpenAI()
+        elif self.provider == "local":
+            # In-process CPU model; weights load on first embed
+            from .local_embeddings import LOCAL_EMBED_MODEL, get_local_embedder
+
+            self.model = self.model or LOCAL_EMBED_MODEL
+            self._local = get_local_embedder(self.model)
         elif self.provider == "mistral" and MistralClient is not None:
             ms_key = os.getenv("MISTRAL_API_KEY")
             if ms_key:
                 self._mistral = MistralClient(api_key=ms_key)
 
+    @property
+    def available(self) -> bool:
+        """False when embed() would fall back to the placeholder vectors."""
+        if self.provider == "openai":
+            return self._openai is not None
+        if self.provider == "mistral":
+            return self._mistral is not None
+        if self.provider == "local":
+            return self._local is not None
+        return self.provider == "huggingface"
+
     def embed(self, texts: List[str]) -> List[List[float]]:
         if self.provider == "openai" and self._openai is not None:
             model = self.model or "text-embedding-3-small"
-            resp = self._openai.embeddings.create(model=model, input=texts)
-            return [d.embedding for d in resp.data]
+
+            def _openai_batch(batch: List[str]) -> List[List[float]]:
+                resp = self._openai.embeddings.create(model=model, input=batch)
+                return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+            items, tokens = _EMBED_BATCH_LIMITS["openai"]
+            try:
+                return _embed_batched(
+                    "openai", texts, _openai_batch, items, tokens,
+                    _embed_pool("openai", _EMBED_CONCURRENCY), _EMBED_MAX_RETRIES,
+                )
+            except RuntimeError as e:
+                raise RuntimeError(f"OpenAI embeddings error: {e}")
+        if self.provider == "local" and self._local is not None:
+            try:
+                return self._local.embed(texts)
+            except RuntimeError as e:
+                raise RuntimeError(f"Local embeddings error: {e}")
         if self.provider == "huggingface":
             # Use HF Inference API models endpoint (recommended) to avoid heavy local installs
             model = self.model or "sentence-transformers/all-MiniLM-L6-v2"
             token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_TOKEN")
             headers = {"Authorization": f"Bearer {token}"} if token else {}
             url = f"https://api-inference.huggingface.co/models/{model}"
-            vecs: List[List[float]] = []
-            for t in texts:
-                r = requests.post(
-                    url,
-                    headers=headers,
-                    json={"inputs": t, "options": {"wait_for_model": True}},
-                    timeout=60,
-                )
-                try:
-                    r.raise_for_status()
-                except Exception:
-                    # Try to surface helpful error body
-                    raise RuntimeError(f"HF embeddings error {r.status_code}: {r.text}")
-                arr = r.json()
-                # Responses may be [dims] or [[dims]] depending on tokenizer
-                vec = arr[0] if (isinstance(arr, list) and len(arr) > 0 and isinstance(arr[0], list)) else arr
-                vecs.append([float(x) for x in vec])
-            return vecs
+            session, pool = _hf_clients()
+            # Retries happen per request (status-aware), not at the batch layer
+            return _embed_batched(
+                "huggingface", texts, lambda batch: _hf_post_batch(session, url, headers, batch),
+                _HF_BATCH_SIZE, 10 ** 9, pool, 0,
+            )
         if self.provider == "mistral" and self._mistral is not None:
             model = self.model or "mistral-embed"
-            last_err = None
-            for attempt in range(3):
-                try:
-                    resp = self._mistral.embeddings.create(model=model, input=texts)  # type: ignore[attr-defined]
-                    last_err = None
-                    break
-                except Exception as e:
-                    last_err = e
-                    if attempt < 2:
-                        time.sleep(0.6 * (2 ** attempt))
-                        continue
-            if last_err is not None:
-                raise RuntimeError(f"Mistral embeddings error: {last_err}")
-            vecs: List[List[float]] = []
-            # Be flexible about response shape across SDK versions
-            data = getattr(resp, "data", None) or getattr(resp, "embeddings", None) or []
-            for item in data:
-                emb = getattr(item, "embedding", None) or getattr(item, "values", None)
-                if emb is None:
-                    raise RuntimeError("Mistral embeddings: unexpected response format")
-                vecs.append([float(x) for x in emb])
-            return vecs
+
+            def _mistral_batch(batch: List[str]) -> List[List[float]]:
+                resp = self._mistral.embeddings.create(model=model, input=batch)  # type: ignore[attr-defined]
+                vecs: List[List[float]] = []
+                # Be flexible about response shape across SDK versions
+                data = getattr(resp, "data", None) or getattr(resp, "embeddings", None) or []
+                for item in data:
+                    emb = getattr(item, "embedding", None) or getattr(item, "values", None)
+                    if emb is None:
+                        raise RuntimeError("Mistral embeddings: unexpected response format")
+                    vecs.append([float(x) for x in emb])
+                return vecs
+
+            items, tokens = _EMBED_BATCH_LIMITS["mistral"]
+            try:
+                return _embed_batched(
+                    "mistral", texts, _mistral_batch, items, tokens,
+                    _embed_pool("mistral", _EMBED_CONCURRENCY), _EMBED_MAX_RETRIES,
+                )
+            except RuntimeError as e:
+                raise RuntimeError(f"Mistral embeddings error: {e}")
         # Fallback placeholder
         return [[float(len(t) % 7), 0.0, 1.0] for t in texts]
 
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """embed() without holding a thread while the provider answers."""
+        if self.provider == "openai" and self._openai is not None and AsyncOpenAI is not None:
+            model = self.model or "text-embedding-3-small"
+            client = _async_sdk(self, lambda http: AsyncOpenAI(http_client=http))
 
-class VectorStore:
-    def __init__(self, provider: str, collection: str | None = None) -> None:
-        self.provider = provider
-        self.collection = collection or "default"
-        self._chroma = None
-        self._chroma_coll = None
-        if self.provider == "chromadb":
-            persist_dir = os.getenv("GLIH_CHROMA_DIR", os.path.join(os.getcwd(), "data", "chroma"))
-            os.makedirs(persist_dir, exist_ok=True)
-            if _HAVE_PERSISTENT:
-                self._chroma = _ChromaPersistentClient(path=persist_dir)
-            else:
-                self._chroma = chromadb.Client(Settings(persist_directory=persist_dir, anonymized_telemetry=False))  # type: ignore
-            self._chroma_coll = self._chroma.get_or_create_collection(name=self.collection)
-
-    def get_collection(self, name: str):
-        if self.provider == "chromadb" and self._chroma is not None:
-            return self._chroma.get_or_create_collection(name=name)
-        return None
+            async def _openai_batch(batch: List[str]) -> List[List[float]]:
+                resp = await client.embeddings.create(model=model, input=batch)
+                return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
 
-    def list_collections(self) -> List[str]:
-        if self.provider == "chromadb" and self._chroma is not None:
+            items, tokens = _EMBED_BATCH_LIMITS["openai"]
             try:
-                cols = self._chroma.list_collections()
-                out: List[str] = []
-                for c in cols:
-                    nm = getattr(c, "name", None) or (c.get("name") if isinstance(c, dict) else None)
-                    if nm:
-                        out.append(nm)
-                return sorted(set(out))
-            except Exception:
-                return [self.collection]
-        return [self.collection]
-
-    def index(
-        self,
-        texts: List[str],
-        embeddings: List[List[float]],
-        metadatas: List[Dict[str, Any]] | None = None,
-    ) -> int:
-        if self.provider == "chromadb" and self._chroma_coll is not None:
-            n = len(texts)
-            ids = [str(uuid.uuid4()) for _ in range(n)]
-            # Some Chroma versions reject empty metadata dicts. If metadata is missing or empty,
-            # omit the parameter entirely to avoid errors like:
-            # "Expected metadata to be a non-empty dict".
-            has_meta = bool(metadatas) and any(bool(m) for m in (metadatas or []))
-            if has_meta:
-                self._chroma_coll.add(documents=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
-            else:
-                self._chroma_coll.add(documents=texts, embeddings=embeddings, ids=ids)
-            return n
-        # Fallback no-op
-        return len(embeddings)
-
-    def index_to(
-        self,
-        collection: str,
-        texts: List[str],
-        embeddings: List[List[float]],
-        metadatas: List[Dict[str, Any]] | None = None,
-    ) -> int:
-        if self.provider == "chromadb" and self._chroma is not None:
-            coll = self.get_collection(collection)
-            n = len(texts)
-            ids = [str(uuid.uuid4()) for _ in range(n)]
-            has_meta = bool(metadatas) and any(bool(m) for m in (metadatas or []))
-            if has_meta:
-                coll.add(documents=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)  # type: ignore
-            else:
-                coll.add(documents=texts, embeddings=embeddings, ids=ids)  # type: ignore
-            return n
-        return self.index(texts, embeddings, metadatas)
+                return await _aembed_batched("openai", texts, _openai_batch, items, tokens, _EMBED_CONCURRENCY, _EMBED_MAX_RETRIES)
+            except RuntimeError as e:
+                raise RuntimeError(f"OpenAI embeddings error: {e}")
+        if self.provider == "local" and self._local is not None:
+            # CPU-bound and batched by the engine's own pool
+            return await asyncio.to_thread(self.embed, texts)
+        if self.provider == "huggingface":
+            model = self.model or "sentence-transformers/all-MiniLM-L6-v2"
+            token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HF_TOKEN")
+            headers = {"Authorization": f"Bearer {token}"} if token else {}
+            url = f"https://api-inference.huggingface.co/models/{model}"
+            return await _aembed_batched(
+                "huggingface", texts, lambda batch: _ahf_post_batch(url, headers, batch),
+                _HF_BATCH_SIZE, 10 ** 9, _HF_CONCURRENCY, 0,
+            )
+        ms_key = os.getenv("MISTRAL_API_KEY")
+        if self.provider == "mistral" and self._mistral is not None and ms_key:
+            model = self.model or "mistral-embed"
+            headers = {"Authorization": f"Bearer {ms_key}"}
 
-    def search(self, query_embedding: List[float], k: int = 5) -> List[Dict[str, Any]]:
-        if self.provider == "chromadb" and self._chroma_coll is not None:
-            try:
-                res = self._chroma_coll.query(
-                    query_embeddings=[query_embedding],
-                    n_results=k,
-                    include=["documents", "metadatas", "distances"],
+            async def _mistral_batch(batch: List[str]) -> List[List[float]]:
+                r = await _async_http().post(
+                    "https://api.mistral.ai/v1/embeddings", headers=headers, json={"model": model, "input": batch}
                 )
-            except Exception:
-                res = self._chroma_coll.query(query_embeddings=[query_embedding], n_results=k)
-            out: List[Dict[str, Any]] = []
-            docs = (res.get("documents") or [[ ]])[0]
-            metas = (res.get("metadatas") or [[ ]])[0]
-            ids = (res.get("ids") or [[ ]])[0]
-            dists = (res.get("distances") or [[ ]])[0] if "distances" in res else [None] * len(docs)
-            for i in range(len(docs)):
-                out.append({
-                    "id": ids[i] if i < len(ids) else None,
-                    "document": docs[i],
-                    "metadata": metas[i] if i < len(metas) else {},
-                    "distance": dists[i] if i < len(dists) else None,
-                })
-            return out
-        return []
+                r.raise_for_status()
+                data = sorted(r.json().get("data") or [], key=lambda d: d.get("index", 0))
+                return [[float(x) for x in d["embedding"]] for d in data]
 
-    def search_in(self, collection: str, query_embedding: List[float], k: int = 5) -> List[Dict[str, Any]]:
-        if self.provider == "chromadb" and self._chroma is not None:
-            coll = self.get_collection(collection)
+            items, tokens = _EMBED_BATCH_LIMITS["mistral"]
             try:
-                res = coll.query(query_embeddings=[query_embedding], n_results=k, include=["documents", "metadatas", "distances"])  # type: ignore
-            except Exception:
-                res = coll.query(query_embeddings=[query_embedding], n_results=k)  # type: ignore
-            out: List[Dict[str, Any]] = []
-            docs = (res.get("documents") or [[ ]])[0]
-            metas = (res.get("metadatas") or [[ ]])[0]
-            ids = (res.get("ids") or [[ ]])[0]
-            dists = (res.get("distances") or [[ ]])[0] if "distances" in res else [None] * len(docs)
-            for i in range(len(docs)):
-                out.append({
-                    "id": ids[i] if i < len(ids) else None,
-                    "document": docs[i],
-                    "metadata": metas[i] if i < len(metas) else {},
-                    "distance": dists[i] if i < len(dists) else None,
-                })
-            return out
-        return self.search(query_embedding, k)
+                return await _aembed_batched("mistral", texts, _mistral_batch, items, tokens, _EMBED_CONCURRENCY, _EMBED_MAX_RETRIES)
+            except RuntimeError as e:
+                raise RuntimeError(f"Mistral embeddings error: {e}")
+        return self.embed(texts)
 
 
 class LLMProvider:
@@ -235,58 +670,119 @@ class LLMProvider:
         self._deepseek: OpenAI | None = None
         self._anthropic = None
         self._mistral = None
+        self.temperature = 0.2
+        self._aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
 
         if self.provider == "openai" and OpenAI is not None:
-            self._openai = OpenAI()
+            self._openai = OpenAI(timeout=_LLM_TIMEOUT_S)
         elif self.provider == "deepseek" and OpenAI is not None:
             ds_key = os.getenv("DEEPSEEK_API_KEY")
             if ds_key:
-                self._deepseek = OpenAI(api_key=ds_key, base_url="https://api.deepseek.com")
+                self._deepseek = OpenAI(api_key=ds_key, base_url="https://api.deepseek.com", timeout=_LLM_TIMEOUT_S)
         elif self.provider == "anthropic" and anthropic is not None:
-            self._anthropic = anthropic.Anthropic()
+            self._anthropic = anthropic.Anthropic(timeout=_LLM_TIMEOUT_S)
         elif self.provider == "mistral" and MistralClient is not None:
             ms_key = os.getenv("MISTRAL_API_KEY")
             if ms_key:
                 self._mistral = MistralClient(api_key=ms_key)
 
+    @property
+    def available(self) -> bool:
+        """True when a real client is configured (otherwise generate() echoes)."""
+        if self.provider == "openai":
+            return self._openai is not None
+        if self.provider == "mistral":
+            return self._mistral is not None or bool(os.getenv("MISTRAL_API_KEY"))
+        if self.provider == "anthropic":
+            return self._anthropic is not None
+        if self.provider == "deepseek":
+            return self._deepseek is not None
+        return False
+
+    @property
+    def _label(self) -> str:
+        return f"{self.provider}/{self.model or ''}"
+
+    def _model_name(self) -> str:
+        return self.model or _LLM_DEFAULT_MODELS.get(self.provider, "")
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Chat messages; a static prefix rides in the system message so every call starts with the same tokens."""
+        prefix, suffix = _split_prompt(prompt)
+        system = f"{_LLM_SYSTEM}\n\n{prefix}" if prefix else _LLM_SYSTEM
+        return [{"role": "system", "content": system}, {"role": "user", "content": suffix}]
+
+    def _anthropic_request(self, prompt: str) -> Tuple[Any, List[Dict[str, Any]]]:
+        """(system, messages) with a cache breakpoint after the static prefix."""
+        prefix, suffix = _split_prompt(prompt)
+        system: Any = _LLM_SYSTEM
+        if prefix:
+            system = [
+                {"type": "text", "text": _LLM_SYSTEM},
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+            ]
+        return system, [{"role": "user", "content": suffix}]
+
+    def _finish(self, prompt: str, text: str, usage: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Attach cache accounting: provider-reported, else the local prefix tracker."""
+        if usage.get("cached_tokens") is not None:
+            usage["cache"] = "provider"
+        else:
+            usage["cached_tokens"] = _prompt_cache.seen_prefix(self._label, _split_prompt(prompt)[0])
+            usage["cache"] = "local"
+        if usage.get("prompt_tokens") is None:
+            usage["prompt_tokens"] = _estimate_tokens(str(prompt))
+        _prompt_cache.record(self._label, usage)
+        return text, usage
+
+    def _flight_key(self, prompt: str) -> Tuple[str, str, str, float]:
+        return (self.provider, str(self.model or ""), hashlib.sha256(prompt.encode("utf-8")).hexdigest(), self.temperature)
+
     def generate(self, prompt: str) -> str:
-        if self.provider == "openai" and self._openai is not None:
-            model = self.model or "gpt-4o-mini"
-            resp = self._openai.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant for logistics intelligence."},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.2,
-            )
-            return (resp.choices[0].message.content or "").strip()
-        if self.provider == "deepseek" and self._deepseek is not None:
-            model = self.model or "deepseek-chat"
-            resp = self._deepseek.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant for logistics intelligence."},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.2,
-            )
-            return (resp.choices[0].message.content or "").strip()
+        """Completion for `prompt`; concurrent identical calls share one request."""
+        return self.generate_ex(prompt)[0]
+
+    def generate_ex(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """(completion, usage): prompt/completion/cached token counts of the call."""
+        return _llm_flights.do(self._flight_key(prompt), lambda: self._generate(prompt))
+
+    async def agenerate(self, prompt: str) -> str:
+        """
+        generate() on the event loop, over the async SDKs / the pooled
+        AsyncClient, so a pending completion does not hold a worker thread.
+        Concurrent identical calls on the loop share one request.
+        """
+        return (await self.agenerate_ex(prompt))[0]
+
+    async def agenerate_ex(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        return await _llm_flights.ado(self._flight_key(prompt), lambda: self._agenerate(prompt))
+
+    def _generate(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        if self.provider in ("openai", "deepseek"):
+            client = self._openai if self.provider == "openai" else self._deepseek
+            if client is not None:
+                resp = client.chat.completions.create(
+                    model=self._model_name(),
+                    messages=self._messages(prompt),
+                    temperature=self.temperature,
+                )
+                return self._finish(prompt, (resp.choices[0].message.content or "").strip(), _chat_usage(resp))
         if self.provider == "anthropic" and self._anthropic is not None:
-            model = self.model or "claude-3-sonnet-20240229"
+            system, messages = self._anthropic_request(prompt)
             resp = self._anthropic.messages.create(
-                model=model,
-                system="You are a helpful assistant for logistics intelligence.",
+                model=self._model_name(),
+                system=system,
                 max_tokens=512,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
             )
             try:
                 # anthropic response content is a list of blocks
-                return "".join([b.text for b in (resp.content or []) if getattr(b, "text", None)])
+                text = "".join([b.text for b in (resp.content or []) if getattr(b, "text", None)])
             except Exception:
-                return str(resp)
+                text = str(resp)
+            return self._finish(prompt, text, _anthropic_usage(resp))
         if self.provider == "mistral":
-            model = self.model or "open-mistral-7b"
+            model = self._model_name()
             # Prefer SDK path if available
             if self._mistral is not None and ChatMessage is not None:
                 last_err = None
@@ -294,11 +790,8 @@ class LLMProvider:
                     try:
                         resp = self._mistral.chat(
                             model=model,
-                            messages=[
-                                ChatMessage(role="system", content="You are a helpful assistant for logistics intelligence."),
-                                ChatMessage(role="user", content=prompt),
-                            ],
-                            temperature=0.2,
+                            messages=[ChatMessage(**m) for m in self._messages(prompt)],
+                            temperature=self.temperature,
                         )
                         last_err = None
                         break
@@ -309,9 +802,10 @@ class LLMProvider:
                             continue
                 if last_err is None:
                     try:
-                        return (resp.choices[0].message.content or "").strip()
+                        text = (resp.choices[0].message.content or "").strip()
                     except Exception:
-                        return str(resp)
+                        text = str(resp)
+                    return self._finish(prompt, text, _chat_usage(resp))
                 # Fallthrough to REST on error
             # REST fallback if SDK unavailable or errored
             ms_key = os.getenv("MISTRAL_API_KEY")
@@ -320,19 +814,147 @@ class LLMProvider:
                     headers = {"Authorization": f"Bearer {ms_key}", "Content-Type": "application/json"}
                     payload = {
                         "model": model,
-                        "messages": [
-                            {"role": "system", "content": "You are a helpful assistant for logistics intelligence."},
-                            {"role": "user", "content": prompt},
-                        ],
-                        "temperature": 0.2,
+                        "messages": self._messages(prompt),
+                        "temperature": self.temperature,
                     }
                     r = requests.post("https://api.mistral.ai/v1/chat/completions", headers=headers, data=json.dumps(payload), timeout=30)
                     r.raise_for_status()
                     jr = r.json()
-                    return (jr.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
+                    text = (jr.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
                 except Exception as e:
-                    return f"[LLM:mistral/{model}] REST error: {e}"
-        return f"[LLM:{self.provider}/{self.model}] Echo: {prompt}"
+                    raise RuntimeError(f"mistral/{model} REST error: {e}") from e
+                return self._finish(prompt, text, _rest_usage(jr))
+        return self._finish(prompt, f"[LLM:{self.provider}/{self.model}] Echo: {prompt}", {})
+
+    async def _agenerate(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        if self.provider == "openai" and self._openai is not None and AsyncOpenAI is not None:
+            client = _async_sdk(self, lambda http: AsyncOpenAI(http_client=http, timeout=_LLM_TIMEOUT_S))
+        elif self.provider == "deepseek" and self._deepseek is not None and AsyncOpenAI is not None:
+            client = _async_sdk(self, lambda http: AsyncOpenAI(
+                api_key=os.getenv("DEEPSEEK_API_KEY"), base_url="https://api.deepseek.com", http_client=http, timeout=_LLM_TIMEOUT_S,
+            ))
+        else:
+            client = None
+        if client is not None:
+            resp = await client.chat.completions.create(
+                model=self._model_name(),
+                messages=self._messages(prompt),
+                temperature=self.temperature,
+            )
+            return self._finish(prompt, (resp.choices[0].message.content or "").strip(), _chat_usage(resp))
+        if self.provider == "anthropic" and self._anthropic is not None:
+            aclient = _async_sdk(self, lambda http: anthropic.AsyncAnthropic(http_client=http, timeout=_LLM_TIMEOUT_S))
+            system, messages = self._anthropic_request(prompt)
+            resp = await aclient.messages.create(
+                model=self._model_name(),
+                system=system,
+                max_tokens=512,
+                messages=messages,
+            )
+            try:
+                text = "".join([b.text for b in (resp.content or []) if getattr(b, "text", None)])
+            except Exception:
+                text = str(resp)
+            return self._finish(prompt, text, _anthropic_usage(resp))
+        if self.provider == "mistral":
+            model = self._model_name()
+            ms_key = os.getenv("MISTRAL_API_KEY")
+            if ms_key:
+                payload = {
+                    "model": model,
+                    "messages": self._messages(prompt),
+                    "temperature": self.temperature,
+                }
+                last_err: Exception | None = None
+                for attempt in range(3):
+                    try:
+                        r = await _async_http().post(
+                            "https://api.mistral.ai/v1/chat/completions",
+                            headers={"Authorization": f"Bearer {ms_key}"},
+                            json=payload,
+                            timeout=30,
+                        )
+                        r.raise_for_status()
+                        jr = r.json()
+                        text = (jr.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
+                        return self._finish(prompt, text, _rest_usage(jr))
+                    except Exception as e:
+                        last_err = e
+                        if attempt < 2:
+                            await asyncio.sleep(0.6 * (2 ** attempt))
+                raise RuntimeError(f"mistral/{model} REST error: {last_err}")
+        return self._finish(prompt, f"[LLM:{self.provider}/{self.model}] Echo: {prompt}", {})
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Same request as generate(), yielding text deltas as the provider sends
+        them. Providers without a streaming client yield the full answer once.
+        """
+        if self.provider in ("openai", "deepseek"):
+            client = self._openai if self.provider == "openai" else self._deepseek
+            if client is not None:
+                stream = client.chat.completions.create(
+                    model=self._model_name(),
+                    messages=self._messages(prompt),
+                    temperature=self.temperature,
+                    stream=True,
+                )
+                for chunk in stream:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
+                return
+        if self.provider == "anthropic" and self._anthropic is not None:
+            system, messages = self._anthropic_request(prompt)
+            with self._anthropic.messages.stream(
+                model=self._model_name(),
+                system=system,
+                max_tokens=512,
+                messages=messages,
+            ) as stream:
+                for text in stream.text_stream:
+                    if text:
+                        yield text
+            return
+        if self.provider == "mistral":
+            model = self._model_name()
+            if self._mistral is not None and ChatMessage is not None and hasattr(self._mistral, "chat_stream"):
+                for chunk in self._mistral.chat_stream(
+                    model=model,
+                    messages=[ChatMessage(**m) for m in self._messages(prompt)],
+                    temperature=self.temperature,
+                ):
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+                return
+            ms_key = os.getenv("MISTRAL_API_KEY")
+            if ms_key:
+                headers = {"Authorization": f"Bearer {ms_key}", "Content-Type": "application/json", "Accept": "text/event-stream"}
+                payload = {
+                    "model": model,
+                    "messages": self._messages(prompt),
+                    "temperature": self.temperature,
+                    "stream": True,
+                }
+                with requests.post(
+                    "https://api.mistral.ai/v1/chat/completions",
+                    headers=headers, data=json.dumps(payload), timeout=30, stream=True,
+                ) as r:
+                    r.raise_for_status()
+                    for line in r.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or [{}]
+                        delta = (choices[0].get("delta") or {}).get("content")
+                        if delta:
+                            yield delta
+                return
+        yield self.generate(prompt)
 
 
 def make_embeddings_provider(cfg: Dict[str, Any]) -> EmbeddingsProvider:
@@ -344,20 +966,35 @@ def make_embeddings_provider(cfg: Dict[str, Any]) -> EmbeddingsProvider:
         model = e.get("hf_model")
     elif provider == "mistral":
         model = e.get("mistral_model")
+    elif provider == "local":
+        model = e.get("local_model")
     else:
         model = None
     return EmbeddingsProvider(provider=provider, model=model)
 
 
-def make_vector_store(cfg: Dict[str, Any]) -> VectorStore:
-    v = cfg.get("vector_store", {}) if isinstance(cfg, dict) else {}
-    provider = v.get("provider", "chromadb")
-    collection = v.get("collection", "glih-default")
-    return VectorStore(provider=provider, collection=collection)
+def make_vector_store(cfg: Dict[str, Any]) -> VectorStoreBase:
+    """
+    The configured [vector_store] backend. It takes precomputed embeddings
+    only (no embedding function): callers embed once, in batches, and query
+    by vector.
+    """
+    return get_vector_store(cfg if isinstance(cfg, dict) else {})
 
 
-def make_llm_provider(cfg: Dict[str, Any]) -> LLMProvider:
+def make_llm_provider(cfg: Dict[str, Any]) -> ResilientLLM:
+    """
+    The configured provider, followed by [llm].failover entries in order.
+    Each entry is a provider name or a {provider, model} table.
+    """
     llm_cfg = cfg.get("llm", {}) if isinstance(cfg, dict) else {}
     provider = llm_cfg.get("provider", "openai")
     model = llm_cfg.get("model", "gpt-4o-mini")
-    return LLMProvider(provider=provider, model=model)
+    chain = [(provider, model)]
+    for entry in llm_cfg.get("failover", []) or []:
+        if isinstance(entry, str):
+            entry = {"provider": entry}
+        spec = (entry.get("provider"), entry.get("model"))
+        if spec[0] and spec not in chain:
+            chain.append(spec)
+    return ResilientLLM([LLMProvider(provider=p, model=m) for p, m in chain])
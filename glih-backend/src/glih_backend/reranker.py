@@ -0,0 +1,386 @@
+"""
+GLIH Platform — Cross-Encoder Reranker
+======================================
+Optional second retrieval stage. Hybrid search fuses vector and BM25 hits
+with RRF. The reranker then reads each (query, chunk) pair with a small
+cross-encoder on the CPU (ms-marco-MiniLM-L-6-v2 by default) and reorders
+the fused candidates by its relevance score.
+
+  - One batched forward pass over every candidate that is not cached.
+  - Scores are cached per (query, chunk id, chunk text), an LRU of
+    GLIH_RERANK_CACHE_SIZE entries. Repeated dispatcher and agent
+    queries rerank without touching the model.
+  - Latency budget: if the pass is not done within GLIH_RERANK_BUDGET_MS,
+    the candidates come back in RRF order (status "timeout"). The pass
+    keeps running in the background and still fills the cache.
+  - The model loads on first use. warm() loads it in the background at
+    startup, so the first query does not pay for the load.
+
+Backends (GLIH_RERANK_BACKEND), same as the local embedder:
+  onnx                   onnxruntime + tokenizers (Hub id or local directory)
+  sentence-transformers  CrossEncoder on torch
+  auto (default)         onnx when available, else sentence-transformers
+
+Env:
+  GLIH_RERANK               enable the stage for /query, /query/stream, /query/batch (default 0)
+  GLIH_RERANK_MODEL         cross-encoder model (default cross-encoder/ms-marco-MiniLM-L-6-v2)
+  GLIH_RERANK_CANDIDATES    fused candidates scored per query (default 20)
+  GLIH_RERANK_BUDGET_MS     latency budget for one rerank (default 150)
+  GLIH_RERANK_CACHE_SIZE    cached (query, chunk) scores (default 8192)
+  GLIH_RERANK_MAX_TOKENS    query + chunk tokens per pair (default 256)
+  GLIH_RERANK_QUANTIZED     int8 model (default 0)
+  GLIH_RERANK_THREADS       intra-op threads for the forward pass (default cores // 2)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+from .local_embeddings import _ONNX_FILES, _ONNX_QUANTIZED_FILES, _OnnxEncoder, _read_json, _resolve_model_dir
+
+logger = logging.getLogger(__name__)
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+RERANK_ENABLED = os.getenv("GLIH_RERANK", "0").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("GLIH_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BACKEND = os.getenv("GLIH_RERANK_BACKEND", "auto").lower()
+RERANK_CANDIDATES = int(os.getenv("GLIH_RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("GLIH_RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = int(os.getenv("GLIH_RERANK_CACHE_SIZE", "8192"))
+RERANK_MAX_TOKENS = int(os.getenv("GLIH_RERANK_MAX_TOKENS", "256"))
+RERANK_QUANTIZED = os.getenv("GLIH_RERANK_QUANTIZED", "0").lower() in ("1", "true", "yes")
+RERANK_THREADS = int(os.getenv("GLIH_RERANK_THREADS", str(max(1, (os.cpu_count() or 1) // 2))))
+
+
+# ── Cross-encoders ────────────────────────────────────────────────────────────
+
+class _OnnxCrossEncoder:
+    """tokenizers + onnxruntime over (query, passage) pairs; one logit per pair."""
+
+    name = "onnx"
+
+    def __init__(self, model: str, quantized: bool, threads: int, max_tokens: int) -> None:
+        import onnxruntime as ort  # type: ignore
+        from tokenizers import Tokenizer  # type: ignore
+
+        candidates = (_ONNX_QUANTIZED_FILES if quantized else []) + _ONNX_FILES
+        model_dir = _resolve_model_dir(model, candidates)
+        path = next((os.path.join(model_dir, c) for c in candidates if os.path.isfile(os.path.join(model_dir, c))), None)
+        if path is None:
+            raise RuntimeError(f"no ONNX model in {model_dir} (looked for {', '.join(candidates)})")
+        if quantized and os.path.basename(path) == "model.onnx":
+            path = _OnnxEncoder._quantize(path)
+        self.model_path = path
+        self.quantized = os.path.basename(path) != "model.onnx"
+
+        cfg = _read_json(os.path.join(model_dir, "tokenizer_config.json")) or {}
+        self.max_tokens = min(max_tokens, int(cfg.get("model_max_length") or max_tokens))
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        # Long chunks lose their tail, never the query
+        self.tokenizer.enable_truncation(max_length=self.max_tokens, strategy="only_second")
+        pad_token = "[PAD]" if self.tokenizer.token_to_id("[PAD]") is not None else "<pad>"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = max(1, threads)
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        encs = self.tokenizer.encode_batch(pairs)
+        feed = {
+            "input_ids": np.asarray([e.ids for e in encs], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encs], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encs], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+        # Single-logit relevance heads; two-class heads score the "relevant" column
+        return np.asarray(logits, dtype=np.float32).reshape(len(pairs), -1)[:, -1]
+
+
+class _TorchCrossEncoder:
+    """sentence-transformers CrossEncoder on CPU."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model: str, quantized: bool, threads: int, max_tokens: int) -> None:
+        import torch  # type: ignore
+        from sentence_transformers import CrossEncoder  # type: ignore
+
+        torch.set_num_threads(max(1, threads))
+        ce = CrossEncoder(model, device="cpu", max_length=max_tokens)
+        if quantized:
+            ce.model = torch.quantization.quantize_dynamic(ce.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = ce
+        self.model_path = model
+        self.quantized = quantized
+
+    def score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        scores = self.model.predict(pairs, batch_size=len(pairs), convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(scores, dtype=np.float32).reshape(len(pairs), -1)[:, -1]
+
+
+def _load_cross_encoder(model: str, backend: str, quantized: bool, threads: int, max_tokens: int):
+    if backend not in ("auto", "onnx", "sentence-transformers"):
+        raise RuntimeError(f"unknown GLIH_RERANK_BACKEND '{backend}'")
+    if backend in ("auto", "onnx"):
+        try:
+            return _OnnxCrossEncoder(model, quantized, threads, max_tokens)
+        except ImportError as e:
+            if backend == "onnx":
+                raise RuntimeError(f"onnx backend needs onnxruntime and tokenizers: {e}")
+            logger.info(f"Reranker: onnx backend unavailable ({e}), trying sentence-transformers")
+    try:
+        return _TorchCrossEncoder(model, quantized, threads, max_tokens)
+    except ImportError as e:
+        raise RuntimeError(
+            f"no cross-encoder backend available (pip install 'glih-backend[local]' or sentence-transformers): {e}"
+        )
+
+
+# ── Reranker ──────────────────────────────────────────────────────────────────
+
+class Reranker:
+    """Lazily loaded cross-encoder + score cache + latency budget."""
+
+    def __init__(
+        self,
+        model: str = RERANK_MODEL,
+        backend: str = RERANK_BACKEND,
+        quantized: bool = RERANK_QUANTIZED,
+        candidates: int = RERANK_CANDIDATES,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+        max_tokens: int = RERANK_MAX_TOKENS,
+        threads: int = RERANK_THREADS,
+    ) -> None:
+        self.model = model
+        self.backend = backend
+        self.quantized = quantized
+        self.candidates = max(1, candidates)
+        self.budget_ms = budget_ms
+        self.cache_size = max(0, cache_size)
+        self.max_tokens = max_tokens
+        self.threads = max(1, threads)
+        self._encoder = None
+        self._load_lock = threading.Lock()
+        # One pass at a time: the encoder already uses `threads` cores
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="glih-rerank")
+        self._cache: "OrderedDict[Tuple[str, str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._latency: "deque[float]" = deque(maxlen=500)
+        self._stats = {
+            "calls": 0, "pairs": 0, "cache_hits": 0, "scored": 0, "batches": 0,
+            "timeouts": 0, "errors": 0, "evictions": 0,
+        }
+        self.load_ms: Optional[float] = None
+
+    # ── lifecycle ──
+
+    def encoder(self):
+        if self._encoder is None:
+            with self._load_lock:
+                if self._encoder is None:
+                    t0 = time.perf_counter()
+                    self._encoder = _load_cross_encoder(self.model, self.backend, self.quantized, self.threads, self.max_tokens)
+                    self.load_ms = round((time.perf_counter() - t0) * 1000, 1)
+                    logger.info(
+                        f"Reranker: {self._encoder.name} model {self._encoder.model_path} loaded in "
+                        f"{self.load_ms}ms (threads={self.threads}, quantized={self._encoder.quantized})"
+                    )
+        return self._encoder
+
+    def warm(self) -> None:
+        """Load the model in the background; errors are logged and surface again on use."""
+        def _load() -> None:
+            try:
+                self.encoder()
+            except Exception as e:
+                logger.warning(f"Reranker: model load failed: {e}")
+        threading.Thread(target=_load, name="glih-rerank-warm", daemon=True).start()
+
+    # ── cache ──
+
+    @staticmethod
+    def _key(query: str, result: Dict[str, Any]) -> Tuple[str, str, int]:
+        doc = result.get("document") or ""
+        return normalize_text(query), str(result.get("id")), zlib.crc32(doc.encode("utf-8"))
+
+    def _cached(self, keys: List[Tuple[str, str, int]]) -> List[Optional[float]]:
+        out: List[Optional[float]] = []
+        with self._lock:
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                out.append(score)
+        return out
+
+    def _store(self, keys: List[Tuple[str, str, int]], scores: List[float]) -> None:
+        if not self.cache_size:
+            return
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    # ── scoring ──
+
+    def _score(self, query: str, docs: List[str], keys: List[Tuple[str, str, int]]) -> List[float]:
+        t0 = time.perf_counter()
+        try:
+            scores = self.encoder().score([(query, d) for d in docs]).tolist()
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        self._store(keys, scores)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["scored"] += len(docs)
+            self._latency.append((time.perf_counter() - t0) * 1000)
+        return scores
+
+    def _plan(self, query: str, results: List[Dict[str, Any]]):
+        """Cached scores for the candidates, and the pass (if any) that scores the rest."""
+        keys = [self._key(query, r) for r in results]
+        scores = self._cached(keys)
+        missing = [i for i, s in enumerate(scores) if s is None]
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["pairs"] += len(results)
+            self._stats["cache_hits"] += len(results) - len(missing)
+        future: Optional[Future] = None
+        if missing:
+            future = self._pool.submit(
+                self._score, query, [results[i].get("document") or "" for i in missing], [keys[i] for i in missing]
+            )
+        return scores, missing, future
+
+    def _order(
+        self, results: List[Dict[str, Any]], scores: List[Optional[float]], k: int, timings: Dict[str, Any], started: float
+    ) -> List[Dict[str, Any]]:
+        ranked = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        timings["rerank_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        timings["rerank_status"] = "ok"
+        return [{**results[i], "rerank_score": round(float(scores[i]), 4)} for i in ranked[:k]]
+
+    def _fallback(self, results, k, timings, started, status: str, error: Optional[Exception] = None):
+        timings["rerank_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        timings["rerank_status"] = status
+        if error is not None:
+            timings["rerank_error"] = str(error)[:200]
+        return results[:k]
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], k: int, timings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Top `k` of the fused `results` by cross-encoder score, or the first `k`
+        in the given (RRF) order when the pass fails or overruns the budget.
+        """
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        if len(results) <= 1:
+            return self._fallback(results, k, timings, started, "skipped")
+        scores, missing, future = self._plan(query, results)
+        timings["rerank_cached"] = len(results) - len(missing)
+        if future is not None:
+            try:
+                fresh = future.result(timeout=max(0.0, self.budget_ms / 1000.0 - (time.perf_counter() - started)))
+            except FutureTimeoutError:
+                return self._timeout(results, k, timings, started)
+            except Exception as e:
+                logger.warning(f"Reranker: scoring failed, keeping RRF order: {e}")
+                return self._fallback(results, k, timings, started, "error", e)
+            for i, s in zip(missing, fresh):
+                scores[i] = s
+        return self._order(results, scores, k, timings, started)
+
+    async def arerank(self, query: str, results: List[Dict[str, Any]], k: int, timings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """rerank() for the event loop; the pass runs on the reranker thread."""
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        if len(results) <= 1:
+            return self._fallback(results, k, timings, started, "skipped")
+        scores, missing, future = self._plan(query, results)
+        timings["rerank_cached"] = len(results) - len(missing)
+        if future is not None:
+            try:
+                fresh = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)),
+                    timeout=max(0.0, self.budget_ms / 1000.0 - (time.perf_counter() - started)),
+                )
+            except asyncio.TimeoutError:
+                return self._timeout(results, k, timings, started)
+            except Exception as e:
+                logger.warning(f"Reranker: scoring failed, keeping RRF order: {e}")
+                return self._fallback(results, k, timings, started, "error", e)
+            for i, s in zip(missing, fresh):
+                scores[i] = s
+        return self._order(results, scores, k, timings, started)
+
+    def _timeout(self, results, k, timings, started):
+        with self._lock:
+            self._stats["timeouts"] += 1
+        logger.warning(f"Reranker: exceeded {self.budget_ms:.0f}ms budget, keeping RRF order")
+        return self._fallback(results, k, timings, started, "timeout")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["cache_entries"] = len(self._cache)
+            lat = sorted(self._latency)
+        if lat:
+            out["batch_ms_p50"] = round(lat[len(lat) // 2], 1)
+            out["batch_ms_p95"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1)
+        out["cache_hit_rate"] = round(out["cache_hits"] / out["pairs"], 4) if out["pairs"] else 0.0
+        enc = self._encoder
+        out.update({
+            "model": self.model,
+            "backend": enc.name if enc is not None else self.backend,
+            "loaded": enc is not None,
+            "load_ms": self.load_ms,
+            "candidates": self.candidates,
+            "budget_ms": self.budget_ms,
+            "cache_size": self.cache_size,
+        })
+        return out
+
+
+_rerankers: Dict[str, Reranker] = {}
+_rerankers_lock = threading.Lock()
+_rerankers_pid: Optional[int] = None
+
+
+def get_reranker(model: Optional[str] = None) -> Reranker:
+    """One reranker (model + score cache) per model and process."""
+    global _rerankers_pid
+    model = model or RERANK_MODEL
+    with _rerankers_lock:
+        if _rerankers_pid != os.getpid():
+            _rerankers_pid = os.getpid()
+            _rerankers.clear()
+        rr = _rerankers.get(model)
+        if rr is None:
+            rr = _rerankers[model] = Reranker(model)
+        return rr
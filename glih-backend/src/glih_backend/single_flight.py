@@ -0,0 +1,112 @@
+"""
+GLIH Platform — Single-Flight Request Coalescing
+================================================
+Identical calls that overlap in time share one upstream call. The first
+caller for a key (the leader) runs the function. Callers that arrive while it
+is still running (followers) wait for it and get the same result or the same
+exception. Once the call settles, the key is forgotten, so this is not a
+cache: a later identical call goes upstream again.
+
+Two independent flight tables:
+  do()   plain callables, threads wait on an Event
+  ado()  coroutines, one Task per key per event loop. Followers await it
+         through asyncio.shield, so a cancelled caller (client disconnect)
+         never cancels the call the other callers are waiting on.
+
+stats() reports leaders, coalesced followers and calls in flight for
+/health/detailed.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key."""
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = weakref.WeakKeyDictionary()
+        self._stats = {"leaders": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await fn()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.get(loop)
+            if tasks is None:
+                tasks = self._tasks[loop] = {}
+            task = tasks.get(key)
+            if task is not None:
+                self._stats["coalesced"] += 1
+            else:
+                task = tasks[key] = loop.create_task(self._lead(tasks, key, fn))
+                self._stats["leaders"] += 1
+        return await asyncio.shield(task)
+
+    async def _lead(self, tasks: Dict[Hashable, asyncio.Task], key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fn()
+        except BaseException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                tasks.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["in_flight"] = len(self._calls) + sum(len(t) for t in self._tasks.values())
+        calls = out["leaders"] + out["coalesced"]
+        out["coalesced_rate"] = round(out["coalesced"] / calls, 4) if calls else 0.0
+        out["enabled"] = self.enabled
+        return out
@@ -47,7 +47,7 @@ class UnifiedVectorStore:
         logger.info(f"UnifiedVectorStore initialized with provider: {self.provider}")
     
     def set_embedding_function(self, embedding_function):
-        """Set the embedding function and initialize the store."""
+        """Set the embedding function (used by search_by_text) and initialize the store."""
         self._embedding_function = embedding_function
         self._store = get_vector_store(self.config, embedding_function)
     
@@ -89,26 +89,15 @@ class UnifiedVectorStore:
         texts: List[str],
         embeddings: List[List[float]],
         metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
     ) -> int:
-        """Index documents to a specific collection."""
+        """Index documents with their precomputed embeddings (one bulk upsert)."""
         if self._store is None:
             raise RuntimeError("Vector store not initialized. Call set_embedding_function first.")
         
         try:
-            # Generate IDs
-            ids = [str(uuid.uuid4()) for _ in range(len(texts))]
-            
-            # Note: We're not using the embeddings parameter directly
-            # because the store will generate them using the embedding function
-            # This maintains backward compatibility
-            success = self._store.add_documents(
-                collection_name=collection,
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            return len(texts) if success else 0
+            ids = ids or [str(uuid.uuid4()) for _ in range(len(texts))]
+            return self._store.upsert(collection, ids, embeddings, texts, metadatas)
         except Exception as e:
             logger.error(f"Failed to index documents: {e}")
             return 0
@@ -117,43 +106,38 @@ class UnifiedVectorStore:
         self,
         query_embedding: List[float],
         k: int = 5,
-        collection: Optional[str] = None
+        collection: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
-        """
-        Search using a query embedding.
-        Note: This is a compatibility method. The new interface uses query_text.
-        """
+        """Search by a query embedding (no re-embedding)."""
         if self._store is None:
             raise RuntimeError("Vector store not initialized")
         
-        # For compatibility, we need to convert embedding back to text
-        # This is not ideal, but maintains backward compatibility
-        # In practice, callers should use search_by_text instead
         collection_name = collection or self.collection
         
         try:
-            # This is a workaround - ideally callers should use search_by_text
-            results = self._store.query(
-                collection_name=collection_name,
-                query_text="",  # Empty query - will use embedding if store supports it
-                n_results=k
-            )
-            
-            # Format for backward compatibility
-            formatted = []
-            for r in results:
-                formatted.append({
-                    'id': r.get('id'),
-                    'document': r.get('document'),
-                    'metadata': r.get('metadata', {}),
-                    'distance': r.get('distance')
-                })
-            
-            return formatted
+            return self._store.query_by_vector(collection_name, query_embedding, k=k, where=where)
         except Exception as e:
             logger.error(f"Search failed: {e}")
             return []
     
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        collection: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Search by several query embeddings in one store call."""
+        if self._store is None:
+            raise RuntimeError("Vector store not initialized")
+        
+        try:
+            return self._store.query_many(collection or self.collection, query_embeddings, k=k, where=where)
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+            return [[] for _ in query_embeddings]
+    
     def search_by_text(
         self,
         query_text: str,
@@ -190,7 +174,10 @@ class UnifiedVectorStore:
         max_distance: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """Search from a specific collection."""
-        return self.search(query_embedding, k, collection)
+        results = self.search(query_embedding, k, collection)
+        if max_distance is None:
+            return results
+        return [r for r in results if r.get('distance') is not None and r['distance'] <= max_distance]
     
     def get_stats(self, collection: Optional[str] = None) -> Dict[str, Any]:
         """Get statistics for a collection."""
@@ -1,6 +1,7 @@
 """Multi-vector database support for GLIH."""
 
 from .base import VectorStoreBase
+from .bulk import BulkUpsertError, get_bulk_upsert_stats
 from .factory import get_vector_store
 
-__all__ = ['VectorStoreBase', 'get_vector_store']
+__all__ = ['VectorStoreBase', 'get_vector_store', 'BulkUpsertError', 'get_bulk_upsert_stats']
@@ -1,32 +1,143 @@
-"""Base interface for vector stores."""
+"""
+Base interface for vector stores.
+
+One contract for every backend (Chroma, FAISS, Pinecone, Qdrant, Weaviate),
+built around precomputed embeddings:
+
+  upsert(collection, ids, embeddings, documents, metadatas)   bulk write, replaces by id
+  query_many(collection, query_embeddings, k, where)          many query vectors per call
+  get / existing_ids / scan / count / delete                  by id, or every chunk
+
+The stores never embed on the read or write path: the API embeds ingest
+chunks once, in batches, and query vectors once (cached). add_documents()
+and query() remain as text conveniences for scripts; they call
+`embedding_function` once per call for the whole batch.
+
+Results are dicts: {"id", "document", "metadata", "distance"}, distance
+lower is better. `where` is a MetadataFilter or a filter spec dict (see
+glih_backend.metadata_filter), applied inside the store before the top k
+is taken.
+"""
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
 
 
 class VectorStoreBase(ABC):
     """Abstract base class for vector store implementations."""
-    
-    def __init__(self, config: Dict[str, Any], embedding_function):
+
+    provider = "base"
+
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         self.config = config
         self.embedding_function = embedding_function
-    
+        # Default collection for requests that do not name one
+        self.collection = config.get('vector_store', {}).get('collection', 'glih-default')
+        # Local data directory, None for hosted stores
+        self.persist_dir: Optional[str] = None
+
+    # ── Collections ──
+
     @abstractmethod
     def create_collection(self, collection_name: str, **kwargs) -> bool:
         """Create a new collection/index."""
         pass
-    
+
     @abstractmethod
     def delete_collection(self, collection_name: str) -> bool:
-        """Delete a collection/index."""
+        """Delete a collection/index. False if it did not exist or could not be deleted."""
         pass
-    
+
     @abstractmethod
     def list_collections(self) -> List[str]:
         """List all collections/indexes."""
         pass
-    
+
+    def reset_collection(self, collection_name: str) -> bool:
+        """Drop every chunk of a collection, keeping the collection."""
+        self.delete_collection(collection_name)
+        return self.create_collection(collection_name)
+
+    def collection_token(self, collection_name: str) -> Optional[str]:
+        """
+        Identity of the current instance of a collection (changes when it is
+        deleted and recreated), or None when the store has no such notion.
+        Derived indexes (BM25) use it to notice a reset.
+        """
+        return None
+
+    # ── Writes ──
+
+    @abstractmethod
+    def upsert(
+        self,
+        collection_name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Write chunks with precomputed embeddings, replacing any with the same
+        id. Creates the collection on first write. Returns the number written.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        """Delete chunks by id. Returns the number of ids submitted for deletion."""
+        pass
+
+    # ── Reads ──
+
     @abstractmethod
+    def query_many(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Top-k per query vector, in one call (one round trip where the store allows)."""
+        pass
+
+    def query_by_vector(
+        self,
+        collection_name: str,
+        query_embedding: List[float],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[Dict[str, Any]]:
+        """Top-k for a single query vector."""
+        return self.query_many(collection_name, [query_embedding], k=k, where=where)[0]
+
+    @abstractmethod
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        """The stored chunks among `ids` (missing ids are skipped), without distances."""
+        pass
+
+    def existing_ids(self, collection_name: str, ids: List[str]) -> set:
+        """Subset of `ids` already stored in the collection."""
+        if not ids:
+            return set()
+        return {r['id'] for r in self.get(collection_name, list(dict.fromkeys(ids)), include_documents=False)}
+
+    @abstractmethod
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Every chunk of a collection, in batches (id, document, metadata)."""
+        pass
+
+    @abstractmethod
+    def count(self, collection_name: str) -> int:
+        """Number of chunks in a collection (0 if it does not exist)."""
+        pass
+
+    # ── Text conveniences (one embedding call per batch) ──
+
     def add_documents(
         self,
         collection_name: str,
@@ -34,26 +145,46 @@ class VectorStoreBase(ABC):
         metadatas: Optional[List[Dict[str, Any]]] = None,
         ids: Optional[List[str]] = None
     ) -> bool:
-        """Add documents to a collection."""
-        pass
-    
-    @abstractmethod
+        """Embed documents in one batch with `embedding_function` and upsert them."""
+        if self.embedding_function is None:
+            raise RuntimeError("add_documents needs an embedding_function; use upsert() with embeddings")
+        try:
+            embeddings = self.embedding_function(list(documents))
+            ids = ids or [str(uuid.uuid4()) for _ in documents]
+            self.upsert(collection_name, ids, embeddings, documents, metadatas)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to add documents to {collection_name}: {e}")
+            return False
+
     def query(
         self,
         collection_name: str,
         query_text: str,
         n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
+        where: Optional[Any] = None,
         max_distance: Optional[float] = None
     ) -> List[Dict[str, Any]]:
-        """Query documents from a collection."""
-        pass
-    
+        """Embed `query_text` once and query by vector."""
+        if self.embedding_function is None:
+            raise RuntimeError("query needs an embedding_function; use query_by_vector()")
+        try:
+            query_embedding = self.embedding_function([query_text])[0]
+            results = self.query_by_vector(collection_name, query_embedding, k=n_results, where=where)
+        except Exception as e:
+            logger.error(f"Failed to query {collection_name}: {e}")
+            return []
+        if max_distance is None:
+            return results
+        return [r for r in results if r.get('distance') is not None and r['distance'] <= max_distance]
+
+    # ── Status ──
+
     @abstractmethod
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about a collection."""
         pass
-    
+
     @abstractmethod
     def health_check(self) -> Dict[str, Any]:
         """Check if the vector store is healthy."""
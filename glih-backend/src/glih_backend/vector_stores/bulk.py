@@ -0,0 +1,277 @@
+"""
+Bulk upsert engine for the hosted vector stores (Qdrant, Pinecone, Weaviate).
+
+The stores turn (id, embedding, document, metadata) rows into provider
+records and hand them here with a `send(records)` callable:
+
+  - records are split into batches by point count (the provider's limit) and
+    by estimated request payload (GLIH_BULK_MAX_BATCH_BYTES);
+  - batches are uploaded concurrently on a per-provider executor, at most
+    GLIH_BULK_WORKERS in flight per process; a single batch runs inline;
+  - only the batches that failed with a transient error (transport error,
+    timeout, HTTP 429 or 5xx) are retried, with exponential backoff +
+    jitter; any other error fails the batch at once. Record ids are
+    deterministic (derived from the chunk id), so a retried or repeated
+    batch overwrites instead of duplicating;
+  - every upsert reports vectors, batches, retries and vectors/sec; totals
+    and recent upserts are exposed through get_bulk_upsert_stats().
+
+Env:
+  GLIH_BULK_WORKERS          concurrent batch uploads per provider (default 4)
+  GLIH_BULK_MAX_BATCH_BYTES  estimated payload per batch (default 2000000)
+  GLIH_BULK_MAX_RETRIES      retries of a failed batch (default 3)
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+BULK_WORKERS = int(os.getenv("GLIH_BULK_WORKERS", "4"))
+BULK_MAX_BATCH_BYTES = int(os.getenv("GLIH_BULK_MAX_BATCH_BYTES", "2000000"))
+BULK_MAX_RETRIES = int(os.getenv("GLIH_BULK_MAX_RETRIES", "3"))
+
+# A float serialized in a JSON request body ("-0.0123456789,")
+_BYTES_PER_DIM = 12
+# Ids, keys and framing per record
+_RECORD_OVERHEAD = 64
+# Exception classes (by name, anywhere in the MRO) of transport failures in
+# requests / httpx / urllib3 / grpc, which client libraries raise unwrapped
+_TRANSPORT_ERRORS = re.compile(r"Timeout|Connect|TransportError|ProtocolError|RemoteDisconnected|RpcError")
+_NOT_FOUND = re.compile(r"not found|not present|does ?n[o']t exist", re.IGNORECASE)
+
+
+class BulkUpsertError(RuntimeError):
+    """Batches still failing after the retries; `report` has the counts."""
+
+    def __init__(self, message: str, report: Dict[str, Any]):
+        super().__init__(message)
+        self.report = report
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by a client exception (status_code / status / response), if any."""
+    for value in (
+        getattr(exc, 'status_code', None),
+        getattr(exc, 'status', None),
+        getattr(getattr(exc, 'response', None), 'status_code', None),
+    ):
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def _causes(exc: BaseException) -> Iterator[BaseException]:
+    """The exception and what it wraps: __cause__, __context__ and .source (qdrant-client)."""
+    seen, todo = set(), [exc]
+    while todo and len(seen) < 16:
+        e = todo.pop(0)
+        if e is None or id(e) in seen or not isinstance(e, BaseException):
+            continue
+        seen.add(id(e))
+        yield e
+        todo.extend((e.__cause__, e.__context__, getattr(e, 'source', None)))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Transport errors, timeouts, 429 and 5xx; not 4xx or payload / validation
+    errors. Client wrappers (qdrant-client's ResponseHandlingException around
+    an httpx timeout) are classified by what they wrap; the outermost status
+    wins.
+    """
+    for e in _causes(exc):
+        status = error_status(e)
+        if status is not None:
+            return status == 429 or status >= 500
+        if isinstance(e, (ConnectionError, TimeoutError)):
+            return True
+        if any(_TRANSPORT_ERRORS.search(cls.__name__) for cls in type(e).__mro__):
+            return True
+    return False
+
+
+def is_not_found(exc: BaseException) -> bool:
+    """The target collection / index / class is gone (404, or a not-found message)."""
+    status = error_status(exc)
+    if status is not None:
+        return status == 404
+    return bool(_NOT_FOUND.search(str(exc)))
+
+
+def estimate_bytes(embedding: Sequence[float], document: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+    """Approximate request payload of one record."""
+    size = len(embedding) * _BYTES_PER_DIM + len(document.encode('utf-8')) + _RECORD_OVERHEAD
+    if metadata:
+        size += len(json.dumps(metadata, default=str))
+    return size
+
+
+def split_batches(sizes: Sequence[int], max_points: int, max_bytes: int) -> List[Tuple[int, int]]:
+    """[start, end) ranges of at most max_points records and ~max_bytes (min. one record)."""
+    ranges: List[Tuple[int, int]] = []
+    start, total = 0, 0
+    for i, size in enumerate(sizes):
+        if i > start and (i - start >= max_points or total + size > max_bytes):
+            ranges.append((start, i))
+            start, total = i, 0
+        total += size
+    if start < len(sizes):
+        ranges.append((start, len(sizes)))
+    return ranges
+
+
+class _BulkMetrics:
+    """Totals per provider plus the most recent upserts."""
+
+    def __init__(self, window: int = 50) -> None:
+        self._lock = threading.Lock()
+        self._recent: "deque[Dict[str, Any]]" = deque(maxlen=window)
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, report: Dict[str, Any]) -> None:
+        with self._lock:
+            self._recent.append(report)
+            t = self._totals.setdefault(report['provider'], {
+                'upserts': 0, 'vectors': 0, 'batches': 0, 'retried_batches': 0, 'failed_batches': 0, 'seconds': 0.0,
+            })
+            t['upserts'] += 1
+            t['vectors'] += report['vectors']
+            t['batches'] += report['batches']
+            t['retried_batches'] += report['retried_batches']
+            t['failed_batches'] += report['failed_batches']
+            t['seconds'] += report['seconds']
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {p: dict(t) for p, t in self._totals.items()}
+            recent = list(self._recent)
+        for t in totals.values():
+            t['seconds'] = round(t['seconds'], 3)
+            t['vectors_per_sec'] = round(t['vectors'] / t['seconds'], 1) if t['seconds'] else None
+        return {
+            'workers': BULK_WORKERS,
+            'max_batch_bytes': BULK_MAX_BATCH_BYTES,
+            'max_retries': BULK_MAX_RETRIES,
+            'providers': totals,
+            'recent': recent[-10:],
+        }
+
+
+_metrics = _BulkMetrics()
+_pool_lock = threading.Lock()
+_pool_pid: Optional[int] = None
+_pools: Dict[str, ThreadPoolExecutor] = {}
+
+
+def _pool(provider: str) -> ThreadPoolExecutor:
+    """Per-provider upload executor, created lazily and again after a fork."""
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool_pid = os.getpid()
+            _pools.clear()
+        pool = _pools.get(provider)
+        if pool is None:
+            pool = _pools[provider] = ThreadPoolExecutor(
+                max_workers=max(BULK_WORKERS, 1), thread_name_prefix=f"glih-bulk-{provider}"
+            )
+        return pool
+
+
+def get_bulk_upsert_stats() -> Dict[str, Any]:
+    """Counters and recent reports of the bulk upsert engine."""
+    return _metrics.snapshot()
+
+
+def bulk_upsert(
+    provider: str,
+    collection_name: str,
+    records: List[Any],
+    sizes: Sequence[int],
+    send: Callable[[List[Any]], None],
+    max_points: int,
+    max_bytes: int = BULK_MAX_BATCH_BYTES,
+    retries: int = BULK_MAX_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Upload `records` (with estimated byte `sizes`) through `send`, batched and
+    concurrent. Returns the report; raises BulkUpsertError if a batch fails
+    with a non-retryable error, or still fails after `retries` (batches that
+    succeeded stay written).
+    """
+    t0 = time.perf_counter()
+    ranges = split_batches(sizes, max(max_points, 1), max(min(max_bytes, BULK_MAX_BATCH_BYTES), 1))
+    attempts = [0] * len(ranges)
+
+    def run(idx: int) -> None:
+        lo, hi = ranges[idx]
+        send(records[lo:hi])
+
+    pending = list(range(len(ranges)))
+    fatal: List[int] = []
+    last_err: Optional[Exception] = None
+
+    def failed_with(idx: int, e: Exception) -> None:
+        nonlocal last_err
+        last_err = e
+        (failed if is_retryable(e) else fatal).append(idx)
+
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(min(20.0, 0.5 * (2 ** (attempt - 1))) * (0.5 + random.random()))
+            logger.warning(f"Bulk upsert to {provider}/{collection_name}: retrying {len(pending)} batch(es): {last_err}")
+        failed: List[int] = []
+        if len(pending) == 1:
+            try:
+                attempts[pending[0]] = attempt
+                run(pending[0])
+            except Exception as e:
+                failed_with(pending[0], e)
+        else:
+            futures = []
+            for idx in pending:
+                attempts[idx] = attempt
+                futures.append((idx, _pool(provider).submit(run, idx)))
+            for idx, fut in futures:
+                try:
+                    fut.result()
+                except Exception as e:
+                    failed_with(idx, e)
+        pending = failed
+        if not pending:
+            break
+    pending += fatal
+
+    seconds = time.perf_counter() - t0
+    written = len(records) - sum(ranges[i][1] - ranges[i][0] for i in pending)
+    report = {
+        'provider': provider,
+        'collection': collection_name,
+        'vectors': written,
+        'batches': len(ranges),
+        'retried_batches': sum(1 for a in attempts if a),
+        'failed_batches': len(pending),
+        'payload_bytes': int(sum(sizes)),
+        'seconds': round(seconds, 3),
+        'vectors_per_sec': round(written / seconds, 1) if seconds > 0 else None,
+    }
+    _metrics.record(report)
+    if pending:
+        raise BulkUpsertError(
+            f"bulk upsert to {provider}/{collection_name}: {len(pending)}/{len(ranges)} batches failed: {last_err}",
+            report,
+        )
+    logger.info(
+        f"Bulk upsert to {provider}/{collection_name}: {written} vectors in {len(ranges)} batches, "
+        f"{report['seconds']}s ({report['vectors_per_sec']} vectors/s, {report['retried_batches']} retried)"
+    )
+    return report
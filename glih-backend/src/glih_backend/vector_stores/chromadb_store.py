@@ -1,45 +1,86 @@
 """ChromaDB vector store implementation."""
 
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+import os
+from typing import List, Dict, Any, Iterator, Optional
 import logging
 
+try:
+    # chromadb >= 0.5 has PersistentClient
+    from chromadb import PersistentClient as _ChromaPersistentClient  # type: ignore
+    _HAVE_PERSISTENT = True
+except Exception:  # chromadb < 0.5 fallback
+    _HAVE_PERSISTENT = False
+    import chromadb  # type: ignore
+    from chromadb.config import Settings  # type: ignore
+
+from ..metadata_filter import MetadataFilter
 from .base import VectorStoreBase
 
 logger = logging.getLogger(__name__)
 
+# Chroma caps the ids / records per get and upsert call
+_CHROMA_BATCH = 5000
+
+
+def _rows(res: Dict[str, Any], q: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Chroma get() / query() column result → result dicts (query row `q`)."""
+    def col(name: str) -> List[Any]:
+        values = res.get(name) or []
+        if q is not None:
+            values = values[q] if q < len(values) else []
+        return values or []
+
+    ids, docs, metas, dists = col('ids'), col('documents'), col('metadatas'), col('distances')
+    return [
+        {
+            'id': rid,
+            'document': docs[i] if i < len(docs) else None,
+            'metadata': (metas[i] if i < len(metas) else None) or {},
+            'distance': dists[i] if i < len(dists) else None,
+        }
+        for i, rid in enumerate(ids)
+    ]
+
 
 class ChromaDBStore(VectorStoreBase):
     """ChromaDB implementation of vector store."""
-    
-    def __init__(self, config: Dict[str, Any], embedding_function):
+
+    provider = "chromadb"
+
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         super().__init__(config, embedding_function)
-        
+
         chromadb_config = config.get('vector_store', {}).get('chromadb', {})
-        persist_dir = chromadb_config.get('persist_directory', 'data/chromadb')
-        
-        self.client = chromadb.Client(Settings(
-            persist_directory=persist_dir,
-            anonymized_telemetry=False
-        ))
-        
-        logger.info(f"ChromaDB initialized with persist_directory: {persist_dir}")
-    
+        persist_dir = os.getenv("GLIH_CHROMA_DIR") or chromadb_config.get('persist_directory') or os.path.join("data", "chroma")
+        self.persist_dir = os.path.abspath(persist_dir)
+        os.makedirs(self.persist_dir, exist_ok=True)
+
+        if _HAVE_PERSISTENT:
+            self.client = _ChromaPersistentClient(path=self.persist_dir)
+        else:
+            self.client = chromadb.Client(Settings(persist_directory=self.persist_dir, anonymized_telemetry=False))  # type: ignore
+        self.client.get_or_create_collection(name=self.collection)
+
+        logger.info(f"ChromaDB initialized with persist_directory: {self.persist_dir}")
+
+    def _collection(self, collection_name: str, create: bool = False):
+        if create:
+            return self.client.get_or_create_collection(name=collection_name)
+        try:
+            return self.client.get_collection(name=collection_name)
+        except Exception:
+            return None
+
     def create_collection(self, collection_name: str, **kwargs) -> bool:
         """Create a new collection."""
         try:
-            self.client.create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function,
-                metadata=kwargs.get('metadata', {})
-            )
+            self.client.get_or_create_collection(name=collection_name, metadata=kwargs.get('metadata') or None)
             logger.info(f"Created collection: {collection_name}")
             return True
         except Exception as e:
             logger.error(f"Failed to create collection {collection_name}: {e}")
             return False
-    
+
     def delete_collection(self, collection_name: str) -> bool:
         """Delete a collection."""
         try:
@@ -49,97 +90,122 @@ class ChromaDBStore(VectorStoreBase):
         except Exception as e:
             logger.error(f"Failed to delete collection {collection_name}: {e}")
             return False
-    
+
     def list_collections(self) -> List[str]:
         """List all collections."""
         try:
-            collections = self.client.list_collections()
-            return [c.name for c in collections]
+            out = []
+            for c in self.client.list_collections():
+                name = c if isinstance(c, str) else getattr(c, "name", None) or (c.get("name") if isinstance(c, dict) else None)
+                if name:
+                    out.append(name)
+            return sorted(set(out))
         except Exception as e:
             logger.error(f"Failed to list collections: {e}")
-            return []
-    
-    def add_documents(
+            return [self.collection]
+
+    def collection_token(self, collection_name: str) -> Optional[str]:
+        coll = self._collection(collection_name)
+        return (str(getattr(coll, "id", "") or "") or None) if coll is not None else None
+
+    def upsert(
         self,
         collection_name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
         documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
-    ) -> bool:
-        """Add documents to a collection."""
-        try:
-            collection = self.client.get_or_create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
-            )
-            
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            logger.info(f"Added {len(documents)} documents to {collection_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add documents to {collection_name}: {e}")
-            return False
-    
-    def query(
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """Bulk upsert of precomputed embeddings."""
+        if not ids:
+            return 0
+        coll = self._collection(collection_name, create=True)
+        # Some Chroma versions reject empty metadata dicts; omit the column when
+        # no chunk has any
+        has_meta = bool(metadatas) and any(bool(m) for m in metadatas)
+        for start in range(0, len(ids), _CHROMA_BATCH):
+            end = start + _CHROMA_BATCH
+            kwargs: Dict[str, Any] = {
+                'ids': ids[start:end],
+                'embeddings': embeddings[start:end],
+                'documents': documents[start:end],
+            }
+            if has_meta:
+                kwargs['metadatas'] = metadatas[start:end]
+            coll.upsert(**kwargs)
+        return len(ids)
+
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        coll = self._collection(collection_name)
+        if coll is None or not ids:
+            return 0
+        for start in range(0, len(ids), _CHROMA_BATCH):
+            coll.delete(ids=ids[start:start + _CHROMA_BATCH])
+        return len(ids)
+
+    def query_many(
         self,
         collection_name: str,
-        query_text: str,
-        n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
-        max_distance: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
-        """Query documents from a collection."""
-        try:
-            collection = self.client.get_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
-            )
-            
-            results = collection.query(
-                query_texts=[query_text],
-                n_results=n_results,
-                where=where
-            )
-            
-            # Format results
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                result = {
-                    'id': results['ids'][0][i],
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                    'distance': results['distances'][0][i] if results['distances'] else None
-                }
-                
-                # Filter by max_distance if specified
-                if max_distance is None or (result['distance'] is not None and result['distance'] <= max_distance):
-                    formatted_results.append(result)
-            
-            return formatted_results
-        except Exception as e:
-            logger.error(f"Failed to query {collection_name}: {e}")
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """All query vectors in one Chroma query call."""
+        if not query_embeddings:
+            return []
+        coll = self._collection(collection_name)
+        if coll is None:
+            return [[] for _ in query_embeddings]
+        flt = MetadataFilter.coerce(where)
+        filt = {'where': flt.to_chroma()} if flt else {}
+        res = coll.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            include=['documents', 'metadatas', 'distances'],
+            **filt
+        )
+        return [_rows(res, q) for q in range(len(query_embeddings))]
+
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        coll = self._collection(collection_name)
+        if coll is None or not ids:
             return []
-    
+        include = ['documents', 'metadatas'] if include_documents else []
+        out: List[Dict[str, Any]] = []
+        for start in range(0, len(ids), _CHROMA_BATCH):
+            out.extend(_rows(coll.get(ids=ids[start:start + _CHROMA_BATCH], include=include)))
+        return out
+
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        coll = self._collection(collection_name)
+        if coll is None:
+            return
+        offset = 0
+        while True:
+            rows = _rows(coll.get(limit=batch_size, offset=offset, include=['documents', 'metadatas']))
+            if not rows:
+                return
+            yield rows
+            offset += len(rows)
+
+    def count(self, collection_name: str) -> int:
+        coll = self._collection(collection_name)
+        return coll.count() if coll is not None else 0
+
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about a collection."""
         try:
-            collection = self.client.get_collection(name=collection_name)
-            count = collection.count()
-            
+            collection = self._collection(collection_name, create=True)
             return {
                 'name': collection_name,
-                'count': count,
+                'count': collection.count(),
+                'metadata': getattr(collection, 'metadata', None) or {},
                 'provider': 'chromadb'
             }
         except Exception as e:
             logger.error(f"Failed to get stats for {collection_name}: {e}")
             return {'name': collection_name, 'count': 0, 'error': str(e)}
-    
+
     def health_check(self) -> Dict[str, Any]:
         """Check if ChromaDB is healthy."""
         try:
@@ -4,22 +4,21 @@ from typing import Dict, Any
 import logging
 
 from .base import VectorStoreBase
-from .chromadb_store import ChromaDBStore
-from .faiss_store import FAISSStore
-from .pinecone_store import PineconeStore
-from .weaviate_store import WeaviateStore
-from .qdrant_store import QdrantStore
 
 logger = logging.getLogger(__name__)
 
 
-def get_vector_store(config: Dict[str, Any], embedding_function) -> VectorStoreBase:
+def get_vector_store(config: Dict[str, Any], embedding_function=None) -> VectorStoreBase:
     """
     Factory function to get the appropriate vector store based on configuration.
     
+    Backends are imported on demand, so only the configured provider's client
+    library has to be installed.
+    
     Args:
         config: Configuration dictionary
-        embedding_function: Function to generate embeddings
+        embedding_function: Optional texts → embeddings function, only used by
+            the add_documents() / query() text conveniences
     
     Returns:
         VectorStoreBase: Instance of the configured vector store
@@ -32,14 +31,19 @@ def get_vector_store(config: Dict[str, Any], embedding_function) -> VectorStoreB
     logger.info(f"Initializing vector store: {provider}")
     
     if provider == 'chromadb':
+        from .chromadb_store import ChromaDBStore
         return ChromaDBStore(config, embedding_function)
     elif provider == 'faiss':
+        from .faiss_store import FAISSStore
         return FAISSStore(config, embedding_function)
     elif provider == 'pinecone':
+        from .pinecone_store import PineconeStore
         return PineconeStore(config, embedding_function)
     elif provider == 'weaviate':
+        from .weaviate_store import WeaviateStore
         return WeaviateStore(config, embedding_function)
     elif provider == 'qdrant':
+        from .qdrant_store import QdrantStore
         return QdrantStore(config, embedding_function)
     elif provider == 'milvus':
         # Milvus implementation can be added later
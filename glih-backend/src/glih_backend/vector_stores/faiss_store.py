@@ -1,107 +1,466 @@
-"""FAISS vector store implementation."""
+"""
+FAISS vector store implementation.
+
+On-disk layout, one directory per collection:
+
+  manifest.json            current generation + dimension (the commit point)
+  snapshot-<gen>.faiss     index of every live row at the last compaction
+  snapshot-<gen>.pkl       ids / documents / metadatas of those rows
+  segment-<gen>.log        append-only log of upserts and deletes since then
+
+A write appends one framed record (ids, documents, metadatas, float32
+vectors, or the ids of a delete) to the segment log and applies it in
+memory; nothing is rewritten. Rows added since the snapshot live in an
+in-memory IndexFlatL2 (the delta), replaced or deleted rows are tombstoned,
+and searches cover snapshot + delta through IDSelectors.
+
+Collections load lazily on first use. Snapshots are read with
+IO_FLAG_MMAP (pages come from the OS cache, shared by every worker on a
+host), falling back to a regular read where the index type does not support
+it. When the delta or the tombstones grow past the thresholds below, a
+background compaction writes a new snapshot of the live rows, moves the log
+records written meanwhile to a new segment and switches the manifest.
+A crash before the switch leaves the previous generation intact; a torn
+record at the end of a segment is dropped on load.
+
+Several workers (processes) may share a directory. Per collection:
+
+  .lock           flock held around every append, load / replay and the
+                  commit of a compaction. A writer first catches up on the
+                  records other workers appended (or reloads when the
+                  manifest generation changed), then appends at the end.
+  .compact.lock   held for a whole compaction (taken without waiting, so
+                  one worker compacts and the others skip); only its holder
+                  removes files of other generations.
+
+Every read first compares the manifest and the segment size with what this
+worker has applied, and replays only the tail it has not seen.
+
+Env:
+  GLIH_FAISS_MMAP                    memory-map snapshots (default 1)
+  GLIH_FAISS_COMPACT_ROWS            delta rows that trigger a compaction (default 50000)
+  GLIH_FAISS_COMPACT_DELETED_RATIO   tombstones (share of max(rows, COMPACT_ROWS)) that trigger one (default 0.2)
+  GLIH_FAISS_FSYNC                   fsync the segment log after every write (default 0)
+"""
+
+import json
+import os
+import pickle
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import faiss
 import numpy as np
-import pickle
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import logging
-import uuid
 
+from ..bm25_store import _lock_file, _try_lock_file, _unlock_file
+from ..metadata_filter import MetadataFilter
 from .base import VectorStoreBase
 
 logger = logging.getLogger(__name__)
 
+_MMAP = os.getenv("GLIH_FAISS_MMAP", "1") == "1"
+_COMPACT_ROWS = int(os.getenv("GLIH_FAISS_COMPACT_ROWS", "50000"))
+_COMPACT_DELETED_RATIO = float(os.getenv("GLIH_FAISS_COMPACT_DELETED_RATIO", "0.2"))
+_FSYNC = os.getenv("GLIH_FAISS_FSYNC", "0") == "1"
+
+_MANIFEST = "manifest.json"
+_LOCK = ".lock"
+_COMPACT_LOCK = ".compact.lock"
+# Format of the store before the segment log (rewritten on every write)
+_LEGACY_INDEX = "index.faiss"
+_LEGACY_METADATA = "metadata.pkl"
+# Segment record frame: payload length, then the pickled record
+_FRAME = struct.Struct('<Q')
+
+
+def _snapshot_file(generation: int, ext: str) -> str:
+    return f"snapshot-{generation:06d}.{ext}"
+
+
+def _segment_file(generation: int) -> str:
+    return f"segment-{generation:06d}.log"
+
+
+def _generation_of(filename: str) -> Optional[int]:
+    stem = filename.split('.', 1)[0]
+    prefix, _, number = stem.partition('-')
+    if prefix in ('snapshot', 'segment') and number.isdigit():
+        return int(number)
+    return None
+
+
+def _read_segment(path: Path, start: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """(record, end offset) for every complete record of a segment log from offset `start`."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while True:
+            head = f.read(_FRAME.size)
+            if len(head) < _FRAME.size:
+                return
+            (size,) = _FRAME.unpack(head)
+            body = f.read(size)
+            if len(body) < size:
+                return
+            try:
+                record = pickle.loads(body)
+            except Exception:
+                return
+            yield record, f.tell()
+
+
+def _read_index(path: Path) -> Tuple[faiss.Index, bool]:
+    """(index, memory-mapped?) — read-only mmap where this faiss build and index type allow it."""
+    if _MMAP and hasattr(faiss, 'IO_FLAG_MMAP'):
+        read_only = getattr(faiss, 'IO_FLAG_READ_ONLY', 0)
+        # Flat codes (IO_FLAG_MMAP_IFC, faiss >= 1.9) and IVF inverted lists
+        # (IO_FLAG_MMAP) cannot be combined: try the former first
+        candidates = [faiss.IO_FLAG_MMAP | read_only]
+        if hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+            candidates.insert(0, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | read_only)
+        error = None
+        for flags in candidates:
+            try:
+                return faiss.read_index(str(path), flags), True
+            except Exception as e:
+                error = e
+        logger.info(f"FAISS: mmap read of {path.name} not supported ({error}), loading into memory")
+    return faiss.read_index(str(path)), False
+
+
+def _reconstruct(index: faiss.Index, rows: List[int]) -> np.ndarray:
+    """Stored vectors of `rows` (IVF indexes get a direct map first)."""
+    if not rows:
+        return np.zeros((0, index.d), dtype='float32')
+    keys = np.asarray(rows, dtype='int64')
+    try:
+        return index.reconstruct_batch(keys)
+    except RuntimeError:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            raise
+        ivf.make_direct_map()
+        return index.reconstruct_batch(keys)
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime, size) of a file, None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return -1
+
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(path.name + '.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class _Collection:
+    """In-memory state of one collection: snapshot (rows < base_rows) + delta + tombstones."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.dimension: Optional[int] = None
+        self.base: Optional[faiss.Index] = None
+        self.base_rows = 0
+        self.mmap = False
+        self.delta: Optional[faiss.Index] = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.deleted: set = set()
+        self.base_deleted = 0  # tombstones among the snapshot rows
+        self.rows: Dict[str, int] = {}  # id → live row
+        # (part, state, filter key) → rows a search is restricted to; see _selection
+        self.selections: Dict[Tuple, Tuple[np.ndarray, bool]] = {}
+        self.log = None
+        self.log_bytes = 0  # segment bytes applied (by this worker or replayed)
+        self.manifest = None  # _file_signature of the manifest when applied
+        self.compacting = False
+        self.legacy = False
+
+    def adopt(self, other: "_Collection") -> None:
+        """Take over another instance's state (after a reload), keeping this lock and compaction flag."""
+        lock, compacting = self.lock, self.compacting
+        self.__dict__.update(other.__dict__)
+        self.lock, self.compacting = lock, compacting
+
 
 class FAISSStore(VectorStoreBase):
-    """FAISS implementation of vector store."""
-    
-    def __init__(self, config: Dict[str, Any], embedding_function):
+    """
+    FAISS implementation of vector store. Rows are append-only: an upsert of
+    an existing id or a delete tombstones the old row, and searches exclude
+    tombstoned rows with the same IDSelector used for metadata filters.
+    Compaction drops tombstoned rows.
+    """
+
+    provider = "faiss"
+
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         super().__init__(config, embedding_function)
-        
+
         faiss_config = config.get('vector_store', {}).get('faiss', {})
-        self.persist_dir = Path(faiss_config.get('persist_directory', 'data/faiss'))
-        self.persist_dir.mkdir(parents=True, exist_ok=True)
-        
+        self._dir = Path(faiss_config.get('persist_directory', 'data/faiss'))
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self.persist_dir = str(self._dir.resolve())
+
         self.index_type = faiss_config.get('index_type', 'IndexFlatL2')
         self.nlist = faiss_config.get('nlist', 100)
         self.m = faiss_config.get('m', 16)
-        
-        # Store for metadata and documents
-        self.collections = {}
-        self._load_collections()
-        
-        logger.info(f"FAISS initialized with persist_directory: {self.persist_dir}")
-    
+
+        # name → loaded collection, or None until first use
+        self.collections: Dict[str, Optional[_Collection]] = {
+            d.name: None for d in self._dir.iterdir() if d.is_dir()
+        }
+        self._lock = threading.Lock()
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="glih-faiss-compact")
+
+        logger.info(f"FAISS initialized with persist_directory: {self._dir} ({len(self.collections)} collections, loaded on first use)")
+
     def _get_collection_path(self, collection_name: str) -> Path:
         """Get path for collection files."""
-        return self.persist_dir / collection_name
-    
-    def _load_collections(self):
-        """Load existing collections from disk."""
-        if not self.persist_dir.exists():
+        return self._dir / collection_name
+
+    # ── Loading ──
+
+    def _collection(self, collection_name: str, create: bool = False) -> Optional[_Collection]:
+        """
+        Loaded collection (loading it on first use), caught up with what other
+        workers wrote; None if it does not exist.
+        """
+        with self._lock:
+            collection = self.collections.get(collection_name)
+            if collection is None:
+                path = self._get_collection_path(collection_name)
+                # Possibly created, or deleted, by another worker since startup
+                if not create and not path.is_dir():
+                    self.collections.pop(collection_name, None)
+                    return None
+                path.mkdir(parents=True, exist_ok=True)
+                collection = _Collection(path)
+                with self._compaction_lock(collection) as idle, self._flock(collection):
+                    # Leftover files are only removed while nobody is compacting
+                    self._load(collection, cleanup=idle)
+                self.collections[collection_name] = collection
+                logger.info(
+                    f"Loaded collection {collection_name}: generation {collection.generation}, "
+                    f"{collection.base_rows} snapshot rows ({'mmap' if collection.mmap else 'in memory'}), "
+                    f"{len(collection.ids) - collection.base_rows} log rows"
+                )
+        with collection.lock:
+            if self._stale(collection):
+                with self._flock(collection):
+                    if not self._sync(collection):
+                        # Deleted by another worker; a write starts a new one
+                        return self._collection(collection_name, create=True) if create else None
+        if collection.legacy:
+            # Rewrite the pre-segment-log format once
+            with collection.lock:
+                migrate = collection.legacy and not collection.compacting
+                collection.compacting = collection.compacting or migrate
+            if migrate:
+                self._compact(collection_name, collection)
+        return collection
+
+    @contextmanager
+    def _flock(self, c: _Collection) -> Iterator[None]:
+        """
+        Exclusive cross-process lock of one collection (take c.lock first).
+        Nothing is locked when the directory is gone (the collection was
+        deleted); _sync then reports it instead of recreating it.
+        """
+        try:
+            fh = open(c.path / _LOCK, 'a+b')
+        except FileNotFoundError:
+            yield
             return
-        
-        for collection_dir in self.persist_dir.iterdir():
-            if collection_dir.is_dir():
-                try:
-                    self._load_collection(collection_dir.name)
-                except Exception as e:
-                    logger.error(f"Failed to load collection {collection_dir.name}: {e}")
-    
-    def _load_collection(self, collection_name: str):
-        """Load a single collection."""
-        collection_path = self._get_collection_path(collection_name)
-        index_file = collection_path / "index.faiss"
-        metadata_file = collection_path / "metadata.pkl"
-        
-        if not index_file.exists() or not metadata_file.exists():
+        with fh:
+            _lock_file(fh)
+            try:
+                yield
+            finally:
+                _unlock_file(fh)
+
+    @contextmanager
+    def _compaction_lock(self, c: _Collection) -> Iterator[bool]:
+        """Cross-process compaction lock, taken without waiting: yields whether it was acquired."""
+        try:
+            fh = open(c.path / _COMPACT_LOCK, 'a+b')
+        except FileNotFoundError:
+            yield False
             return
-        
-        # Load FAISS index
-        index = faiss.read_index(str(index_file))
-        
-        # Load metadata
-        with open(metadata_file, 'rb') as f:
-            metadata = pickle.load(f)
-        
-        self.collections[collection_name] = {
-            'index': index,
-            'documents': metadata.get('documents', []),
-            'metadatas': metadata.get('metadatas', []),
-            'ids': metadata.get('ids', []),
-            'dimension': index.d
-        }
-        
-        logger.info(f"Loaded collection {collection_name} with {len(metadata.get('ids', []))} documents")
-    
-    def _save_collection(self, collection_name: str):
-        """Save a collection to disk."""
-        if collection_name not in self.collections:
+        with fh:
+            acquired = _try_lock_file(fh)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    _unlock_file(fh)
+
+    def _load(self, c: _Collection, cleanup: bool = False) -> None:
+        """
+        Snapshot of the manifest generation + replay of its segment log. Runs
+        under the flock. With `cleanup` (compaction lock held), files of other
+        generations are removed.
+        """
+        manifest_file = c.path / _MANIFEST
+        c.manifest = _file_signature(manifest_file)
+        if c.manifest is not None:
+            manifest = json.loads(manifest_file.read_text())
+            c.generation = int(manifest['generation'])
+            c.dimension = manifest.get('dimension')
+            if c.generation > 0:
+                c.base, c.mmap = _read_index(c.path / _snapshot_file(c.generation, 'faiss'))
+                with open(c.path / _snapshot_file(c.generation, 'pkl'), 'rb') as f:
+                    rows = pickle.load(f)
+                c.ids, c.documents, c.metadatas = rows['ids'], rows['documents'], rows['metadatas']
+                c.base_rows = len(c.ids)
+                c.dimension = c.base.d
+        elif (c.path / _LEGACY_INDEX).exists() and (c.path / _LEGACY_METADATA).exists():
+            c.base = faiss.read_index(str(c.path / _LEGACY_INDEX))
+            with open(c.path / _LEGACY_METADATA, 'rb') as f:
+                metadata = pickle.load(f)
+            c.ids = metadata.get('ids', [])
+            c.documents = metadata.get('documents', [])
+            c.metadatas = metadata.get('metadatas', [])
+            c.deleted = set(metadata.get('deleted', ()))
+            c.base_deleted = len(c.deleted)
+            c.base_rows = len(c.ids)
+            c.dimension = c.base.d
+            c.legacy = True
+        c.rows = {rid: row for row, rid in enumerate(c.ids) if row not in c.deleted}
+
+        if cleanup:
+            # Files of other generations are leftovers of an interrupted
+            # compaction, or previous generations other workers have since
+            # reloaded from (an open mmap keeps its pages)
+            for f in c.path.iterdir():
+                gen = _generation_of(f.name)
+                if (gen is not None and gen != c.generation) or f.name.endswith('.tmp'):
+                    try:
+                        f.unlink()
+                    except OSError:
+                        pass
+
+        c.log_bytes = self._replay(c, 0)
+        c.log = open(c.path / _segment_file(c.generation), 'ab')
+
+    def _replay(self, c: _Collection, start: int) -> int:
+        """
+        Apply the segment records from offset `start`; returns the end offset.
+        Under the flock no append is in progress, so bytes past the last
+        complete record are a torn write of a crashed worker and are dropped.
+        """
+        segment = c.path / _segment_file(c.generation)
+        end = start
+        if segment.exists():
+            for record, end in _read_segment(segment, start):
+                self._apply(c, record)
+            if segment.stat().st_size > end:
+                logger.warning(f"FAISS: dropping torn record at the end of {segment}")
+                with open(segment, 'r+b') as f:
+                    f.truncate(end)
+        return end
+
+    def _stale(self, c: _Collection) -> bool:
+        """
+        Whether another worker appended, compacted, reset or deleted the
+        collection since this worker last looked (two stats; the segment is
+        missing once the directory is gone).
+        """
+        return (
+            _file_signature(c.path / _MANIFEST) != c.manifest
+            or _file_size(c.path / _segment_file(c.generation)) != c.log_bytes
+        )
+
+    def _sync(self, c: _Collection) -> bool:
+        """
+        Catch up with the other workers (under c.lock and the flock): replay
+        the segment tail past this worker's offset, or reload everything when
+        the manifest generation changed or the segment was replaced. Returns
+        False, and forgets the collection, when another worker deleted it.
+        """
+        manifest = _file_signature(c.path / _MANIFEST)
+        size = _file_size(c.path / _segment_file(c.generation))
+        if manifest == c.manifest and size >= c.log_bytes:
+            if size > c.log_bytes:
+                c.log_bytes = self._replay(c, c.log_bytes)
+            return True
+        c.log.close()
+        if not c.path.is_dir():
+            with self._lock:
+                if self.collections.get(c.path.name) is c:
+                    del self.collections[c.path.name]
+            logger.info(f"FAISS collection {c.path.name} was deleted by another worker")
             return False
-        
-        collection_path = self._get_collection_path(collection_name)
-        collection_path.mkdir(parents=True, exist_ok=True)
-        
-        collection = self.collections[collection_name]
-        
-        # Save FAISS index
-        index_file = collection_path / "index.faiss"
-        faiss.write_index(collection['index'], str(index_file))
-        
-        # Save metadata
-        metadata_file = collection_path / "metadata.pkl"
-        metadata = {
-            'documents': collection['documents'],
-            'metadatas': collection['metadatas'],
-            'ids': collection['ids']
-        }
-        with open(metadata_file, 'wb') as f:
-            pickle.dump(metadata, f)
-        
-        logger.info(f"Saved collection {collection_name}")
+        fresh = _Collection(c.path)
+        self._load(fresh)
+        c.adopt(fresh)
         return True
-    
+
+    # ── Segment log ──
+
+    def _apply(self, c: _Collection, record: Dict[str, Any]) -> int:
+        """Apply an add / delete record to the in-memory state."""
+        if record['op'] == 'delete':
+            removed = 0
+            for rid in record['ids']:
+                row = c.rows.pop(rid, None)
+                if row is not None:
+                    self._tombstone(c, row)
+                    removed += 1
+            return removed
+        vectors = record['vectors']
+        if c.dimension is None:
+            c.dimension = int(vectors.shape[1])
+        if c.delta is None:
+            c.delta = faiss.IndexFlatL2(c.dimension)
+        first = len(c.ids)
+        for offset, rid in enumerate(record['ids']):
+            old = c.rows.get(rid)
+            if old is not None:
+                self._tombstone(c, old)
+            c.rows[rid] = first + offset
+        c.delta.add(vectors)
+        c.ids.extend(record['ids'])
+        c.documents.extend(record['documents'])
+        c.metadatas.extend(record['metadatas'])
+        return len(record['ids'])
+
+    @staticmethod
+    def _tombstone(c: _Collection, row: int) -> None:
+        c.deleted.add(row)
+        if row < c.base_rows:
+            c.base_deleted += 1
+
+    def _append(self, c: _Collection, record: Dict[str, Any]) -> None:
+        """Write one record at the end of the segment (under the flock, after _sync)."""
+        body = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        c.log.write(_FRAME.pack(len(body)) + body)
+        c.log.flush()
+        if _FSYNC:
+            os.fsync(c.log.fileno())
+        c.log_bytes += _FRAME.size + len(body)
+
+    # ── Compaction ──
+
     def _create_index(self, dimension: int) -> faiss.Index:
         """Create a FAISS index based on configuration."""
         if self.index_type == 'IndexFlatL2':
@@ -116,181 +475,429 @@ class FAISSStore(VectorStoreBase):
         else:
             logger.warning(f"Unknown index type {self.index_type}, using IndexFlatL2")
             return faiss.IndexFlatL2(dimension)
-    
+
+    def _build_index(self, dimension: int, vectors: np.ndarray) -> faiss.Index:
+        if self.index_type == 'IndexIVFFlat' and len(vectors) < self.nlist:
+            # Too few rows to train nlist centroids; the next compaction retries
+            index = faiss.IndexFlatL2(dimension)
+        else:
+            index = self._create_index(dimension)
+            if not index.is_trained:
+                index.train(vectors)
+        index.add(vectors)
+        return index
+
+    def _maybe_compact(self, collection_name: str, c: _Collection) -> None:
+        delta_rows = len(c.ids) - c.base_rows
+        if c.compacting:
+            return
+        if delta_rows >= _COMPACT_ROWS or len(c.deleted) > _COMPACT_DELETED_RATIO * max(len(c.ids), _COMPACT_ROWS):
+            c.compacting = True
+            self._compactor.submit(self._compact, collection_name, c)
+
+    def compact(self, collection_name: str) -> bool:
+        """Write a new snapshot of the live rows now (normally done in the background)."""
+        c = self._collection(collection_name)
+        if c is None or c.dimension is None:
+            return False
+        with c.lock:
+            if c.compacting:
+                return False
+            c.compacting = True
+        return self._compact(collection_name, c)
+
+    def _write_snapshot(self, path: Path, generation: int, dimension: int, vectors: np.ndarray, rows: Dict[str, list]) -> None:
+        """Build the index of a compaction and write both snapshot files (no locks held)."""
+        index = self._build_index(dimension, np.ascontiguousarray(vectors, dtype='float32'))
+        _write_atomic(path / _snapshot_file(generation, 'faiss'), lambda p: faiss.write_index(index, str(p)))
+
+        def write_rows(p: Path) -> None:
+            with open(p, 'wb') as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        _write_atomic(path / _snapshot_file(generation, 'pkl'), write_rows)
+
+    def _compact(self, collection_name: str, c: _Collection) -> bool:
+        """
+        Snapshot the live rows (captured under the locks, index built outside
+        them), then under the locks: catch up, carry the log records written
+        since the capture (by any worker) over to the new segment, switch the
+        manifest, reload. The compaction lock is held throughout; if another
+        worker holds it, this one skips.
+        """
+        try:
+            with self._compaction_lock(c) as acquired:
+                if not acquired:
+                    return False
+                with c.lock, self._flock(c):
+                    if self.collections.get(collection_name) is not c:
+                        return False
+                    if not self._sync(c) or c.dimension is None:
+                        return False
+                    live = sorted(c.rows.values())
+                    base_live = [row for row in live if row < c.base_rows]
+                    delta_live = [row - c.base_rows for row in live if row >= c.base_rows]
+                    parts = []
+                    if base_live:
+                        parts.append(_reconstruct(c.base, base_live))
+                    if delta_live:
+                        parts.append(_reconstruct(c.delta, delta_live))
+                    vectors = np.vstack(parts) if parts else np.zeros((0, c.dimension), dtype='float32')
+                    rows = {
+                        'ids': [c.ids[row] for row in live],
+                        'documents': [c.documents[row] for row in live],
+                        'metadatas': [c.metadatas[row] for row in live],
+                    }
+                    captured_bytes = c.log_bytes
+                    dimension = c.dimension
+                    generation = c.generation + 1
+
+                self._write_snapshot(c.path, generation, dimension, vectors, rows)
+                del vectors, rows
+
+                with c.lock, self._flock(c):
+                    if self.collections.get(collection_name) is not c or not self._sync(c):
+                        return False
+                    if c.generation != generation - 1 or c.log_bytes < captured_bytes:
+                        # Reset by another worker meanwhile; the files are removed as leftovers
+                        return False
+                    old_segment = c.path / _segment_file(c.generation)
+
+                    def write_tail(p: Path) -> None:
+                        with open(old_segment, 'rb') as src, open(p, 'wb') as dst:
+                            src.seek(captured_bytes)
+                            shutil.copyfileobj(src, dst)
+                    _write_atomic(c.path / _segment_file(generation), write_tail)
+                    _write_atomic(
+                        c.path / _MANIFEST,
+                        lambda p: p.write_text(json.dumps({'generation': generation, 'dimension': dimension}))
+                    )
+
+                    c.log.close()
+                    fresh = _Collection(c.path)
+                    self._load(fresh, cleanup=True)  # removes the previous generation's files
+                    for name in (_LEGACY_INDEX, _LEGACY_METADATA):
+                        (c.path / name).unlink(missing_ok=True)
+                    c.adopt(fresh)
+            logger.info(
+                f"Compacted FAISS collection {collection_name}: generation {generation}, "
+                f"{c.base_rows} snapshot rows, {len(c.ids) - c.base_rows} log rows"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to compact collection {collection_name}: {e}")
+            return False
+        finally:
+            c.compacting = False
+            c.legacy = False
+
+    # ── Collections ──
+
     def create_collection(self, collection_name: str, **kwargs) -> bool:
         """Create a new collection."""
         try:
-            if collection_name in self.collections:
+            if self._collection(collection_name) is not None:
                 logger.warning(f"Collection {collection_name} already exists")
                 return False
-            
-            # We'll create the index when first document is added
-            self.collections[collection_name] = {
-                'index': None,
-                'documents': [],
-                'metadatas': [],
-                'ids': [],
-                'dimension': None
-            }
-            
+
+            # The index is created with the first upsert
+            self._collection(collection_name, create=True)
+
             logger.info(f"Created collection: {collection_name}")
             return True
         except Exception as e:
             logger.error(f"Failed to create collection {collection_name}: {e}")
             return False
-    
+
     def delete_collection(self, collection_name: str) -> bool:
-        """Delete a collection."""
+        """Delete a collection (under its flock, so no other worker is appending or reloading meanwhile)."""
         try:
-            if collection_name in self.collections:
-                del self.collections[collection_name]
-            
-            # Delete from disk
+            with self._lock:
+                known = collection_name in self.collections
+                collection = self.collections.pop(collection_name, None)
             collection_path = self._get_collection_path(collection_name)
-            if collection_path.exists():
-                import shutil
-                shutil.rmtree(collection_path)
-            
-            logger.info(f"Deleted collection: {collection_name}")
-            return True
+            c = collection or _Collection(collection_path)
+            with c.lock, self._flock(c):
+                if c.log is not None:
+                    c.log.close()
+                # Delete from disk; other workers notice on their next access
+                if collection_path.exists():
+                    shutil.rmtree(collection_path)
+                    known = True
+
+            if known:
+                logger.info(f"Deleted collection: {collection_name}")
+            return known
         except Exception as e:
             logger.error(f"Failed to delete collection {collection_name}: {e}")
             return False
-    
+
     def list_collections(self) -> List[str]:
-        """List all collections."""
-        return list(self.collections.keys())
-    
-    def add_documents(
+        """List all collections (including ones other workers created, or deleted, since startup)."""
+        with self._lock:
+            on_disk = {d.name for d in self._dir.iterdir() if d.is_dir()}
+            for name in on_disk:
+                self.collections.setdefault(name, None)
+            for name in [n for n, c in self.collections.items() if c is None and n not in on_disk]:
+                del self.collections[name]
+            return [name for name in self.collections if name in on_disk]
+
+    # ── Writes ──
+
+    def upsert(
         self,
         collection_name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
         documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
-    ) -> bool:
-        """Add documents to a collection."""
-        try:
-            # Create collection if it doesn't exist
-            if collection_name not in self.collections:
-                self.create_collection(collection_name)
-            
-            collection = self.collections[collection_name]
-            
-            # Generate embeddings
-            embeddings = []
-            for doc in documents:
-                emb = self.embedding_function([doc])[0]
-                embeddings.append(emb)
-            
-            embeddings_array = np.array(embeddings).astype('float32')
-            
-            # Create index if this is the first add
-            if collection['index'] is None:
-                dimension = embeddings_array.shape[1]
-                collection['index'] = self._create_index(dimension)
-                collection['dimension'] = dimension
-                
-                # Train index if needed
-                if self.index_type == 'IndexIVFFlat':
-                    collection['index'].train(embeddings_array)
-            
-            # Add to index
-            collection['index'].add(embeddings_array)
-            
-            # Store documents and metadata
-            collection['documents'].extend(documents)
-            collection['metadatas'].extend(metadatas or [{} for _ in documents])
-            collection['ids'].extend(ids or [str(uuid.uuid4()) for _ in documents])
-            
-            # Save to disk
-            self._save_collection(collection_name)
-            
-            logger.info(f"Added {len(documents)} documents to {collection_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add documents to {collection_name}: {e}")
-            return False
-    
-    def query(
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """Append one record to the segment log and one batch to the delta index; reused ids are tombstoned."""
+        if not ids:
+            return 0
+        vectors = np.ascontiguousarray(embeddings, dtype='float32')
+        c = self._collection(collection_name, create=True)
+        with c.lock, self._flock(c):
+            if not self._sync(c):
+                # Deleted by another worker just now: write to a new collection
+                return self.upsert(collection_name, ids, embeddings, documents, metadatas)
+            if c.dimension is not None and vectors.shape[1] != c.dimension:
+                raise ValueError(f"embedding dimension {vectors.shape[1]} does not match collection {collection_name} ({c.dimension})")
+            record = {
+                'op': 'add',
+                'ids': list(ids),
+                'documents': list(documents),
+                'metadatas': [dict(m or {}) for m in metadatas] if metadatas else [{} for _ in ids],
+                'vectors': vectors,
+            }
+            self._append(c, record)
+            self._apply(c, record)
+            self._maybe_compact(collection_name, c)
+        logger.info(f"Upserted {len(ids)} documents to {collection_name}")
+        return len(ids)
+
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        """Tombstone rows by id; they are skipped by every search and dropped by compaction."""
+        c = self._collection(collection_name)
+        if c is None or not ids:
+            return 0
+        with c.lock, self._flock(c):
+            if not self._sync(c):
+                return 0
+            live = [rid for rid in ids if rid in c.rows]
+            if not live:
+                return 0
+            record = {'op': 'delete', 'ids': live}
+            self._append(c, record)
+            removed = self._apply(c, record)
+            self._maybe_compact(collection_name, c)
+        return removed
+
+    # ── Reads ──
+
+    def _selection(self, c: _Collection, delta: bool, flt: Optional[MetadataFilter]) -> Optional[Tuple[np.ndarray, bool]]:
+        """
+        (rows, exclude) restricting a search of the snapshot or the delta
+        (under c.lock; rows relative to the part): without a filter, the
+        tombstones to exclude; with one, the live matching rows. None when
+        every row is searched. Rows and tombstones only grow until a reload
+        replaces the state (and this cache), so their counts identify it.
+        """
+        first, n_rows = (c.base_rows, len(c.ids) - c.base_rows) if delta else (0, c.base_rows)
+        n_deleted = len(c.deleted) - c.base_deleted if delta else c.base_deleted
+        if not flt and not n_deleted:
+            return None
+        key = (delta, n_rows, n_deleted, flt.key() if flt else None)
+        selection = c.selections.get(key)
+        if selection is not None:
+            return selection
+        deleted = np.fromiter((row - first for row in c.deleted if first <= row < first + n_rows), dtype='int64')
+        if flt:
+            mask = np.fromiter((flt.matches(m) for m in c.metadatas[first:first + n_rows]), dtype=bool, count=n_rows)
+            mask[deleted] = False
+            selection = (np.flatnonzero(mask).astype('int64'), False)
+        else:
+            selection = (np.sort(deleted), True)
+        if len(c.selections) >= 64:
+            c.selections.clear()
+        c.selections[key] = selection
+        return selection
+
+    def _search_params(self, index: faiss.Index, rows: np.ndarray, exclude: bool):
+        """
+        (search parameters, selectors) restricting the search to `rows`, or to
+        every row but them; (None, None) on faiss without search parameters.
+        The selectors must outlive the search; the parameters do not own them.
+        """
+        if not hasattr(faiss, 'SearchParameters'):
+            return None, None
+        selectors = [faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(rows))]
+        if exclude:
+            selectors.append(faiss.IDSelectorNot(selectors[0]))
+        if faiss.try_extract_index_ivf(index) is not None:
+            params = faiss.SearchParametersIVF(sel=selectors[-1])
+        elif isinstance(index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selectors[-1])
+        else:
+            params = faiss.SearchParameters(sel=selectors[-1])
+        return params, selectors
+
+    def _search_part(
         self,
-        collection_name: str,
-        query_text: str,
-        n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
-        max_distance: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
-        """Query documents from a collection."""
-        try:
-            if collection_name not in self.collections:
-                logger.error(f"Collection {collection_name} not found")
-                return []
-            
-            collection = self.collections[collection_name]
-            
-            if collection['index'] is None or len(collection['ids']) == 0:
-                return []
-            
-            # Generate query embedding
-            query_embedding = self.embedding_function([query_text])[0]
-            query_array = np.array([query_embedding]).astype('float32')
-            
-            # Search
-            distances, indices = collection['index'].search(query_array, min(n_results, len(collection['ids'])))
-            
-            # Format results
-            formatted_results = []
-            for i, idx in enumerate(indices[0]):
+        index: Optional[faiss.Index],
+        first: int,
+        n_rows: int,
+        selection: Optional[Tuple[np.ndarray, bool]],
+        query_array: np.ndarray,
+        k: int
+    ) -> List[List[Tuple[float, int]]]:
+        """(distance, row) per query over rows [first, first + n_rows) of one index, restricted by _selection."""
+        empty: List[List[Tuple[float, int]]] = [[] for _ in range(len(query_array))]
+        if index is None or n_rows == 0:
+            return empty
+        params = None
+        n_candidates = n_rows
+        if selection is not None:
+            rows, exclude = selection
+            n_candidates = n_rows - len(rows) if exclude else len(rows)
+            if n_candidates == 0:
+                return empty
+            params, selectors = self._search_params(index, rows, exclude)
+
+        n = min(k, n_candidates)
+        skip = keep = None
+        if params is not None:
+            distances, indices = index.search(query_array, n, params=params)
+        elif selection is not None:
+            # faiss < 1.7.3 has no search-time selector: rank everything, filter below
+            distances, indices = index.search(query_array, n_rows)
+            skip, keep = (set(rows.tolist()), None) if exclude else (None, set(rows.tolist()))
+        else:
+            distances, indices = index.search(query_array, n)
+
+        out = []
+        for q in range(len(query_array)):
+            hits = []
+            for distance, idx in zip(distances[q], indices[q]):
                 if idx == -1:  # FAISS returns -1 for empty slots
                     continue
-                
-                distance = float(distances[0][i])
-                
-                # Filter by max_distance if specified
-                if max_distance is not None and distance > max_distance:
+                if (skip is not None and idx in skip) or (keep is not None and idx not in keep):
                     continue
-                
-                result = {
-                    'id': collection['ids'][idx],
-                    'document': collection['documents'][idx],
-                    'metadata': collection['metadatas'][idx],
+                hits.append((float(distance), first + int(idx)))
+                if len(hits) >= k:
+                    break
+            out.append(hits)
+        return out
+
+    def query_many(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        One search of the snapshot and one of the delta for every query
+        vector, merged by distance. The delta is searched under the lock
+        (writes append to it); the snapshot is immutable and is searched
+        outside it, on the state captured with the delta.
+        """
+        if not query_embeddings:
+            return []
+        c = self._collection(collection_name)
+        if c is None or not c.rows:
+            return [[] for _ in query_embeddings]
+
+        flt = MetadataFilter.coerce(where)
+        query_array = np.ascontiguousarray(query_embeddings, dtype='float32')
+        with c.lock:
+            base, base_rows = c.base, c.base_rows
+            ids, documents, metadatas = c.ids, c.documents, c.metadatas
+            base_selection = self._selection(c, False, flt)
+            delta_selection = self._selection(c, True, flt)
+            delta = self._search_part(c.delta, base_rows, len(ids) - base_rows, delta_selection, query_array, k)
+        snapshot = self._search_part(base, 0, base_rows, base_selection, query_array, k)
+
+        out = []
+        for q in range(len(query_embeddings)):
+            hits = sorted(snapshot[q] + delta[q])[:k]
+            out.append([
+                {
+                    'id': ids[row],
+                    'document': documents[row],
+                    'metadata': metadatas[row],
                     'distance': distance
                 }
-                
-                # Apply metadata filter if specified
-                if where:
-                    matches = all(
-                        result['metadata'].get(k) == v
-                        for k, v in where.items()
-                    )
-                    if not matches:
-                        continue
-                
-                formatted_results.append(result)
-            
-            return formatted_results
-        except Exception as e:
-            logger.error(f"Failed to query {collection_name}: {e}")
+                for distance, row in hits
+            ])
+        return out
+
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        c = self._collection(collection_name)
+        if c is None:
             return []
-    
+        out = []
+        with c.lock:
+            for rid in ids:
+                row = c.rows.get(rid)
+                if row is None:
+                    continue
+                out.append({
+                    'id': rid,
+                    'document': c.documents[row] if include_documents else None,
+                    'metadata': c.metadatas[row] if include_documents else {},
+                    'distance': None
+                })
+        return out
+
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        c = self._collection(collection_name)
+        if c is None:
+            return
+        with c.lock:
+            live = sorted(c.rows.values())
+            ids, documents, metadatas = c.ids, c.documents, c.metadatas
+        for start in range(0, len(live), batch_size):
+            yield [
+                {
+                    'id': ids[row],
+                    'document': documents[row],
+                    'metadata': metadatas[row],
+                    'distance': None
+                }
+                for row in live[start:start + batch_size]
+            ]
+
+    def count(self, collection_name: str) -> int:
+        c = self._collection(collection_name)
+        return len(c.rows) if c is not None else 0
+
+    # ── Status ──
+
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about a collection."""
         try:
-            if collection_name not in self.collections:
+            c = self._collection(collection_name)
+            if c is None:
                 return {'name': collection_name, 'count': 0, 'error': 'Collection not found'}
-            
-            collection = self.collections[collection_name]
-            
+
             return {
                 'name': collection_name,
-                'count': len(collection['ids']),
+                'count': len(c.rows),
+                'deleted': len(c.deleted),
                 'provider': 'faiss',
                 'index_type': self.index_type,
-                'dimension': collection['dimension']
+                'dimension': c.dimension,
+                'generation': c.generation,
+                'snapshot_rows': c.base_rows,
+                'log_rows': len(c.ids) - c.base_rows,
+                'log_bytes': c.log_bytes,
+                'mmap': c.mmap,
+                'compacting': c.compacting
             }
         except Exception as e:
             logger.error(f"Failed to get stats for {collection_name}: {e}")
             return {'name': collection_name, 'count': 0, 'error': str(e)}
-    
+
     def health_check(self) -> Dict[str, Any]:
         """Check if FAISS is healthy."""
         try:
@@ -298,6 +905,7 @@ class FAISSStore(VectorStoreBase):
                 'status': 'healthy',
                 'provider': 'faiss',
                 'collections_count': len(self.collections),
+                'loaded_collections': sum(1 for c in self.collections.values() if c is not None),
                 'index_type': self.index_type
             }
         except Exception as e:
@@ -1,26 +1,64 @@
-"""Pinecone vector store implementation."""
+"""
+Pinecone vector store implementation (pinecone-client >= 3).
+
+Indexes are serverless (`cloud` / `region`) unless `pod_type` is set. Only
+serverless indexes can list their ids, so scan() — and with it the BM25 half
+of hybrid search — works on serverless indexes only; on a pod-based index
+retrieval is vector-only.
+"""
 
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
 import logging
-import uuid
 
+from ..metadata_filter import MetadataFilter
 from .base import VectorStoreBase
+from .bulk import bulk_upsert, estimate_bytes, is_not_found
 
 logger = logging.getLogger(__name__)
 
+# Vectors per upsert request (Pinecone caps a request at 2 MB), ids per
+# fetch / delete request
+_UPSERT_BATCH = 100
+_MAX_REQUEST_BYTES = 2 * 1024 * 1024
+_FETCH_BATCH = 1000
+# Concurrent single-vector queries in query_many
+_QUERY_WORKERS = 8
+
+
+def _pinecone_metadata(metadata: Dict[str, Any], document: str) -> Dict[str, Any]:
+    """Pinecone metadata takes strings, numbers, booleans and lists of strings; no nulls."""
+    out: Dict[str, Any] = {}
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        if isinstance(value, (str, int, float, bool)):
+            out[key] = value
+        elif isinstance(value, (list, tuple)):
+            out[key] = [str(v) for v in value]
+        else:
+            out[key] = str(value)
+    out['document'] = document  # Store document in metadata
+    return out
+
 
 class PineconeStore(VectorStoreBase):
     """Pinecone implementation of vector store."""
     
-    def __init__(self, config: Dict[str, Any], embedding_function):
+    provider = "pinecone"
+    
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         super().__init__(config, embedding_function)
         
         try:
             import pinecone
             self.pinecone = pinecone
         except ImportError:
-            raise ImportError("pinecone-client is not installed. Install with: pip install pinecone-client")
+            raise ImportError("pinecone-client is not installed. Install with: pip install 'pinecone-client>=3'")
+        if not hasattr(pinecone, 'Pinecone'):
+            raise ImportError("pinecone-client >= 3 is required. Upgrade with: pip install -U 'pinecone-client>=3'")
         
         pinecone_config = config.get('vector_store', {}).get('pinecone', {})
         
@@ -32,24 +70,44 @@ class PineconeStore(VectorStoreBase):
         
         environment = pinecone_config.get('environment', 'us-east-1-aws')
         
-        self.pinecone.init(api_key=api_key, environment=environment)
+        self.client = self.pinecone.Pinecone(api_key=api_key)
         
         self.index_name = pinecone_config.get('index_name', 'glih-index')
         self.dimension = pinecone_config.get('dimension', 1024)
         self.metric = pinecone_config.get('metric', 'cosine')
         self.pod_type = pinecone_config.get('pod_type', 'p1.x1')
+        self.environment = environment
+        self.cloud = pinecone_config.get('cloud', 'aws')
+        self.region = pinecone_config.get('region', 'us-east-1')
+        self._indexes: Dict[str, Any] = {}
+        self._create_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=_QUERY_WORKERS, thread_name_prefix="glih-pinecone")
         
-        logger.info(f"Pinecone initialized with environment: {environment}")
+        if self.pod_type:
+            logger.info(
+                f"Pinecone initialized with environment: {environment} (pod-based indexes: "
+                f"ids cannot be listed, hybrid search falls back to vector-only)"
+            )
+        else:
+            logger.info(f"Pinecone initialized, serverless indexes in {self.cloud}/{self.region}")
+    
+    def _index_names(self) -> List[str]:
+        return list(self.client.list_indexes().names())
+    
+    def _spec(self) -> Any:
+        if self.pod_type:
+            return self.pinecone.PodSpec(environment=self.environment, pod_type=self.pod_type)
+        return self.pinecone.ServerlessSpec(cloud=self.cloud, region=self.region)
     
     def create_collection(self, collection_name: str, **kwargs) -> bool:
         """Create a new index (collection in Pinecone terms)."""
         try:
-            if collection_name not in self.pinecone.list_indexes():
-                self.pinecone.create_index(
+            if collection_name not in self._index_names():
+                self.client.create_index(
                     name=collection_name,
                     dimension=self.dimension,
                     metric=self.metric,
-                    pod_type=self.pod_type
+                    spec=self._spec()
                 )
                 logger.info(f"Created Pinecone index: {collection_name}")
             return True
@@ -60,7 +118,8 @@ class PineconeStore(VectorStoreBase):
     def delete_collection(self, collection_name: str) -> bool:
         """Delete an index."""
         try:
-            self.pinecone.delete_index(collection_name)
+            self._indexes.pop(collection_name, None)
+            self.client.delete_index(collection_name)
             logger.info(f"Deleted Pinecone index: {collection_name}")
             return True
         except Exception as e:
@@ -70,126 +129,167 @@ class PineconeStore(VectorStoreBase):
     def list_collections(self) -> List[str]:
         """List all indexes."""
         try:
-            return self.pinecone.list_indexes()
+            return self._index_names()
         except Exception as e:
             logger.error(f"Failed to list indexes: {e}")
             return []
     
-    def add_documents(
+    def _index(self, collection_name: str, create: bool = False):
+        """Index handle, cached per process; None if the index does not exist."""
+        index = self._indexes.get(collection_name)
+        if index is not None:
+            return index
+        with self._create_lock:
+            index = self._indexes.get(collection_name)
+            if index is not None:
+                return index
+            if collection_name not in self._index_names():
+                if not create:
+                    return None
+                self.create_collection(collection_name)
+            index = self._indexes[collection_name] = self.client.Index(collection_name)
+            return index
+
+    def _forget_index(self, collection_name: str, index: Any) -> None:
+        """Drop a cached handle whose index was deleted elsewhere (once, however many batches noticed)."""
+        with self._create_lock:
+            if self._indexes.get(collection_name) is index:
+                del self._indexes[collection_name]
+    
+    def _distance(self, score: float) -> float:
+        """Pinecone similarity score → distance (lower is better)."""
+        if self.metric == 'cosine':
+            return 1 - score
+        if self.metric == 'dotproduct':
+            return -score
+        return score  # euclidean
+    
+    @staticmethod
+    def _result(rid: str, metadata: Optional[Dict[str, Any]], score: Optional[float] = None) -> Dict[str, Any]:
+        metadata = dict(metadata or {})
+        document = metadata.pop('document', '')
+        return {'id': rid, 'document': document, 'metadata': metadata, 'distance': score}
+    
+    def upsert(
         self,
         collection_name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
         documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
-    ) -> bool:
-        """Add documents to an index."""
-        try:
-            # Ensure index exists
-            if collection_name not in self.pinecone.list_indexes():
-                self.create_collection(collection_name)
-            
-            index = self.pinecone.Index(collection_name)
-            
-            # Generate embeddings
-            embeddings = []
-            for doc in documents:
-                emb = self.embedding_function([doc])[0]
-                embeddings.append(emb)
-            
-            # Prepare vectors for upsert
-            vectors = []
-            for i, (doc, emb) in enumerate(zip(documents, embeddings)):
-                vector_id = ids[i] if ids else str(uuid.uuid4())
-                metadata = metadatas[i] if metadatas else {}
-                metadata['document'] = doc  # Store document in metadata
-                
-                vectors.append({
-                    'id': vector_id,
-                    'values': emb,
-                    'metadata': metadata
-                })
-            
-            # Upsert in batches of 100
-            batch_size = 100
-            for i in range(0, len(vectors), batch_size):
-                batch = vectors[i:i+batch_size]
-                index.upsert(vectors=batch)
-            
-            logger.info(f"Added {len(documents)} documents to Pinecone index {collection_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add documents to {collection_name}: {e}")
-            return False
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Upsert precomputed embeddings through the bulk engine (concurrent
+        batches of at most _UPSERT_BATCH vectors / 2 MB). Vector ids are the
+        chunk ids, so a retried batch overwrites.
+        """
+        if not ids:
+            return 0
+        self._index(collection_name, create=True)
+        vectors, sizes = [], []
+        for i, (rid, doc, emb) in enumerate(zip(ids, documents, embeddings)):
+            metadata = _pinecone_metadata((metadatas[i] if metadatas else None) or {}, doc)
+            sizes.append(estimate_bytes(emb, '', metadata))
+            vectors.append({'id': rid, 'values': list(emb), 'metadata': metadata})
+        
+        def send(batch: List[Dict[str, Any]]) -> None:
+            current = self._index(collection_name, create=True)
+            try:
+                current.upsert(vectors=batch)
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+                # Deleted by another worker since this process cached it
+                logger.warning(f"Pinecone index {collection_name} is gone, recreating it: {e}")
+                self._forget_index(collection_name, current)
+                self._index(collection_name, create=True).upsert(vectors=batch)
+        
+        report = bulk_upsert('pinecone', collection_name, vectors, sizes, send, _UPSERT_BATCH, _MAX_REQUEST_BYTES)
+        return report['vectors']
     
-    def query(
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        index = self._index(collection_name)
+        if index is None or not ids:
+            return 0
+        for start in range(0, len(ids), _FETCH_BATCH):
+            index.delete(ids=ids[start:start + _FETCH_BATCH])
+        return len(ids)
+    
+    def query_many(
         self,
         collection_name: str,
-        query_text: str,
-        n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
-        max_distance: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
-        """Query documents from an index."""
-        try:
-            if collection_name not in self.pinecone.list_indexes():
-                logger.error(f"Index {collection_name} not found")
-                return []
-            
-            index = self.pinecone.Index(collection_name)
-            
-            # Generate query embedding
-            query_embedding = self.embedding_function([query_text])[0]
-            
-            # Query
-            results = index.query(
-                vector=query_embedding,
-                top_k=n_results,
-                include_metadata=True,
-                filter=where
-            )
-            
-            # Format results
-            formatted_results = []
-            for match in results['matches']:
-                score = match['score']
-                
-                # Convert score to distance (Pinecone returns similarity scores)
-                if self.metric == 'cosine':
-                    distance = 1 - score
-                elif self.metric == 'dotproduct':
-                    distance = -score
-                else:  # euclidean
-                    distance = score
-                
-                # Filter by max_distance if specified
-                if max_distance is not None and distance > max_distance:
-                    continue
-                
-                metadata = match.get('metadata', {})
-                document = metadata.pop('document', '')
-                
-                result = {
-                    'id': match['id'],
-                    'document': document,
-                    'metadata': metadata,
-                    'distance': distance,
-                    'score': score
-                }
-                
-                formatted_results.append(result)
-            
-            return formatted_results
-        except Exception as e:
-            logger.error(f"Failed to query {collection_name}: {e}")
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Pinecone answers one vector per query request, so the vectors are sent
+        concurrently on a small pool. The metadata filter is applied by
+        Pinecone before top_k.
+        """
+        if not query_embeddings:
+            return []
+        index = self._index(collection_name)
+        if index is None:
+            return [[] for _ in query_embeddings]
+        flt = MetadataFilter.coerce(where)
+        filt = flt.to_pinecone() if flt else None
+        
+        def one(emb: List[float]) -> List[Dict[str, Any]]:
+            res = index.query(vector=list(emb), top_k=k, include_metadata=True, filter=filt)
+            out = []
+            for match in res['matches']:
+                r = self._result(match['id'], match.get('metadata'), self._distance(match['score']))
+                r['score'] = match['score']
+                out.append(r)
+            return out
+        
+        if len(query_embeddings) == 1:
+            return [one(query_embeddings[0])]
+        return list(self._pool.map(one, query_embeddings))
+    
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        index = self._index(collection_name)
+        if index is None or not ids:
             return []
+        out = []
+        for start in range(0, len(ids), _FETCH_BATCH):
+            res = index.fetch(ids=ids[start:start + _FETCH_BATCH])
+            vectors = res.get('vectors', {}) if isinstance(res, dict) else getattr(res, 'vectors', {})
+            for rid, vec in vectors.items():
+                metadata = vec.get('metadata') if isinstance(vec, dict) else getattr(vec, 'metadata', None)
+                out.append(self._result(rid, metadata if include_documents else None))
+        return out
+    
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Id listing + fetch. Pinecone lists ids of serverless indexes only."""
+        index = self._index(collection_name)
+        if index is None:
+            return
+        if self.pod_type:
+            raise NotImplementedError("Pinecone pod-based indexes cannot list their ids; use a serverless index (pod_type = \"\")")
+        pending: List[str] = []
+        for page in index.list(limit=min(batch_size, 100)):
+            pending.extend(page)
+            if len(pending) >= batch_size:
+                yield self.get(collection_name, pending)
+                pending = []
+        if pending:
+            yield self.get(collection_name, pending)
+    
+    def count(self, collection_name: str) -> int:
+        index = self._index(collection_name)
+        if index is None:
+            return 0
+        return int(index.describe_index_stats().get('total_vector_count', 0))
     
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about an index."""
         try:
-            if collection_name not in self.pinecone.list_indexes():
+            if collection_name not in self._index_names():
                 return {'name': collection_name, 'count': 0, 'error': 'Index not found'}
             
-            index = self.pinecone.Index(collection_name)
+            index = self.client.Index(collection_name)
             stats = index.describe_index_stats()
             
             return {
@@ -205,7 +305,7 @@ class PineconeStore(VectorStoreBase):
     def health_check(self) -> Dict[str, Any]:
         """Check if Pinecone is healthy."""
         try:
-            indexes = self.pinecone.list_indexes()
+            indexes = self._index_names()
             return {
                 'status': 'healthy',
                 'provider': 'pinecone',
@@ -1,19 +1,45 @@
 """Qdrant vector store implementation."""
 
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Iterator, Optional
 import logging
 import uuid
 
+from ..metadata_filter import MetadataFilter
 from .base import VectorStoreBase
+from .bulk import bulk_upsert, estimate_bytes, is_not_found
 
 logger = logging.getLogger(__name__)
 
+# Payload indexes created with each collection, so filters on the common
+# metadata fields do not scan every point
+_PAYLOAD_INDEXES = {
+    'source': 'keyword',
+    'doc_id': 'keyword',
+    'facility': 'keyword',
+    'product_type': 'keyword',
+    'ingested_at': 'float',
+}
+# Points per upsert / retrieve request; Qdrant rejects REST bodies over 32 MB
+_UPSERT_BATCH = 256
+_MAX_REQUEST_BYTES = 32 * 1024 * 1024
+
+
+def _point_id(rid: str) -> str:
+    """Qdrant point ids must be UUIDs (or integers): other ids map to a stable uuid5."""
+    try:
+        return str(uuid.UUID(str(rid)))
+    except ValueError:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"glih:{rid}"))
+
 
 class QdrantStore(VectorStoreBase):
     """Qdrant implementation of vector store."""
     
-    def __init__(self, config: Dict[str, Any], embedding_function):
+    provider = "qdrant"
+    
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         super().__init__(config, embedding_function)
         
         try:
@@ -46,15 +72,20 @@ class QdrantStore(VectorStoreBase):
             'Dot': self.Distance.DOT
         }
         self.distance = distance_map.get(self.distance_metric, self.Distance.COSINE)
+        # Collections this process has seen or created (skips the exists round
+        # trip); an entry is dropped when a write finds the collection gone
+        self._known: set = set()
+        self._create_lock = threading.Lock()
         
         logger.info(f"Qdrant initialized with URL: {url}")
     
     def create_collection(self, collection_name: str, **kwargs) -> bool:
-        """Create a new collection."""
+        """Create a new collection (`vector_size` given, else on the first upsert)."""
         try:
-            # Check if collection exists
-            collections = self.client.get_collections().collections
-            if any(c.name == collection_name for c in collections):
+            if kwargs.get('vector_size'):
+                self._ensure_collection(collection_name, int(kwargs['vector_size']))
+                return True
+            if self._exists(collection_name):
                 logger.warning(f"Collection {collection_name} already exists")
                 return True
             
@@ -69,6 +100,7 @@ class QdrantStore(VectorStoreBase):
     def delete_collection(self, collection_name: str) -> bool:
         """Delete a collection."""
         try:
+            self._known.discard(collection_name)
             self.client.delete_collection(collection_name=collection_name)
             logger.info(f"Deleted Qdrant collection: {collection_name}")
             return True
@@ -85,128 +117,175 @@ class QdrantStore(VectorStoreBase):
             logger.error(f"Failed to list collections: {e}")
             return []
     
-    def add_documents(
-        self,
-        collection_name: str,
-        documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
-    ) -> bool:
-        """Add documents to a collection."""
+    def _exists(self, collection_name: str) -> bool:
+        if collection_name in self._known:
+            return True
         try:
-            # Generate embeddings
-            embeddings = []
-            for doc in documents:
-                emb = self.embedding_function([doc])[0]
-                embeddings.append(emb)
-            
-            # Create collection if it doesn't exist
-            collections = self.client.get_collections().collections
-            if not any(c.name == collection_name for c in collections):
-                vector_size = len(embeddings[0])
+            exists = bool(self.client.collection_exists(collection_name=collection_name))
+        except AttributeError:  # qdrant-client < 1.8
+            exists = any(c.name == collection_name for c in self.client.get_collections().collections)
+        if exists:
+            self._known.add(collection_name)
+        return exists
+    
+    def _ensure_collection(self, collection_name: str, vector_size: int) -> None:
+        if collection_name in self._known:
+            return
+        with self._create_lock:
+            if self._exists(collection_name):
+                return
+            try:
                 self.client.create_collection(
                     collection_name=collection_name,
                     vectors_config=self.VectorParams(size=vector_size, distance=self.distance)
                 )
-                logger.info(f"Created Qdrant collection: {collection_name}")
-            
-            # Prepare points
-            points = []
-            for i, (doc, emb) in enumerate(zip(documents, embeddings)):
-                point_id = ids[i] if ids else str(uuid.uuid4())
-                metadata = metadatas[i] if metadatas else {}
-                metadata['document'] = doc  # Store document in payload
-                
-                points.append(
-                    self.PointStruct(
-                        id=point_id,
-                        vector=emb,
-                        payload=metadata
-                    )
+            except Exception:
+                # Another worker created it first
+                if self._exists(collection_name):
+                    return
+                raise
+            for field, schema in _PAYLOAD_INDEXES.items():
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field,
+                    field_schema=schema
                 )
-            
-            # Upsert points
-            self.client.upsert(
-                collection_name=collection_name,
-                points=points
-            )
-            
-            logger.info(f"Added {len(documents)} documents to Qdrant collection {collection_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add documents to {collection_name}: {e}")
-            return False
+            self._known.add(collection_name)
+            logger.info(f"Created Qdrant collection: {collection_name}")
+    
+    def _distance(self, score: float) -> float:
+        """Qdrant score → distance (lower is better)."""
+        if self.distance == self.Distance.COSINE:
+            return 1 - score
+        if self.distance == self.Distance.DOT:
+            return -score
+        return score
+    
+    def _result(self, point: Any, score: Optional[float] = None) -> Dict[str, Any]:
+        payload = dict(point.payload or {})
+        document = payload.pop('document', '')
+        original_id = payload.pop('original_id', None)
+        result = {
+            'id': original_id or str(point.id),
+            'document': document,
+            'metadata': payload,
+            'distance': self._distance(score) if score is not None else None
+        }
+        if score is not None:
+            result['score'] = score
+        return result
     
-    def query(
+    def upsert(
         self,
         collection_name: str,
-        query_text: str,
-        n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
-        max_distance: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
-        """Query documents from a collection."""
-        try:
-            # Check if collection exists
-            collections = self.client.get_collections().collections
-            if not any(c.name == collection_name for c in collections):
-                logger.error(f"Collection {collection_name} not found")
-                return []
-            
-            # Generate query embedding
-            query_embedding = self.embedding_function([query_text])[0]
-            
-            # Build filter if where is specified
-            query_filter = None
-            if where:
-                from qdrant_client.models import Filter, FieldCondition, MatchValue
-                conditions = []
-                for key, value in where.items():
-                    conditions.append(
-                        FieldCondition(key=key, match=MatchValue(value=value))
-                    )
-                query_filter = Filter(must=conditions)
-            
-            # Search
-            search_result = self.client.search(
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Upsert precomputed embeddings through the bulk engine (concurrent
+        batches of at most _UPSERT_BATCH points). Point ids derive from the
+        chunk id, so a retried batch overwrites.
+        """
+        if not ids:
+            return 0
+        self._ensure_collection(collection_name, len(embeddings[0]))
+        points, sizes = [], []
+        for i, (rid, doc, emb) in enumerate(zip(ids, documents, embeddings)):
+            payload = dict((metadatas[i] if metadatas else None) or {})
+            sizes.append(estimate_bytes(emb, doc, payload))
+            payload['document'] = doc  # Store document in payload
+            payload['original_id'] = rid
+            points.append(self.PointStruct(id=_point_id(rid), vector=list(emb), payload=payload))
+        
+        def send(batch: List[Any]) -> None:
+            try:
+                self.client.upsert(collection_name=collection_name, points=batch, wait=True)
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+                # Deleted by another worker since this process cached it
+                logger.warning(f"Qdrant collection {collection_name} is gone, recreating it: {e}")
+                self._known.discard(collection_name)
+                self._ensure_collection(collection_name, len(embeddings[0]))
+                self.client.upsert(collection_name=collection_name, points=batch, wait=True)
+        
+        report = bulk_upsert('qdrant', collection_name, points, sizes, send, _UPSERT_BATCH, _MAX_REQUEST_BYTES)
+        return report['vectors']
+    
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        if not ids or not self._exists(collection_name):
+            return 0
+        from qdrant_client import models
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=[_point_id(rid) for rid in ids])
+        )
+        return len(ids)
+    
+    def query_many(
+        self,
+        collection_name: str,
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """All query vectors in one search_batch request; the filter is evaluated by Qdrant."""
+        if not query_embeddings:
+            return []
+        if not self._exists(collection_name):
+            return [[] for _ in query_embeddings]
+        from qdrant_client import models
+        flt = MetadataFilter.coerce(where)
+        query_filter = flt.to_qdrant(models) if flt else None
+        requests = [
+            models.SearchRequest(vector=list(emb), limit=k, filter=query_filter, with_payload=True)
+            for emb in query_embeddings
+        ]
+        batches = self.client.search_batch(collection_name=collection_name, requests=requests)
+        return [[self._result(hit, hit.score) for hit in hits] for hits in batches]
+    
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        if not ids or not self._exists(collection_name):
+            return []
+        out = []
+        for start in range(0, len(ids), _UPSERT_BATCH):
+            points = self.client.retrieve(
                 collection_name=collection_name,
-                query_vector=query_embedding,
-                limit=n_results,
-                query_filter=query_filter
+                ids=[_point_id(rid) for rid in ids[start:start + _UPSERT_BATCH]],
+                with_payload=True if include_documents else ['original_id'],
+                with_vectors=False
             )
-            
-            # Format results
-            formatted_results = []
-            for hit in search_result:
-                distance = hit.score
-                
-                # Filter by max_distance if specified
-                if max_distance is not None and distance > max_distance:
-                    continue
-                
-                payload = hit.payload
-                document = payload.pop('document', '')
-                
-                result = {
-                    'id': str(hit.id),
-                    'document': document,
-                    'metadata': payload,
-                    'distance': distance,
-                    'score': hit.score
-                }
-                
-                formatted_results.append(result)
-            
-            return formatted_results
-        except Exception as e:
-            logger.error(f"Failed to query {collection_name}: {e}")
-            return []
+            out.extend(self._result(p) for p in points)
+        return out
+    
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        if not self._exists(collection_name):
+            return
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            if points:
+                yield [self._result(p) for p in points]
+            if offset is None:
+                return
+    
+    def count(self, collection_name: str) -> int:
+        if not self._exists(collection_name):
+            return 0
+        return self.client.count(collection_name=collection_name, exact=True).count
     
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about a collection."""
         try:
-            collections = self.client.get_collections().collections
-            if not any(c.name == collection_name for c in collections):
+            if not self._exists(collection_name):
                 return {'name': collection_name, 'count': 0, 'error': 'Collection not found'}
             
             collection_info = self.client.get_collection(collection_name=collection_name)
@@ -1,19 +1,56 @@
 """Weaviate vector store implementation."""
 
+import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Iterator, Optional
 import logging
 import uuid
 
+from ..metadata_filter import MetadataFilter
 from .base import VectorStoreBase
+from .bulk import bulk_upsert, estimate_bytes, is_not_found
 
 logger = logging.getLogger(__name__)
 
+# Metadata fields declared as filterable properties on every class. Text
+# properties use field tokenization so Equal matches the whole value. Other
+# scalar metadata is written too and picked up by Weaviate's auto-schema.
+_FILTER_PROPERTIES = {
+    'source': 'text',
+    'doc_id': 'text',
+    'facility': 'text',
+    'product_type': 'text',
+    'ingested_at': 'int',
+}
+_INT_FIELDS = tuple(f for f, t in _FILTER_PROPERTIES.items() if t == 'int')
+
+
+# Objects per batch import / id lookup; import bodies are kept well under
+# Weaviate's default request size limit
+_BATCH_SIZE = 100
+_MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+
+def _object_uuid(rid: str) -> str:
+    """Chunk id → Weaviate object uuid (the id itself when it is a UUID, else a stable uuid5)."""
+    try:
+        return str(uuid.UUID(str(rid)))
+    except ValueError:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"glih:{rid}"))
+
+
+def _meta_property(field: str) -> str:
+    """Metadata field → Weaviate property name (prefixed so it cannot clash)."""
+    return 'meta_' + ''.join(c if c.isalnum() else '_' for c in field)
+
 
 class WeaviateStore(VectorStoreBase):
     """Weaviate implementation of vector store."""
     
-    def __init__(self, config: Dict[str, Any], embedding_function):
+    provider = "weaviate"
+    
+    def __init__(self, config: Dict[str, Any], embedding_function=None):
         super().__init__(config, embedding_function)
         
         try:
@@ -38,6 +75,10 @@ class WeaviateStore(VectorStoreBase):
         
         self.class_name = weaviate_config.get('class_name', 'GlihDocument')
         self.distance_metric = weaviate_config.get('distance_metric', 'cosine')
+        # Classes this process has seen or created (skips the exists round
+        # trip); an entry is dropped when a write finds the class gone
+        self._known: set = set()
+        self._create_lock = threading.Lock()
         
         logger.info(f"Weaviate initialized with URL: {url}")
     
@@ -75,8 +116,17 @@ class WeaviateStore(VectorStoreBase):
                     {
                         'name': 'original_id',
                         'dataType': ['text'],
-                        'description': 'Original document ID'
+                        'description': 'Original document ID',
+                        'tokenization': 'field'
                     }
+                ] + [
+                    {
+                        'name': _meta_property(field),
+                        'dataType': [data_type],
+                        'description': f'Metadata field {field} (filterable)',
+                        **({'tokenization': 'field'} if data_type == 'text' else {})
+                    }
+                    for field, data_type in _FILTER_PROPERTIES.items()
                 ]
             }
             
@@ -91,6 +141,7 @@ class WeaviateStore(VectorStoreBase):
         """Delete a class."""
         try:
             class_name = self._sanitize_class_name(collection_name)
+            self._known.discard(class_name)
             self.client.schema.delete_class(class_name)
             logger.info(f"Deleted Weaviate class: {class_name}")
             return True
@@ -107,111 +158,200 @@ class WeaviateStore(VectorStoreBase):
             logger.error(f"Failed to list classes: {e}")
             return []
     
-    def add_documents(
+    def _result(self, obj: Dict[str, Any], with_distance: bool = True) -> Dict[str, Any]:
+        additional = obj.get('_additional') or {}
+        # Parse metadata
+        try:
+            metadata = json.loads(obj.get('metadata') or '{}')
+        except Exception:
+            metadata = {}
+        return {
+            'id': obj.get('original_id') or additional.get('id', ''),
+            'document': obj.get('document', ''),
+            'metadata': metadata,
+            'distance': additional.get('distance') if with_distance else None
+        }
+    
+    def _exists(self, class_name: str) -> bool:
+        if class_name in self._known:
+            return True
+        if self.client.schema.exists(class_name):
+            self._known.add(class_name)
+            return True
+        return False
+    
+    def _ensure_class(self, collection_name: str) -> str:
+        class_name = self._sanitize_class_name(collection_name)
+        if class_name in self._known:
+            return class_name
+        with self._create_lock:
+            if not self._exists(class_name):
+                # create_collection() logs and returns False on error; a class
+                # another worker created meanwhile still counts
+                if not self.create_collection(collection_name) and not self._exists(class_name):
+                    raise RuntimeError(f"could not create Weaviate class {class_name}")
+                self._known.add(class_name)
+        return class_name
+    
+    def upsert(
         self,
         collection_name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
         documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None
-    ) -> bool:
-        """Add documents to a class."""
-        try:
-            class_name = self._sanitize_class_name(collection_name)
-            
-            # Ensure class exists
-            if not self.client.schema.exists(class_name):
-                self.create_collection(collection_name)
-            
-            # Add documents with batch
-            with self.client.batch as batch:
-                batch.batch_size = 100
-                
-                for i, doc in enumerate(documents):
-                    # Generate embedding
-                    embedding = self.embedding_function([doc])[0]
-                    
-                    # Prepare properties
-                    properties = {
-                        'document': doc,
-                        'metadata': str(metadatas[i]) if metadatas else '{}',
-                        'original_id': ids[i] if ids else str(uuid.uuid4())
-                    }
-                    
-                    # Add to batch
-                    batch.add_data_object(
-                        data_object=properties,
-                        class_name=class_name,
-                        vector=embedding
-                    )
-            
-            logger.info(f"Added {len(documents)} documents to Weaviate class {class_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add documents to {collection_name}: {e}")
-            return False
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Batch import of precomputed embeddings through the bulk engine
+        (concurrent batch requests). Object uuids derive from the chunk id, so
+        writing an id again, or retrying a batch, replaces the object.
+        """
+        if not ids:
+            return 0
+        from weaviate.batch.requests import ObjectsBatchRequest
+        class_name = self._ensure_class(collection_name)
+        objects, sizes = [], []
+        for i, (rid, doc, emb) in enumerate(zip(ids, documents, embeddings)):
+            # Scalar metadata is also stored as meta_* properties so
+            # queries can filter on it
+            metadata = (metadatas[i] if metadatas else None) or {}
+            properties = {
+                'document': doc,
+                'metadata': json.dumps(metadata, default=str),
+                'original_id': rid
+            }
+            for field, value in metadata.items():
+                if isinstance(value, (str, int, float, bool)):
+                    properties[_meta_property(field)] = value
+            sizes.append(estimate_bytes(emb, doc, properties))
+            objects.append((properties, _object_uuid(rid), list(emb)))
+        
+        def send_once(batch: List[Any]) -> None:
+            request = ObjectsBatchRequest()
+            for properties, object_uuid, vector in batch:
+                request.add(class_name=class_name, data_object=properties, uuid=object_uuid, vector=vector)
+            # Weaviate answers 200 with per-object errors
+            results = self.client.batch.create_objects(request) or []
+            errors = [
+                err.get('message', str(err))
+                for res in results
+                for err in ((res.get('result') or {}).get('errors') or {}).get('error', [])
+            ]
+            if errors:
+                raise RuntimeError(f"{len(errors)} objects failed, first: {errors[0]}")
+        
+        def send(batch: List[Any]) -> None:
+            try:
+                send_once(batch)
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+                # Deleted by another worker since this process cached it
+                logger.warning(f"Weaviate class {class_name} is gone, recreating it: {e}")
+                self._known.discard(class_name)
+                self._ensure_class(collection_name)
+                send_once(batch)
+        
+        report = bulk_upsert('weaviate', collection_name, objects, sizes, send, _BATCH_SIZE, _MAX_REQUEST_BYTES)
+        return report['vectors']
+    
+    @staticmethod
+    def _ids_filter(ids: List[str]) -> Dict[str, Any]:
+        operands = [{'path': ['id'], 'operator': 'Equal', 'valueText': _object_uuid(rid)} for rid in ids]
+        return operands[0] if len(operands) == 1 else {'operator': 'Or', 'operands': operands}
     
-    def query(
+    def delete(self, collection_name: str, ids: List[str]) -> int:
+        class_name = self._sanitize_class_name(collection_name)
+        if not ids or not self._exists(class_name):
+            return 0
+        for start in range(0, len(ids), _BATCH_SIZE):
+            self.client.batch.delete_objects(class_name=class_name, where=self._ids_filter(ids[start:start + _BATCH_SIZE]))
+        return len(ids)
+    
+    def query_many(
         self,
         collection_name: str,
-        query_text: str,
-        n_results: int = 5,
-        where: Optional[Dict[str, Any]] = None,
-        max_distance: Optional[float] = None
-    ) -> List[Dict[str, Any]]:
-        """Query documents from a class."""
-        try:
-            class_name = self._sanitize_class_name(collection_name)
-            
-            if not self.client.schema.exists(class_name):
-                logger.error(f"Class {class_name} not found")
-                return []
-            
-            # Generate query embedding
-            query_embedding = self.embedding_function([query_text])[0]
-            
-            # Build query
+        query_embeddings: List[List[float]],
+        k: int = 5,
+        where: Optional[Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Every query vector as an aliased Get in one GraphQL request."""
+        if not query_embeddings:
+            return []
+        class_name = self._sanitize_class_name(collection_name)
+        if not self._exists(class_name):
+            return [[] for _ in query_embeddings]
+        flt = MetadataFilter.coerce(where)
+        
+        def builder(emb: List[float]):
             query_builder = (
                 self.client.query
                 .get(class_name, ['document', 'metadata', 'original_id'])
-                .with_near_vector({'vector': query_embedding})
-                .with_limit(n_results)
+                .with_near_vector({'vector': list(emb)})
+                .with_limit(k)
                 .with_additional(['distance', 'id'])
             )
-            
-            # Execute query
-            result = query_builder.do()
-            
-            # Format results
-            formatted_results = []
-            objects = result.get('data', {}).get('Get', {}).get(class_name, [])
-            
-            for obj in objects:
-                distance = obj.get('_additional', {}).get('distance', 0)
-                
-                # Filter by max_distance if specified
-                if max_distance is not None and distance > max_distance:
-                    continue
-                
-                # Parse metadata
-                import json
-                try:
-                    metadata = json.loads(obj.get('metadata', '{}'))
-                except Exception:
-                    metadata = {}
-                
-                result_obj = {
-                    'id': obj.get('original_id', obj.get('_additional', {}).get('id', '')),
-                    'document': obj.get('document', ''),
-                    'metadata': metadata,
-                    'distance': distance
-                }
-                
-                formatted_results.append(result_obj)
-            
-            return formatted_results
-        except Exception as e:
-            logger.error(f"Failed to query {collection_name}: {e}")
+            if flt:
+                query_builder = query_builder.with_where(flt.to_weaviate(_meta_property, _INT_FIELDS))
+            return query_builder
+        
+        if len(query_embeddings) > 1 and hasattr(self.client.query, 'multi_get'):
+            builders = [builder(emb).with_alias(f'q{i}') for i, emb in enumerate(query_embeddings)]
+            data = self.client.query.multi_get(builders).do().get('data', {}).get('Get', {})
+            return [[self._result(obj) for obj in data.get(f'q{i}') or []] for i in range(len(query_embeddings))]
+        out = []
+        for emb in query_embeddings:
+            objects = builder(emb).do().get('data', {}).get('Get', {}).get(class_name, [])
+            out.append([self._result(obj) for obj in objects or []])
+        return out
+    
+    def get(self, collection_name: str, ids: List[str], include_documents: bool = True) -> List[Dict[str, Any]]:
+        class_name = self._sanitize_class_name(collection_name)
+        if not ids or not self._exists(class_name):
             return []
+        properties = ['document', 'metadata', 'original_id'] if include_documents else ['original_id']
+        out = []
+        for start in range(0, len(ids), _BATCH_SIZE):
+            chunk = ids[start:start + _BATCH_SIZE]
+            result = (
+                self.client.query
+                .get(class_name, properties)
+                .with_where(self._ids_filter(chunk))
+                .with_limit(len(chunk))
+                .with_additional(['id'])
+                .do()
+            )
+            objects = result.get('data', {}).get('Get', {}).get(class_name, [])
+            out.extend(self._result(obj, with_distance=False) for obj in objects or [])
+        return out
+    
+    def scan(self, collection_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Cursor over every object (Weaviate >= 1.18)."""
+        class_name = self._sanitize_class_name(collection_name)
+        if not self._exists(class_name):
+            return
+        after = None
+        while True:
+            query_builder = (
+                self.client.query
+                .get(class_name, ['document', 'metadata', 'original_id'])
+                .with_limit(batch_size)
+                .with_additional(['id'])
+            )
+            if after is not None:
+                query_builder = query_builder.with_after(after)
+            objects = query_builder.do().get('data', {}).get('Get', {}).get(class_name, [])
+            if not objects:
+                return
+            yield [self._result(obj, with_distance=False) for obj in objects]
+            after = objects[-1]['_additional']['id']
+    
+    def count(self, collection_name: str) -> int:
+        class_name = self._sanitize_class_name(collection_name)
+        if not self._exists(class_name):
+            return 0
+        result = self.client.query.aggregate(class_name).with_meta_count().do()
+        return result.get('data', {}).get('Aggregate', {}).get(class_name, [{}])[0].get('meta', {}).get('count', 0)
     
     def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get statistics about a class."""
@@ -221,9 +361,7 @@ class WeaviateStore(VectorStoreBase):
             if not self.client.schema.exists(class_name):
                 return {'name': collection_name, 'count': 0, 'error': 'Class not found'}
             
-            # Get count
-            result = self.client.query.aggregate(class_name).with_meta_count().do()
-            count = result.get('data', {}).get('Aggregate', {}).get(class_name, [{}])[0].get('meta', {}).get('count', 0)
+            count = self.count(collection_name)
             
             return {
                 'name': collection_name,
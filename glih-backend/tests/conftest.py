@@ -0,0 +1,13 @@
+"""
+Shared pytest setup for glih-backend.
+
+Run: make test  (or: cd glih-backend && python -m pytest tests/ -v)
+
+The tests import glih_backend from src/ without an install, and never touch
+the network or the data/ directory: stores, caches and history databases
+are created under pytest's tmp_path.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
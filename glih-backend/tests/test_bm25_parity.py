@@ -0,0 +1,62 @@
+"""BM25Index scores against rank_bm25.BM25Okapi, fresh and after incremental updates."""
+import random
+
+import numpy as np
+import pytest
+
+from glih_backend.bm25_index import BM25Index, build_index, tokenize
+
+rank_bm25 = pytest.importorskip("rank_bm25")
+
+_WORDS = (
+    "reefer dairy seafood breach setpoint alarm door chicago dallas route "
+    "quarantine inspect pallet carrier dock temperature excursion sop"
+).split()
+_QUERIES = ["dairy breach", "reefer door alarm", "seafood route dallas chicago", "sop", "unknown term", "dock dock pallet"]
+
+
+def _docs(n, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(_WORDS, k=rng.randint(1, 12))) for _ in range(n)]
+
+
+def _assert_parity(index, live):
+    """`live` is [(id, text)] in slot order, the order get_scores() reports."""
+    okapi = rank_bm25.BM25Okapi([tokenize(text) for _, text in live])
+    for query in _QUERIES:
+        expected = okapi.get_scores(tokenize(query))
+        np.testing.assert_allclose(index.get_scores(tokenize(query)), expected, rtol=1e-9, atol=1e-12)
+    assert len(index) == len(live)
+
+
+def test_fresh_build_matches_okapi():
+    texts = _docs(60, 0)
+    ids = [f"d{i}" for i in range(60)]
+    _assert_parity(build_index(ids, texts), list(zip(ids, texts)))
+
+
+def test_incremental_add_and_remove_match_a_rebuilt_okapi():
+    index = BM25Index()
+    live = {}  # id → text, in slot order (a replaced id moves to the end)
+    texts = _docs(120, 1)
+    for start in range(0, 90, 30):
+        ids = [f"d{i}" for i in range(start, start + 30)]
+        index.add(ids, texts[start:start + 30])
+        live.update(zip(ids, texts[start:start + 30]))
+    removed = [f"d{i}" for i in range(0, 90, 4)]
+    index.remove(removed)
+    for rid in removed:
+        del live[rid]
+    _assert_parity(index, list(live.items()))
+
+    # Re-adding existing ids tombstones their old slots
+    replaced = [f"d{i}" for i in range(1, 90, 5)]
+    new_texts = texts[90:90 + len(replaced)]
+    index.add(replaced, new_texts)
+    for rid, text in zip(replaced, new_texts):
+        live.pop(rid, None)
+        live[rid] = text
+    _assert_parity(index, list(live.items()))
+
+    index.compact()
+    _assert_parity(index, list(live.items()))
@@ -0,0 +1,53 @@
+"""BM25 store: generations on disk, swapped atomically under readers."""
+from glih_backend.bm25_index import build_index, tokenize
+from glih_backend.bm25_store import BM25Store
+
+
+def _ids(index, query, k=10):
+    return [r["id"] for r in index.search(tokenize(query), k)]
+
+
+def test_save_publishes_a_new_generation_and_old_readers_keep_theirs(tmp_path):
+    store = BM25Store(str(tmp_path))
+    index = build_index(["a", "b"], ["dairy breach at chicago", "seafood route dallas"], [{}, {}])
+    with store.lock("sops"):
+        first = store.save("sops", index, source="coll-1")
+
+    token, reader = store.load("sops", "coll-1")
+    assert token == first == store.current("sops")
+    assert _ids(reader, "dairy") == ["a"]
+
+    # An ingest in another worker: load the current generation, append, publish
+    with store.lock("sops"):
+        _, writer = store.load("sops", "coll-1")
+        writer.add(["c"], ["dairy recall notice"], [{}])
+        second = store.save("sops", writer, source="coll-1")
+
+    assert second != first and store.current("sops") == second
+    # The reader still serves its memory-mapped generation until it reloads
+    assert _ids(reader, "dairy") == ["a"]
+    _, fresh = store.load("sops", "coll-1")
+    assert sorted(_ids(fresh, "dairy")) == ["a", "c"]
+    assert _ids(fresh, "seafood") == ["b"]
+
+
+def test_index_of_another_collection_instance_is_ignored(tmp_path):
+    store = BM25Store(str(tmp_path))
+    with store.lock("sops"):
+        store.save("sops", build_index(["a"], ["dairy"], [{}]), source="coll-1")
+
+    assert store.load("sops", "coll-2") is None
+
+
+def test_drop_then_rebuild_never_reuses_a_token(tmp_path):
+    store = BM25Store(str(tmp_path))
+    with store.lock("sops"):
+        before = store.save("sops", build_index(["a"], ["dairy"], [{}]))
+    store.drop("sops")
+    assert store.current("sops") is None and store.load("sops") is None
+
+    with store.lock("sops"):
+        after = store.save("sops", build_index(["b"], ["seafood"], [{}]))
+
+    assert after != before
+    assert _ids(store.load("sops")[1], "seafood") == ["b"]
@@ -0,0 +1,127 @@
+"""
+Bulk upsert engine: batching, and which failures are retried.
+"""
+import threading
+
+import pytest
+
+from glih_backend.vector_stores import bulk
+from glih_backend.vector_stores.bulk import BulkUpsertError, bulk_upsert, is_not_found, is_retryable, split_batches
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class _Response:
+    status_code = 503
+
+
+class _HTTPError(Exception):
+    response = _Response()
+
+
+class ConnectTimeout(Exception):
+    """Named like the httpx / requests transport errors."""
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(bulk.time, "sleep", lambda s: None)
+
+
+def test_split_batches_by_points_and_bytes():
+    assert split_batches([10] * 7, 3, 1000) == [(0, 3), (3, 6), (6, 7)]
+    assert split_batches([600, 600, 10, 10], 100, 1000) == [(0, 1), (1, 4)]
+    # An oversized record still goes out alone
+    assert split_batches([5000], 10, 100) == [(0, 1)]
+
+
+def test_retryable_errors():
+    assert is_retryable(_StatusError(429))
+    assert is_retryable(_StatusError(502))
+    assert is_retryable(_HTTPError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectTimeout())
+    assert not is_retryable(_StatusError(400))
+    assert not is_retryable(_StatusError(404))
+    assert not is_retryable(ValueError("vector dimension mismatch"))
+    assert not is_retryable(RuntimeError("3 objects failed, first: invalid property"))
+
+
+class ResponseHandlingException(Exception):
+    """qdrant-client's wrapper around httpx errors: no status, the cause in .source."""
+
+    def __init__(self, source):
+        super().__init__(str(source))
+        self.source = source
+
+
+def test_wrapped_transport_errors_are_retryable():
+    httpx = pytest.importorskip("httpx")
+    assert is_retryable(ResponseHandlingException(httpx.ConnectTimeout("timed out")))
+    try:
+        try:
+            raise httpx.ReadTimeout("timed out")
+        except httpx.ReadTimeout as e:
+            raise RuntimeError("upsert failed") from e
+    except RuntimeError as e:
+        assert is_retryable(e)
+    assert not is_retryable(ResponseHandlingException(ValueError("bad payload")))
+    # The outermost status decides
+    err = _StatusError(400)
+    err.__cause__ = ConnectTimeout()
+    assert not is_retryable(err)
+
+
+def test_not_found_errors():
+    assert is_not_found(_StatusError(404))
+    assert is_not_found(RuntimeError("Not found: Collection `sops` doesn't exist!"))
+    assert not is_not_found(_StatusError(500))
+
+
+def test_transient_failures_are_retried():
+    calls = {}
+    lock = threading.Lock()
+
+    def send(batch):
+        with lock:
+            calls[batch[0]] = calls.get(batch[0], 0) + 1
+            first = calls[batch[0]] == 1
+        if batch[0] == 30 and first:
+            raise _StatusError(503)
+
+    report = bulk_upsert("test", "c", list(range(100)), [1] * 100, send, 10)
+    assert report["vectors"] == 100
+    assert report["retried_batches"] == 1 and report["failed_batches"] == 0
+    assert calls[30] == 2 and calls[0] == 1
+
+
+def test_permanent_failures_are_not_retried():
+    calls = []
+
+    def send(batch):
+        calls.append(batch[0])
+        if batch[0] == 0:
+            raise _StatusError(400)
+
+    with pytest.raises(BulkUpsertError) as err:
+        bulk_upsert("test", "c", list(range(20)), [1] * 20, send, 10, retries=3)
+    assert calls.count(0) == 1
+    assert err.value.report["vectors"] == 10
+    assert err.value.report["failed_batches"] == 1
+
+
+def test_retries_are_bounded():
+    calls = []
+
+    def send(batch):
+        calls.append(batch[0])
+        raise ConnectionRefusedError()
+
+    with pytest.raises(BulkUpsertError):
+        bulk_upsert("test", "c", list(range(5)), [1] * 5, send, 10, retries=2)
+    assert len(calls) == 3
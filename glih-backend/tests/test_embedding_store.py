@@ -0,0 +1,73 @@
+"""
+Idempotent ingest across embedding-model switches (embedding_store helpers).
+
+The collection is a dict id → metadata, written the way _index_chunks does:
+selected chunks are upserted under their deterministic id with the current
+embedding tag.
+"""
+from glih_backend.embedding_store import (
+    EMBEDDING_MODEL_KEY,
+    PLACEHOLDER_MODEL,
+    chunk_ids,
+    embedding_tag,
+    select_chunks,
+)
+
+
+class _Provider:
+    def __init__(self, provider, model, available=True):
+        self.provider = provider
+        self.model = model
+        self.available = available
+
+
+def _ingest(collection, provider, texts, metas=None):
+    tag = embedding_tag(provider)
+    ids = chunk_ids(texts, metas)
+    stored = {cid: collection[cid] for cid in ids if cid in collection}
+    keep, stale = select_chunks(ids, stored, tag)
+    for i in keep:
+        collection[ids[i]] = {**((metas[i] if metas else None) or {}), EMBEDDING_MODEL_KEY: tag}
+    return len(keep), stale
+
+
+def test_reingest_same_model_is_noop():
+    coll = {}
+    emb = _Provider("openai", "text-embedding-3-small")
+    texts = ["reefer setpoint -18C", "door open alarm", "reefer setpoint -18C"]
+    assert _ingest(coll, emb, texts) == (2, 0)
+    assert _ingest(coll, emb, texts) == (0, 0)
+    assert len(coll) == 2
+
+
+def test_model_switch_reembeds_under_same_ids():
+    coll = {}
+    texts = ["reefer setpoint -18C", "door open alarm"]
+    _ingest(coll, _Provider("openai", "text-embedding-3-small"), texts)
+    ids = set(coll)
+
+    new = _Provider("openai", "text-embedding-3-large")
+    assert _ingest(coll, new, texts) == (2, 2)
+    # Overwritten in place, not duplicated
+    assert set(coll) == ids
+    assert {m[EMBEDDING_MODEL_KEY] for m in coll.values()} == {"openai/text-embedding-3-large"}
+    assert _ingest(coll, new, texts) == (0, 0)
+
+
+def test_placeholder_vectors_are_replaced_once_provider_is_available():
+    coll = {}
+    texts = ["temperature excursion SOP"]
+    offline = _Provider("openai", None, available=False)
+    assert embedding_tag(offline) == PLACEHOLDER_MODEL
+    assert _ingest(coll, offline, texts) == (1, 0)
+    assert _ingest(coll, offline, texts) == (0, 0)
+
+    online = _Provider("openai", None)
+    assert _ingest(coll, online, texts) == (1, 1)
+    assert next(iter(coll.values()))[EMBEDDING_MODEL_KEY] == "openai/"
+
+
+def test_chunks_stored_without_a_tag_are_reembedded():
+    ids = chunk_ids(["legacy chunk"])
+    keep, stale = select_chunks(ids, {ids[0]: {"source": "sop.pdf"}}, "openai/text-embedding-3-small")
+    assert (keep, stale) == ([0], 1)
@@ -0,0 +1,163 @@
+"""
+FAISS store: segment log, compaction and several workers sharing a directory.
+
+Each FAISSStore instance stands for one worker; the cross-process locks are
+flocks on separate file handles, so instances in one process contend for
+them like separate processes do. One test also forks real processes.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from glih_backend.vector_stores import faiss_store  # noqa: E402
+from glih_backend.vector_stores.faiss_store import FAISSStore  # noqa: E402
+
+DIM = 8
+
+
+def _store(path):
+    return FAISSStore({"vector_store": {"faiss": {"persist_directory": str(path)}}})
+
+
+def _vectors(n, seed):
+    return np.random.default_rng(seed).random((n, DIM)).astype("float32").tolist()
+
+
+def _write(store, prefix, n, seed=0, batch=25):
+    vecs = _vectors(n, seed)
+    for start in range(0, n, batch):
+        ids = [f"{prefix}{i}" for i in range(start, min(start + batch, n))]
+        store.upsert("col", ids, vecs[start:start + len(ids)], ids)
+
+
+def test_workers_see_each_others_appends(tmp_path):
+    a, b = _store(tmp_path), _store(tmp_path)
+    _write(a, "a", 10)
+    assert b.count("col") == 10
+    _write(b, "b", 10, seed=1)
+    a.delete("col", ["b0"])
+    assert a.count("col") == b.count("col") == 19
+    assert b.get("col", ["b0"]) == []
+    # The same id written by two workers: the later write wins everywhere
+    a.upsert("col", ["x"], _vectors(1, 2), ["from a"])
+    b.upsert("col", ["x"], _vectors(1, 3), ["from b"])
+    assert a.get("col", ["x"])[0]["document"] == b.get("col", ["x"])[0]["document"] == "from b"
+    assert "col" in _store(tmp_path).list_collections()
+
+
+def test_compaction_with_concurrent_writes_and_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "_COMPACT_ROWS", 60)
+    workers = [_store(tmp_path) for _ in range(3)]
+    threads = [
+        threading.Thread(target=_write, args=(w, f"w{i}_", 200, i)) for i, w in enumerate(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for w in workers:
+        w._compactor.shutdown(wait=True)
+
+    expected = {f"w{i}_{j}" for i in range(3) for j in range(200)}
+    fresh = _store(tmp_path)
+    stats = fresh.get_collection_stats("col")
+    assert stats["generation"] >= 1
+    assert stats["count"] == len(expected)
+    assert {r["id"] for batch in fresh.scan("col") for r in batch} == expected
+    for w in workers:
+        assert w.count("col") == len(expected)
+    # Only the current generation is left on disk
+    gens = {faiss_store._generation_of(f) for f in os.listdir(tmp_path / "col")} - {None}
+    assert gens == {stats["generation"]}
+    # Every row is still searchable by its own vector
+    vec = _vectors(200, 2)[123]
+    assert fresh.query_by_vector("col", vec, k=1)[0]["id"] == "w2_123"
+
+
+def test_append_after_another_worker_compacted(tmp_path):
+    a, b = _store(tmp_path), _store(tmp_path)
+    _write(a, "a", 30)
+    assert b.count("col") == 30
+    assert a.compact("col")
+    # b still holds the previous generation's segment open; it must reload
+    # before appending instead of writing to the unlinked file
+    _write(b, "b", 5, seed=1)
+    assert b.get_collection_stats("col")["generation"] == 1
+    assert _store(tmp_path).count("col") == 35
+    assert a.count("col") == 35
+
+
+def test_torn_tail_is_dropped_under_the_lock(tmp_path):
+    a = _store(tmp_path)
+    _write(a, "a", 10)
+    segment = tmp_path / "col" / faiss_store._segment_file(0)
+    with open(segment, "ab") as f:
+        f.write(faiss_store._FRAME.pack(64) + b"torn")
+    b = _store(tmp_path)
+    assert b.count("col") == 10
+    _write(b, "b", 3, seed=1)
+    assert a.count("col") == _store(tmp_path).count("col") == 13
+
+
+def test_collection_deleted_by_another_worker_stays_deleted(tmp_path):
+    a, b = _store(tmp_path), _store(tmp_path)
+    _write(a, "a", 10)
+    assert b.count("col") == 10
+    assert a.delete_collection("col")
+    # b has it loaded; it must notice instead of recreating the directory
+    assert b.count("col") == 0
+    assert b.get("col", ["a0"]) == [] and b.delete("col", ["a1"]) == 0
+    assert "col" not in b.list_collections()
+    assert not (tmp_path / "col").exists()
+    # A write starts a new, empty collection
+    _write(b, "b", 3, seed=1)
+    assert a.count("col") == b.count("col") == 3
+    assert _store(tmp_path).get("col", ["a0"]) == []
+
+
+def test_search_skips_tombstones_with_and_without_filter(tmp_path):
+    store = _store(tmp_path)
+    vecs = _vectors(40, 4)
+    ids = [f"r{i}" for i in range(40)]
+    store.upsert("col", ids[:30], vecs[:30], ids[:30], [{"even": i % 2 == 0} for i in range(30)])
+    assert store.compact("col")
+    store.upsert("col", ids[30:], vecs[30:], ids[30:], [{"even": i % 2 == 0} for i in range(30, 40)])
+    dead = {f"r{i}" for i in range(0, 40, 3)}
+    store.delete("col", sorted(dead))
+    flt = {"even": True}
+    for _ in range(2):  # the second round is served from the selection cache
+        for i in (0, 4, 33, 36):
+            hits = store.query_by_vector("col", vecs[i], k=40)
+            assert {h["id"] for h in hits} == set(ids) - dead
+            assert (hits[0]["id"] == ids[i]) == (ids[i] not in dead)
+            filtered = store.query_many("col", [vecs[i]], k=40, where=flt)[0]
+            assert {h["id"] for h in filtered} == {f"r{j}" for j in range(0, 40, 2)} - dead
+    # New tombstones invalidate the cached selection
+    store.delete("col", ["r4"])
+    assert "r4" not in {h["id"] for h in store.query_many("col", [vecs[4]], k=40, where=flt)[0]}
+    assert store.query_by_vector("col", vecs[4], k=1)[0]["id"] != "r4"
+
+
+def _process_writer(path, prefix, seed):
+    _write(_store(path), prefix, 150, seed)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses fork")
+def test_processes_write_and_compact_the_same_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_store, "_COMPACT_ROWS", 50)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_process_writer, args=(tmp_path, f"p{i}_", i)) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    fresh = _store(tmp_path)
+    assert fresh.count("col") == 450
+    assert fresh.query_by_vector("col", _vectors(150, 1)[7], k=1)[0]["id"] == "p1_7"
@@ -0,0 +1,55 @@
+"""
+Federated retrieval: collection specs and the cross-collection fusion.
+"""
+import pytest
+
+from glih_backend.federated import CollectionSpecError, federation_label, fuse_collections, parse_collections
+
+
+def _hits(*ids, distance=None):
+    return [{"id": rid, "document": rid, "distance": distance} for rid in ids]
+
+
+def test_parse_collections():
+    assert parse_collections("lineage-sops:2, lineage-routes") == [("lineage-sops", 2.0), ("lineage-routes", 1.0)]
+    assert parse_collections(["a", "a:3", "b:0.5"]) == [("a", 1.0), ("b", 0.5)]
+    assert parse_collections("") is None
+    assert federation_label([("a", 1.0), ("b", 2.0)]) == "a,b:2"
+    for bad in ("bad name!", "a:0", "a:x", "a:inf"):
+        with pytest.raises(CollectionSpecError):
+            parse_collections(bad)
+
+
+def test_fuse_collections_weights_and_provenance():
+    ranked = {"sops": _hits("s1", "s2"), "routes": _hits("r1", "r2")}
+    out = fuse_collections(ranked, {"sops": 1.0, "routes": 2.0}, k=4, rrf_k=60)
+    assert [r["id"] for r in out] == ["r1", "r2", "s1", "s2"]
+    assert out[0]["collection"] == "routes" and out[0]["collection_rank"] == 1
+    assert out[0]["collections"] == ["routes"]
+    # Ranked first everywhere it was asked for would be 1.0
+    assert 0 < out[0]["fused_score"] < 1
+
+
+def test_fuse_collections_sums_a_chunk_found_in_several_collections():
+    ranked = {"a": _hits("x", "shared"), "b": _hits("y", "shared")}
+    out = fuse_collections(ranked, {"a": 1.0, "b": 1.0}, k=3, rrf_k=60)
+    assert out[0]["id"] == "shared"
+    assert sorted(out[0]["collections"]) == ["a", "b"]
+
+
+def test_fuse_collections_breaks_rank_ties_on_collection_score_then_distance():
+    ranked = {
+        "a": [{"id": "a1", "distance": 0.2}, {"id": "a2", "distance": 0.9}],
+        "b": [{"id": "b1", "distance": 0.1}],
+    }
+    out = fuse_collections(ranked, {"a": 1.0, "b": 1.0}, k=3, rrf_k=60)
+    # a1 and b1 are both ranked first and both normalize to 1.0; b1 is closer
+    assert [r["id"] for r in out] == ["b1", "a1", "a2"]
+    assert out[0]["fused_score"] == out[1]["fused_score"] == 0.5
+
+
+def test_dropped_collection_still_counts_in_normalization():
+    full = fuse_collections({"a": _hits("x"), "b": _hits("x")}, {"a": 1.0, "b": 1.0}, k=1, rrf_k=60)
+    partial = fuse_collections({"a": _hits("x")}, {"a": 1.0, "b": 1.0}, k=1, rrf_k=60)
+    assert full[0]["fused_score"] == 1.0
+    assert partial[0]["fused_score"] == 0.5
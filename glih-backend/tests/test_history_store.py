@@ -0,0 +1,181 @@
+"""History store: keyset pagination and the write-behind queue."""
+from glih_backend import history_store as hs
+
+
+def _walk(backend, kind, limit):
+    """Every record id, page by page, following the returned cursor."""
+    seen, before = [], None
+    while True:
+        page = backend.list(kind, {}, limit, 0, before)
+        seen.extend(r["id"] for r in page)
+        if len(page) < limit:
+            return seen
+        before = page[-1]["cursor"]
+
+
+def _records(n_same, prefix="q"):
+    # Batch and agent runs write many records within the same timestamp
+    return [{"id": f"{prefix}{i}", "user_id": "u1", "timestamp": "2026-01-01T00:00:00"} for i in range(n_same)] + [
+        {"id": f"{prefix}old", "user_id": "u1", "timestamp": "2025-12-31T23:59:59"}
+    ]
+
+
+def test_sqlite_cursor_pages_through_equal_timestamps(tmp_path):
+    backend = hs._SQLiteBackend(tmp_path / "history.db")
+    backend.append_many("queries", _records(7))
+
+    ids = _walk(backend, "queries", limit=3)
+
+    assert ids == [f"q{i}" for i in reversed(range(7))] + ["qold"]
+
+
+def test_sqlite_bare_timestamp_cursor_still_accepted(tmp_path):
+    backend = hs._SQLiteBackend(tmp_path / "history.db")
+    backend.append_many("queries", _records(3))
+
+    page = backend.list("queries", {}, 10, 0, "2026-01-01T00:00:00")
+
+    assert [r["id"] for r in page] == ["qold"]
+
+
+def test_json_cursor_pages_through_equal_timestamps(tmp_path):
+    backend = hs._JSONBackend(tmp_path / "history.json")
+    backend.append_batch([("queries", r) for r in _records(5)])
+
+    ids = _walk(backend, "queries", limit=2)
+
+    assert ids == [f"q{i}" for i in reversed(range(5))] + ["qold"]
+
+
+class _FlakyBackend:
+    """SQLite backend whose next `failures` batch writes raise."""
+
+    def __init__(self, path, failures=0):
+        self.inner = hs._SQLiteBackend(path)
+        self.failures = failures
+        self.calls = 0
+
+    def append_batch(self, items):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        return self.inner.append_batch(items)
+
+    def get(self, kind, record_id):
+        return self.inner.get(kind, record_id)
+
+
+def _queue(tmp_path, backend, retries=1, **kwargs):
+    return hs._WriteBehindQueue(
+        backend, flush_interval_s=0.01, retries=retries, spill_path=tmp_path / "spill.jsonl", **kwargs
+    )
+
+
+def test_write_behind_flush_writes_and_lookup_sees_pending(tmp_path):
+    backend = _FlakyBackend(tmp_path / "history.db")
+    writer = _queue(tmp_path, backend)
+    writer.put("queries", {"id": "a", "timestamp": "2026-01-01T00:00:00"})
+
+    # Visible before the flusher got to it, and after
+    assert writer.pending("queries", "a") is not None or backend.inner.get("queries", "a") is not None
+    assert writer.flush(timeout=5)
+    assert backend.inner.get("queries", "a")["id"] == "a"
+    assert writer.pending("queries", "a") is None
+    assert writer.stats()["written"] == 1
+    writer.close()
+
+
+def test_write_behind_retries_a_failed_batch(tmp_path):
+    backend = _FlakyBackend(tmp_path / "history.db", failures=1)
+    writer = _queue(tmp_path, backend, retries=2)
+    writer.put("queries", {"id": "a", "timestamp": "2026-01-01T00:00:00"})
+
+    assert writer.flush(timeout=5)
+
+    stats = writer.stats()
+    assert backend.inner.get("queries", "a") is not None
+    assert (stats["retried"], stats["spilled"], stats["failed"]) == (1, 0, 0)
+    writer.close()
+
+
+def test_write_behind_spills_and_replays_after_recovery(tmp_path):
+    backend = _FlakyBackend(tmp_path / "history.db", failures=2)
+    writer = _queue(tmp_path, backend, retries=1)
+    writer.put("queries", {"id": "lost?", "timestamp": "2026-01-01T00:00:00"})
+    assert writer.flush(timeout=5)
+
+    # Both attempts failed: the record is in the spill file and still readable
+    assert writer.stats()["spilled"] == 1
+    assert (tmp_path / "spill.jsonl").exists()
+    assert writer.pending("queries", "lost?") is not None
+    assert backend.inner.get("queries", "lost?") is None
+
+    # The next successful batch replays the spill
+    writer.put("queries", {"id": "b", "timestamp": "2026-01-01T00:00:01"})
+    assert writer.flush(timeout=5)
+
+    assert backend.inner.get("queries", "lost?") is not None
+    assert backend.inner.get("queries", "b") is not None
+    assert not (tmp_path / "spill.jsonl").exists()
+    assert writer.pending("queries", "lost?") is None
+    assert writer.stats()["replayed"] == 1 and writer.stats()["failed"] == 0
+    writer.close()
+
+
+def test_json_save_errors_reach_the_write_behind_queue(tmp_path):
+    (tmp_path / "not-a-dir").write_text("")
+    backend = hs._JSONBackend(tmp_path / "not-a-dir" / "history.json")
+    writer = _queue(tmp_path, backend, retries=0)
+    writer.put("queries", {"id": "a", "timestamp": "2026-01-01T00:00:00"})
+    assert writer.flush(timeout=5)
+
+    assert writer.stats()["spilled"] == 1 and writer.stats()["written"] == 0
+    assert writer.pending("queries", "a") is not None
+    writer.close()
+
+
+def test_failed_replay_puts_back_only_the_unwritten_records(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    spill.write_text("".join(
+        hs.json.dumps({"kind": "queries", "record": {"id": f"s{i}", "timestamp": "2026-01-01T00:00:00"}}) + "\n"
+        for i in range(5)
+    ))
+
+    class _FailsSecondChunk(_FlakyBackend):
+        def append_batch(self, items):
+            self.calls += 1
+            if self.calls == 2:
+                raise RuntimeError("database is locked")
+            return self.inner.append_batch(items)
+
+    backend = _FailsSecondChunk(tmp_path / "history.db")
+    writer = _queue(tmp_path, backend, batch_size=2)
+    writer._replay_spill()
+
+    left = [hs.json.loads(line)["record"]["id"] for line in spill.read_text().splitlines()]
+    assert left == ["s2", "s3", "s4"]
+    assert backend.inner.get("queries", "s1") is not None
+    assert writer.stats()["replayed"] == 2
+    assert not list(tmp_path.glob("*.replay"))
+
+
+def test_records_replayed_by_another_worker_stop_being_pending(tmp_path):
+    backend = _FlakyBackend(tmp_path / "history.db", failures=1)
+    a = _queue(tmp_path, backend, retries=0)
+    b = _queue(tmp_path, _FlakyBackend(tmp_path / "history.db"))
+    a.put("queries", {"id": "spilled", "timestamp": "2026-01-01T00:00:00"})
+    assert a.flush(timeout=5)
+    assert a.pending("queries", "spilled") is not None
+
+    # Worker b writes first after recovery and replays a's spill
+    b.put("queries", {"id": "b", "timestamp": "2026-01-01T00:00:01"})
+    assert b.flush(timeout=5)
+    assert backend.inner.get("queries", "spilled") is not None
+
+    # a's next successful batch notices and drops its in-memory copy
+    a.put("queries", {"id": "a", "timestamp": "2026-01-01T00:00:02"})
+    assert a.flush(timeout=5)
+    assert a.pending("queries", "spilled") is None
+    a.close()
+    b.close()
@@ -0,0 +1,126 @@
+"""
+LLM resilience: circuit breaker, hedging, failover, deadline and streams.
+"""
+import gc
+import time
+
+import pytest
+
+from glih_backend import llm_resilience
+from glih_backend.llm_resilience import CircuitBreaker, CircuitOpenError, ResilientLLM
+
+
+class _Provider:
+    def __init__(self, model, answer="ok", delay=0.0, fail=False):
+        self.provider = "fake"
+        self.model = model
+        self.available = True
+        self.answer = answer
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def generate_ex(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.model} down")
+        return self.answer, {"prompt_tokens": 1}
+
+    def generate_stream(self, prompt):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError(f"{self.model} down")
+        yield from self.answer.split()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_resilience, "_stats", dict.fromkeys(llm_resilience._stats, 0))
+
+
+def test_breaker_opens_and_admits_one_probe_when_half_open():
+    b = CircuitBreaker("x", failures=2, cooldown_s=0.05)
+    for _ in range(2):
+        assert b.allow()
+        b.record(False)
+    assert b.state == "open" and not b.allow()
+    time.sleep(0.06)
+    assert b.allow()
+    assert b.state == "half_open" and not b.allow()
+    b.record(False)
+    assert b.state == "open"
+    time.sleep(0.06)
+    assert b.allow()
+    b.record(True, 10.0)
+    assert b.state == "closed" and b.allow()
+
+
+def test_failover_to_the_next_provider():
+    down, up = _Provider("a", fail=True), _Provider("b", answer="from b")
+    text, info = ResilientLLM([down, up]).generate_served("q")
+    assert text == "from b" and info["served_by"] == "fake/b"
+    assert llm_resilience._stats["failovers"] == 1
+
+
+def test_open_circuit_is_skipped():
+    down, up = _Provider("a", fail=True), _Provider("b")
+    llm = ResilientLLM([down, up])
+    llm_resilience._breaker(down).failures = 1
+    llm.generate_served("q")
+    llm.generate_served("q")
+    assert down.calls == 1 and up.calls == 2
+    with pytest.raises(CircuitOpenError):
+        ResilientLLM([down]).generate_served("q")
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "_HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_resilience, "_HEDGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(llm_resilience, "_HEDGE_MIN_MS", 50)
+    slow, fast = _Provider("a", answer="slow", delay=1.0), _Provider("b", answer="fast")
+    llm_resilience._breaker(slow)._latencies.extend([10.0, 10.0, 10.0])
+    t0 = time.monotonic()
+    text, info = ResilientLLM([slow, fast]).generate_served("q")
+    assert (text, info["served_by"]) == ("fast", "fake/b")
+    assert time.monotonic() - t0 < 0.5
+    assert llm_resilience._stats["hedges"] == llm_resilience._stats["hedge_wins"] == 1
+
+
+def test_deadline_bounds_the_request(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "_DEADLINE_S", 0.1)
+    with pytest.raises(TimeoutError):
+        ResilientLLM([_Provider("a", delay=0.5)]).generate_served("q")
+    assert llm_resilience._stats["deadline_exceeded"] == 1
+
+
+def test_stream_fails_over_before_the_first_delta():
+    served_by, deltas = ResilientLLM([_Provider("a", fail=True), _Provider("b", answer="x y")]).generate_stream_served("q")
+    assert served_by == "fake/b" and list(deltas) == ["x", "y"]
+    assert llm_resilience._breaker(_Provider("b")).snapshot()["ok"] == 1
+
+
+@pytest.mark.parametrize("consume", [0, 1])
+def test_abandoned_stream_releases_a_half_open_probe(consume):
+    p = _Provider("a", answer="one two three")
+    b = llm_resilience._breaker(p)
+    b.cooldown_s = 0.0
+    b._state = "open"
+    _, deltas = ResilientLLM([p]).generate_stream_served("q")
+    assert b.state == "half_open" and not b.allow()
+    for _ in range(consume):
+        next(deltas)
+    # Client disconnected: the response drops the iterator without exhausting it
+    del deltas
+    gc.collect()
+    assert b.allow()
+
+
+def test_stream_outcome_is_recorded_once():
+    p = _Provider("a", answer="one two")
+    _, deltas = ResilientLLM([p]).generate_stream_served("q")
+    assert list(deltas) == ["one", "two"]
+    deltas.close()
+    snap = llm_resilience._breaker(p).snapshot()
+    assert (snap["ok"], snap["failed"]) == (1, 0)
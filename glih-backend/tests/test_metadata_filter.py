@@ -0,0 +1,85 @@
+"""
+MetadataFilter: spec parsing, build_filter date ranges and the backend dialects.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from glih_backend.metadata_filter import FilterError, MetadataFilter, build_filter
+
+
+def _epoch(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_date_only_date_to_includes_the_whole_day():
+    flt = build_filter(date_from="2024-03-01", date_to="2024-03-31")
+    assert set(flt.conditions) == {
+        ("ingested_at", "gte", _epoch("2024-03-01")),
+        ("ingested_at", "lt", _epoch("2024-04-01")),
+    }
+    assert flt.matches({"ingested_at": _epoch("2024-03-31T23:59:59")})
+    assert not flt.matches({"ingested_at": _epoch("2024-04-01")})
+
+
+def test_datetime_date_to_is_inclusive():
+    flt = build_filter(date_to="2024-03-31T12:00:00")
+    assert flt.conditions == (("ingested_at", "lte", _epoch("2024-03-31T12:00:00")),)
+
+
+def test_invalid_specs_raise_filter_error():
+    with pytest.raises(FilterError):
+        MetadataFilter.from_spec({"facility": {"like": "DAL"}})
+    with pytest.raises(FilterError):
+        MetadataFilter.from_spec({"bad field": "x"})
+    with pytest.raises(FilterError):
+        build_filter(date_to="2024-02-30")
+
+
+def test_to_chroma():
+    flt = MetadataFilter.from_spec({"facility": "DAL-01", "product_type": ["Dairy", "Seafood"]})
+    assert flt.to_chroma() == {"$and": [
+        {"facility": {"$eq": "DAL-01"}},
+        {"product_type": {"$in": ["Dairy", "Seafood"]}},
+    ]}
+    assert MetadataFilter.from_spec({"facility": "DAL-01"}).to_chroma() == {"facility": {"$eq": "DAL-01"}}
+
+
+def test_to_pinecone_groups_operators_per_field():
+    flt = MetadataFilter.from_spec({"facility": "DAL-01", "ingested_at": {"gte": 10, "lt": 20}})
+    assert flt.to_pinecone() == {"facility": {"$eq": "DAL-01"}, "ingested_at": {"$gte": 10.0, "$lt": 20.0}}
+
+
+def test_to_qdrant_merges_ranges_per_field():
+    class _Models:
+        FieldCondition = staticmethod(lambda **kw: ("field", kw))
+        MatchValue = staticmethod(lambda **kw: ("value", kw))
+        MatchAny = staticmethod(lambda **kw: ("any", kw))
+        Range = staticmethod(lambda **kw: ("range", kw))
+        Filter = staticmethod(lambda **kw: kw)
+
+    flt = MetadataFilter.from_spec({"facility": ["DAL-01", "ATL-02"], "ingested_at": {"gt": 1, "lte": 5}})
+    assert flt.to_qdrant(_Models) == {"must": [
+        ("field", {"key": "facility", "match": ("any", {"any": ["DAL-01", "ATL-02"]})}),
+        ("field", {"key": "ingested_at", "range": ("range", {"gt": 1.0, "lte": 5.0})}),
+    ]}
+
+
+def test_to_weaviate_sends_int_operands_for_int_properties():
+    flt = build_filter(facility="DAL-01", date_from="2024-03-01", date_to="2024-03-31")
+    where = flt.to_weaviate(lambda f: "meta_" + f, int_fields=("ingested_at",))
+    assert where["operator"] == "And"
+    operands = {(o["path"][0], o["operator"]): o for o in where["operands"]}
+    assert operands[("meta_facility", "Equal")]["valueText"] == "DAL-01"
+    lo = operands[("meta_ingested_at", "GreaterThanEqual")]
+    hi = operands[("meta_ingested_at", "LessThan")]
+    assert lo == {"path": ["meta_ingested_at"], "operator": "GreaterThanEqual", "valueInt": int(_epoch("2024-03-01"))}
+    assert hi["valueInt"] == int(_epoch("2024-04-01")) and "valueNumber" not in hi
+
+
+def test_to_weaviate_rounds_fractional_int_bounds_inward():
+    flt = MetadataFilter.from_spec({"n": {"gt": 1.5, "gte": 1.5, "lt": 4.5, "lte": 4.5}})
+    ops = {o["operator"]: o["valueInt"] for o in flt.to_weaviate(int_fields=("n",))["operands"]}
+    assert ops == {"GreaterThan": 1, "GreaterThanEqual": 2, "LessThan": 5, "LessThanEqual": 4}
+    # Other numeric fields keep valueNumber
+    assert MetadataFilter.from_spec({"score": {"gt": 0.5}}).to_weaviate()["valueNumber"] == 0.5
@@ -1 +1 @@
-__all__ = ["metrics"]
+__all__ = ["metrics", "retrieval"]
@@ -0,0 +1,184 @@
+"""
+GLIH Platform — Retrieval Evaluation
+====================================
+Measures what a retrieval stage buys and what it costs: recall@k and MRR
+against a labelled question set, and per-query latency, for two or more
+retrievers run over the same questions.
+
+Dataset: JSONL, one question per line:
+
+  {"question": "What is the max temperature for dairy?", "relevant": ["sop-dairy-007", "4°C"]}
+
+Each `relevant` entry is matched against a result's id, metadata doc_id /
+source, or (case-insensitively) its document text. A question's recall@k is
+the fraction of its relevant entries found in the top k.
+
+A retriever is a callable (question, k) -> results, or -> (results, timings),
+where results are the backend's result dicts (id, document, metadata). With
+timings, the per-stage statuses (rerank_status, vector_status, ...) are
+counted in the summary, so budget fallbacks show up next to the recall.
+
+Against the backend, in-process (same config and data dir as the API):
+
+  python -m glih_eval.retrieval --dataset eval/sops.jsonl --collection lineage-sops --k 1 3 5
+
+compares RRF fusion alone ("rrf") with RRF + cross-encoder rerank ("rerank").
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+Retriever = Callable[[str, int], Any]
+
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    rows = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if not row.get("question") or not row.get("relevant"):
+                raise ValueError(f"dataset row needs 'question' and 'relevant': {line[:120]}")
+            rows.append(row)
+    return rows
+
+
+def _matches(result: Dict[str, Any], label: str) -> bool:
+    md = result.get("metadata") or {}
+    if label in (result.get("id"), md.get("doc_id"), md.get("source"), md.get("source_url")):
+        return True
+    return label.casefold() in (result.get("document") or "").casefold()
+
+
+def first_hit_ranks(results: Sequence[Dict[str, Any]], relevant: Iterable[str]) -> List[Optional[int]]:
+    """1-based rank of the first result matching each relevant label (None if absent)."""
+    return [next((i + 1 for i, r in enumerate(results) if _matches(r, label)), None) for label in relevant]
+
+
+def recall_at_k(ranks: Sequence[Optional[int]], k: int) -> float:
+    return sum(1 for r in ranks if r is not None and r <= k) / len(ranks) if ranks else 0.0
+
+
+def reciprocal_rank(ranks: Sequence[Optional[int]]) -> float:
+    found = [r for r in ranks if r is not None]
+    return 1.0 / min(found) if found else 0.0
+
+
+def evaluate(dataset: List[Dict[str, Any]], retrieve: Retriever, ks: Sequence[int] = (1, 3, 5)) -> pd.DataFrame:
+    """One row per question: recall@k for each k, reciprocal rank, latency and stage statuses."""
+    depth = max(ks)
+    rows = []
+    for row in dataset:
+        t0 = time.perf_counter()
+        out = retrieve(row["question"], depth)
+        latency_ms = (time.perf_counter() - t0) * 1000
+        results, timings = out if isinstance(out, tuple) else (out, {})
+        ranks = first_hit_ranks(results, row["relevant"])
+        rec = {"question": row["question"], "latency_ms": round(latency_ms, 2), "rr": reciprocal_rank(ranks)}
+        for k in ks:
+            rec[f"recall@{k}"] = recall_at_k(ranks, k)
+        rec.update({key: v for key, v in timings.items() if key.endswith("_status")})
+        rows.append(rec)
+    return pd.DataFrame(rows)
+
+
+def summarize(per_question: pd.DataFrame, ks: Sequence[int]) -> Dict[str, Any]:
+    lat = per_question["latency_ms"]
+    out: Dict[str, Any] = {f"recall@{k}": round(per_question[f"recall@{k}"].mean(), 4) for k in ks}
+    out.update({
+        "mrr": round(per_question["rr"].mean(), 4),
+        "latency_p50_ms": round(lat.quantile(0.5), 2),
+        "latency_p95_ms": round(lat.quantile(0.95), 2),
+        "latency_mean_ms": round(lat.mean(), 2),
+        "questions": len(per_question),
+    })
+    for col in sorted(c for c in per_question.columns if c.endswith("_status")):
+        counts = per_question[col].value_counts(dropna=True)
+        out[col] = ", ".join(f"{status}={n}" for status, n in counts.items())
+    return out
+
+
+def compare(
+    dataset: List[Dict[str, Any]],
+    retrievers: Dict[str, Retriever],
+    ks: Sequence[int] = (1, 3, 5),
+    warmup: int = 2,
+) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """
+    Summary table (one row per retriever, plus "<name> vs <baseline>" delta
+    rows against the first retriever) and the per-question frames. The first
+    `warmup` questions are run once per retriever untimed, so model loads and
+    cold caches do not land in the latency numbers.
+    """
+    summaries: Dict[str, Dict[str, Any]] = {}
+    details: Dict[str, pd.DataFrame] = {}
+    for name, retrieve in retrievers.items():
+        for row in dataset[:warmup]:
+            retrieve(row["question"], max(ks))
+        details[name] = evaluate(dataset, retrieve, ks)
+        summaries[name] = summarize(details[name], ks)
+    table = pd.DataFrame.from_dict(summaries, orient="index")
+    names = list(retrievers)
+    if len(names) > 1:
+        base = table.loc[names[0]]
+        metrics = [f"recall@{k}" for k in ks] + ["mrr", "latency_p50_ms", "latency_p95_ms", "latency_mean_ms"]
+        for name in names[1:]:
+            table.loc[f"{name} vs {names[0]}", metrics] = (table.loc[name, metrics] - base[metrics]).round(4)
+    return table, details
+
+
+def backend_retrievers(collection: str, fetch_k: int = 40, budget_ms: Optional[float] = None) -> Dict[str, Retriever]:
+    """
+    "rrf" and "rerank" retrievers over the backend's hybrid search, run
+    in-process. `budget_ms` overrides GLIH_RERANK_BUDGET_MS for the run.
+    Reranker caches are cleared so every question is scored by the model.
+    """
+    try:
+        from glih_backend.api import main as backend  # type: ignore
+        from glih_backend.reranker import get_reranker  # type: ignore
+    except ImportError as e:
+        raise RuntimeError(f"backend_retrievers needs glih-backend installed: {e}")
+
+    reranker = backend._reranker or get_reranker()
+    if budget_ms is not None:
+        reranker.budget_ms = budget_ms
+    reranker.encoder()
+    reranker.clear()
+
+    def make(rerank: bool) -> Retriever:
+        def retrieve(question: str, k: int):
+            timings: Dict[str, Any] = {}
+            results = backend._hybrid_search(question, collection, k=k, fetch_k=max(fetch_k, k), timings=timings, rerank=rerank)
+            return results, timings
+        return retrieve
+
+    return {"rrf": make(False), "rerank": make(True)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Recall@k and latency of RRF vs RRF + cross-encoder rerank")
+    ap.add_argument("--dataset", required=True, help="JSONL with question / relevant")
+    ap.add_argument("--collection", required=True)
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    ap.add_argument("--fetch-k", type=int, default=40, help="candidates per retrieval branch")
+    ap.add_argument("--budget-ms", type=float, default=None, help="rerank latency budget for this run")
+    ap.add_argument("--out", default=None, help="write per-question results to this CSV")
+    args = ap.parse_args(argv)
+
+    dataset = load_dataset(args.dataset)
+    table, details = compare(dataset, backend_retrievers(args.collection, args.fetch_k, args.budget_ms), args.k)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(table)
+    if args.out:
+        pd.concat(details, names=["retriever"]).to_csv(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+GLIH BM25 Microbenchmark
+========================
+Run: python tests/bench_bm25.py [--sizes 1000 10000 100000 1000000] [--queries 200]
+
+Compares glih_backend.bm25_index.BM25Index (CSR postings, sparse dot product,
+argpartition top-k) with rank_bm25.BM25Okapi (dense per-term scoring + full
+sort) on a synthetic Zipf-distributed corpus of chunk-sized documents.
+
+Reports build time, p50/p95 query latency for top-k and, for sizes where the
+baseline runs (--baseline-max), the max absolute score difference and top-k
+agreement. rank_bm25 is a dev dependency: pip install -e "glih-backend[dev]".
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "glih-backend", "src"))
+
+from glih_backend.bm25_index import build_index, tokenize  # noqa: E402
+
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:  # baseline is optional
+    BM25Okapi = None
+
+
+def make_corpus(n_docs: int, vocab_size: int, doc_len: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"t{i}" for i in range(vocab_size)])
+    lengths = rng.integers(doc_len // 2, doc_len * 3 // 2 + 1, size=n_docs)
+    tokens = vocab[np.minimum(rng.zipf(1.2, size=int(lengths.sum())) - 1, vocab_size - 1)]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    return [" ".join(tokens[bounds[i]:bounds[i + 1]]) for i in range(n_docs)], vocab
+
+
+def make_queries(vocab, n_queries: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    # Mid-frequency terms, 2–5 per query — roughly what SOP questions look like
+    pool = vocab[10: min(len(vocab), 5000)]
+    return [list(rng.choice(pool, size=rng.integers(2, 6))) for _ in range(n_queries)]
+
+
+def pct(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def bench(n_docs: int, args) -> None:
+    docs, vocab = make_corpus(n_docs, args.vocab, args.doc_len, args.seed)
+    ids = [f"c{i}" for i in range(n_docs)]
+    queries = make_queries(vocab, args.queries, args.seed)
+
+    t0 = time.perf_counter()
+    index = build_index(ids, docs, None)
+    build_s = time.perf_counter() - t0
+
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.top_k(q, args.k)
+        lat.append(time.perf_counter() - t0)
+    row = f"{n_docs:>9,} | csr    build {build_s:7.2f}s | p50 {pct(lat, .5):8.2f}ms p95 {pct(lat, .95):8.2f}ms"
+    print(row, flush=True)
+
+    if BM25Okapi is None or n_docs > args.baseline_max:
+        return
+    t0 = time.perf_counter()
+    ref = BM25Okapi([tokenize(d) for d in docs])
+    ref_build_s = time.perf_counter() - t0
+    ref_lat, max_diff, agree = [], 0.0, 0
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = ref.get_scores(q)
+        top = np.argsort(-scores, kind="stable")[: args.k]
+        ref_lat.append(time.perf_counter() - t0)
+        max_diff = max(max_diff, float(np.abs(np.asarray(index.get_scores(q)) - scores).max()))
+        agree += [s for s, _ in index.top_k(q, args.k)] == [int(i) for i in top if scores[i] != 0]
+    print(
+        f"{'':>9} | rank25 build {ref_build_s:7.2f}s | p50 {pct(ref_lat, .5):8.2f}ms p95 {pct(ref_lat, .95):8.2f}ms"
+        f" | speedup p50 {pct(ref_lat, .5) / max(pct(lat, .5), 1e-6):6.1f}x"
+        f" | max |Δscore| {max_diff:.1e} | top-{args.k} equal {agree}/{len(queries)}",
+        flush=True,
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--vocab", type=int, default=50_000)
+    ap.add_argument("--doc-len", type=int, default=120, help="mean tokens per chunk")
+    ap.add_argument("--baseline-max", type=int, default=100_000, help="skip rank_bm25 above this size")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    for n in args.sizes:
+        bench(n, args)
+
+
+if __name__ == "__main__":
+    main()